@@ -0,0 +1,63 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Fixtures shared by the unit tests of every Lambda Function and of the layers (layers/test), the test/unit/conftest.py
+of a function only lists the modules of the function (local_modules) and the layers other than CTE_Common it uses."""
+
+import os
+import sys
+import importlib
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'layers', 'CTE_Common'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import tracing  # noqa: E402 pylint: disable=wrong-import-position
+from state_store import LocalStateStore  # noqa: E402 pylint: disable=wrong-import-position
+
+
+class LambdaContext():
+    function_name = 'CTE_Test'
+    aws_request_id = 'f1e2d3c4'
+    log_stream_name = 'stream'
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:999999999999:function:CTE_Test'
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+@pytest.fixture(autouse=True)
+def local_state_store(monkeypatch):
+    monkeypatch.delenv('CTE_STATE_TABLE', raising=False)
+    LocalStateStore.reset()
+    yield
+    LocalStateStore.reset()
+
+
+@pytest.fixture()
+def lambda_context():
+    return LambdaContext()
+
+
+@pytest.fixture()
+def exporter():
+    """Spans of the invocation, kept in memory instead of being exported"""
+    exporter = tracing.InMemoryExporter()
+    tracing.set_tracer(tracing.Tracer(service_name='CTE_Test', exporter=exporter))
+    yield exporter
+    tracing.set_tracer(None)
+
+
+@pytest.fixture()
+def load_src(request, local_modules):
+    """Imports a module from the src folder of the Lambda Function under test the same way the Lambda runtime does,
+    the local_modules fixture of the function lists the modules to reload"""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(request.module.__file__)), '..', '..', 'src')
+    saved = {name: sys.modules.pop(name) for name in local_modules if name in sys.modules}
+    sys.path.insert(0, src_dir)
+    yield importlib.import_module
+    sys.path.remove(src_dir)
+    for name in local_modules:
+        sys.modules.pop(name, None)
+    sys.modules.update(saved)
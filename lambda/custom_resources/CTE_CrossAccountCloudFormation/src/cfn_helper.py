@@ -6,6 +6,7 @@ import re
 import json
 import time
 import logging
+import functools
 from datetime import datetime, timezone
 import botocore.exceptions as ex
 from client_session_helper import boto3_client
@@ -17,8 +18,63 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logging.getLogger("botocore").setLevel(logging.ERROR)
 
-
-def create_update_stack(stack_name, template, cfn_params, capability, region='us-east-1', waiter=False, tags=None, session=None):
+STACK_POLL_SECONDS = 10
+# Same limit as the stack_create_complete / stack_update_complete waiters (120 x 30 seconds)
+STACK_WAIT_TIMEOUT = 3600
+STACK_START_STATUSES = ['CREATE_IN_PROGRESS', 'UPDATE_IN_PROGRESS', 'IMPORT_IN_PROGRESS']
+STACK_SUCCESS_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'IMPORT_COMPLETE']
+STACK_FAILURE_STATUSES = [
+    'CREATE_FAILED',
+    'ROLLBACK_IN_PROGRESS',
+    'ROLLBACK_COMPLETE',
+    'ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'UPDATE_ROLLBACK_FAILED',
+    'IMPORT_ROLLBACK_IN_PROGRESS',
+    'IMPORT_ROLLBACK_COMPLETE',
+    'IMPORT_ROLLBACK_FAILED',
+    'DELETE_IN_PROGRESS',
+    'DELETE_COMPLETE'
+]
+RESOURCE_FAILURE_STATUSES = ['CREATE_FAILED', 'UPDATE_FAILED', 'DELETE_FAILED', 'IMPORT_FAILED']
+# Reason of the resources CloudFormation stops once another resource failed
+CANCELLED_REASONS = ['Resource creation cancelled', 'Resource update cancelled']
+# Every status list_stacks reports but DELETE_COMPLETE
+LIVE_STACK_STATUSES = [
+    'CREATE_IN_PROGRESS',
+    'CREATE_FAILED',
+    'CREATE_COMPLETE',
+    'ROLLBACK_IN_PROGRESS',
+    'ROLLBACK_FAILED',
+    'ROLLBACK_COMPLETE',
+    'DELETE_IN_PROGRESS',
+    'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS',
+    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_IN_PROGRESS',
+    'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'REVIEW_IN_PROGRESS'
+]
+# Statuses of a stack that has an operation running, no other operation can start until it settles
+IN_PROGRESS_STATUSES = [
+    'CREATE_IN_PROGRESS',
+    'UPDATE_IN_PROGRESS',
+    'DELETE_IN_PROGRESS',
+    'ROLLBACK_IN_PROGRESS',
+    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_ROLLBACK_IN_PROGRESS'
+]
+# Ends the Description of every template deployed by CTE_CrossAccountCloudFormation, marks the stacks it manages
+MANAGED_DESCRIPTION = '(Lambda:CrossAccountCloudFormation)'
+
+
+def create_update_stack(stack_name, template, cfn_params, capability, region='us-east-1', waiter=False, tags=None, session=None,
+                        fail_fast=True, cancel_on_failure=False, client_request_token=None):
     """Creates or updates a cloudformation stack using the provided parameters and
     optionally waits for it to be complete
 
@@ -32,12 +88,17 @@ def create_update_stack(stack_name, template, cfn_params, capability, region='us
         waiter (bool): True/False if we should wait for the stack to complete or immediately return response
         tags (list): tags set on CloudFormation stack
         session (object, optional): boto3 session object
+        fail_fast (bool, optional): Stop waiting at the first failed resource instead of the end of the rollback
+        cancel_on_failure (bool, optional): With fail_fast, cancels an update that has a failed resource
+        client_request_token (str, optional): Same token for the retries of the create / update call
 
     Returns:
         dict: Standard AWS response dict
     """
     # Setup default arguments for cfn
     args = {'StackName': stack_name, 'Capabilities': [], 'session': session, 'TemplateBody': json.dumps(template)}
+    if client_request_token:
+        args['ClientRequestToken'] = client_request_token
 
     # Setup CloudFormation Path and/or Body
     template_body = args['TemplateBody']
@@ -48,27 +109,22 @@ def create_update_stack(stack_name, template, cfn_params, capability, region='us
         session=session
     )
 
+    # If CloudFormation stack is currently in progress wait for it to settle, then apply the template to it
+    if stack_exists and stack_exists['Stacks'][0]['StackStatus'] in IN_PROGRESS_STATUSES:
+        stack_exists = wait_stack_settled(stack_name=stack_name, session=session)
+
+    # A stack whose creation rolled back can only be deleted, it is replaced by a new one
+    if stack_exists and stack_exists['Stacks'][0]['StackStatus'] == 'ROLLBACK_COMPLETE':
+        LOGGER.info(f"Stack ({stack_name}) creation was rolled back, deleting it before creating it again")
+        delete_stack(stack_name=stack_name, session=session)
+        stack_exists = wait_stack_settled(stack_name=stack_name, session=session)
+
     # Setup Tags
     if tags:
         args['Tags'] = tags
     if not tags and stack_exists:
         args['Tags'] = stack_exists['Stacks'][0]['Tags']
 
-    # If CloudFormation stack is currently in progress pickup where it was left off
-    in_progress_status = [
-        "CREATE_IN_PROGRESS",
-        "UPDATE_IN_PROGRESS",
-        "DELETE_IN_PROGRESS",
-        "ROLLBACK_IN_PROGRESS",
-        "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
-        "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS",
-        "UPDATE_ROLLBACK_IN_PROGRESS"
-    ]
-
-    if stack_exists and (stack_exists['Stacks'][0]['StackStatus'] in in_progress_status):
-        wait_all_stacks([{"Name": stack_name, "Session": session}])
-        return
-
     # Setup capability to be a list so CloudFormation doesn't fail
     if isinstance(capability, str):
         args['Capabilities'] = [capability]
@@ -104,67 +160,71 @@ def create_update_stack(stack_name, template, cfn_params, capability, region='us
         stack_id = response['StackId']
         stack_url = f"https://console.aws.amazon.com/cloudformation/home?region={region}#/stack/detail?stackId={re.sub('/', '%2F', stack_id)}"
         LOGGER.info("Waiting for CloudFormation Stack to complete")
-        wait_for_stack_complete(stack_name=stack_name, stack_url=stack_url, cfn_action=cfn_action, session=session)
+        wait_for_stack_complete(stack_name=stack_name, stack_url=stack_url, cfn_action=cfn_action, session=session,
+                                fail_fast=fail_fast, cancel_on_failure=cancel_on_failure)
 
     return response
 
 
+def parameters_to_dict(parameters) -> dict:
+    """Indexes CloudFormation Parameters by key, the last value of a key wins and the order of the keys is kept
+
+    Args:
+        parameters (dict or list, optional): {key: value}, {"Parameters": {key: value}} or a list of
+            {"ParameterKey", "ParameterValue"}
+
+    Returns:
+        dict: {"ParameterKey": {"ParameterKey", "ParameterValue"}}
+    """
+    if not parameters:
+        return {}
+    if isinstance(parameters, dict):
+        if parameters.get('Parameters'):
+            LOGGER.info('Found "Parameters" section in dict, using that value for all parameters.')
+            parameters = parameters['Parameters']
+        return {str(key): {"ParameterKey": str(key), "ParameterValue": str(value)}
+                for key, value in parameters.items()}
+    return {x['ParameterKey']: x for x in parameters}
+
+
 def update_parameters(override_parameters=None, current_parameters=None):
-    """This will diff 2 sets of CloudFormation Parameters and will set any duplicate ones to
-    the Override value
+    """Merges 2 sets of CloudFormation Parameters, a key in both is set to the Override value
+
+    The current keys keep their position and the new override keys, of a dict or a list override alike, are added
+    after them.
 
     Args:
         override_parameters (dict or list, optional): Override Parameters to deploy a CloudFormation Template
-        current_parameters (list, optional): Path to the template file on disk to create stack with
+        current_parameters (list, optional): Parameters of the existing CloudFormation Stack
 
     Returns:
         list: A list of CloudFormation Parameters
     """
-    # Parameters with override values
-    parameters = []
     LOGGER.info(f"Override Parameters:{override_parameters}")
     LOGGER.info(f"Current Parameters:{current_parameters}")
 
-    if current_parameters:
-        for c_param in current_parameters:
-            parameters.append({"ParameterKey": c_param['ParameterKey'], "ParameterValue": c_param['ParameterValue']})
-
-    if override_parameters and isinstance(override_parameters, dict):
-        if override_parameters.get('Parameters'):
-            LOGGER.info('Found "Parameters" section in dict, using that value for all parameters.')
-            override_parameters = override_parameters['Parameters']
-
-        for key, value in override_parameters.items():
-            # Parse through list to see if it needs to be updated.
-            for parameter in parameters:
-                if key == parameter['ParameterKey'] and value != parameter['ParameterValue']:
-                    LOGGER.info(f'Removing {{"ParameterKey": {key}, "ParameterValue": {parameter["ParameterValue"]} }}')
-                    parameters.remove({"ParameterKey": key, "ParameterValue": parameter["ParameterValue"]})
-
-            LOGGER.info(f'Adding {{"ParameterKey": {str(key)}, "ParameterValue": {str(value)}}})')
-            temp = {"ParameterKey": str(key), "ParameterValue": str(value)}
-            parameters.append(temp)
-
-    elif override_parameters and isinstance(override_parameters, list):
-        if not current_parameters:
-            parameters = override_parameters
-        else:
-            for o_param in override_parameters:
-                # Parse through list to see if it needs to be updated.
-                for c_param in parameters:
-                    if o_param['ParameterKey'] == c_param['ParameterKey'] and \
-                            o_param['ParameterValue'] != c_param['ParameterValue']:
-                        LOGGER.info(
-                            f"Replacing Parameter:{o_param['ParameterKey']} with Value:{o_param['ParameterValue']}")
-                        parameters.remove(
-                            {"ParameterKey": c_param['ParameterKey'], "ParameterValue": c_param['ParameterValue']})
-                        parameters.append(
-                            {"ParameterKey": o_param['ParameterKey'], "ParameterValue": o_param['ParameterValue']})
+    parameters = {x['ParameterKey']: {"ParameterKey": x['ParameterKey'], "ParameterValue": x['ParameterValue']}
+                  for x in current_parameters or []}
+    parameters.update(parameters_to_dict(override_parameters))
 
+    parameters = list(parameters.values())
     LOGGER.info(f"New Deployment Parameters:{parameters}")
     return parameters
 
 
+@functools.lru_cache(maxsize=32)
+def template_parameter_keys(template: str) -> frozenset:
+    """Parameter keys of an AWS CloudFormation template, a template is only parsed once per container
+
+    Args:
+        template (str): String of AWS CloudFormation Template
+
+    Returns:
+        frozenset: Keys of the template Parameters section
+    """
+    return frozenset(load_yaml(template).get('Parameters') or {})
+
+
 def remove_unused_parameters(template, parameters):
     """This will scan each parameter to ensure it still exists in the
     AWS CloudFormation template
@@ -174,27 +234,14 @@ def remove_unused_parameters(template, parameters):
         parameters (list): List of AWS CloudFormation Parameters
 
     Returns:
-        str: Returns the StackStatus message from the response
+        list: The parameters found in the template
     """
-    return_parameters = []
-    LOGGER.info(f"Scanning Parameters to be removed - {parameters}")
-    LOGGER.debug(f"template:{template}")
-    cfn_template = load_yaml(template)
-    template_params = cfn_template.get('Parameters')
-    if template_params:
-        LOGGER.info(f"Template Parameters:{template_params}")
-        template_parameters_keys = template_params.keys()
-
-        for parameter in parameters:
-            LOGGER.debug(f"Checking Parameter:{parameter} against template_parameters_keys:{template_parameters_keys}")
-            param_value = parameter['ParameterKey']
-            if param_value in template_parameters_keys:
-                LOGGER.info(f"Found Parameter:{param_value} in template, appending to return parameter list")
-                return_parameters.append(parameter)
-
-            else:
-                LOGGER.info(f"Parameter:{param_value} was not found in template")
+    template_keys = template_parameter_keys(template)
+    return_parameters = [x for x in parameters if x['ParameterKey'] in template_keys]
 
+    removed = [x['ParameterKey'] for x in parameters if x['ParameterKey'] not in template_keys]
+    if removed:
+        LOGGER.info(f"Parameters not found in template:{removed}")
     return return_parameters
 
 
@@ -268,6 +315,33 @@ def wait_all_stacks(stack_list):
         raise Exception(failed_list)
 
 
+def wait_stack_settled(stack_name, session=None, poll_seconds=STACK_POLL_SECONDS, timeout=STACK_WAIT_TIMEOUT):
+    """Waits for the running operation of a stack to end, whatever its outcome
+
+    Args:
+        stack_name (str): Name of the stack to wait on
+        session (object, optional): boto3 session object
+        poll_seconds (int, optional): Seconds between two describes
+        timeout (int, optional): Seconds to wait
+
+    Returns:
+        dict: describe_stack response of the settled stack, None once the stack is deleted
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        response = describe_stack(stack_name=stack_name, session=session)
+        if not response or response['Stacks'][0]['StackStatus'] == 'DELETE_COMPLETE':
+            return None
+        stack_status = response['Stacks'][0]['StackStatus']
+        if stack_status not in IN_PROGRESS_STATUSES:
+            LOGGER.info(f"Stack ({stack_name}) settled in {stack_status}")
+            return response
+        if time.monotonic() >= deadline:
+            raise Exception(f"Timed out waiting for stack {stack_name} to settle ({stack_status})")
+        LOGGER.info(f"Stack ({stack_name}) Status:{stack_status}, waiting for it to settle")
+        time.sleep(poll_seconds)
+
+
 def get_stack_output_parameter(stack_name, output_name, session=None):
     """Gets the value of the provided output from a stack
 
@@ -317,6 +391,7 @@ def determine_stack_failure_event(stack_name, session=None):
     err_msg = None
     cfn_failure_list = [
         'CREATE_FAILED',
+        'DELETE_FAILED',
         'ROLLBACK_COMPLETE',
         'ROLLBACK_FAILED',
         'UPDATE_FAILED',
@@ -339,7 +414,8 @@ def determine_stack_failure_event(stack_name, session=None):
     return err_msg
 
 
-def wait_for_stack_complete(stack_name, stack_url, cfn_action, session=None):
+def wait_for_stack_complete(stack_name, stack_url, cfn_action, session=None, fail_fast=False,
+                            cancel_on_failure=False):
     """Waits for the provided stack to finish being created
 
     Args:
@@ -347,10 +423,20 @@ def wait_for_stack_complete(stack_name, stack_url, cfn_action, session=None):
         stack_url (str): Url for the AWS CloudFormation Stack
         cfn_action (str):  "stack_update_complete" or "stack_create_complete"
         session (object, optional): boto3 session object
+        fail_fast (bool, optional): Follows the stack events and fails at the first failed resource, see
+                                    wait_for_stack_events()
+        cancel_on_failure (bool, optional): With fail_fast, cancels an update that has a failed resource
 
     Returns:
         None
     """
+    if fail_fast:
+        try:
+            wait_for_stack_events(stack_name=stack_name, session=session, cancel_on_failure=cancel_on_failure)
+            return
+
+        except Exception as e:
+            raise Exception(f'Stack Failure: {stack_url} [ERROR] {e}') from e
 
     try:
         waiter = get_stack_waiter(event=cfn_action, session=session)
@@ -362,6 +448,103 @@ def wait_for_stack_complete(stack_name, stack_url, cfn_action, session=None):
         raise Exception(f'Stack Failure: {stack_url} [ERROR] {response}') from e
 
 
+def read_new_stack_events(stack_name, last_event_id=None, session=None):
+    """Reads the stack events that happened after last_event_id, only the pages needed to reach it
+
+    Args:
+        stack_name (str): Name or id of the stack
+        last_event_id (str, optional): Last event already read, defaults to the start of the latest create or
+                                       update of the stack
+        session (object, optional): boto3 session object
+
+    Returns:
+        list: Stack events, oldest first
+    """
+    client = boto3_client(service='cloudformation', session=session)
+    events = []
+    args = {'StackName': stack_name}
+    while True:
+        response = client.describe_stack_events(**args)
+        for event in response['StackEvents']:
+            if event['EventId'] == last_event_id:
+                return events[::-1]
+            events.append(event)
+            if last_event_id is None and is_stack_event(event) and event['ResourceStatus'] in STACK_START_STATUSES:
+                return events[::-1]
+
+        if not response.get('NextToken'):
+            return events[::-1]
+        args['NextToken'] = response['NextToken']
+
+
+def is_stack_event(event):
+    """True for the events of the stack itself, not of one of its resources (nested stacks included)"""
+    return event['ResourceType'] == 'AWS::CloudFormation::Stack' and event.get('PhysicalResourceId') == event['StackId']
+
+
+def wait_for_stack_events(stack_name, session=None, cancel_on_failure=False, poll_seconds=STACK_POLL_SECONDS,
+                          timeout=STACK_WAIT_TIMEOUT):
+    """Waits for the latest create or update of a stack by reading its new events every poll
+
+    The first failed resource raises straight away with its reason, the rollback carries on in the background and
+    a later request waits for it to settle before applying its template (see create_update_stack).
+
+    Args:
+        stack_name (str): Name of the stack to wait on
+        session (object, optional): boto3 session object
+        cancel_on_failure (bool, optional): Cancels an update in progress once a resource failed
+        poll_seconds (int, optional): Seconds between two reads
+        timeout (int, optional): Seconds to wait
+
+    Returns:
+        str: Final StackStatus, raises an Exception with the root cause of a failure
+    """
+    last_event_id = None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for event in read_new_stack_events(stack_name=stack_name, last_event_id=last_event_id, session=session):
+            last_event_id = event['EventId']
+            status = event['ResourceStatus']
+            reason = event.get('ResourceStatusReason')
+            if is_stack_event(event):
+                if status in STACK_SUCCESS_STATUSES:
+                    return status
+                if status in STACK_FAILURE_STATUSES:
+                    raise Exception(f"{stack_name} {status} - {reason}")
+
+            elif status in RESOURCE_FAILURE_STATUSES and reason not in CANCELLED_REASONS:
+                LOGGER.error(f"Stack:{stack_name} - Error:{reason} LogicalResourceId:{event['LogicalResourceId']}")
+                if cancel_on_failure:
+                    cancel_update_stack(stack_name=stack_name, session=session)
+                raise Exception(f"{event['LogicalResourceId']} - {reason}")
+
+        time.sleep(poll_seconds)
+
+    raise Exception(f"Timed out waiting for {stack_name}")
+
+
+def cancel_update_stack(stack_name, session=None):
+    """Cancels the update of a stack, ignored when it isn't updating (ie: a create or an update already
+    rolling back)
+
+    http://boto3.readthedocs.io/en/latest/reference/services/cloudformation.html#CloudFormation.Client.cancel_update_stack
+
+    Args:
+        stack_name (str): Name of the stack
+        session (object, optional): boto3 session object
+
+    Returns:
+        None
+    """
+    client = boto3_client(service='cloudformation', session=session)
+    try:
+        LOGGER.info(f"Cancelling update of {stack_name}")
+        client.cancel_update_stack(StackName=stack_name)
+
+    except ex.ClientError as e:
+        LOGGER.warning(f"Unable to cancel update of {stack_name}: {e}")
+
+
 def wait_for_stack_delete_complete(stack_name, session=None):
     """Waits for the provided stack to finish being deleted
 
@@ -492,7 +675,7 @@ def create_stack(**kwargs):
     return response
 
 
-def delete_stack(stack_name:str, session=None):
+def delete_stack(stack_name:str, session=None, retain_resources:list=None):
     """Deletes the provided stack name
 
     http://boto3.readthedocs.io/en/latest/reference/services/cloudformation.html#CloudFormation.Client.delete_stack
@@ -500,14 +683,16 @@ def delete_stack(stack_name:str, session=None):
     Args:
         stack_name (str): Name of the stack to delete
         session (object, optional): boto3 session object
+        retain_resources (list, optional): Logical ids of the resources to keep, only for a DELETE_FAILED stack
 
     Returns:
         dict: Standard AWS dictionary with stack deletion results
     """
     client = boto3_client(service='cloudformation', session=session)
-    response = client.delete_stack(
-        StackName=stack_name
-    )
+    args = {'StackName': stack_name}
+    if retain_resources:
+        args['RetainResources'] = retain_resources
+    response = client.delete_stack(**args)
     return response
 
 
@@ -572,6 +757,30 @@ def get_stack_waiter(event, session=None):
     return waiter
 
 
+def list_stack_summaries(session=None, status_filter=None):
+    """Yields the summary of every CloudFormation stack in the account, page by page
+
+    http://boto3.readthedocs.io/en/latest/reference/services/cloudformation.html#CloudFormation.Client.list_stacks
+
+    Args:
+        session (object, optional): boto3 session object
+        status_filter (list, optional): Stack statuses, defaults to every status but DELETE_COMPLETE
+
+    Yields:
+        dict: StackSummary (StackName, StackId, StackStatus, CreationTime, LastUpdatedTime, TemplateDescription...)
+    """
+    client = boto3_client(service='cloudformation', session=session)
+    try:
+        paginator = client.get_paginator("list_stacks")
+        for page in paginator.paginate(StackStatusFilter=status_filter or LIVE_STACK_STATUSES):
+            yield from page['StackSummaries']
+
+    except Exception as e:
+        raise Exception(
+            f"Failed to get list of cloudformation templates: {str(e)}"
+        ) from e
+
+
 def list_stacks(session=None):
     """Gets a list of all CloudFormation stacks in the account
 
@@ -583,40 +792,30 @@ def list_stacks(session=None):
     Returns:
         list of str: List of stack names in the account
     """
-    stacks = []
+    return [x['StackName'] for x in list_stack_summaries(session=session)]
+
+
+def get_template(stack_name, session=None):
+    """Gets the template of a stack as it was submitted
+
+    http://boto3.readthedocs.io/en/latest/reference/services/cloudformation.html#CloudFormation.Client.get_template
+
+    Args:
+        stack_name (str): Name or id of the stack
+        session (object, optional): boto3 session object
+
+    Returns:
+        dict or str: TemplateBody, parsed when the template is JSON
+    """
     client = boto3_client(service='cloudformation', session=session)
     try:
-        paginator = client.get_paginator("list_stacks")
-        for page in paginator.paginate(
-                StackStatusFilter=[
-                    'CREATE_IN_PROGRESS',
-                    'CREATE_FAILED',
-                    'CREATE_COMPLETE',
-                    'ROLLBACK_IN_PROGRESS',
-                    'ROLLBACK_FAILED',
-                    'ROLLBACK_COMPLETE',
-                    'DELETE_IN_PROGRESS',
-                    'DELETE_FAILED',
-                    'UPDATE_IN_PROGRESS',
-                    'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
-                    'UPDATE_COMPLETE',
-                    'UPDATE_ROLLBACK_IN_PROGRESS',
-                    'UPDATE_ROLLBACK_FAILED',
-                    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS',
-                    'UPDATE_ROLLBACK_COMPLETE',
-                    'REVIEW_IN_PROGRESS'
-                ]
-        ):
-            for x in page['StackSummaries']:
-                stacks.append(x['StackName'])
+        return client.get_template(StackName=stack_name, TemplateStage='Original')['TemplateBody']
 
     except Exception as e:
         raise Exception(
-            f"Failed to get list of cloudformation templates: {str(e)}"
+            f"Failed to get the template of {stack_name}: {str(e)}"
         ) from e
 
-    return stacks
-
 
 def enable_termination_protection(stack_name, session=None):
     """Enables Termination Protection on CloudFormation Stacks
@@ -642,19 +841,20 @@ def enable_termination_protection(stack_name, session=None):
         raise Exception from e
 
 
-def disable_termination_protection(stack_name, session=None):
+def disable_termination_protection(stack_name, session=None, stack_info=None):
     """Disables Termination Protection on CloudFormation Stacks
 
     Args:
         stack_name (str): Passing key word arguments that will be used to create the
         session (object, optional): boto3 session object
+        stack_info (dict, optional): describe_stack response of the stack if the caller already has it
 
     Returns:
         none
     """
     try:
         client = boto3_client(service='cloudformation', session=session)
-        stack_exists = describe_stack(stack_name=stack_name, session=session)
+        stack_exists = stack_info or describe_stack(stack_name=stack_name, session=session)
         if stack_exists:
             LOGGER.info("Checking time difference between Stack Creation and now. (disable if < 20 min)")
             diff = datetime.now(timezone.utc) - stack_exists['Stacks'][0]['CreationTime']
@@ -4,6 +4,7 @@
 import os
 import logging
 import boto3
+from rate_limiter import rate_limit_session
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOGGER = logging.getLogger()
@@ -11,13 +12,15 @@ LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logging.getLogger("botocore").setLevel(logging.ERROR)
 
 
-def boto3_session(region=None, credentials=None, profile=None):
-    """Creates a boto3 session using optional profile
+def boto3_session(region=None, credentials=None, profile=None, account=None):
+    """Creates a boto3 session using optional profile. The clients of the session use the standard retry
+    mode and share the request rate of the (account, region, service) with every other client of the function.
 
     Args:
         region (str, optional): AWS Region to create a boto3 session in
         credentials (str, optional): Name of the credential to use
         profile (str, optional): Name of the profile to use
+        account (str, optional): Account the credentials belong to, keys the shared rate limit
 
     Returns:
         :obj:`boto3.session`: Returns a boto3 session object
@@ -39,7 +42,7 @@ def boto3_session(region=None, credentials=None, profile=None):
                 args['aws_session_token'] = credentials['sessionToken']
 
         session = boto3.Session(**args)
-        return session
+        return rate_limit_session(session, account=account)
 
     except BaseException as e:
         raise Exception(
@@ -0,0 +1,208 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from cfn_helper import MANAGED_DESCRIPTION
+from targets import build_targets, SessionPool
+from state_store import get_state_store
+from tracing import get_tracer, trace_handler
+from profiler import profile_handler
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+NAMESPACE = 'stack-drift'
+# Bounds the detect_stack_drift / describe calls in flight across every target
+DRIFT_WORKERS = 16
+DRIFT_POLL_SECONDS = 5
+# Scans of a target within this window are answered from the state store
+DRIFT_CACHE_SECONDS = 3600
+# Time kept to return the report once the detections are waited on
+RESPONSE_MARGIN_SECONDS = 30
+# Drift detection isn't supported while the stack is being changed
+DETECTABLE_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE', 'UPDATE_ROLLBACK_COMPLETE', 'UPDATE_ROLLBACK_FAILED',
+                       'IMPORT_COMPLETE', 'IMPORT_ROLLBACK_COMPLETE']
+DRIFTED_RESOURCE_STATUSES = ['MODIFIED', 'DELETED']
+DETECTION_IN_PROGRESS = 'DETECTION_IN_PROGRESS'
+CACHED_STATUSES = {'IN_SYNC', 'DRIFTED', 'NOT_CHECKED'}
+
+# Credentials and clients are reused by the invocations of a warm container
+SESSION_POOL = SessionPool()
+
+
+def _target_key(target) -> str:
+    return f"{target.account}/{target.region}"
+
+
+def managed_stacks(client, prefix: str = None) -> list:
+    """Names of the stacks deployed by CTE_CrossAccountCloudFormation drift detection can run on
+
+    Args:
+        client (boto3.client): CloudFormation client of the target
+        prefix (str, optional): Only the stacks whose name starts with it
+
+    Returns:
+        list: Stack names
+    """
+    names = []
+    paginator = client.get_paginator('list_stacks')
+    for page in paginator.paginate(StackStatusFilter=DETECTABLE_STATUSES):
+        for summary in page['StackSummaries']:
+            if not summary.get('TemplateDescription', '').endswith(MANAGED_DESCRIPTION):
+                continue
+            if prefix and not summary['StackName'].startswith(prefix):
+                continue
+            names.append(summary['StackName'])
+    return names
+
+
+def drifted_resources(client, stack_name: str) -> list:
+    """Resources of a drifted stack that were modified or deleted outside of CloudFormation"""
+    drifts = []
+    paginator = client.get_paginator('describe_stack_resource_drifts')
+    for page in paginator.paginate(StackName=stack_name, StackResourceDriftStatusFilters=DRIFTED_RESOURCE_STATUSES):
+        for drift in page['StackResourceDrifts']:
+            drifts.append({'LogicalResourceId': drift['LogicalResourceId'], 'ResourceType': drift['ResourceType'],
+                           'Status': drift['StackResourceDriftStatus']})
+    return drifts
+
+
+def scan_drift(targets: list, pool: SessionPool = SESSION_POOL, prefix: str = None, timeout: float = 600,
+               poll_seconds: float = DRIFT_POLL_SECONDS, max_age: float = DRIFT_CACHE_SECONDS,
+               store=None) -> dict:
+    """Detects the drift of every managed stack of the targets at once
+
+    - targets scanned within max_age seconds are read from the state store, without any API call
+    - the managed stacks of the other targets are listed in parallel
+    - detect_stack_drift is started on all of them, DRIFT_WORKERS calls at a time
+    - the pending detections are polled together, one round every poll_seconds
+    - the modified / deleted resources of the drifted stacks are listed
+
+    Args:
+        targets (list): Target matrix
+        pool (SessionPool, optional): Clients of the target roles
+        prefix (str, optional): Only the stacks whose name starts with it
+        timeout (float, optional): Seconds to wait for the detections
+        poll_seconds (float, optional): Seconds between two polling rounds
+        max_age (float, optional): Seconds a target scan is reused, 0 always scans again
+        store (StateStore, optional): Defaults to the 'stack-drift' namespace of the state store
+
+    Returns:
+        dict: {'Stacks': [{Account, Region, StackName, DriftStatus, DriftedResources}], 'Errors': [str],
+               'Cached': int}
+    """
+    store = store or get_state_store(NAMESPACE)
+    now = time.time()
+    report = {'Stacks': [], 'Errors': [], 'Cached': 0}
+    pending_targets = []
+    for target in targets:
+        cached = store.get(_target_key(target)) if max_age else None
+        if cached and now - cached['ScannedAt'] <= max_age:
+            report['Stacks'].extend(cached['Stacks'])
+            report['Cached'] += 1
+        else:
+            pending_targets.append(target)
+    if not pending_targets:
+        return report
+
+    def _list(target):
+        try:
+            client = pool.client(target, 'cloudformation')
+            return target, [{'Account': target.account, 'Region': target.region, 'StackName': x}
+                            for x in managed_stacks(client=client, prefix=prefix)]
+        except Exception as e:
+            report['Errors'].append(f"{target.account}/{target.region}: Unable to list the stacks: {e}")
+            return target, None
+
+    def _detect(item):
+        target, stack = item
+        try:
+            response = pool.client(target, 'cloudformation').detect_stack_drift(StackName=stack['StackName'])
+            stack['DetectionId'] = response['StackDriftDetectionId']
+        except Exception as e:
+            stack['DriftStatus'] = 'UNKNOWN'
+            stack['Reason'] = str(e)
+
+    def _poll(item):
+        target, stack = item
+        try:
+            client = pool.client(target, 'cloudformation')
+            status = client.describe_stack_drift_detection_status(StackDriftDetectionId=stack['DetectionId'])
+            if status['DetectionStatus'] == 'DETECTION_IN_PROGRESS':
+                return False
+            stack['DriftStatus'] = status.get('StackDriftStatus', 'UNKNOWN')
+            if status['DetectionStatus'] == 'DETECTION_FAILED':
+                stack['Reason'] = status.get('DetectionStatusReason')
+            if stack['DriftStatus'] == 'DRIFTED':
+                stack['DriftedResources'] = drifted_resources(client=client, stack_name=stack['StackName'])
+
+        except Exception as e:
+            stack['DriftStatus'] = 'UNKNOWN'
+            stack['Reason'] = str(e)
+        return True
+
+    with get_tracer().start_span('drift_scan', attributes={'cte.targets': len(pending_targets)}), \
+            ThreadPoolExecutor(max_workers=DRIFT_WORKERS) as executor:
+        listed = [x for x in executor.map(_list, pending_targets) if x[1] is not None]
+        items = [(target, stack) for target, stacks in listed for stack in stacks]
+        list(executor.map(_detect, items))
+
+        pending = [x for x in items if 'DetectionId' in x[1]]
+        deadline = time.monotonic() + timeout
+        while pending:
+            done = list(executor.map(_poll, pending))
+            pending = [x for x, finished in zip(pending, done) if not finished]
+            if not pending or time.monotonic() + poll_seconds > deadline:
+                break
+            time.sleep(poll_seconds)
+
+    for _, stack in pending:
+        stack['DriftStatus'] = DETECTION_IN_PROGRESS
+    for target, stacks in listed:
+        for stack in stacks:
+            stack.pop('DetectionId', None)
+        # A target with an unfinished or failed detection is scanned again next time
+        if all(x['DriftStatus'] in CACHED_STATUSES for x in stacks):
+            store.put(_target_key(target), {'ScannedAt': now, 'Stacks': stacks}, ttl=int(max_age) or None)
+        report['Stacks'].extend(stacks)
+    return report
+
+
+@trace_handler('CTE_StackDriftScanFn')
+@profile_handler('CTE_StackDriftScanFn')
+def lambda_handler(event, context):
+    """Reports the drift of the stacks CTE_CrossAccountCloudFormation deployed to the accounts and regions of the
+    event
+
+    Args:
+        event (dict): Accounts / RoleArn, RoleName and Regions like the Custom Resource Configuration, optional
+            StackNamePrefix and MaxAgeSeconds (0 to ignore the previous scans)
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: Drift report, only the drifted and failed stacks are listed
+    """
+    print(json.dumps(event))
+    targets = build_targets(config=event, default_region=os.getenv('AWS_REGION', 'us-east-1'))
+    timeout = context.get_remaining_time_in_millis() / 1000 - RESPONSE_MARGIN_SECONDS
+    report = scan_drift(targets=targets, prefix=event.get('StackNamePrefix'), timeout=timeout,
+                        max_age=float(event.get('MaxAgeSeconds', DRIFT_CACHE_SECONDS)))
+
+    counts = {}
+    for stack in report['Stacks']:
+        counts[stack['DriftStatus']] = counts.get(stack['DriftStatus'], 0) + 1
+    summary = {
+        'Scanned': len(report['Stacks']),
+        'Counts': counts,
+        'CachedTargets': report['Cached'],
+        'Stacks': [x for x in report['Stacks'] if x['DriftStatus'] != 'IN_SYNC'],
+        'Errors': report['Errors']
+    }
+    LOGGER.info(json.dumps(summary))
+    return summary
@@ -0,0 +1,198 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cfn_helper import list_stack_summaries, get_template, MANAGED_DESCRIPTION, STACK_SUCCESS_STATUSES
+from targets import build_targets, SessionPool
+from state_store import get_state_store
+from tracing import get_tracer, trace_handler
+from profiler import profile_handler
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+NAMESPACE = 'stack-inventory'
+# Targets read at once, the assume role / list_stacks / get_template calls are mostly waiting on the network
+INVENTORY_WORKERS = 32
+# A target read within this window is reused unless it is listed as changed
+INVENTORY_MAX_AGE = 3600
+
+# Credentials and clients are reused by the invocations of a warm container
+SESSION_POOL = SessionPool()
+
+
+def _target_key(account: str, region: str) -> str:
+    return f"{account}/{region}"
+
+
+def _timestamp(value) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def template_fingerprint(template) -> str:
+    """sha256 of the template, a JSON template is hashed in its canonical form"""
+    body = template if isinstance(template, str) else json.dumps(template, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def managed_summaries(summaries):
+    """Keeps the stacks deployed by CTE_CrossAccountCloudFormation"""
+    for summary in summaries:
+        if summary.get('TemplateDescription', '').endswith(MANAGED_DESCRIPTION):
+            yield summary
+
+
+def stack_entries(summaries, previous: dict, session=None):
+    """Index entries of the stacks, the template of a stack is only read again when the stack changed
+
+    Args:
+        summaries (iterable): StackSummary of the stacks
+        previous (dict): Entries of the previous read of the target, by stack name
+        session (object, optional): boto3 session of the target
+
+    Yields:
+        tuple: (stack name, {StackId, Status, LastUpdated, Fingerprint})
+    """
+    for summary in summaries:
+        last_updated = _timestamp(summary.get('LastUpdatedTime') or summary['CreationTime'])
+        known = previous.get(summary['StackName'])
+        if known and known['StackId'] == summary['StackId'] and known['LastUpdated'] == last_updated:
+            fingerprint = known['Fingerprint']
+        else:
+            fingerprint = template_fingerprint(get_template(stack_name=summary['StackId'], session=session))
+        yield summary['StackName'], {'StackId': summary['StackId'], 'Status': summary['StackStatus'],
+                                     'LastUpdated': last_updated, 'Fingerprint': fingerprint}
+
+
+def stack_health(status: str) -> str:
+    if status in STACK_SUCCESS_STATUSES:
+        return 'HEALTHY'
+    if status.endswith('_IN_PROGRESS'):
+        return 'IN_PROGRESS'
+    return 'UNHEALTHY'
+
+
+class StackInventory():
+    """Index of the managed stacks of every target: status, last update and template fingerprint, kept in the
+    'stack-inventory' namespace of the state store per (account, region)
+
+    Args:
+        store (StateStore, optional): Defaults to the 'stack-inventory' namespace of the state store
+        pool (SessionPool, optional): Sessions of the target roles
+        workers (int, optional): Targets read at once
+    """
+
+    def __init__(self, store=None, pool: SessionPool = SESSION_POOL, workers: int = INVENTORY_WORKERS):
+        self.store = store or get_state_store(NAMESPACE)
+        self.pool = pool
+        self.workers = workers
+
+    def target(self, account: str, region: str) -> dict:
+        """{'RefreshedAt': float, 'Stacks': {stack name: entry}} of the target, None when it was never read"""
+        return self.store.get(_target_key(account, region))
+
+    def read_target(self, target, previous: dict) -> dict:
+        """Stacks of one target, list_stack_summaries -> managed_summaries -> stack_entries"""
+        session = self.pool.session(target)
+        summaries = managed_summaries(list_stack_summaries(session=session))
+        return dict(stack_entries(summaries=summaries, previous=previous, session=session))
+
+    def walk(self, targets: list, previous: dict):
+        """Reads the targets concurrently
+
+        Yields:
+            tuple: (target, stacks or None, error or None) as soon as a target was read
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for target in targets:
+                known = previous.get(_target_key(target.account, target.region)) or {}
+                futures[executor.submit(self.read_target, target, known.get('Stacks', {}))] = target
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+
+    def refresh(self, targets: list, changed: list = None, max_age: float = INVENTORY_MAX_AGE) -> dict:
+        """Re-reads the targets that changed, a target is read again when
+
+        - it is in changed, ie: a deployment just ran there
+        - it was never read or was read more than max_age seconds ago (0 reads every target)
+
+        Args:
+            targets (list): Target matrix
+            changed (list, optional): (account, region) of the targets known to have changed
+            max_age (float, optional): Seconds a read of a target is reused
+
+        Returns:
+            dict: {'Refreshed': int, 'Reused': int, 'Errors': [str]}
+        """
+        now = time.time()
+        changed = {_target_key(str(account), region) for account, region in changed or []}
+        previous = {}
+        stale = []
+        for target in targets:
+            key = _target_key(target.account, target.region)
+            previous[key] = self.store.get(key)
+            if key in changed or not previous[key] or now - previous[key]['RefreshedAt'] > max_age:
+                stale.append(target)
+
+        report = {'Refreshed': 0, 'Reused': len(targets) - len(stale), 'Errors': []}
+        with get_tracer().start_span('inventory_refresh', attributes={'cte.targets': len(stale)}):
+            for target, stacks, error in self.walk(targets=stale, previous=previous):
+                if error is not None:
+                    report['Errors'].append(f"{target.account}/{target.region}: {error}")
+                    continue
+                self.store.put(_target_key(target.account, target.region), {'RefreshedAt': now, 'Stacks': stacks})
+                report['Refreshed'] += 1
+        return report
+
+    def stacks(self, targets: list):
+        """Yields the indexed stacks of the targets as {Account, Region, StackName, StackId, Status, LastUpdated,
+        Fingerprint}"""
+        for target in targets:
+            indexed = self.target(target.account, target.region) or {'Stacks': {}}
+            for name, entry in indexed['Stacks'].items():
+                yield dict(entry, Account=target.account, Region=target.region, StackName=name)
+
+
+@trace_handler('CTE_StackInventoryFn')
+@profile_handler('CTE_StackInventoryFn')
+def lambda_handler(event, context):
+    """Refreshes the inventory of the stacks CTE_CrossAccountCloudFormation deployed to the accounts and regions of
+    the event
+
+    Args:
+        event (dict): Accounts / RoleArn, RoleName and Regions like the Custom Resource Configuration, optional
+            Changed ([{Account, Region}] to read again) and MaxAgeSeconds
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: Inventory summary, only the stacks that aren't healthy are listed
+    """
+    print(json.dumps(event))
+    targets = build_targets(config=event, default_region=os.getenv('AWS_REGION', 'us-east-1'))
+    inventory = StackInventory()
+    report = inventory.refresh(targets=targets, changed=[(x['Account'], x['Region']) for x in event.get('Changed', [])],
+                               max_age=float(event.get('MaxAgeSeconds', INVENTORY_MAX_AGE)))
+
+    counts = {}
+    unhealthy = []
+    total = 0
+    for stack in inventory.stacks(targets):
+        total += 1
+        counts[stack['Status']] = counts.get(stack['Status'], 0) + 1
+        if stack_health(stack['Status']) == 'UNHEALTHY':
+            unhealthy.append({x: stack[x] for x in ('Account', 'Region', 'StackName', 'Status', 'LastUpdated')})
+
+    summary = dict(report, Targets=len(targets), Stacks=total, Counts=counts, Unhealthy=unhealthy)
+    LOGGER.info(json.dumps(summary))
+    return summary
@@ -5,29 +5,41 @@ import os
 import ast
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
 import cfnresponse
-from sts_helper import assume_role_arn
-from cfn_helper import create_update_stack, describe_stack, delete_stack, enable_termination_protection, \
-    disable_termination_protection
+from cfn_helper import create_update_stack, describe_stack, enable_termination_protection, MANAGED_DESCRIPTION
 from client_session_helper import boto3_session
+from targets import build_targets, target_stack_name, output_key, SessionPool, CredentialCache
+from stack_graph import build_graph, reverse_graph, run_graph, resolve_references
+from stack_set import pinned_backend, stack_set_name, deploy_stack_set, stack_set_outputs, delete_stack_set, \
+    BACKEND_STACK_SET
+from tracing import get_tracer, trace_handler, instrument
+from profiler import profile_handler
+from stack_outputs import get_output_index
+from teardown import delete_stacks, DELETE_WORKERS
+from preflight import preflight
+from idempotency import idempotent_handler, client_request_token
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOGGER = logging.getLogger()
 LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logging.getLogger("botocore").setLevel(logging.ERROR)
 
+# Time kept to send the cfnresponse once the deletions are waited on
+RESPONSE_MARGIN_SECONDS = 30
 
+
+@trace_handler('CTE_CrossAccountCloudFormation')
+@profile_handler('CTE_CrossAccountCloudFormation')
+@idempotent_handler()
 def lambda_handler(event, context):
     print(json.dumps(event))
     response_data = {}
-    response = None
     description = ''
     config = event['ResourceProperties']['Parameters']['Configuration']
     base_stack_name = config['StackName']
-    resources = config['Resources']
+    resources = config.get('Resources', {})
     outputs = {}
-    regions = []
-    count = 1
 
     # This will replace to all for local supported functions to ensure they will run as expected
     resources = ast.literal_eval(json.dumps(resources).replace("&Ref", "Ref").replace("&Fn", "Fn"))
@@ -36,14 +48,6 @@ def lambda_handler(event, context):
     # Get tags from Cfn Configuration
     tags = config.get('Tags')
 
-    # If regions are specified within the Cfn Configuration use that list, if non are provided use
-    #  the region that executed the cfn stack
-    if config.get('Regions'):
-        regions = config['Regions']
-
-    else:
-        regions.append(event['ResponseURL'].split("%3A")[3])
-
     if config.get('Description'):
         description = config['Description'] + ' '
 
@@ -57,20 +61,22 @@ def lambda_handler(event, context):
         LOGGER.warning(e)
         LOGGER.warning(f"No Outputs found from template {config['StackName']}")
 
-    # Get the number of regions it will deploy to allow for proper Cfn Outputs
-    num_of_regions = len(regions)
-
-    for region in regions:
-        LOGGER.info(f"Running in Region:{region}")
-        config['StackName'] = base_stack_name.replace('%_REGION_%', region)
-        _resources = json.loads(json.dumps(resources).replace("%_REGION_%", region))
+    # Every (account, region) the stack is deployed to
+    default_region = event['ResponseURL'].split("%3A")[3]
+    targets = build_targets(config=config, default_region=default_region)
+    credentials = CredentialCache()
+    if config.get('Stacks'):
+        config['Stacks'] = ast.literal_eval(json.dumps(config['Stacks']).replace("&Ref", "Ref").replace("&Fn", "Fn"))
 
+    # Opt-in, nothing is deployed unless every template, role and region of the request passed the checks
+    if event['RequestType'] != "Delete" and str(config.get('Preflight', 'false')).lower() == 'true':
         try:
-            credentials = assume_role_arn(role_arn=config['RoleArn'])
-            session = boto3_session(region=region, credentials=credentials)
+            with get_tracer().start_span('preflight', attributes={'cte.targets': len(targets)}):
+                preflight(templates=stack_templates(config=config, resources=resources, outputs=outputs),
+                          targets=targets, credentials=credentials, region=default_region)
 
         except Exception as e:
-            LOGGER.error(f"Assume Role Error:{e}", exc_info=True)
+            LOGGER.error(f"Preflight Error:{e}", exc_info=True)
             response_data['ERROR'] = str(e)
             cfnresponse.send(
                 event=event,
@@ -80,94 +86,427 @@ def lambda_handler(event, context):
             )
             return
 
+    if config.get('Stacks'):
+        return stacks_handler(event=event, context=context, config=config, targets=targets, credentials=credentials)
+
+    try:
+        backend = pinned_backend(event=event, config=config, resources=resources, targets=targets,
+                                 default_region=default_region)
+
+    except Exception as e:
+        LOGGER.error(f"Backend Error:{e}", exc_info=True)
+        response_data['ERROR'] = str(e)
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.FAILED,
+            responseData=response_data
+        )
+        return
+
+    if backend == BACKEND_STACK_SET:
+        return stack_set_handler(event=event, context=context, config=config, resources=resources, outputs=outputs,
+                                 targets=targets, description=description)
+
+    if event['RequestType'] == "Delete":
+        return delete_handler(event=event, context=context, config=config, targets=targets,
+                              base_stack_name=base_stack_name)
+
+    # Every target is deployed, the outputs and the failures of all of them go in one response
+    errors = []
+    for target in targets:
+        try:
+            deploy_target(event=event, config=config, target=target, targets=targets,
+                          base_stack_name=base_stack_name, resources=resources, outputs=outputs,
+                          description=description, tags=tags, credentials=credentials, response_data=response_data)
+
+        except Exception as e:
+            LOGGER.error(f"Main Function Error ({target.account}/{target.region}):{e}", exc_info=True)
+            errors.append(f"{target.account}/{target.region}: {e}")
+
+    if errors:
+        response_data['ERROR'] = '; '.join(errors)
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.FAILED,
+            responseData=response_data
+        )
+        return
+
+    LOGGER.debug(f"response_data:{response_data}")
+    cfnresponse.send(
+        event=event,
+        context=context,
+        responseStatus=cfnresponse.SUCCESS,
+        responseData=response_data
+    )
+
+
+def deploy_target(event, config, target, targets, base_stack_name, resources, outputs, description, tags,
+                  credentials, response_data):
+    """Creates / updates the stack of one target and adds its outputs to response_data
+
+    Returns:
+        str: create_update_stack() response, None if the stack didn't change
+    """
+    region = target.region
+    LOGGER.info(f"Running in Account:{target.account} Region:{region}")
+    stack_name = target_stack_name(stack_name=base_stack_name, target=target)
+    _resources = json.loads(json.dumps(resources).replace("%_REGION_%", region))
+
+    try:
+        with get_tracer().start_span('assume_role', attributes={'aws.role_arn': target.role_arn,
+                                                                'aws.region': region}):
+            target_credentials = credentials.get(target.role_arn)
+        # Every call made in the target account becomes a span of this trace
+        session = instrument(boto3_session(region=region, credentials=target_credentials, account=target.account))
+
+    except Exception as e:
+        LOGGER.error(f"Assume Role Error:{e}", exc_info=True)
+        raise
+
+    LOGGER.debug(f"Deployed Resources:{_resources}")
+    template = {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"{description}{MANAGED_DESCRIPTION}",
+        "Resources": _resources,
+        "Outputs": outputs
+    }
+
+    response = create_update_stack(
+        stack_name=stack_name,
+        template=template,
+        cfn_params=None,
+        capability=config['Capabilities'],
+        waiter=True,
+        tags=tags,
+        session=session,
+        client_request_token=client_request_token(event, target.account, region, stack_name),
+        **wait_options(config)
+    )
+
+    if response:
+        response_data['Data'] = response
+        try:
+            stack_info = describe_stack(stack_name=stack_name, session=session)
+            if stack_info["Stacks"][0].get("Outputs"):
+                for output in stack_info["Stacks"][0]["Outputs"]:
+                    key = output_key(key=output["OutputKey"], target=target, targets=targets)
+                    response_data[key] = output["OutputValue"]
+            else:
+                LOGGER.info('Not Stack Outputs Found')
+            publish_outputs(config=config, target=target, stack_name=stack_name,
+                            outputs={x["OutputKey"]: x["OutputValue"]
+                                     for x in stack_info["Stacks"][0].get("Outputs", [])})
+
+        except Exception as e:
+            LOGGER.error(f"Error getting Stack Details:{e}", exc_info=True)
+            raise
+
+    if config.get('TerminationProtection') and (config['TerminationProtection'].lower() == 'true'):
+        enable_termination_protection(stack_name=stack_name, session=session)
+
+    return response
+
+
+def node_template(node, resources=None) -> dict:
+    """Template of a stack of Configuration.Stacks"""
+    return {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"{node.description + ' ' if node.description else ''}{MANAGED_DESCRIPTION}",
+        "Resources": node.resources if resources is None else resources,
+        "Outputs": node.outputs
+    }
+
+
+def stack_templates(config, resources, outputs) -> list:
+    """Templates of the request as they are deployed, before the per target placeholders are replaced
+
+    Args:
+        config (dict): Custom Resource Configuration
+        resources (dict): Template Resources
+        outputs (dict): Template Outputs
+
+    Returns:
+        list: (stack name, template, capabilities) of every stack
+    """
+    if config.get('Stacks'):
+        return [(x.stack_name, node_template(node=x), x.capabilities) for x in build_graph(config).values()]
+
+    description = config['Description'] + ' ' if config.get('Description') else ''
+    template = {
+        "AWSTemplateFormatVersion": "2010-09-09",
+        "Description": f"{description}{MANAGED_DESCRIPTION}",
+        "Resources": resources,
+        "Outputs": outputs
+    }
+    return [(config['StackName'], template, config.get('Capabilities'))]
+
+
+def wait_options(config) -> dict:
+    """create_update_stack() waiter options: FailFast (default true) stops waiting at the first failed resource,
+    CancelOnFailure (default false) also cancels the update"""
+    return {
+        'fail_fast': str(config.get('FailFast', 'true')).lower() == 'true',
+        'cancel_on_failure': str(config.get('CancelOnFailure', 'false')).lower() == 'true'
+    }
+
+
+def remaining_seconds(context) -> float:
+    """Seconds left to wait on CloudFormation before the function has to respond"""
+    return context.get_remaining_time_in_millis() / 1000 - RESPONSE_MARGIN_SECONDS
+
+
+def delete_handler(event, context, config, targets, base_stack_name):
+    """Deletes the stack of every target at once and waits for all the deletions, then sends one response with
+    the status of every stack (or all the failures)
+
+    Args:
+        event (dict): Custom Resource event
+        context (object): Lambda Function context information
+        config (dict): Custom Resource Configuration
+        targets (list): Target matrix
+        base_stack_name (str): StackName with its placeholders
+
+    Returns:
+        N/A
+    """
+    response_data = {}
+    credentials = CredentialCache()
+    parent = get_tracer().current_span()
+
+    def _stack(target):
+        with get_tracer().start_span('assume_role', parent=parent, attributes={'aws.role_arn': target.role_arn,
+                                                                               'aws.region': target.region}):
+            session = boto3_session(region=target.region, credentials=credentials.get(target.role_arn),
+                                    account=target.account)
+        return {'Name': target_stack_name(stack_name=base_stack_name, target=target), 'Target': target,
+                'Session': instrument(session)}
+
+    try:
+        if config.get("OnFailure", "DELETE") == "DELETE":
+            with ThreadPoolExecutor(max_workers=min(DELETE_WORKERS, len(targets))) as pool:
+                stack_list = list(pool.map(_stack, targets))
+            delete_stacks(stack_list, timeout=remaining_seconds(context))
+
+            for stack in stack_list:
+                unpublish_outputs(config=config, target=stack['Target'], stack_name=stack['Name'])
+            response_data['Data'] = {'Stacks': [
+                {'Account': x['Target'].account, 'Region': x['Target'].region, 'StackName': x['Name'],
+                 'Status': x['Status']} for x in stack_list
+            ]}
+
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.SUCCESS,
+            responseData=response_data
+        )
+
+    except Exception as e:
+        LOGGER.error(f"Deleting Stack Error:{e}", exc_info=True)
+        response_data['ERROR'] = str(e)
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.FAILED,
+            responseData=response_data
+        )
+
+
+def publish_outputs(config, target, stack_name, outputs):
+    """Writes the outputs of a deployed stack to the output index when Configuration.PublishOutputs is true, so
+    they can be read from the function account without assuming a role in the target account. A failed
+    publication doesn't fail the deployment.
+
+    Args:
+        config (dict): Custom Resource Configuration
+        target (Target): Account and region of the stack
+        stack_name (str): Name of the stack (StackSet name for the StackSet backend)
+        outputs (dict): {OutputKey: OutputValue}
+
+    Returns:
+        N/A
+    """
+    if str(config.get('PublishOutputs', '')).lower() != 'true':
+        return
+    try:
+        get_output_index().publish(account=target.account, region=target.region, stack_name=stack_name,
+                                   outputs=outputs)
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to publish the outputs of {stack_name}: {e}")
+
+
+def unpublish_outputs(config, target, stack_name):
+    """Removes the outputs of a deleted stack from the output index, see publish_outputs()"""
+    if str(config.get('PublishOutputs', '')).lower() != 'true':
+        return
+    try:
+        get_output_index().unpublish(account=target.account, region=target.region, stack_name=stack_name)
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to remove the outputs of {stack_name}: {e}")
+
+
+def stack_set_handler(event, context, config, resources, outputs, targets, description):
+    """Deploys the Configuration to its targets as the stack instances of one StackSet, administered from the
+    function account. The response carries the stack outputs with the same keys as the Stacks backend.
+
+    Args:
+        event (dict): Custom Resource event
+        context (object): Lambda Function context information
+        config (dict): Custom Resource Configuration
+        resources (dict): Template Resources
+        outputs (dict): Template Outputs
+        targets (list): Target matrix
+        description (str): Template description prefix
+
+    Returns:
+        N/A
+    """
+    response_data = {}
+    name = stack_set_name(config)
+    LOGGER.info(f"Deploying StackSet {name} to {len(targets)} targets")
+    client = instrument(boto3_session(region=event['ResponseURL'].split("%3A")[3])).client('cloudformation')
+
+    try:
         if event['RequestType'] == "Delete":
-            try:
-                if config.get("OnFailure", "DELETE") == "DELETE":
-                    disable_termination_protection(stack_name=config['StackName'], session=session)
-                    response = delete_stack(stack_name=config['StackName'], session=session)
-
-                    if response:
-                        response_data['Data'] = response
-
-                cfnresponse.send(
-                    event=event,
-                    context=context,
-                    responseStatus=cfnresponse.SUCCESS,
-                    responseData=response_data
-                )
-                return
-
-            except Exception as e:
-                LOGGER.error(f"Deleting Stack Error:{e}", exc_info=True)
-                response_data['ERROR'] = str(e)
-                cfnresponse.send(
-                    event=event,
-                    context=context,
-                    responseStatus=cfnresponse.FAILED,
-                    responseData=response_data
-                )
-                return
+            if config.get("OnFailure", "DELETE") == "DELETE":
+                response_data['Data'] = {
+                    'StackSetName': name,
+                    'Operations': delete_stack_set(name=name, targets=targets, config=config, client=client,
+                                                   timeout=remaining_seconds(context))
+                }
+                for target in targets:
+                    unpublish_outputs(config=config, target=target, stack_name=name)
 
         else:
-            try:
-                LOGGER.debug(f"Deployed Resources:{_resources}")
-                template = {
-                    "AWSTemplateFormatVersion": "2010-09-09",
-                    "Description": f"{description}(Lambda:CrossAccountCloudFormation)",
-                    "Resources": _resources,
-                    "Outputs": outputs
-                }
+            template = {
+                "AWSTemplateFormatVersion": "2010-09-09",
+                "Description": f"{description}{MANAGED_DESCRIPTION}",
+                "Resources": resources,
+                "Outputs": outputs
+            }
+            operations = deploy_stack_set(
+                name=name,
+                template=template,
+                targets=targets,
+                config=config,
+                client=client,
+                administrator_account=context.invoked_function_arn.split(':')[4],
+                tags=config.get('Tags'),
+                description=config.get('Description'),
+                timeout=remaining_seconds(context)
+            )
+            response_data['Data'] = {'StackSetName': name, 'Operations': operations}
+            for target, stack_outputs in stack_set_outputs(name=name, targets=targets, client=client,
+                                                           sessions=SessionPool()).items():
+                for key, value in stack_outputs.items():
+                    response_data[output_key(key=key, target=target, targets=targets)] = value
+                publish_outputs(config=config, target=target, stack_name=name, outputs=stack_outputs)
+
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.SUCCESS,
+            responseData=response_data
+        )
 
-                response = create_update_stack(
-                    stack_name=config['StackName'],
-                    template=template,
-                    cfn_params=None,
-                    capability=config['Capabilities'],
-                    waiter=True,
-                    tags=tags,
-                    session=session
-                )
-
-                if response:
-                    response_data['Data'] = response
-                    try:
-                        stack_info = describe_stack(stack_name=config['StackName'], session=session)
-                        if stack_info["Stacks"][0].get("Outputs"):
-                            for output in stack_info["Stacks"][0]["Outputs"]:
-                                if num_of_regions > 1:
-                                    response_data[output["OutputKey"] + f"_Region{count}"] = output["OutputValue"]
-                                else:
-                                    response_data[output["OutputKey"]] = output["OutputValue"]
-                        else:
-                            LOGGER.info('Not Stack Outputs Found')
-
-                    except Exception as e:
-                        LOGGER.error(f"Error getting Stack Details:{e}", exc_info=True)
-                        raise
-
-                if config.get('TerminationProtection') and (config['TerminationProtection'].lower() == 'true'):
-                    enable_termination_protection(stack_name=config['StackName'], session=session)
-
-                LOGGER.debug(f"response_data:{response_data}")
-                cfnresponse.send(
-                    event=event,
-                    context=context,
-                    responseStatus=cfnresponse.SUCCESS,
-                    responseData=response_data
-                )
-
-            except Exception as e:
-                LOGGER.error(f"Main Function Error:{e}", exc_info=True)
-                if response:
-                    response_data['ERROR'] = f"{response} - {str(e)}"
-
-                else:
-                    response_data['ERROR'] = str(e)
-
-                cfnresponse.send(
-                    event=event,
-                    context=context,
-                    responseStatus=cfnresponse.FAILED,
-                    responseData=response_data
-                )
-        count += 1
+    except Exception as e:
+        LOGGER.error(f"StackSet Error:{e}", exc_info=True)
+        response_data['ERROR'] = str(e)
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.FAILED,
+            responseData=response_data
+        )
+
+
+def stacks_handler(event, context, config, targets, credentials=None):
+    """Deploys the named stacks of Configuration.Stacks to every target, following their DependsOn edges. On
+    Delete the stacks are deleted in the reverse order. The outputs are returned as <Stack>_<OutputKey>, with the
+    per account / region suffixes of the targets.
+
+    Args:
+        event (dict): Custom Resource event
+        context (object): Lambda Function context information
+        config (dict): Custom Resource Configuration
+        targets (list): Target matrix
+        credentials (CredentialCache, optional): Credentials of the target roles
+
+    Returns:
+        N/A
+    """
+    response_data = {}
+    credentials = credentials or CredentialCache()
+    tracer = get_tracer()
+    parent = tracer.current_span()
+
+    def _session(target):
+        # One session per stack, boto3 sessions aren't thread safe
+        return instrument(boto3_session(region=target.region, credentials=credentials.get(target.role_arn),
+                                        account=target.account))
+
+    def _deploy(target, node, upstream):
+        stack_name = target_stack_name(stack_name=node.stack_name, target=target)
+        with tracer.start_span('deploy_stack', parent=parent, attributes={'aws.account': target.account,
+                                                                          'aws.region': target.region,
+                                                                          'cfn.stack_name': stack_name}):
+            session = _session(target)
+            resources = resolve_references(node.resources, upstream)
+            template = node_template(node=node, resources=json.loads(
+                json.dumps(resources).replace("%_REGION_%", target.region)))
+            create_update_stack(stack_name=stack_name, template=template, cfn_params=None,
+                                capability=node.capabilities, region=target.region, waiter=True, tags=node.tags,
+                                session=session, **wait_options(config),
+                                client_request_token=client_request_token(event, target.account, target.region,
+                                                                          stack_name))
+            stack_info = describe_stack(stack_name=stack_name, session=session)
+            if node.termination_protection:
+                enable_termination_protection(stack_name=stack_name, session=session)
+            outputs = {x['OutputKey']: x['OutputValue'] for x in stack_info['Stacks'][0].get('Outputs', [])}
+            publish_outputs(config=config, target=target, stack_name=stack_name, outputs=outputs)
+            return outputs
+
+    def _delete(target, node, upstream):  # pylint: disable=unused-argument
+        stack_name = target_stack_name(stack_name=node.stack_name, target=target)
+        with tracer.start_span('delete_stack', parent=parent, attributes={'aws.account': target.account,
+                                                                          'aws.region': target.region,
+                                                                          'cfn.stack_name': stack_name}):
+            delete_stacks([{'Name': stack_name, 'Session': _session(target)}], timeout=remaining_seconds(context))
+            unpublish_outputs(config=config, target=target, stack_name=stack_name)
+            return {}
+
+    try:
+        graph = build_graph(config)
+        if event['RequestType'] == "Delete":
+            if config.get("OnFailure", "DELETE") == "DELETE":
+                run_graph(graph=reverse_graph(graph), targets=targets, action=_delete)
+
+        else:
+            results = run_graph(graph=graph, targets=targets, action=_deploy)
+            response_data['Data'] = {'Stacks': [node.stack_name for node in graph.values()]}
+            for target, stacks in results.items():
+                for stack, outputs in stacks.items():
+                    for key, value in outputs.items():
+                        response_data[output_key(key=f"{stack}_{key}", target=target, targets=targets)] = value
+
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.SUCCESS,
+            responseData=response_data
+        )
+
+    except Exception as e:
+        LOGGER.error(f"Stacks Error:{e}", exc_info=True)
+        response_data['ERROR'] = str(e)
+        cfnresponse.send(
+            event=event,
+            context=context,
+            responseStatus=cfnresponse.FAILED,
+            responseData=response_data
+        )
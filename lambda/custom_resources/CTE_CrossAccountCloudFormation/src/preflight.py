@@ -0,0 +1,174 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cfn_helper import validate_template
+from client_session_helper import boto3_session
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+# TemplateBody limit of create_stack / update_stack / validate_template
+MAX_TEMPLATE_BODY = 51200
+PREFLIGHT_WORKERS = 16
+PSEUDO_PARAMETERS = {'AWS::AccountId', 'AWS::NotificationARNs', 'AWS::NoValue', 'AWS::Partition', 'AWS::Region',
+                     'AWS::StackId', 'AWS::StackName', 'AWS::URLSuffix'}
+# Named IAM resources need CAPABILITY_NAMED_IAM, the other IAM resources CAPABILITY_IAM
+NAMED_IAM_PROPERTIES = {'RoleName', 'UserName', 'GroupName', 'ManagedPolicyName', 'InstanceProfileName'}
+
+# Successful validate_template calls of the container, by template hash
+_VALIDATED = set()
+_VALIDATED_LOCK = threading.Lock()
+
+
+def template_hash(template: dict) -> str:
+    return hashlib.sha256(json.dumps(template, sort_keys=True).encode()).hexdigest()
+
+
+def _references(value, found: set):
+    """Logical ids used by Ref / Fn::GetAtt"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'Ref' and isinstance(item, str):
+                found.add(item)
+            elif key == 'Fn::GetAtt':
+                target = item.split('.')[0] if isinstance(item, str) else item[0]
+                if isinstance(target, str):
+                    found.add(target)
+            _references(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _references(item, found)
+    return found
+
+
+def required_capabilities(resources: dict) -> set:
+    capabilities = set()
+    for resource in resources.values():
+        if str(resource.get('Type', '')).startswith('AWS::IAM::'):
+            named = NAMED_IAM_PROPERTIES & set(resource.get('Properties') or {})
+            capabilities.add('CAPABILITY_NAMED_IAM' if named else 'CAPABILITY_IAM')
+    return capabilities
+
+
+def check_template(name: str, template: dict, capabilities) -> list:
+    """Offline checks of a template as it will be deployed
+
+    Args:
+        name (str): Name of the stack, used in the errors
+        template (dict): Template after the &Ref / &Fn replacement
+        capabilities (str or list): Capabilities of the Configuration
+
+    Returns:
+        list: Errors, empty when the template passed
+    """
+    errors = []
+    resources = template.get('Resources')
+    if not resources or not isinstance(resources, dict):
+        return [f"{name}: Resources must be a non empty dict"]
+
+    for logical_id, resource in resources.items():
+        if not isinstance(resource, dict) or not isinstance(resource.get('Type'), str):
+            errors.append(f"{name}: Resource {logical_id} has no Type")
+    for output_name, output in (template.get('Outputs') or {}).items():
+        if not isinstance(output, dict) or 'Value' not in output:
+            errors.append(f"{name}: Output {output_name} has no Value")
+
+    known = set(resources) | set(template.get('Parameters') or {}) | PSEUDO_PARAMETERS
+    unknown = _references(template, set()) - known
+    if unknown:
+        errors.append(f"{name}: Ref / Fn::GetAtt to unknown resources {sorted(unknown)}")
+
+    granted = {capabilities} if isinstance(capabilities, str) else set(capabilities or [])
+    if 'CAPABILITY_NAMED_IAM' in granted:
+        granted.add('CAPABILITY_IAM')
+    missing = required_capabilities(resources) - granted
+    if missing:
+        errors.append(f"{name}: IAM resources require Capabilities {sorted(missing)}")
+
+    if len(json.dumps(template)) > MAX_TEMPLATE_BODY:
+        errors.append(f"{name}: Template is larger than {MAX_TEMPLATE_BODY} bytes")
+    return errors
+
+
+def validate_template_cached(template: dict, session=None):
+    """validate_template() once per template content, raises when CloudFormation rejects it"""
+    digest = template_hash(template)
+    with _VALIDATED_LOCK:
+        if digest in _VALIDATED:
+            return
+    validate_template(template=json.dumps(template), session=session)
+    with _VALIDATED_LOCK:
+        _VALIDATED.add(digest)
+
+
+def enabled_regions(session) -> set:
+    """Regions enabled in the account of the session"""
+    response = session.client('ec2').describe_regions(AllRegions=False)
+    return {x['RegionName'] for x in response['Regions']}
+
+
+def preflight(templates: list, targets: list, credentials, region: str):
+    """Checks the request across all targets at once before anything is deployed
+
+    - offline structure of every template (types, references, IAM capabilities, size)
+    - validate_template of every template, cached by template hash
+    - every target role can be assumed (the credentials are reused by the deployment)
+    - every target region is enabled in its account
+
+    Args:
+        templates (list): (stack name, template, capabilities) of every stack
+        targets (list): Target matrix
+        credentials (CredentialCache): Credentials of the target roles
+        region (str): Region of the function, validate_template runs there
+
+    Returns:
+        None, raises an Exception listing every failed check
+    """
+    errors = []
+    for name, template, capabilities in templates:
+        errors.extend(check_template(name=name, template=template, capabilities=capabilities))
+    if errors:
+        raise Exception(f"Preflight failed: {errors}")
+
+    def _validate(item):
+        name, template, _ = item
+        try:
+            validate_template_cached(template=template, session=boto3_session(region=region))
+        except Exception as e:
+            return f"{name}: {e}"
+
+    def _target(account_targets):
+        target = account_targets[0]
+        try:
+            session = boto3_session(region=region, credentials=credentials.get(target.role_arn),
+                                    account=target.account)
+        except Exception as e:
+            return [f"{target.account}: Unable to assume {target.role_arn}: {e}"]
+        try:
+            enabled = enabled_regions(session)
+        except Exception as e:
+            return [f"{target.account}: Unable to list the enabled regions: {e}"]
+        return [f"{x.account}: Region {x.region} is not enabled" for x in account_targets if x.region not in enabled]
+
+    accounts = {}
+    for target in targets:
+        accounts.setdefault(target.role_arn, []).append(target)
+
+    with ThreadPoolExecutor(max_workers=PREFLIGHT_WORKERS) as pool:
+        validations = pool.map(_validate, templates)
+        checks = pool.map(_target, accounts.values())
+        errors.extend(x for x in validations if x)
+        for x in checks:
+            errors.extend(x)
+
+    if errors:
+        raise Exception(f"Preflight failed: {errors}")
+    LOGGER.info(f"Preflight passed for {len(templates)} templates and {len(targets)} targets")
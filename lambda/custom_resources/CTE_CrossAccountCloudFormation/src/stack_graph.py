@@ -0,0 +1,180 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import re
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+# %_OUTPUT_<Stack>.<OutputKey>_% is replaced by the output of an upstream stack of the same target
+OUTPUT_REFERENCE = re.compile(r'%_OUTPUT_([A-Za-z0-9-]+)\.([A-Za-z0-9]+)_%')
+MAX_WORKERS = 16
+
+StackNode = namedtuple('StackNode', ['name', 'stack_name', 'resources', 'outputs', 'depends_on', 'capabilities',
+                                     'tags', 'description', 'termination_protection'])
+
+
+class StackGraphError(Exception):
+    """One or more stacks of the graph failed, the stacks depending on them were skipped
+
+    Args:
+        errors (dict): {(Target, stack): str}
+        results (dict): Outputs of the stacks that completed, {Target: {stack: {OutputKey: OutputValue}}}
+    """
+
+    def __init__(self, errors: dict, results: dict):
+        self.errors = errors
+        self.results = results
+        super().__init__('; '.join(f"{target.account}/{target.region}/{stack}: {error}"
+                                   for (target, stack), error in errors.items()))
+
+
+def output_references(value) -> set:
+    """(stack, OutputKey) referenced by %_OUTPUT_<Stack>.<OutputKey>_% placeholders"""
+    return set(OUTPUT_REFERENCE.findall(json.dumps(value)))
+
+
+def resolve_references(value, outputs: dict):
+    """Replaces the %_OUTPUT_<Stack>.<OutputKey>_% placeholders
+
+    Args:
+        value (dict): Resources of a stack
+        outputs (dict): Upstream outputs, {stack: {OutputKey: OutputValue}}
+
+    Returns:
+        dict: Resources with the output values
+    """
+    def _replace(match):
+        return json.dumps(outputs[match.group(1)][match.group(2)])[1:-1]
+    return json.loads(OUTPUT_REFERENCE.sub(_replace, json.dumps(value)))
+
+
+def build_graph(config: dict) -> dict:
+    """Reads the named stacks of Configuration.Stacks
+
+    Every stack has its Resources and Outputs, an optional StackName (defaults to <StackName>-<name>) and
+    DependsOn. A stack referencing the output of another one depends on it implicitly. Capabilities, Tags,
+    Description and TerminationProtection default to the ones of the Configuration.
+
+    Args:
+        config (dict): Custom Resource Configuration, Resources/Outputs already use the local functions (&Ref)
+
+    Returns:
+        dict: StackNode per name, in Configuration order
+    """
+    graph = {}
+    for name, stack in config['Stacks'].items():
+        depends_on = stack.get('DependsOn', [])
+        depends_on = [depends_on] if isinstance(depends_on, str) else list(depends_on)
+        references = output_references(stack.get('Resources', {}))
+        depends_on.extend(x[0] for x in sorted(references) if x[0] not in depends_on)
+        graph[name] = StackNode(
+            name=name,
+            stack_name=stack.get('StackName') or f"{config['StackName']}-{name}",
+            resources=stack.get('Resources', {}),
+            outputs=stack.get('Outputs', {}),
+            depends_on=tuple(depends_on),
+            capabilities=stack.get('Capabilities', config.get('Capabilities')),
+            tags=stack.get('Tags', config.get('Tags')),
+            description=stack.get('Description', config.get('Description')),
+            termination_protection=str(
+                stack.get('TerminationProtection', config.get('TerminationProtection', ''))).lower() == 'true'
+        )
+
+    for node in graph.values():
+        for dependency in node.depends_on:
+            if dependency not in graph:
+                raise ValueError(f"Stack {node.name} depends on unknown stack {dependency}")
+        for stack, key in output_references(node.resources):
+            if key not in graph[stack].outputs:
+                raise ValueError(f"Stack {node.name} references {stack}.{key} which is not an output of {stack}")
+    topological_order(graph)
+    return graph
+
+
+def topological_order(graph: dict) -> list:
+    """Names of the stacks, every stack after its dependencies, raises on a cycle"""
+    order = []
+    remaining = {name: set(node.depends_on) for name, node in graph.items()}
+    while remaining:
+        ready = [name for name, depends_on in remaining.items() if not depends_on]
+        if not ready:
+            raise ValueError(f"Stacks have a dependency cycle: {sorted(remaining)}")
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for depends_on in remaining.values():
+            depends_on.difference_update(ready)
+    return order
+
+
+def reverse_graph(graph: dict) -> dict:
+    """Same stacks, every stack depending on the ones that depend on it (ie: delete order)"""
+    dependents = {name: [] for name in graph}
+    for node in graph.values():
+        for dependency in node.depends_on:
+            dependents[dependency].append(node.name)
+    return {name: node._replace(depends_on=tuple(dependents[name])) for name, node in graph.items()}
+
+
+def run_graph(graph: dict, targets: list, action, max_workers: int = MAX_WORKERS) -> dict:
+    """Runs the action of every (target, stack) as soon as the stacks it depends on are done in that target
+
+    Independent stacks, and all targets, run in parallel so the longest dependency chain sets the duration. The
+    outputs of the upstream stacks are passed to the action in memory.
+
+    Args:
+        graph (dict): StackNode per name
+        targets (list): Target matrix
+        action (callable): action(target, node, upstream) -> dict of outputs, upstream being
+                           {stack: {OutputKey: OutputValue}} of the stacks it depends on
+        max_workers (int, optional): Stacks running at the same time
+
+    Returns:
+        dict: {Target: {stack: {OutputKey: OutputValue}}}
+    """
+    results = {target: {} for target in targets}
+    errors = {}
+    waiting = {(target, name): set(node.depends_on) for target in targets for name, node in graph.items()}
+    dependents = {name: [x.name for x in graph.values() if name in x.depends_on] for name in graph}
+
+    def _skip(target, name, reason):
+        for dependent in dependents[name]:
+            if (target, dependent) in waiting:
+                del waiting[(target, dependent)]
+                errors[(target, dependent)] = reason
+                _skip(target, dependent, reason)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while waiting or running:
+            for key in [k for k, depends_on in waiting.items() if not depends_on]:
+                target, name = key
+                del waiting[key]
+                upstream = {x: results[target][x] for x in graph[name].depends_on}
+                running[pool.submit(action, target, graph[name], upstream)] = key
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                target, name = running.pop(future)
+                try:
+                    results[target][name] = future.result() or {}
+                except Exception as e:
+                    LOGGER.error(f"Stack {name} failed in {target.account}/{target.region}: {e}")
+                    errors[(target, name)] = str(e)
+                    _skip(target, name, f"Skipped, {name} failed")
+                    continue
+                for dependent in dependents[name]:
+                    if (target, dependent) in waiting:
+                        waiting[(target, dependent)].discard(name)
+
+    if errors:
+        raise StackGraphError(errors=errors, results=results)
+    return results
@@ -0,0 +1,358 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import re
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import botocore.exceptions as ex
+from targets import Target, build_targets
+from state_store import get_state_store
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+BACKEND_STACKS = 'Stacks'
+BACKEND_STACK_SET = 'StackSet'
+BACKEND_AUTO = 'Auto'
+# Auto: matrices of this many (account, region) targets or more are deployed with a StackSet
+STACKSET_THRESHOLD = 10
+# Control Tower creates both roles, the execution role is also the role the function assumes
+DEFAULT_ADMINISTRATION_ROLE = 'service-role/AWSControlTowerStackSetRole'
+DEFAULT_OPERATION_PREFERENCES = {
+    'RegionConcurrencyType': 'PARALLEL',
+    'FailureToleranceCount': 0,
+    'MaxConcurrentPercentage': 100
+}
+OPERATION_PREFERENCE_KEYS = ('RegionConcurrencyType', 'RegionOrder', 'FailureToleranceCount',
+                             'FailureTolerancePercentage', 'MaxConcurrentCount', 'MaxConcurrentPercentage')
+OPERATION_POLL_SECONDS = 10
+OPERATION_DONE = ('SUCCEEDED', 'FAILED', 'STOPPED')
+OUTPUT_WORKERS = 16
+# Backend each Custom Resource was deployed with, by StackId#LogicalResourceId
+BACKEND_NAMESPACE = 'backends'
+
+
+def select_backend(config: dict, resources: dict, targets: list) -> str:
+    """Picks the deployment backend of a Configuration
+
+    Backend: Stacks | StackSet | Auto (default). Auto uses a StackSet for StackSetThreshold (10) targets or more,
+    unless TerminationProtection is requested (StackSet instances don't support it) or the Resources use the
+    %_REGION_% placeholder (a StackSet deploys the same template to every target).
+
+    Args:
+        config (dict): Custom Resource Configuration
+        resources (dict): Template Resources
+        targets (list): Target matrix
+
+    Returns:
+        str: BACKEND_STACKS or BACKEND_STACK_SET
+    """
+    backend = config.get('Backend', BACKEND_AUTO)
+    per_target = '%_REGION_%' in json.dumps(resources)
+    if backend == BACKEND_STACK_SET and per_target:
+        raise ValueError("Resources with %_REGION_% can't be deployed with a StackSet, use ${AWS::Region}")
+    if backend in (BACKEND_STACKS, BACKEND_STACK_SET):
+        return backend
+
+    if per_target or str(config.get('TerminationProtection', '')).lower() == 'true':
+        return BACKEND_STACKS
+    threshold = int(config.get('StackSetThreshold', STACKSET_THRESHOLD))
+    return BACKEND_STACK_SET if len(targets) >= threshold else BACKEND_STACKS
+
+
+def pinned_backend(event: dict, config: dict, resources: dict, targets: list, default_region: str,
+                   store=None) -> str:
+    """Backend of the Custom Resource: picked by select_backend() on Create, then kept for its lifetime
+
+    An Auto deployment that grows past (or shrinks below) StackSetThreshold keeps its backend, switching would
+    leave the stacks (or the StackSet) of the other backend orphaned. Resources deployed before the backend was
+    recorded fall back to the backend of OldResourceProperties on Update.
+
+    Args:
+        event (dict): Custom Resource event
+        config (dict): Custom Resource Configuration
+        resources (dict): Template Resources
+        targets (list): Target matrix
+        default_region (str): Region of the CloudFormation stack that invoked the function
+        store (StateStore, optional): State store, defaults to the 'backends' namespace
+
+    Returns:
+        str: BACKEND_STACKS or BACKEND_STACK_SET
+    """
+    store = store or get_state_store(BACKEND_NAMESPACE)
+    key = f"{event['StackId']}#{event['LogicalResourceId']}"
+    if event['RequestType'] == 'Create':
+        backend = select_backend(config=config, resources=resources, targets=targets)
+        store.put(key, {'Backend': backend})
+        return backend
+
+    previous = (store.get(key) or {}).get('Backend')
+    if not previous and event.get('OldResourceProperties'):
+        old_config = event['OldResourceProperties']['Parameters']['Configuration']
+        previous = select_backend(config=old_config, resources=old_config.get('Resources', {}),
+                                  targets=build_targets(config=old_config, default_region=default_region))
+    if not previous:
+        return select_backend(config=config, resources=resources, targets=targets)
+
+    requested = config.get('Backend', BACKEND_AUTO)
+    if requested not in (BACKEND_AUTO, previous):
+        raise ValueError(f"The resource was deployed with the {previous} backend, changing it to {requested} isn't "
+                         f"supported: deploy it as a new resource (LogicalResourceId) and remove this one")
+    backend = select_backend(config=dict(config, Backend=previous), resources=resources, targets=targets)
+    if event['RequestType'] == 'Update':
+        store.put(key, {'Backend': backend})
+    return backend
+
+
+def stack_set_name(config: dict) -> str:
+    """StackSetName, defaults to the StackName without its per target placeholders"""
+    if config.get('StackSetName'):
+        return config['StackSetName']
+    return re.sub(r'[-_]?%_(REGION|ACCOUNT)_%', '', config['StackName'])
+
+
+def operation_preferences(config: dict) -> dict:
+    """StackSet operation preferences from Configuration.StackSet, ie: {FailureTolerancePercentage: 10,
+    MaxConcurrentPercentage: 50}. A count and a percentage of the same setting are exclusive, the count wins."""
+    preferences = dict(DEFAULT_OPERATION_PREFERENCES)
+    requested = {k: v for k, v in (config.get('StackSet') or {}).items() if k in OPERATION_PREFERENCE_KEYS}
+    if 'FailureTolerancePercentage' in requested:
+        preferences.pop('FailureToleranceCount')
+    if 'MaxConcurrentCount' in requested:
+        preferences.pop('MaxConcurrentPercentage')
+    preferences.update(requested)
+
+    for count, percentage in (('FailureToleranceCount', 'FailureTolerancePercentage'),
+                              ('MaxConcurrentCount', 'MaxConcurrentPercentage')):
+        if count in preferences and percentage in preferences:
+            preferences.pop(percentage)
+    for key in ('FailureToleranceCount', 'FailureTolerancePercentage', 'MaxConcurrentCount',
+                'MaxConcurrentPercentage'):
+        if key in preferences:
+            preferences[key] = int(preferences[key])
+    return preferences
+
+
+def describe_stack_set(name: str, client):
+    try:
+        return client.describe_stack_set(StackSetName=name)['StackSet']
+
+    except ex.ClientError as e:
+        if e.response['Error']['Code'] == 'StackSetNotFoundException':
+            return None
+        raise
+
+
+def list_stack_instances(name: str, client) -> dict:
+    """Returns:
+        dict: {(account, region): StackInstanceSummary}
+    """
+    instances = {}
+    paginator = client.get_paginator('list_stack_instances')
+    for page in paginator.paginate(StackSetName=name):
+        for instance in page['Summaries']:
+            instances[(instance['Account'], instance['Region'])] = instance
+    return instances
+
+
+def group_by_regions(pairs: list) -> list:
+    """Splits (account, region) pairs in (accounts, regions) groups whose accounts x regions are exactly the pairs,
+    the stack instance operations take an accounts x regions matrix
+
+    Args:
+        pairs (list): (account, region) of the stack instances
+
+    Returns:
+        list: [(accounts, regions)], one group per set of regions
+    """
+    regions = {}
+    for account, region in pairs:
+        regions.setdefault(account, []).append(region)
+    groups = {}
+    for account, account_regions in regions.items():
+        groups.setdefault(frozenset(account_regions), (account_regions, []))[1].append(account)
+    return [(accounts, account_regions) for account_regions, accounts in groups.values()]
+
+
+def _deadline(timeout: float = None) -> float:
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def wait_for_operation(name: str, operation_id: str, client, poll_seconds: int = OPERATION_POLL_SECONDS,
+                       deadline: float = None) -> dict:
+    """Waits for a StackSet operation, raises with the failed stack instances if it didn't succeed
+
+    Args:
+        name (str): StackSet name
+        operation_id (str): StackSet operation Id
+        client (boto3.client): CloudFormation client of the administrator account
+        poll_seconds (int, optional): Seconds between two polls
+        deadline (float, optional): time.monotonic() after which the wait raises, the operation keeps running
+
+    Returns:
+        dict: StackSetOperation
+    """
+    while True:
+        operation = client.describe_stack_set_operation(StackSetName=name, OperationId=operation_id)
+        operation = operation['StackSetOperation']
+        if operation['Status'] in OPERATION_DONE:
+            break
+        if deadline is not None and time.monotonic() + poll_seconds > deadline:
+            raise Exception(f"Timed out waiting for StackSet {name} operation {operation_id} ({operation['Status']})")
+        LOGGER.info(f"StackSet {name} operation {operation_id}: {operation['Status']}")
+        time.sleep(poll_seconds)
+
+    if operation['Status'] != 'SUCCEEDED':
+        failures = []
+        paginator = client.get_paginator('list_stack_set_operation_results')
+        for page in paginator.paginate(StackSetName=name, OperationId=operation_id):
+            failures.extend(
+                f"{x['Account']}/{x['Region']}: {x.get('StatusReason', x['Status'])}"
+                for x in page['Summaries'] if x['Status'] != 'SUCCEEDED'
+            )
+        raise Exception(f"StackSet {name} operation {operation_id} {operation['Status']}: {failures}")
+
+    return operation
+
+
+def deploy_stack_set(name: str, template: dict, targets: list, config: dict, client, administrator_account: str,
+                     tags: list = None, description: str = None, timeout: float = None) -> list:
+    """Creates or updates the StackSet and its stack instances, then waits for the operations
+
+    The StackSet is self-managed from the function account: AdministrationRoleARN (defaults to the Control Tower
+    StackSet role) assumes ExecutionRoleName (the role name of the targets) in every target account.
+
+    Args:
+        name (str): StackSet name
+        template (dict): CloudFormation template
+        targets (list): Target matrix
+        config (dict): Custom Resource Configuration
+        client (boto3.client): CloudFormation client of the administrator account
+        administrator_account (str): Account of the function
+        tags (list, optional): Tags of the StackSet (and of its stacks)
+        description (str, optional): StackSet description
+        timeout (float, optional): Seconds to wait for all the operations, no limit by default
+
+    Returns:
+        list: Ids of the operations that ran
+    """
+    deadline = _deadline(timeout)
+    preferences = operation_preferences(config)
+    args = {'StackSetName': name, 'TemplateBody': json.dumps(template)}
+    if config.get('Capabilities'):
+        capabilities = config['Capabilities']
+        args['Capabilities'] = [capabilities] if isinstance(capabilities, str) else capabilities
+    if tags:
+        args['Tags'] = tags
+    if description:
+        args['Description'] = description
+
+    operations = []
+    if not describe_stack_set(name, client=client):
+        partition = targets[0].role_arn.split(':')[1]
+        LOGGER.info(f"Creating StackSet {name}")
+        client.create_stack_set(
+            AdministrationRoleARN=config.get('StackSetAdministrationRoleArn') or
+            f"arn:{partition}:iam::{administrator_account}:role/{DEFAULT_ADMINISTRATION_ROLE}",
+            ExecutionRoleName=targets[0].role_arn.split('/')[-1],
+            PermissionModel='SELF_MANAGED',
+            **args
+        )
+        existing = {}
+
+    else:
+        # Also without stack instances (ie: a failed first create), new instances use the StackSet template
+        existing = list_stack_instances(name, client=client)
+        LOGGER.info(f"Updating StackSet {name} ({len(existing)} stack instances)")
+        try:
+            response = client.update_stack_set(OperationPreferences=preferences, **args)
+            operations.append(response['OperationId'])
+            wait_for_operation(name, response['OperationId'], client=client, deadline=deadline)
+
+        except ex.ClientError as e:
+            if 'No updates are to be performed' not in str(e):
+                raise
+            LOGGER.info(f"No updates need to be performed on StackSet {name}")
+
+    # Stack instances are added per (accounts x regions) matrix, only for the targets without one
+    pairs = [(x.account, x.region) for x in targets]
+    for accounts, regions in group_by_regions([x for x in pairs if x not in existing]):
+        LOGGER.info(f"Creating stack instances in {len(accounts)} accounts x {len(regions)} regions")
+        response = client.create_stack_instances(StackSetName=name, Accounts=accounts, Regions=regions,
+                                                 OperationPreferences=preferences)
+        operations.append(response['OperationId'])
+        wait_for_operation(name, response['OperationId'], client=client, deadline=deadline)
+
+    # Targets dropped from the matrix (ie: an account or region removed on Update)
+    for accounts, regions in group_by_regions([x for x in existing if x not in pairs]):
+        LOGGER.info(f"Deleting stack instances in {len(accounts)} accounts x {len(regions)} regions")
+        response = client.delete_stack_instances(StackSetName=name, Accounts=accounts, Regions=regions,
+                                                 OperationPreferences=preferences, RetainStacks=False)
+        operations.append(response['OperationId'])
+        wait_for_operation(name, response['OperationId'], client=client, deadline=deadline)
+
+    return operations
+
+
+def stack_set_outputs(name: str, targets: list, client, sessions) -> dict:
+    """Reads the outputs of every stack instance in its target account
+
+    Args:
+        name (str): StackSet name
+        targets (list): Target matrix
+        client (boto3.client): CloudFormation client of the administrator account
+        sessions (SessionPool): Sessions of the targets
+
+    Returns:
+        dict: {Target: {OutputKey: OutputValue}}
+    """
+    instances = list_stack_instances(name, client=client)
+
+    def _outputs(target: Target) -> dict:
+        instance = instances.get((target.account, target.region))
+        if not instance or not instance.get('StackId'):
+            raise Exception(f"StackSet {name} has no stack instance in {target.account}/{target.region}")
+        stack = sessions.client(target, 'cloudformation').describe_stacks(StackName=instance['StackId'])
+        return {x['OutputKey']: x['OutputValue'] for x in stack['Stacks'][0].get('Outputs', [])}
+
+    with ThreadPoolExecutor(max_workers=min(OUTPUT_WORKERS, len(targets))) as pool:
+        return dict(zip(targets, pool.map(_outputs, targets)))
+
+
+def delete_stack_set(name: str, targets: list, config: dict, client, timeout: float = None) -> list:
+    """Deletes the stack instances of the targets, then the StackSet once it has no instance left
+
+    Args:
+        name (str): StackSet name
+        targets (list): Target matrix
+        config (dict): Custom Resource Configuration
+        client (boto3.client): CloudFormation client of the administrator account
+        timeout (float, optional): Seconds to wait for the deletion, no limit by default
+
+    Returns:
+        list: Ids of the operations that ran
+    """
+    deadline = _deadline(timeout)
+    if not describe_stack_set(name, client=client):
+        LOGGER.warning(f"StackSet {name} does not exist...")
+        return []
+
+    operations = []
+    existing = list_stack_instances(name, client=client)
+    for accounts, regions in group_by_regions([(x.account, x.region) for x in targets
+                                               if (x.account, x.region) in existing]):
+        response = client.delete_stack_instances(StackSetName=name, Accounts=accounts, Regions=regions,
+                                                 OperationPreferences=operation_preferences(config),
+                                                 RetainStacks=False)
+        operations.append(response['OperationId'])
+        wait_for_operation(name, response['OperationId'], client=client, deadline=deadline)
+
+    if not list_stack_instances(name, client=client):
+        LOGGER.info(f"Deleting StackSet {name}")
+        client.delete_stack_set(StackSetName=name)
+    return operations
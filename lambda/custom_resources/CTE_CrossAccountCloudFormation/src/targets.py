@@ -0,0 +1,149 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from sts_helper import assume_role_arn
+from client_session_helper import boto3_session
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+DEFAULT_ROLE_NAME = 'AWSControlTowerExecution'
+ROLE_ARN_TEMPLATE = 'arn:{partition}:iam::{account}:role/{role_name}'
+# Assumed credentials are refreshed when they expire within this window
+CREDENTIALS_REFRESH = timedelta(minutes=5)
+
+Target = namedtuple('Target', ['account', 'region', 'role_arn'])
+
+
+def parse_role_arn(role_arn: str) -> dict:
+    """Splits an IAM Role ARN (arn:aws:iam::111111111111:role/path/Name)
+
+    Returns:
+        dict: {'Partition': str, 'Account': str, 'RoleName': str}
+    """
+    parts = role_arn.split(':')
+    return {'Partition': parts[1], 'Account': parts[4], 'RoleName': parts[5].split('/')[-1]}
+
+
+def build_targets(config: dict, default_region: str) -> list:
+    """Expands the Configuration in the (account, region) matrix it deploys to
+
+    A single account is taken from RoleArn. Several accounts are listed in Accounts, the role assumed in each of
+    them is RoleName (defaults to the role name of RoleArn, then AWSControlTowerExecution).
+
+    Args:
+        config (dict): Custom Resource Configuration
+        default_region (str): Region of the CloudFormation stack that invoked the function
+
+    Returns:
+        list: Target per account and region, accounts first
+    """
+    regions = config.get('Regions') or [default_region]
+    if not config.get('Accounts'):
+        account = parse_role_arn(config['RoleArn'])['Account']
+        return [Target(account=account, region=region, role_arn=config['RoleArn']) for region in regions]
+
+    role = parse_role_arn(config['RoleArn']) if config.get('RoleArn') else {}
+    role_name = config.get('RoleName') or role.get('RoleName') or DEFAULT_ROLE_NAME
+    partition = role.get('Partition', 'aws')
+    accounts = list(dict.fromkeys(str(x) for x in config['Accounts']))
+    return [
+        Target(account=account, region=region,
+               role_arn=ROLE_ARN_TEMPLATE.format(partition=partition, account=account, role_name=role_name))
+        for account in accounts for region in regions
+    ]
+
+
+def target_stack_name(stack_name: str, target: Target) -> str:
+    """StackName with the %_REGION_% / %_ACCOUNT_% placeholders of the target replaced"""
+    return stack_name.replace('%_REGION_%', target.region).replace('%_ACCOUNT_%', target.account)
+
+
+def output_key(key: str, target: Target, targets: list) -> str:
+    """Response Data key of a stack output
+
+    One target keeps the OutputKey, several regions add _Region<N> (position in Regions, starting at 1) and several
+    accounts add _<AccountId> in front of it, ie: oBucket_111111111111_Region2
+    """
+    accounts = list(dict.fromkeys(x.account for x in targets))
+    regions = list(dict.fromkeys(x.region for x in targets))
+    if len(accounts) > 1:
+        key = f"{key}_{target.account}"
+    if len(regions) > 1:
+        key = f"{key}_Region{regions.index(target.region) + 1}"
+    return key
+
+
+class CredentialCache():
+    """Assumed role credentials shared by every thread of the invocation, a role is assumed once until its
+    credentials are about to expire"""
+
+    def __init__(self, assume_role=assume_role_arn):
+        self._assume_role = assume_role
+        self._credentials = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _expiring(credentials: dict) -> bool:
+        expiration = credentials.get('Expiration')
+        if not isinstance(expiration, datetime):
+            return False
+        return expiration - datetime.now(timezone.utc) < CREDENTIALS_REFRESH
+
+    def get(self, role_arn: str) -> dict:
+        with self._lock:
+            lock = self._locks.setdefault(role_arn, threading.Lock())
+
+        # One assume role call per role, the other threads wait for it
+        with lock:
+            credentials = self._credentials.get(role_arn)
+            if credentials is None or self._expiring(credentials):
+                credentials = self._assume_role(role_arn=role_arn)
+                self._credentials[role_arn] = credentials
+            return credentials
+
+
+class SessionPool():
+    """boto3 sessions per (role, region), the clients created from a session are reused by the callers
+
+    Sessions aren't thread safe, they are created and used to create clients under the pool lock. The clients
+    themselves are thread safe.
+
+    Args:
+        credentials (CredentialCache, optional): Defaults to a new cache
+    """
+
+    def __init__(self, credentials: CredentialCache = None):
+        self.credentials = credentials or CredentialCache()
+        self._sessions = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def session(self, target: Target):
+        # Assumed outside of the pool lock, the credential cache serializes per role
+        credentials = self.credentials.get(target.role_arn)
+        key = (target.role_arn, target.region)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = boto3_session(region=target.region, credentials=credentials,
+                                                    account=target.account)
+            return self._sessions[key]
+
+    def client(self, target: Target, service: str):
+        key = (target.role_arn, target.region, service)
+        with self._lock:
+            if key in self._clients:
+                return self._clients[key]
+        session = self.session(target)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = session.client(service)
+            return self._clients[key]
@@ -0,0 +1,112 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from client_session_helper import boto3_client
+from cfn_helper import describe_stack, delete_stack, disable_termination_protection, determine_stack_failure_event
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGER = logging.getLogger()
+LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+logging.getLogger("botocore").setLevel(logging.ERROR)
+
+DELETE_POLL_SECONDS = 10
+# Stays within the 900 seconds of the function when the caller doesn't pass its remaining time
+DELETE_TIMEOUT = 840
+# A DELETE_FAILED stack is deleted once more, keeping the resources that couldn't be deleted
+MAX_DELETE_ATTEMPTS = 2
+DELETE_WORKERS = 16
+DOES_NOT_EXIST = 'DOES_NOT_EXIST'
+
+
+def failed_resources(stack_name: str, session=None) -> list:
+    """Logical ids of the DELETE_FAILED resources of a stack"""
+    client = boto3_client(service='cloudformation', session=session)
+    resources = []
+    paginator = client.get_paginator('list_stack_resources')
+    for page in paginator.paginate(StackName=stack_name):
+        resources.extend(
+            x['LogicalResourceId'] for x in page['StackResourceSummaries'] if x['ResourceStatus'] == 'DELETE_FAILED'
+        )
+    return resources
+
+
+def start_delete(stack: dict):
+    """Starts the deletion of a stack, disabling its termination protection with the same describe call. The
+    stack is tracked by StackId from then on since a deleted stack can't be described by name.
+
+    Args:
+        stack (dict): {'Name': str, 'Session': boto3.session}, StackId and Status are added to it
+
+    Returns:
+        dict: The stack
+    """
+    stack_info = describe_stack(stack_name=stack['Name'], session=stack['Session'])
+    if not stack_info:
+        stack['Status'] = DOES_NOT_EXIST
+        return stack
+
+    details = stack_info['Stacks'][0]
+    stack['StackId'] = details['StackId']
+    stack['Status'] = details['StackStatus']
+    if details['StackStatus'] != 'DELETE_IN_PROGRESS':
+        if details.get('EnableTerminationProtection'):
+            disable_termination_protection(stack_name=stack['Name'], session=stack['Session'], stack_info=stack_info)
+        LOGGER.info(f"Deleting Stack:{stack['Name']}")
+        delete_stack(stack_name=stack['StackId'], session=stack['Session'])
+    return stack
+
+
+def delete_stacks(stack_list: list, timeout: float = DELETE_TIMEOUT, poll_seconds: float = DELETE_POLL_SECONDS,
+                  max_attempts: int = MAX_DELETE_ATTEMPTS) -> list:
+    """Deletes all the stacks at once then waits for them with one status loop
+
+    The deletions are started in parallel. Every poll describes each remaining stack once, a DELETE_FAILED stack
+    is deleted again keeping the resources that failed (RetainResources) up to max_attempts.
+
+    Args:
+        stack_list (list of dict): [{'Name': str, 'Session': boto3.session}], other keys are kept
+        timeout (float, optional): Seconds to wait for the deletions
+        poll_seconds (float, optional): Seconds between two polls
+        max_attempts (int, optional): Delete attempts of a stack
+
+    Returns:
+        list of dict: The stacks with their final Status (DELETE_COMPLETE or DOES_NOT_EXIST), raises an Exception
+                      with the failed ones
+    """
+    failed_list = []
+    with ThreadPoolExecutor(max_workers=min(DELETE_WORKERS, len(stack_list) or 1)) as pool:
+        pending = [x for x in pool.map(start_delete, stack_list) if x['Status'] != DOES_NOT_EXIST]
+
+    attempts = {id(x): 1 for x in pending}
+    deadline = time.monotonic() + timeout
+    while pending:
+        if time.monotonic() > deadline:
+            failed_list.extend({"Name": x['Name'], "Failure": f"Timed out in {x['Status']}"} for x in pending)
+            break
+        time.sleep(poll_seconds)
+
+        for stack in list(pending):
+            stack_info = describe_stack(stack_name=stack['StackId'], session=stack['Session'])
+            stack['Status'] = stack_info['Stacks'][0]['StackStatus'] if stack_info else 'DELETE_COMPLETE'
+            if stack['Status'] == 'DELETE_COMPLETE':
+                LOGGER.info(f"{stack['Name']} was deleted")
+                pending.remove(stack)
+
+            elif stack['Status'] == 'DELETE_FAILED':
+                if attempts[id(stack)] < max_attempts:
+                    retain = failed_resources(stack_name=stack['StackId'], session=stack['Session'])
+                    LOGGER.warning(f"{stack['Name']} failed to delete, retrying and retaining {retain}")
+                    delete_stack(stack_name=stack['StackId'], session=stack['Session'], retain_resources=retain)
+                    attempts[id(stack)] += 1
+                else:
+                    failure = determine_stack_failure_event(stack_name=stack['StackId'], session=stack['Session'])
+                    failed_list.append({"Name": stack['Name'], "Failure": failure})
+                    pending.remove(stack)
+
+    if failed_list:
+        raise Exception(failed_list)
+    return stack_list
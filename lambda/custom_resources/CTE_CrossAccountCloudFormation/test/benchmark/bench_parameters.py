@@ -0,0 +1,88 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Times the CloudFormation parameter helpers of cfn_helper from 10 to 10k parameters.
+
+    python lambda/custom_resources/CTE_CrossAccountCloudFormation/test/benchmark/bench_parameters.py --sizes 10 100 1000
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', 'src'))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', '..', '..', 'layers', 'CTE_Common'))
+
+import cfn_helper  # noqa: E402 pylint: disable=wrong-import-position
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def nested_merge(override_parameters: dict, current_parameters: list) -> list:
+    """Reference merge that scans the current parameters for every override key"""
+    parameters = [dict(x) for x in current_parameters]
+    for key, value in override_parameters.items():
+        for parameter in list(parameters):
+            if key == parameter['ParameterKey'] and value != parameter['ParameterValue']:
+                parameters.remove(parameter)
+        parameters.append({"ParameterKey": key, "ParameterValue": value})
+    return parameters
+
+
+def fixtures(size: int) -> dict:
+    """Stack with `size` parameters, the override changes half of them and adds a quarter of new ones"""
+    current = [{"ParameterKey": f"pParam{x}", "ParameterValue": f"value-{x}"} for x in range(size)]
+    override = {f"pParam{x}": f"new-{x}" for x in range(0, size, 2)}
+    override.update({f"pExtra{x}": f"extra-{x}" for x in range(size // 4)})
+    template = json.dumps({'Parameters': {f"pParam{x}": {'Type': 'String'} for x in range(0, size, 3)},
+                           'Resources': {'rTopic': {'Type': 'AWS::SNS::Topic'}}})
+    return {'current': current, 'override': override, 'template': template}
+
+
+def run(sizes: list = None, repeat: int = 3) -> dict:
+    """Best time of each helper in milliseconds
+
+    Returns:
+        dict: {size: {helper: milliseconds}}
+    """
+    results = {}
+    for size in sizes or SIZES:
+        data = fixtures(size)
+        merged = cfn_helper.update_parameters(override_parameters=data['override'],
+                                              current_parameters=data['current'])
+        cases = {
+            'update_parameters': lambda: cfn_helper.update_parameters(
+                override_parameters=data['override'], current_parameters=data['current']),
+            'parameters_to_dict': lambda: cfn_helper.parameters_to_dict(data['current']),
+            'remove_unused_parameters': lambda: cfn_helper.remove_unused_parameters(
+                template=data['template'], parameters=merged),
+        }
+        # Quadratic, only timed where it finishes in a reasonable time
+        if size <= 1000:
+            cases['nested_merge'] = lambda: nested_merge(data['override'], data['current'])
+
+        number = max(1, 10000 // size)
+        results[size] = {name: min(timeit.repeat(case, number=number, repeat=repeat)) / number * 1000
+                         for name, case in cases.items()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(sizes=args.sizes, repeat=args.repeat)
+    print(f"{'helper':<26}" + ''.join(f"{size:>12}" for size in results) + '  (ms)')
+    for name in results[args.sizes[0]]:
+        row = ''.join(f"{results[size][name]:>12.3f}" if name in results[size] else f"{'-':>12}" for size in results)
+        print(f"{name:<26}{row}")
+
+
+if __name__ == '__main__':
+    main()
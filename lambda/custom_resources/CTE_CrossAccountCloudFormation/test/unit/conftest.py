@@ -1,10 +1,17 @@
 # Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import os
 import sys
 import mock
 import pytest
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE_DIR, '..', '..', 'src')
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', '..', '..', 'layers', 'CTE_CfnResponse'))
+sys.path.insert(0, SRC_DIR)
+os.environ.setdefault('AWS_LAMBDA_FUNCTION_NAME', 'CTE_CrossAccountCloudFormation')
+
 client_session_helper = mock.Mock()
 helper = mock.Mock()
 
@@ -12,6 +19,12 @@ sys.modules["client_session_helper"] = client_session_helper
 sys.modules["helper"] = helper
 
 
+@pytest.fixture()
+def local_modules():
+    """Modules that share their name with modules of other Lambda Functions"""
+    return ['main']
+
+
 @pytest.fixture()
 def upper_creds():
     credentials = {
@@ -56,6 +56,17 @@ def test_boto3_session_credentials_accesskeyid(mocker, monkeypatch):
     )
 
 
+def test_boto3_session_shares_the_account_rate_limit(upper_creds, mocker, monkeypatch):
+    rate_limit_session = mocker.Mock(side_effect=lambda session, account=None: session)
+    monkeypatch.setattr(client_session_helper, "rate_limit_session", rate_limit_session)
+    session = client_session_helper.boto3_session(
+        credentials=upper_creds,
+        region='us-east-1',
+        account='111111111111'
+    )
+    rate_limit_session.assert_called_once_with(session, account='111111111111')
+
+
 def test_boto3_client_profile(mocker, monkeypatch):
     boto3_session_mock = mocker.Mock()
     session_mock = mocker.Mock()
@@ -0,0 +1,91 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from state_store import LocalStateStore
+
+ACCOUNTS = ['111111111111', '222222222222', '333333333333']
+REGIONS = ['us-east-1', 'eu-west-1']
+
+
+def matrix_event(request_type='Create', **config):
+    return {
+        'RequestType': request_type,
+        'ResponseURL': 'https://cloudformation-custom-resource-response-useast1.s3.amazonaws.com/'
+                       'arn%3Aaws%3Acloudformation%3Aus-east-1%3A999999999999%3Astack/sdlc/abc',
+        'StackId': 'arn:aws:cloudformation:us-east-1:999999999999:stack/sdlc/abc',
+        'RequestId': f"request-{request_type}",
+        'LogicalResourceId': 'rBuckets',
+        'ResourceProperties': {'Parameters': {'Configuration': dict({
+            'StackName': 'cte-bucket-%_REGION_%',
+            'RoleArn': 'arn:aws:iam::111111111111:role/AWSControlTowerExecution',
+            'Accounts': ACCOUNTS,
+            'Regions': REGIONS,
+            'Capabilities': 'CAPABILITY_NAMED_IAM',
+            'Resources': {'rBucket': {'Type': 'AWS::S3::Bucket'}},
+            'Outputs': {'oBucket': {'Value': {'&Ref': 'rBucket'}}}
+        }, **config)}}
+    }
+
+
+@pytest.fixture()
+def handler(load_src, exporter, monkeypatch, mocker):
+    """CTE_CrossAccountCloudFormation with the CloudFormation calls and the responses replaced"""
+    main = load_src('main')
+    monkeypatch.delenv('CTE_STATE_TABLE', raising=False)
+    LocalStateStore.reset()
+    main.responses = []
+    mocker.patch.object(main.cfnresponse, 'send', side_effect=lambda event, context, responseStatus, responseData,
+                        **kwargs: main.responses.append((responseStatus, responseData)))
+    mocker.patch.object(main, 'create_update_stack', return_value='CREATE_COMPLETE')
+    mocker.patch.object(main, 'describe_stack', side_effect=lambda stack_name, session=None: {
+        'Stacks': [{'Outputs': [{'OutputKey': 'oBucket', 'OutputValue': stack_name}]}]})
+    yield main
+    LocalStateStore.reset()
+
+
+def test_matrix_sends_one_response_with_every_output(handler, lambda_context):
+    handler.lambda_handler(matrix_event(), lambda_context)
+
+    assert len(handler.responses) == 1
+    status, data = handler.responses[0]
+    assert status == 'SUCCESS'
+    assert data['oBucket_333333333333_Region2'] == 'cte-bucket-eu-west-1'
+    assert len([x for x in data if x.startswith('oBucket_')]) == 6
+
+
+def test_matrix_failure_is_not_swallowed(handler, lambda_context):
+    def _create_update_stack(**kwargs):
+        if handler.create_update_stack.call_count == 5:
+            raise Exception('Bucket already exists')
+        return 'CREATE_COMPLETE'
+    handler.create_update_stack.side_effect = _create_update_stack
+
+    handler.lambda_handler(matrix_event(), lambda_context)
+
+    assert len(handler.responses) == 1
+    status, data = handler.responses[0]
+    assert status == 'FAILED'
+    assert data['ERROR'] == '333333333333/us-east-1: Bucket already exists'
+    assert handler.create_update_stack.call_count == 6
+
+
+def test_preflight_only_runs_when_requested(handler, mocker, lambda_context):
+    mocker.patch.object(handler, 'preflight')
+
+    handler.lambda_handler(matrix_event(), lambda_context)
+    handler.preflight.assert_not_called()
+
+    handler.lambda_handler(matrix_event(request_type='Update', Preflight='true'), lambda_context)
+    assert handler.preflight.call_count == 1
+
+
+def test_handler_is_profiled(handler, monkeypatch, tmp_path, lambda_context):
+    monkeypatch.setenv('CTE_PROFILE', 'cpu')
+    monkeypatch.setenv('CTE_PROFILE_DIR', str(tmp_path))
+    monkeypatch.delenv('CTE_PROFILE_BUCKET', raising=False)
+
+    handler.lambda_handler(matrix_event(), lambda_context)
+
+    assert [x.name for x in tmp_path.iterdir()] == ['CTE_CrossAccountCloudFormation-f1e2d3c4.prof']
+    assert handler.responses[0][0] == 'SUCCESS'
@@ -0,0 +1,104 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import drift
+from state_store import LocalStateStore
+from targets import Target
+
+TARGETS = [Target('111111111111', 'us-east-1', 'arn:aws:iam::111111111111:role/AWSControlTowerExecution'),
+           Target('222222222222', 'us-east-1', 'arn:aws:iam::222222222222:role/AWSControlTowerExecution')]
+
+
+class FakePaginator():
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return self.pages
+
+
+class FakeCloudFormation():
+    """Detections finish on the second poll, drifted is the set of drifted stacks"""
+
+    def __init__(self, stacks, drifted):
+        self.stacks = stacks
+        self.drifted = drifted
+        self.detections = {}
+        self.calls = []
+
+    def get_paginator(self, operation):
+        self.calls.append(operation)
+        if operation == 'list_stacks':
+            return FakePaginator([{'StackSummaries': [{'StackName': x, 'TemplateDescription': description}
+                                                      for x, description in self.stacks.items()]}])
+        return FakePaginator([{'StackResourceDrifts': [
+            {'LogicalResourceId': 'rBucket', 'ResourceType': 'AWS::S3::Bucket', 'StackResourceDriftStatus': 'MODIFIED'}
+        ]}])
+
+    def detect_stack_drift(self, StackName):
+        self.calls.append('detect_stack_drift')
+        self.detections[StackName] = 0
+        return {'StackDriftDetectionId': StackName}
+
+    def describe_stack_drift_detection_status(self, StackDriftDetectionId):
+        self.calls.append('describe_stack_drift_detection_status')
+        self.detections[StackDriftDetectionId] += 1
+        if self.detections[StackDriftDetectionId] < 2:
+            return {'DetectionStatus': 'DETECTION_IN_PROGRESS'}
+        status = 'DRIFTED' if StackDriftDetectionId in self.drifted else 'IN_SYNC'
+        return {'DetectionStatus': 'DETECTION_COMPLETE', 'StackDriftStatus': status}
+
+
+class FakePool():
+    def __init__(self, clients):
+        self.clients = clients
+
+    def client(self, target, service):
+        return self.clients[target.account]
+
+
+@pytest.fixture()
+def pool(monkeypatch):
+    monkeypatch.delenv('CTE_STATE_TABLE', raising=False)
+    LocalStateStore.reset()
+    yield FakePool({
+        '111111111111': FakeCloudFormation({'cte-bucket': 'Buckets (Lambda:CrossAccountCloudFormation)',
+                                            'cte-roles': '(Lambda:CrossAccountCloudFormation)',
+                                            'StackSet-other': 'Not deployed by the extension'}, drifted={'cte-bucket'}),
+        '222222222222': FakeCloudFormation({'cte-bucket': '(Lambda:CrossAccountCloudFormation)'}, drifted=set())
+    })
+    LocalStateStore.reset()
+
+
+def test_scan_detects_every_managed_stack(pool):
+    report = drift.scan_drift(targets=TARGETS, pool=pool, poll_seconds=0)
+
+    assert sorted((x['Account'], x['StackName'], x['DriftStatus']) for x in report['Stacks']) == [
+        ('111111111111', 'cte-bucket', 'DRIFTED'),
+        ('111111111111', 'cte-roles', 'IN_SYNC'),
+        ('222222222222', 'cte-bucket', 'IN_SYNC')
+    ]
+    drifted = [x for x in report['Stacks'] if x['DriftStatus'] == 'DRIFTED'][0]
+    assert drifted['DriftedResources'] == [{'LogicalResourceId': 'rBucket', 'ResourceType': 'AWS::S3::Bucket',
+                                            'Status': 'MODIFIED'}]
+    assert report['Errors'] == []
+
+
+def test_repeated_scan_within_the_window_is_cached(pool):
+    first = drift.scan_drift(targets=TARGETS, pool=pool, poll_seconds=0)
+    calls = {x: len(y.calls) for x, y in pool.clients.items()}
+
+    second = drift.scan_drift(targets=TARGETS, pool=pool, poll_seconds=0)
+
+    assert second['Cached'] == 2 and sorted(map(str, second['Stacks'])) == sorted(map(str, first['Stacks']))
+    assert {x: len(y.calls) for x, y in pool.clients.items()} == calls
+    drift.scan_drift(targets=TARGETS, pool=pool, poll_seconds=0, max_age=0)
+    assert pool.clients['111111111111'].calls.count('detect_stack_drift') == 4
+
+
+def test_unfinished_detection_is_reported_and_not_cached(pool):
+    report = drift.scan_drift(targets=TARGETS[:1], pool=pool, poll_seconds=0.1, timeout=0)
+
+    assert {x['DriftStatus'] for x in report['Stacks']} == {drift.DETECTION_IN_PROGRESS}
+    assert drift.scan_drift(targets=TARGETS[:1], pool=pool, poll_seconds=0)['Cached'] == 0
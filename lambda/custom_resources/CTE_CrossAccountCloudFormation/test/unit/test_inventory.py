@@ -0,0 +1,121 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import threading
+import pytest
+import inventory
+from state_store import LocalStateStore
+from targets import Target
+
+MANAGED = 'Buckets (Lambda:CrossAccountCloudFormation)'
+
+
+def summary(name, status='CREATE_COMPLETE', updated=None, description=MANAGED):
+    item = {'StackName': name, 'StackId': f"arn/{name}", 'StackStatus': status, 'CreationTime': '2022-01-01T00:00:00',
+            'TemplateDescription': description}
+    if updated:
+        item['LastUpdatedTime'] = updated
+    return item
+
+
+class FakeFleet():
+    """Stacks of every target, sessions are the targets themselves"""
+
+    def __init__(self, stacks, latency=0.0):
+        self.stacks = stacks
+        self.latency = latency
+        self.templates = []
+        self.lists = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def session(self, target):
+        return target
+
+    def list_stack_summaries(self, session=None):
+        with self._lock:
+            self.lists += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        if session.account == 'broken':
+            raise Exception('AccessDenied')
+        return iter(self.stacks.get((session.account, session.region), []))
+
+    def get_template(self, stack_name, session=None):
+        self.templates.append(stack_name)
+        return {'Resources': {'rBucket': {'Type': 'AWS::S3::Bucket'}}, 'Description': stack_name}
+
+
+@pytest.fixture()
+def fleet(monkeypatch):
+    def _fleet(stacks, latency=0.0):
+        fake = FakeFleet(stacks, latency)
+        monkeypatch.setattr(inventory, 'list_stack_summaries', fake.list_stack_summaries)
+        monkeypatch.setattr(inventory, 'get_template', fake.get_template)
+        return fake
+
+    monkeypatch.delenv('CTE_STATE_TABLE', raising=False)
+    LocalStateStore.reset()
+    yield _fleet
+    LocalStateStore.reset()
+
+
+def target(account, region='us-east-1'):
+    return Target(account, region, f"arn:aws:iam::{account}:role/AWSControlTowerExecution")
+
+
+def test_refresh_indexes_the_managed_stacks(fleet):
+    fake = fleet({('111111111111', 'us-east-1'): [summary('cte-bucket'), summary('cte-logs', 'UPDATE_ROLLBACK_FAILED'),
+                                                  summary('other', description='Not deployed by the extension')]})
+    stack_inventory = inventory.StackInventory(pool=fake)
+
+    report = stack_inventory.refresh([target('111111111111'), target('broken')])
+
+    assert report['Refreshed'] == 1 and report['Errors'] == ['broken/us-east-1: AccessDenied']
+    stacks = {x['StackName']: x for x in stack_inventory.stacks([target('111111111111')])}
+    assert set(stacks) == {'cte-bucket', 'cte-logs'}
+    assert stacks['cte-logs']['Status'] == 'UPDATE_ROLLBACK_FAILED'
+    assert stacks['cte-bucket']['LastUpdated'] == '2022-01-01T00:00:00'
+    assert stacks['cte-bucket']['Fingerprint'] != stacks['cte-logs']['Fingerprint']
+    assert inventory.stack_health('UPDATE_ROLLBACK_FAILED') == 'UNHEALTHY'
+
+
+def test_incremental_refresh_only_reads_what_changed(fleet):
+    stacks = {('111111111111', 'us-east-1'): [summary('cte-bucket'), summary('cte-logs')],
+              ('222222222222', 'us-east-1'): [summary('cte-bucket')]}
+    fake = fleet(stacks)
+    stack_inventory = inventory.StackInventory(pool=fake)
+    targets = [target('111111111111'), target('222222222222')]
+    stack_inventory.refresh(targets)
+    assert (fake.lists, len(fake.templates)) == (2, 3)
+
+    # Nothing is read within the window
+    assert stack_inventory.refresh(targets)['Reused'] == 2
+    assert fake.lists == 2
+
+    # A changed target is listed again, only the template of its updated stack is read
+    stacks[('111111111111', 'us-east-1')][1]['LastUpdatedTime'] = '2022-02-01T00:00:00'
+    report = stack_inventory.refresh(targets, changed=[('111111111111', 'us-east-1')])
+
+    assert (report['Refreshed'], report['Reused']) == (1, 1)
+    assert (fake.lists, fake.templates[3:]) == (3, ['arn/cte-logs'])
+
+
+def test_fleet_targets_are_read_concurrently(fleet):
+    accounts = [str(100000000000 + x) for x in range(100)]
+    regions = ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1']
+    fake = fleet({(x, y): [summary('cte-bucket')] for x in accounts for y in regions}, latency=0.02)
+    targets = [target(x, y) for x in accounts for y in regions]
+
+    started = time.monotonic()
+    report = inventory.StackInventory(pool=fake).refresh(targets)
+
+    assert report['Refreshed'] == 400
+    assert fake.max_in_flight > 1
+    # 8 seconds when read one by one
+    assert time.monotonic() - started < 5
@@ -0,0 +1,50 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import cfn_helper
+
+
+def param(key, value):
+    return {"ParameterKey": key, "ParameterValue": value}
+
+
+def test_override_keeps_the_order_without_duplicate_keys():
+    current = [param('pA', '1'), param('pB', '2'), param('pC', '3')]
+
+    merged = cfn_helper.update_parameters(override_parameters={'Parameters': {'pB': 20, 'pC': '3', 'pD': True}},
+                                          current_parameters=current)
+
+    assert merged == [param('pA', '1'), param('pB', '20'), param('pC', '3'), param('pD', 'True')]
+
+
+def test_list_override_adds_the_new_keys():
+    current = [param('pA', '1'), param('pB', '2')]
+
+    merged = cfn_helper.update_parameters(override_parameters=[param('pB', '20'), param('pC', '30')],
+                                          current_parameters=current)
+
+    # pC isn't a parameter of the stack yet, it is added like the new keys of a dict override
+    assert merged == [param('pA', '1'), param('pB', '20'), param('pC', '30')]
+    assert merged == cfn_helper.update_parameters(override_parameters={'pB': '20', 'pC': '30'},
+                                                  current_parameters=current)
+    assert cfn_helper.update_parameters() == []
+
+
+def test_remove_unused_parameters_against_the_template_keys():
+    template = json.dumps({'Parameters': {'pA': {'Type': 'String'}, 'pC': {'Type': 'String'}}, 'Resources': {}})
+    parameters = [param(f"p{x}", str(x)) for x in 'ABCD']
+
+    assert cfn_helper.remove_unused_parameters(template=template, parameters=parameters) == \
+        [param('pA', 'A'), param('pC', 'C')]
+    assert cfn_helper.remove_unused_parameters(template=json.dumps({'Resources': {}}), parameters=parameters) == []
+
+
+def test_large_merge_keeps_every_key():
+    current = [param(f"pParam{x}", str(x)) for x in range(20000)]
+    override = {f"pParam{x}": 'new' for x in range(0, 20000, 2)}
+
+    merged = cfn_helper.update_parameters(override_parameters=override, current_parameters=current)
+
+    assert len(merged) == 20000
+    assert merged[2] == param('pParam2', 'new') and merged[3] == param('pParam3', '3')
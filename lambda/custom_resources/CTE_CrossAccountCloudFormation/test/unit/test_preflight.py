@@ -0,0 +1,72 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import preflight
+from targets import Target
+
+TEMPLATE = {
+    'Resources': {
+        'rRole': {'Type': 'AWS::IAM::Role', 'Properties': {'RoleName': 'cte-role'}},
+        'rKey': {'Type': 'AWS::KMS::Key', 'Properties': {'Principal': {'Fn::GetAtt': ['rRole', 'Arn']}}}
+    },
+    'Outputs': {'oKeyArn': {'Value': {'Fn::GetAtt': 'rKey.Arn'}}, 'oRegion': {'Value': {'Ref': 'AWS::Region'}}}
+}
+TARGETS = [Target('111111111111', 'us-east-1', 'arn:aws:iam::111111111111:role/AWSControlTowerExecution'),
+           Target('111111111111', 'me-south-1', 'arn:aws:iam::111111111111:role/AWSControlTowerExecution'),
+           Target('222222222222', 'us-east-1', 'arn:aws:iam::222222222222:role/AWSControlTowerExecution')]
+
+
+class FakeCredentials():
+    def get(self, role_arn):
+        if role_arn.split(':')[4] == '222222222222':
+            raise Exception('AccessDenied')
+        return {'AccessKeyId': 'key'}
+
+
+@pytest.fixture()
+def validations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(preflight, '_VALIDATED', set())
+    monkeypatch.setattr(preflight, 'validate_template', lambda template, session: calls.append(template))
+    monkeypatch.setattr(preflight, 'boto3_session', lambda **kwargs: kwargs)
+    monkeypatch.setattr(preflight, 'enabled_regions', lambda session: {'us-east-1', 'us-west-2'})
+    return calls
+
+
+def test_check_template_passes_a_valid_template():
+    assert preflight.check_template('cte-key', TEMPLATE, ['CAPABILITY_NAMED_IAM']) == []
+
+
+def test_check_template_reports_every_problem():
+    template = {
+        'Resources': {'rRole': {'Type': 'AWS::IAM::Role'}, 'rBucket': {'Properties': {'Name': {'Ref': 'rMissing'}}}},
+        'Outputs': {'oRole': {'Export': 'x'}}
+    }
+
+    errors = preflight.check_template('cte-key', template, None)
+
+    assert errors == [
+        'cte-key: Resource rBucket has no Type',
+        'cte-key: Output oRole has no Value',
+        "cte-key: Ref / Fn::GetAtt to unknown resources ['rMissing']",
+        "cte-key: IAM resources require Capabilities ['CAPABILITY_IAM']"
+    ]
+
+
+def test_preflight_checks_every_target_before_deploying(validations):
+    with pytest.raises(Exception) as e:
+        preflight.preflight(templates=[('cte-key', TEMPLATE, 'CAPABILITY_NAMED_IAM')], targets=TARGETS,
+                            credentials=FakeCredentials(), region='us-east-1')
+
+    assert '111111111111: Region me-south-1 is not enabled' in str(e.value)
+    assert '222222222222: Unable to assume' in str(e.value)
+    assert len(validations) == 1
+
+
+def test_validate_template_is_cached_by_hash(validations):
+    for _ in range(3):
+        preflight.preflight(templates=[('cte-key', TEMPLATE, 'CAPABILITY_NAMED_IAM')], targets=TARGETS[:1],
+                            credentials=FakeCredentials(), region='us-east-1')
+
+    assert len(validations) == 1
@@ -0,0 +1,94 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import pytest
+import stack_graph
+from targets import Target
+
+TARGETS = [Target('111111111111', 'us-east-1', 'role'), Target('111111111111', 'us-west-2', 'role')]
+
+
+@pytest.fixture()
+def config():
+    return {
+        'StackName': 'cte-baseline',
+        'Stacks': {
+            'Iam': {'Resources': {'rRole': {}}, 'Outputs': {'oRoleArn': {}}},
+            'Logs': {'Resources': {'rGroup': {}}, 'Outputs': {'oGroup': {}}},
+            'Kms': {
+                'Resources': {'rKey': {'Properties': {'Principal': '%_OUTPUT_Iam.oRoleArn_%'}}},
+                'Outputs': {'oKeyArn': {}}
+            },
+            'Bucket': {
+                'DependsOn': 'Logs',
+                'Resources': {'rBucket': {'Properties': {'KmsKey': '%_OUTPUT_Kms.oKeyArn_%'}}}
+            }
+        }
+    }
+
+
+def test_build_graph_adds_the_output_references(config):
+    graph = stack_graph.build_graph(config)
+
+    assert graph['Kms'].depends_on == ('Iam',)
+    assert graph['Bucket'].depends_on == ('Logs', 'Kms')
+    assert graph['Bucket'].stack_name == 'cte-baseline-Bucket'
+    assert stack_graph.topological_order(graph) == ['Iam', 'Logs', 'Kms', 'Bucket']
+    assert stack_graph.topological_order(stack_graph.reverse_graph(graph)) == ['Bucket', 'Logs', 'Kms', 'Iam']
+
+
+@pytest.mark.parametrize('stacks, message', [
+    ({'A': {'DependsOn': 'B'}, 'B': {'DependsOn': 'A'}}, 'cycle'),
+    ({'A': {'DependsOn': 'C'}}, 'unknown stack'),
+    ({'A': {}, 'B': {'Resources': {'r': '%_OUTPUT_A.oMissing_%'}}}, 'not an output'),
+])
+def test_build_graph_rejects_invalid_stacks(stacks, message):
+    with pytest.raises(ValueError, match=message):
+        stack_graph.build_graph({'StackName': 'cte', 'Stacks': stacks})
+
+
+def test_run_graph_passes_outputs_downstream_per_target(config):
+    graph = stack_graph.build_graph(config)
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def _action(target, node, upstream):
+        with lock:
+            running.add((target, node.name))
+            if ('Iam' in node.name or 'Logs' in node.name) and len(running) > 1:
+                overlapped.set()
+        resources = stack_graph.resolve_references(node.resources, upstream)
+        overlapped.wait(1)
+        with lock:
+            running.discard((target, node.name))
+        return {key: f"{target.region}:{node.name}:{_principal(resources)}" for key in node.outputs}
+
+    results = stack_graph.run_graph(graph, TARGETS, _action)
+
+    assert overlapped.is_set()
+    assert results[TARGETS[1]]['Kms']['oKeyArn'] == "us-west-2:Kms:us-west-2:Iam:{}"
+    assert results[TARGETS[0]]['Bucket'] == {}
+
+
+def test_run_graph_skips_the_dependents_of_a_failed_stack(config):
+    graph = stack_graph.build_graph(config)
+    deployed = []
+
+    def _action(target, node, upstream):
+        if node.name == 'Iam' and target.region == 'us-west-2':
+            raise Exception('AccessDenied')
+        deployed.append((target.region, node.name))
+        return {key: 'value' for key in node.outputs}
+
+    with pytest.raises(stack_graph.StackGraphError) as e:
+        stack_graph.run_graph(graph, TARGETS, _action)
+
+    assert sorted(e.value.errors.values()) == ['AccessDenied', 'Skipped, Iam failed', 'Skipped, Iam failed']
+    assert ('us-west-2', 'Logs') in deployed and ('us-west-2', 'Kms') not in deployed
+    assert set(e.value.results[TARGETS[0]]) == {'Iam', 'Logs', 'Kms', 'Bucket'}
+
+
+def _principal(resources):
+    return resources.get('rKey', {}).get('Properties', {}).get('Principal', '{}')
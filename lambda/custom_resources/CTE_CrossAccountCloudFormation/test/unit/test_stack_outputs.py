@@ -0,0 +1,85 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from state_store import LocalStateStore
+import stack_outputs
+
+
+class FakeSsm():
+    def __init__(self):
+        self.parameters = {}
+        self.writes = []
+
+    def get_paginator(self, operation):
+        parameters = self.parameters
+
+        class _Paginator():
+            def paginate(self, Path, Recursive):
+                return [{'Parameters': [{'Name': k, 'Value': v} for k, v in sorted(parameters.items())
+                                        if k.rsplit('/', 1)[0] == Path]}]
+        return _Paginator()
+
+    def put_parameter(self, Name, Value, Type, Overwrite):
+        self.writes.append(Name)
+        self.parameters[Name] = Value
+
+    def delete_parameters(self, Names):
+        for name in Names:
+            self.parameters.pop(name)
+
+
+@pytest.fixture()
+def local_index():
+    LocalStateStore.reset()
+    yield stack_outputs.StateStoreOutputIndex(store=LocalStateStore(stack_outputs.NAMESPACE))
+    LocalStateStore.reset()
+
+
+def test_state_store_index_skips_unchanged_outputs(local_index):
+    assert local_index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': 'k1'}) == 2
+    assert local_index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': 'k1'}) == 0
+    assert local_index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b2'}) == 2
+
+    assert stack_outputs.get_stack_outputs('111111111111', 'us-east-1', 'cte-bucket', index=local_index) == \
+        {'oBucket': 'b2'}
+    local_index.unpublish('111111111111', 'us-east-1', 'cte-bucket')
+    assert local_index.get_output('111111111111', 'us-east-1', 'cte-bucket', 'oBucket') is None
+
+
+def test_parameter_store_index_writes_changed_outputs_only():
+    client = FakeSsm()
+    index = stack_outputs.ParameterStoreOutputIndex(path='/cte/outputs/', client=client)
+
+    index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': 'k1'})
+    changed = index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': 'k2', 'oEmpty': ''})
+
+    assert changed == 1
+    assert client.writes[-1] == '/cte/outputs/111111111111/us-east-1/cte-bucket/oKey'
+    assert index.get_outputs('111111111111', 'us-east-1', 'cte-bucket') == {'oBucket': 'b1', 'oKey': 'k2'}
+
+    index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oKey': 'k2'})
+    index.unpublish('111111111111', 'us-west-2', 'cte-bucket')
+    assert list(client.parameters) == ['/cte/outputs/111111111111/us-east-1/cte-bucket/oKey']
+
+
+def test_parameter_store_index_removes_outputs_that_became_empty():
+    client = FakeSsm()
+    index = stack_outputs.ParameterStoreOutputIndex(path='/cte/outputs', client=client)
+    index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': 'k1'})
+
+    assert index.publish('111111111111', 'us-east-1', 'cte-bucket', {'oBucket': 'b1', 'oKey': None}) == 1
+    assert index.get_outputs('111111111111', 'us-east-1', 'cte-bucket') == {'oBucket': 'b1'}
+
+
+def test_output_index_is_abstract():
+    with pytest.raises(TypeError):
+        stack_outputs.OutputIndex()
+
+
+def test_output_index_from_environment(monkeypatch):
+    monkeypatch.setenv(stack_outputs.OUTPUT_PARAMETER_PATH_ENV, '/cte/outputs')
+    assert isinstance(stack_outputs.get_output_index(), stack_outputs.ParameterStoreOutputIndex)
+
+    monkeypatch.delenv(stack_outputs.OUTPUT_PARAMETER_PATH_ENV)
+    assert isinstance(stack_outputs.get_output_index(), stack_outputs.StateStoreOutputIndex)
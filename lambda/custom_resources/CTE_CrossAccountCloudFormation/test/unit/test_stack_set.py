@@ -0,0 +1,224 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import types
+import pytest
+import targets
+import stack_set
+
+ROLE_ARN = 'arn:aws:iam::111111111111:role/AWSControlTowerExecution'
+
+
+class FakeCloudFormation():
+    """Administrator account client, stack set operations succeed immediately"""
+
+    def __init__(self, instances=None, exists=False):
+        self.exists = exists or bool(instances)
+        self.instances = instances or []
+        self.calls = []
+
+    def describe_stack_set(self, StackSetName):
+        if not self.exists:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': 'StackSetNotFoundException'}}, 'DescribeStackSet')
+        return {'StackSet': {'StackSetName': StackSetName}}
+
+    def get_paginator(self, operation):
+        instances = self.instances
+
+        class _Paginator():
+            def paginate(self, **kwargs):
+                return [{'Summaries': [{'Account': a, 'Region': r, 'StackId': f"{a}-{r}"} for a, r in instances]}]
+        return _Paginator()
+
+    def describe_stack_set_operation(self, StackSetName, OperationId):
+        return {'StackSetOperation': {'Status': 'SUCCEEDED'}}
+
+    def create_stack_set(self, **kwargs):
+        self.calls.append(('create_stack_set', kwargs))
+        self.exists = True
+
+    def update_stack_set(self, **kwargs):
+        self.calls.append(('update_stack_set', kwargs))
+        return {'OperationId': 'update'}
+
+    def create_stack_instances(self, **kwargs):
+        self.calls.append(('create_stack_instances', kwargs))
+        self.instances.extend((a, r) for a in kwargs['Accounts'] for r in kwargs['Regions'])
+        return {'OperationId': 'create'}
+
+    def delete_stack_instances(self, **kwargs):
+        self.calls.append(('delete_stack_instances', kwargs))
+        pairs = [(a, r) for a in kwargs['Accounts'] for r in kwargs['Regions']]
+        self.instances[:] = [x for x in self.instances if x not in pairs]
+        return {'OperationId': 'delete'}
+
+
+class FakeSessions():
+    def client(self, target, service):
+        class _Client():
+            def describe_stacks(self, StackName):
+                return {'Stacks': [{'Outputs': [{'OutputKey': 'oBucket', 'OutputValue': StackName}]}]}
+        return _Client()
+
+
+@pytest.fixture()
+def config():
+    return {
+        'RoleArn': ROLE_ARN,
+        'StackName': 'cte-bucket-%_REGION_%',
+        'Accounts': ['111111111111', '222222222222'],
+        'Regions': ['us-east-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 'ap-southeast-2']
+    }
+
+
+def test_build_targets_expands_accounts_and_regions(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+
+    assert len(matrix) == 10
+    assert matrix[5] == targets.Target('222222222222', 'us-east-1',
+                                       'arn:aws:iam::222222222222:role/AWSControlTowerExecution')
+
+
+def test_output_keys_match_the_stacks_backend(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+    single = targets.build_targets({'RoleArn': ROLE_ARN, 'Regions': ['us-east-1', 'eu-west-1']}, 'us-east-1')
+
+    assert targets.output_key('oBucket', matrix[6], matrix) == 'oBucket_222222222222_Region2'
+    assert targets.output_key('oBucket', single[1], single) == 'oBucket_Region2'
+    assert targets.output_key('oBucket', single[0], single[:1]) == 'oBucket'
+
+
+def test_auto_backend_follows_the_matrix_size(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+
+    assert stack_set.select_backend(config, {}, matrix) == stack_set.BACKEND_STACK_SET
+    assert stack_set.select_backend(config, {}, matrix[:9]) == stack_set.BACKEND_STACKS
+    assert stack_set.select_backend(config, {'Name': '%_REGION_%'}, matrix) == stack_set.BACKEND_STACKS
+    assert stack_set.select_backend(dict(config, TerminationProtection='true'), {}, matrix) == stack_set.BACKEND_STACKS
+    with pytest.raises(ValueError):
+        stack_set.select_backend(dict(config, Backend='StackSet'), {'Name': '%_REGION_%'}, matrix)
+
+
+def test_operation_preferences_count_wins_over_percentage():
+    preferences = stack_set.operation_preferences({'StackSet': {
+        'FailureTolerancePercentage': '10', 'MaxConcurrentCount': 4, 'MaxConcurrentPercentage': 50}})
+
+    assert preferences == {'RegionConcurrencyType': 'PARALLEL', 'FailureTolerancePercentage': 10,
+                           'MaxConcurrentCount': 4}
+
+
+def test_deploy_creates_the_missing_stack_instances(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+    client = FakeCloudFormation(instances=[('111111111111', r) for r in config['Regions']])
+
+    operations = stack_set.deploy_stack_set(name='cte-bucket', template={}, targets=matrix, config=config,
+                                            client=client, administrator_account='999999999999')
+    outputs = stack_set.stack_set_outputs(name='cte-bucket', targets=matrix, client=client, sessions=FakeSessions())
+
+    assert operations == ['update', 'create']
+    assert client.calls[1][1]['Accounts'] == ['222222222222']
+    assert client.calls[1][1]['Regions'] == config['Regions']
+    assert outputs[matrix[9]] == {'oBucket': '222222222222-ap-southeast-2'}
+
+
+def test_deploy_creates_only_the_missing_stack_instances(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+    missing = [('111111111111', 'us-east-1'), ('222222222222', 'us-west-2'), ('222222222222', 'eu-west-1')]
+    client = FakeCloudFormation(instances=[(t.account, t.region) for t in matrix if (t.account, t.region) not in missing])
+
+    stack_set.deploy_stack_set(name='cte-bucket', template={}, targets=matrix, config=config, client=client,
+                               administrator_account='999999999999')
+
+    creates = [(x['Accounts'], x['Regions']) for call, x in client.calls if call == 'create_stack_instances']
+    assert creates == [(['111111111111'], ['us-east-1']), (['222222222222'], ['us-west-2', 'eu-west-1'])]
+    assert sorted(client.instances) == sorted((t.account, t.region) for t in matrix)
+
+
+def test_deploy_removes_the_stack_instances_of_dropped_targets(config):
+    client = FakeCloudFormation(instances=[(t.account, t.region)
+                                           for t in targets.build_targets(config, default_region='us-east-1')])
+    config = dict(config, Accounts=['111111111111'], Regions=config['Regions'][:4])
+    matrix = targets.build_targets(config, default_region='us-east-1')
+
+    operations = stack_set.deploy_stack_set(name='cte-bucket', template={}, targets=matrix, config=config,
+                                            client=client, administrator_account='999999999999')
+
+    deletes = [(x['Accounts'], x['Regions']) for call, x in client.calls if call == 'delete_stack_instances']
+    assert operations == ['update', 'delete', 'delete']
+    assert deletes == [(['111111111111'], ['ap-southeast-2']), (['222222222222'], config['Regions'] +
+                                                                ['ap-southeast-2'])]
+    assert sorted(client.instances) == sorted((t.account, t.region) for t in matrix)
+
+
+def test_deploy_creates_a_self_managed_stack_set(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+    client = FakeCloudFormation()
+
+    stack_set.deploy_stack_set(name='cte-bucket', template={}, targets=matrix, config=config, client=client,
+                               administrator_account='999999999999')
+
+    create = client.calls[0][1]
+    assert create['AdministrationRoleARN'] == \
+        'arn:aws:iam::999999999999:role/service-role/AWSControlTowerStackSetRole'
+    assert create['ExecutionRoleName'] == 'AWSControlTowerExecution'
+    assert [x[0] for x in client.calls] == ['create_stack_set', 'create_stack_instances']
+
+
+def backend_event(request_type, config, old_config=None):
+    event = {'RequestType': request_type, 'StackId': 'arn:aws:cloudformation:us-east-1:999999999999:stack/sdlc/abc',
+             'LogicalResourceId': 'rBuckets', 'ResourceProperties': {'Parameters': {'Configuration': config}}}
+    if old_config:
+        event['OldResourceProperties'] = {'Parameters': {'Configuration': old_config}}
+    return event
+
+
+def test_backend_is_pinned_for_the_lifetime_of_the_resource(config):
+    from state_store import LocalStateStore
+    store = LocalStateStore('backends')
+    LocalStateStore.reset()
+    small = dict(config, Regions=config['Regions'][:3])
+    large = dict(config, Regions=config['Regions'])
+
+    def _backend(request_type, current, old=None):
+        event = backend_event(request_type, current, old)
+        return stack_set.pinned_backend(event=event, config=current, resources={},
+                                        targets=targets.build_targets(current, 'us-east-1'),
+                                        default_region='us-east-1', store=store)
+
+    # 6 targets on Create, 10 after the Update: the direct stacks are kept
+    assert _backend('Create', small) == stack_set.BACKEND_STACKS
+    assert _backend('Update', large, small) == stack_set.BACKEND_STACKS
+    assert _backend('Delete', large) == stack_set.BACKEND_STACKS
+
+    # Not recorded yet, the backend of the old properties is kept
+    LocalStateStore.reset()
+    assert _backend('Update', small, large) == stack_set.BACKEND_STACK_SET
+
+    with pytest.raises(ValueError):
+        _backend('Update', dict(small, Backend='Stacks'))
+    LocalStateStore.reset()
+
+
+def test_stack_set_without_instances_gets_the_new_template(config):
+    matrix = targets.build_targets(config, default_region='us-east-1')
+    # The first create failed after the StackSet was created
+    client = FakeCloudFormation(exists=True)
+
+    stack_set.deploy_stack_set(name='cte-bucket', template={'Resources': {'rFixed': {}}}, targets=matrix,
+                               config=config, client=client, administrator_account='999999999999')
+
+    assert [x[0] for x in client.calls] == ['update_stack_set', 'create_stack_instances']
+    assert 'rFixed' in client.calls[0][1]['TemplateBody']
+
+
+def test_operation_wait_stops_at_the_deadline(config, monkeypatch):
+    client = FakeCloudFormation(exists=True)
+    client.describe_stack_set_operation = lambda StackSetName, OperationId: {'StackSetOperation': {'Status': 'RUNNING'}}
+    clock = [0.0]
+    monkeypatch.setattr(stack_set, 'time', types.SimpleNamespace(
+        monotonic=lambda: clock[0], sleep=lambda seconds: clock.__setitem__(0, clock[0] + seconds)))
+
+    with pytest.raises(Exception, match='Timed out waiting for StackSet cte-bucket operation update'):
+        stack_set.deploy_stack_set(name='cte-bucket', template={}, targets=targets.build_targets(config, 'us-east-1'),
+                                   config=config, client=client, administrator_account='999999999999', timeout=30)
@@ -0,0 +1,136 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import types
+import pytest
+import cfn_helper
+
+STACK_ID = 'arn:aws:cloudformation:us-east-1:111111111111:stack/cte-bucket/1'
+
+
+def stack_event(event_id, status, logical_id='cte-bucket', reason=None):
+    event = {'EventId': event_id, 'StackId': STACK_ID, 'LogicalResourceId': logical_id, 'ResourceStatus': status,
+             'ResourceType': 'AWS::CloudFormation::Stack' if logical_id == 'cte-bucket' else 'AWS::S3::Bucket',
+             'PhysicalResourceId': STACK_ID if logical_id == 'cte-bucket' else logical_id}
+    if reason:
+        event['ResourceStatusReason'] = reason
+    return event
+
+
+class FakeCloudFormation():
+    """Events are appended by every poll, describe_stack_events returns them newest first two per page"""
+
+    def __init__(self, history, polls):
+        self.events = list(history)
+        self.polls = list(polls)
+        self.calls = []
+        self.cancelled = False
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        if NextToken is None and self.polls:
+            self.events.extend(self.polls.pop(0))
+        start = int(NextToken or 0)
+        self.calls.append(start)
+        newest_first = self.events[::-1]
+        page = {'StackEvents': newest_first[start:start + 2]}
+        if start + 2 < len(newest_first):
+            page['NextToken'] = str(start + 2)
+        return page
+
+    def cancel_update_stack(self, StackName):
+        self.cancelled = True
+
+
+@pytest.fixture()
+def cloudformation(monkeypatch):
+    def _cloudformation(history, polls):
+        client = FakeCloudFormation(history, polls)
+        monkeypatch.setattr(cfn_helper, 'boto3_client', lambda service, session=None: client)
+        monkeypatch.setattr(cfn_helper, 'time', types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda x: None))
+        return client
+    return _cloudformation
+
+
+# A previous update that failed, its events must not be read again
+HISTORY = [
+    stack_event('1', 'UPDATE_IN_PROGRESS'),
+    stack_event('2', 'UPDATE_FAILED', 'rOld', reason='Old failure'),
+    stack_event('3', 'UPDATE_ROLLBACK_COMPLETE'),
+    stack_event('4', 'UPDATE_IN_PROGRESS')
+]
+
+
+def test_waiter_returns_on_stack_success(cloudformation):
+    client = cloudformation(HISTORY, [
+        [stack_event('5', 'UPDATE_IN_PROGRESS', 'rBucket')],
+        [stack_event('6', 'UPDATE_COMPLETE', 'rBucket'), stack_event('7', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS')],
+        [stack_event('8', 'UPDATE_COMPLETE')]
+    ])
+
+    assert cfn_helper.wait_for_stack_events('cte-bucket') == 'UPDATE_COMPLETE'
+    # Only the first page is read once the last event is known
+    assert client.calls[-1] == 0
+
+
+def test_waiter_fails_at_the_first_failed_resource(cloudformation):
+    client = cloudformation(HISTORY, [
+        [stack_event('5', 'UPDATE_FAILED', 'rBucket', reason='Resource update cancelled'),
+         stack_event('6', 'UPDATE_FAILED', 'rKey', reason='Access denied for kms:PutKeyPolicy')],
+        [stack_event('7', 'UPDATE_ROLLBACK_IN_PROGRESS')]
+    ])
+
+    with pytest.raises(Exception, match='rKey - Access denied for kms:PutKeyPolicy'):
+        cfn_helper.wait_for_stack_events('cte-bucket', cancel_on_failure=True)
+    assert client.cancelled and client.polls
+
+
+def test_wait_for_stack_complete_reports_the_stack_url(cloudformation):
+    cloudformation([], [[stack_event('1', 'CREATE_IN_PROGRESS'), stack_event('2', 'ROLLBACK_IN_PROGRESS',
+                                                                             reason='The following resource(s) failed')]])
+
+    with pytest.raises(Exception, match=r'Stack Failure: https://console \[ERROR\] cte-bucket ROLLBACK_IN_PROGRESS'):
+        cfn_helper.wait_for_stack_complete('cte-bucket', 'https://console', 'stack_create_complete', fail_fast=True)
+
+
+@pytest.fixture()
+def stack(monkeypatch):
+    """Every describe_stack returns the next status, None once they run out after a delete"""
+    calls = []
+
+    def _stack(statuses):
+        statuses = list(statuses)
+
+        def describe_stack(stack_name, session=None):
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            return status and {'Stacks': [{'StackStatus': status, 'Tags': [], 'Parameters': []}]}
+
+        def delete_stack(stack_name, session=None):
+            calls.append('delete')
+            statuses[:] = ['DELETE_IN_PROGRESS', None]
+
+        monkeypatch.setattr(cfn_helper, 'describe_stack', describe_stack)
+        monkeypatch.setattr(cfn_helper, 'delete_stack', delete_stack)
+        monkeypatch.setattr(cfn_helper, 'update_stack', lambda **kwargs: calls.append('update') or {'StackId': '1'})
+        monkeypatch.setattr(cfn_helper, 'create_stack', lambda **kwargs: calls.append('create') or {'StackId': '1'})
+        monkeypatch.setattr(cfn_helper, 'time', types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda x: None))
+        return calls
+    return _stack
+
+
+def test_stack_rolling_back_is_updated_once_settled(stack):
+    calls = stack(['UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE'])
+
+    response = cfn_helper.create_update_stack('cte-bucket', {'Resources': {}}, None, 'CAPABILITY_IAM')
+
+    assert response == {'StackId': '1'}
+    assert calls == ['update']
+
+
+def test_stack_whose_creation_rolled_back_is_created_again(stack):
+    calls = stack(['ROLLBACK_IN_PROGRESS', 'ROLLBACK_COMPLETE'])
+
+    response = cfn_helper.create_update_stack('cte-bucket', {'Resources': {}}, None, 'CAPABILITY_IAM')
+
+    assert response == {'StackId': '1'}
+    assert calls == ['delete', 'create']
@@ -0,0 +1,78 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import types
+import pytest
+import teardown
+
+
+class FakeStacks():
+    """CloudFormation stacks of every session, statuses are replayed on each describe"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.deletes = []
+        self.describes = 0
+
+    def describe_stack(self, stack_name, session=None):
+        self.describes += 1
+        name = stack_name.split('/')[-1]
+        if name not in self.statuses[session]:
+            return None
+        statuses = self.statuses[session][name]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        return {'Stacks': [{'StackId': f"arn/{name}", 'StackStatus': status, 'EnableTerminationProtection': False}]}
+
+    def delete_stack(self, stack_name, session=None, retain_resources=None):
+        self.deletes.append((session, stack_name, retain_resources))
+
+
+@pytest.fixture()
+def stacks(monkeypatch):
+    def _stacks(statuses):
+        fake = FakeStacks(statuses)
+        monkeypatch.setattr(teardown, 'describe_stack', fake.describe_stack)
+        monkeypatch.setattr(teardown, 'delete_stack', fake.delete_stack)
+        monkeypatch.setattr(teardown, 'failed_resources', lambda stack_name, session: ['rBucket'])
+        monkeypatch.setattr(teardown, 'determine_stack_failure_event',
+                            lambda stack_name, session: 'rBucket - The bucket you tried to delete is not empty')
+        monkeypatch.setattr(teardown, 'time', types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda x: None))
+        return fake
+    return _stacks
+
+
+def test_delete_stacks_deletes_every_target_and_waits(stacks):
+    fake = stacks({
+        'us-east-1': {'cte-bucket': ['CREATE_COMPLETE', 'DELETE_IN_PROGRESS', 'DELETE_COMPLETE']},
+        'us-west-2': {'cte-bucket': ['UPDATE_COMPLETE', 'DELETE_COMPLETE']},
+        'eu-west-1': {}
+    })
+    stack_list = [{'Name': 'cte-bucket', 'Session': x} for x in ('us-east-1', 'us-west-2', 'eu-west-1')]
+
+    teardown.delete_stacks(stack_list, poll_seconds=0)
+
+    assert [x['Status'] for x in stack_list] == ['DELETE_COMPLETE', 'DELETE_COMPLETE', teardown.DOES_NOT_EXIST]
+    assert sorted(fake.deletes) == [('us-east-1', 'arn/cte-bucket', None), ('us-west-2', 'arn/cte-bucket', None)]
+
+
+def test_delete_failed_stack_is_retried_retaining_its_resources(stacks):
+    fake = stacks({'us-east-1': {'cte-bucket': ['CREATE_COMPLETE', 'DELETE_FAILED', 'DELETE_COMPLETE']}})
+
+    teardown.delete_stacks([{'Name': 'cte-bucket', 'Session': 'us-east-1'}], poll_seconds=0)
+
+    assert fake.deletes[-1] == ('us-east-1', 'arn/cte-bucket', ['rBucket'])
+
+
+def test_delete_stacks_reports_every_failure(stacks):
+    stacks({
+        'us-east-1': {'cte-bucket': ['CREATE_COMPLETE', 'DELETE_FAILED']},
+        'us-west-2': {'cte-bucket': ['CREATE_COMPLETE', 'DELETE_IN_PROGRESS']}
+    })
+    stack_list = [{'Name': 'cte-bucket', 'Session': x} for x in ('us-east-1', 'us-west-2')]
+
+    with pytest.raises(Exception) as e:
+        teardown.delete_stacks(stack_list, timeout=0.5, poll_seconds=0.1)
+
+    assert 'The bucket you tried to delete is not empty' in str(e.value)
+    assert 'Timed out in DELETE_IN_PROGRESS' in str(e.value)
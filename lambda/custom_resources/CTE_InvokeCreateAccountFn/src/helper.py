@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import re
+import hashlib
 import logging
 import boto3
 
@@ -10,31 +12,69 @@ LOGGER = logging.getLogger()
 LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logging.getLogger("botocore").setLevel(logging.ERROR)
 
+# Step Function execution names are limited to 80 characters
+SF_EXEC_NAME_MAX_LEN = 80
+SF_EXEC_DIGEST_LEN = 16
 
-def generate_sf_exec_name(account_name: str, client: boto3.client, statemachine_arn: str) -> str:
-    """ Generates a Step Function execution name, based on the number of previous execution
+
+def generate_sf_exec_name(account_name: str, event: dict) -> str:
+    """ Generates a deterministic Step Function execution name for a CloudFormation Custom Resource request.
+    The same request (StackId, LogicalResourceId, RequestId) always maps to the same name, so a re-sent
+    request lands on the execution that is already running instead of starting a new one.
 
     Args:
         account_name (str): The name in which the requester would like the account
+        event (dict): Event information passed in by the CloudFormation from the Custom Resource
+
+    Returns:
+        str: Returns generated Step Function execution name
+    """
+    request_key = "|".join([event['StackId'], event['LogicalResourceId'], event['RequestId']])
+    digest = hashlib.sha256(request_key.encode('utf-8')).hexdigest()[:SF_EXEC_DIGEST_LEN]
+
+    # Only alphanumeric, dash and underscore characters are safe within an execution name
+    prefix = re.sub(r'[^0-9A-Za-z_-]', '-', account_name)[:SF_EXEC_NAME_MAX_LEN - SF_EXEC_DIGEST_LEN - 1]
+
+    return f"{prefix}-{digest}"
+
+
+def get_sf_exec_arn(statemachine_arn: str, exec_name: str) -> str:
+    """ Builds the Step Function execution ARN from the State Machine ARN and execution name
+
+    Args:
+        statemachine_arn (str): AWS Statemachine ARN
+        exec_name (str): Step Function execution name
+
+    Returns:
+        str: Step Function execution ARN
+    """
+    arn_prefix, sm_name = statemachine_arn.split(':stateMachine:')
+    return f"{arn_prefix}:execution:{sm_name}:{exec_name}"
+
+
+def start_sf_execution(client: boto3.client, statemachine_arn: str, exec_name: str, sf_input: str) -> dict:
+    """ Starts the Step Function execution, or returns the existing execution when the same request
+    has already been started.
+
+    Args:
         client (boto3.client): boto3 client for Step Function
         statemachine_arn (str): AWS Statemachine ARN
+        exec_name (str): Step Function execution name
+        sf_input (str): JSON input for the Step Function execution
 
     Returns:
-        str: Returns generated Step Function execution name
+        dict: {'executionArn': str, 'status': str, 'existing': bool}
     """
-    # Get number of executions with that account name in execution name
-    count = 0
-
-    paginator = client.get_paginator("list_executions")
-    for page in paginator.paginate(stateMachineArn=statemachine_arn):
-        for ex in page['executions']:
-            if account_name in ex['name']:
-                count = (count + 1)
-
-    # If count is above 0 then append execution name with the next digit
-    if count > 0:
-        name = f"{account_name}-{str(count).zfill(2)}"
-    else:
-        name = account_name
-
-    return name
+    try:
+        response = client.start_execution(
+            stateMachineArn=statemachine_arn,
+            name=exec_name,
+            input=sf_input,
+        )
+        return {'executionArn': response['executionArn'], 'status': 'RUNNING', 'existing': False}
+
+    except client.exceptions.ExecutionAlreadyExists:
+        exec_arn = get_sf_exec_arn(statemachine_arn=statemachine_arn, exec_name=exec_name)
+        LOGGER.info(f"Execution {exec_name} already exists, attaching to {exec_arn}")
+        response = client.describe_execution(executionArn=exec_arn)
+        return {'executionArn': exec_arn, 'status': response['status'], 'existing': True}
@@ -5,17 +5,30 @@ import os
 import json
 import logging
 import cfnresponse
-import boto3
-from helper import generate_sf_exec_name
+from helper import generate_sf_exec_name, start_sf_execution
+from account_outputs import get_cached_account_outputs
+import timeline
+from tracing import trace_handler, inject, instrument
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
+from idempotency import idempotent_handler
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOGGER = logging.getLogger()
 LOGGER.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logging.getLogger("botocore").setLevel(logging.ERROR)
 
+# TimeoutSeconds of the account creation State Machine (stepfunctions/serverless.yaml), a request stays in progress
+#  until its execution sends the response
+STATE_MACHINE_TIMEOUT_SECONDS = 7200
 
+
+@trace_handler('CTE_InvokeCreateAccountFn')
+@profile_handler('CTE_InvokeCreateAccountFn')
+@idempotent_handler(attach=False, lease_seconds=STATE_MACHINE_TIMEOUT_SECONDS)
 def lambda_handler(event, context):
-    """This function will initiate the AWS Step Function for building an AWS Account.
+    """This function will initiate the AWS Step Function for building an AWS Account. A re-sent request in progress
+    is answered by its execution, a completed one is replayed.
 
     Args:
         event (dict): Event information passed in by the CloudFormation from the Custom Resource
@@ -26,8 +39,7 @@ def lambda_handler(event, context):
     """
     print(json.dumps(event))
     response_body = {}
-    exec_count = 0
-    sfn_client = boto3.client('stepfunctions')
+    sfn_client = instrument(rate_limited_client('stepfunctions'))
     resource_properties = event["ResourceProperties"]
     state_machine_arn = resource_properties["CreateAccountSfn"]
     sc_parameters = resource_properties['ServiceCatalogParameters']
@@ -42,33 +54,38 @@ def lambda_handler(event, context):
 
     else:
         try:
+            # Fast path: an AVAILABLE account with unchanged parameters doesn't need a State Machine execution
+            outputs = get_cached_account_outputs(
+                parameters=sc_parameters,
+                client=instrument(rate_limited_client('servicecatalog'))
+            )
+            if outputs:
+                LOGGER.info(f"{sc_parameters['AccountName']} is AVAILABLE and unchanged, returning cached outputs")
+                cfnresponse.send(
+                    event=event,
+                    context=context,
+                    responseStatus=cfnresponse.SUCCESS,
+                    responseData=outputs
+                )
+                return
+
             sf_exec_name = generate_sf_exec_name(
                 account_name=sc_parameters['AccountName'],
-                client=sfn_client,
-                statemachine_arn=state_machine_arn
+                event=event
             )
             LOGGER.info(f"Invoking State Machine: {state_machine_arn} with input: {event}")
+            timeline.mark(event, timeline.QUEUED)
+            # The executions continue the trace of this request
+            inject(event)
 
-            while True:
-                try:
-                    # Start step function
-                    sfn_client.start_execution(
-                        stateMachineArn=state_machine_arn,
-                        name=sf_exec_name,
-                        input=json.dumps(event),
-                    )
-                    break
-
-                except Exception as err:
-                    logging.debug(err)
-                    # If execution already exists increment count and try again
-                    if "when calling the StartExecution operation: Execution Already Exists" in str(err):
-                        exec_count = (exec_count + 1)
-                        sf_exec_name = f"{sc_parameters['AccountName']}-{str(exec_count).zfill(2)}"
-                        LOGGER.debug(f'Incrementing count and trying with execution name:{sf_exec_name}')
-
-                    else:
-                        raise Exception(err) from err
+            # Start step function, a re-sent request will attach to the existing execution
+            execution = start_sf_execution(
+                client=sfn_client,
+                statemachine_arn=state_machine_arn,
+                exec_name=sf_exec_name,
+                sf_input=json.dumps(event)
+            )
+            LOGGER.info(f"Execution:{execution}")
 
         except Exception as e:
             LOGGER.error(e, exc_info=True)
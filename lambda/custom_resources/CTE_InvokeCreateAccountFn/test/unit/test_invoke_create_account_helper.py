@@ -0,0 +1,58 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from custom_resources.CTE_InvokeCreateAccountFn.src import helper
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+STATE_MACHINE_ARN = 'arn:aws:states:us-east-1:111111111111:stateMachine:CTE_SDLC_Integration'
+
+
+@pytest.fixture()
+def cfn_event():
+    return {
+        'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/sdlc/abc',
+        'LogicalResourceId': 'rCreateDevAccount',
+        'RequestId': 'a1b2c3d4'
+    }
+
+
+def test_generate_sf_exec_name_deterministic(cfn_event):
+    first = helper.generate_sf_exec_name(account_name='ent-ct-team-dev', event=cfn_event)
+    second = helper.generate_sf_exec_name(account_name='ent-ct-team-dev', event=dict(cfn_event))
+    assert first == second
+    assert first.startswith('ent-ct-team-dev-')
+
+
+def test_generate_sf_exec_name_unique_per_request(cfn_event):
+    first = helper.generate_sf_exec_name(account_name='dev', event=cfn_event)
+    cfn_event['RequestId'] = 'e5f6a7b8'
+    second = helper.generate_sf_exec_name(account_name='dev', event=cfn_event)
+    assert first != second
+
+
+def test_generate_sf_exec_name_sanitized_and_bounded(cfn_event):
+    name = helper.generate_sf_exec_name(account_name='My Account (dev)' * 10, event=cfn_event)
+    assert len(name) <= helper.SF_EXEC_NAME_MAX_LEN
+    assert ' ' not in name and '(' not in name
+
+
+def test_start_sf_execution_attaches_to_existing():
+    client = boto3.client('stepfunctions', region_name='us-east-1')
+    exec_arn = helper.get_sf_exec_arn(statemachine_arn=STATE_MACHINE_ARN, exec_name='dev-0123')
+    assert exec_arn == 'arn:aws:states:us-east-1:111111111111:execution:CTE_SDLC_Integration:dev-0123'
+
+    with Stubber(client) as stubber:
+        stubber.add_client_error('start_execution', service_error_code='ExecutionAlreadyExists')
+        stubber.add_response(
+            'describe_execution',
+            {'executionArn': exec_arn, 'stateMachineArn': STATE_MACHINE_ARN, 'status': 'RUNNING',
+             'startDate': '2021-01-01T00:00:00Z'},
+            {'executionArn': exec_arn}
+        )
+        execution = helper.start_sf_execution(
+            client=client, statemachine_arn=STATE_MACHINE_ARN, exec_name='dev-0123', sf_input='{}'
+        )
+
+    assert execution == {'executionArn': exec_arn, 'status': 'RUNNING', 'existing': True}
@@ -17,6 +17,8 @@ FAILED = "FAILED"
 
 http = urllib3.PoolManager()
 FUNCTION_NAME = os.getenv('AWS_LAMBDA_FUNCTION_NAME', "LAMBDA_FUNCTION")
+# Called with (event, responseBody) once a response was accepted (ie: idempotency.record_responses())
+RESPONSE_HOOKS = []
 
 
 def send(event, context, responseStatus, responseData, physicalResourceId=FUNCTION_NAME, noEcho=False, reason=None):
@@ -55,3 +57,14 @@ def send(event, context, responseStatus, responseData, physicalResourceId=FUNCTI
 
     except Exception as e:
         LOGGER.error("send(..) failed executing http.request(..):", e)
+        return
+
+    # Only a response CloudFormation accepted is delivered
+    if not 200 <= response.status < 300:
+        return
+    for hook in RESPONSE_HOOKS:
+        try:
+            hook(event, responseBody)
+
+        except Exception as e:
+            LOGGER.error(f"send(..) response hook {getattr(hook, '__name__', hook)} failed: {e}")
@@ -0,0 +1,67 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import time
+import logging
+from state_store import get_state_store
+from account_parameters import fingerprint_parameters
+
+LOGGER = logging.getLogger()
+
+NAMESPACE = 'account-outputs'
+
+
+def put_account_outputs(account_name: str, parameters: dict, provisioned_product_id: str, record_id: str,
+                        outputs: dict, store=None):
+    """Caches the outputs of an account that finished provisioning
+
+    Args:
+        account_name (str): Account Name (Service Catalog Provisioned Product name)
+        parameters (dict): Service Catalog parameters as requested by the Custom Resource
+        provisioned_product_id (str): Service Catalog Provisioned Product Id
+        record_id (str): Service Catalog Record Id the outputs were read from
+        outputs (dict): Provisioned Product outputs {'OutputKey1': 'OutputValue1'}
+        store (StateStore, optional): State store, defaults to the 'account-outputs' namespace
+    """
+    store = store or get_state_store(NAMESPACE)
+    store.put(account_name, {
+        'Fingerprint': fingerprint_parameters(parameters),
+        'ProvisionedProductId': provisioned_product_id,
+        'RecordId': record_id,
+        'Outputs': outputs,
+        'UpdatedAt': time.time()
+    })
+    LOGGER.info(f"Cached outputs of {account_name} from record {record_id}")
+
+
+def get_cached_account_outputs(parameters: dict, client, store=None) -> dict:
+    """Returns the cached outputs of an account if it is AVAILABLE and unchanged since they were cached.
+    The requested parameters must match the cached ones and the Provisioned Product must not have had
+    another provisioning record since.
+
+    Args:
+        parameters (dict): Requested Service Catalog parameters
+        client (boto3.client): Boto3 Client for Service Catalog
+        store (StateStore, optional): State store, defaults to the 'account-outputs' namespace
+
+    Returns:
+        dict: Cached outputs or None when the account has to go through the State Machine
+    """
+    try:
+        store = store or get_state_store(NAMESPACE)
+        cached = store.get(parameters['AccountName'])
+        if not cached or cached['Fingerprint'] != fingerprint_parameters(parameters):
+            return None
+
+        detail = client.describe_provisioned_product(Id=cached['ProvisionedProductId'])['ProvisionedProductDetail']
+        if detail['Status'] != 'AVAILABLE' or detail.get('LastProvisioningRecordId') != cached['RecordId']:
+            LOGGER.info(f"{parameters['AccountName']} changed since its outputs were cached")
+            return None
+
+        return cached['Outputs']
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to use cached account outputs: {e}")
+        return None
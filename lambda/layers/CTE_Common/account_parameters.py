@@ -0,0 +1,110 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import re
+import json
+import hashlib
+import logging
+
+LOGGER = logging.getLogger()
+
+OU_FIELD = 'ManagedOrganizationalUnit'
+EMAIL_FIELDS = ('AccountEmail', 'SSOUserEmail')
+# Service Catalog parameters the Control Tower Account Factory product acts on
+CONTROL_TOWER_FIELDS = ('AccountName', 'AccountEmail', 'SSOUserEmail', 'SSOUserFirstName', 'SSOUserLastName',
+                        OU_FIELD)
+
+# "Dev (ou-abcd-12345678)" or "Root (r-abcd)"
+OU_WITH_ID = re.compile(r'^\s*(?P<name>.*?)\s*\((?P<id>(ou-[0-9a-z]+-[0-9a-z]+)|(r-[0-9a-z]+))\)\s*$')
+
+
+def parse_ou(value: str) -> dict:
+    """Parses the ManagedOrganizationalUnit parameter
+
+    Args:
+        value (str): 'Name (ou-id)', 'Name:ou-id' (tag form) or an OU path like 'Workloads:ent:Dev'
+
+    Returns:
+        dict: {'Name': str, 'Id': str or None, 'Path': str or None}
+    """
+    match = OU_WITH_ID.match(value)
+    if match:
+        return {'Name': match.group('name'), 'Id': match.group('id'), 'Path': None}
+
+    parts = [p.strip() for p in value.split(':')]
+    if len(parts) == 2 and re.match(r'^(ou-[0-9a-z]+-[0-9a-z]+|r-[0-9a-z]+)$', parts[1]):
+        return {'Name': parts[0], 'Id': parts[1], 'Path': None}
+
+    return {'Name': parts[-1], 'Id': None, 'Path': ':'.join(parts)}
+
+
+def canonicalize_parameters(parameters: dict, ou_resolver=None) -> dict:
+    """Builds the canonical form of the Service Catalog parameters. Values are trimmed, emails are compared
+    case-insensitive and the OU is compared by its id.
+
+    Args:
+        parameters (dict): Service Catalog parameters {"key1":"value1", "key2":"value2"}
+        ou_resolver (callable, optional): Resolves an OU path to its id, paths are compared as-is without it
+
+    Returns:
+        dict: Canonical parameters
+    """
+    canonical = {}
+    for key, value in (parameters or {}).items():
+        value = ' '.join(str(value).split())
+        if key in EMAIL_FIELDS:
+            value = value.lower()
+
+        elif key == OU_FIELD:
+            ou = parse_ou(value)
+            if not ou['Id'] and ou_resolver:
+                try:
+                    ou['Id'] = ou_resolver(ou['Path'])
+                except Exception as e:
+                    # A path that no longer resolves is compared as-is
+                    LOGGER.warning(f"Unable to resolve OU path {ou['Path']}: {e}")
+            value = ou['Id'] or f"path:{ou['Path'].lower()}"
+
+        canonical[key.strip()] = value
+
+    return canonical
+
+
+def diff_parameters(current: dict, desired: dict, ou_resolver=None) -> dict:
+    """Compares two sets of Service Catalog parameters, ignoring key order and formatting differences
+
+    Args:
+        current (dict): Parameters the account was provisioned with
+        desired (dict): Requested parameters
+        ou_resolver (callable, optional): Resolves an OU path to its id
+
+    Returns:
+        dict: {field: {'Current': value, 'Desired': value, 'ControlTower': bool}} for every changed field
+    """
+    current_canonical = canonicalize_parameters(current, ou_resolver=ou_resolver)
+    desired_canonical = canonicalize_parameters(desired, ou_resolver=ou_resolver)
+
+    diff = {}
+    for field in sorted(set(current_canonical) | set(desired_canonical)):
+        if current_canonical.get(field) != desired_canonical.get(field):
+            diff[field] = {
+                'Current': current_canonical.get(field),
+                'Desired': desired_canonical.get(field),
+                'ControlTower': field in CONTROL_TOWER_FIELDS
+            }
+
+    return diff
+
+
+def update_required(diff: dict) -> bool:
+    """Only a change of a field Control Tower acts on needs an update_provisioned_product"""
+    return any(change['ControlTower'] for change in diff.values())
+
+
+def fingerprint_parameters(parameters: dict, ou_resolver=None) -> str:
+    """Stable hash of the Control Tower relevant fields of the canonical parameters"""
+    canonical = canonicalize_parameters(parameters, ou_resolver=ou_resolver)
+    relevant = {k: v for k, v in canonical.items() if k in CONTROL_TOWER_FIELDS}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode('utf-8')).hexdigest()
@@ -0,0 +1,93 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import hashlib
+import logging
+from state_store import get_state_store
+
+LOGGER = logging.getLogger()
+
+# Long enough to cover the State Machine timeout and any CloudFormation re-send
+STATE_TTL_SECONDS = 3 * 24 * 3600
+# Documents that used to travel inline within the Step Function payload
+CLAIM_DOCUMENTS = ('CustomResourceEvent', 'ServiceCatalogEvent')
+
+
+def claim_key(cfn_event: dict) -> str:
+    """Builds the claim-check key for a CloudFormation Custom Resource request
+
+    Args:
+        cfn_event (dict): CloudFormation Custom Resource event
+
+    Returns:
+        str: Key of the state stored for the request
+    """
+    request_key = "|".join([cfn_event['StackId'], cfn_event['LogicalResourceId'], cfn_event['RequestId']])
+    return hashlib.sha256(request_key.encode('utf-8')).hexdigest()[:32]
+
+
+class ClaimCheck():
+    """Lazy handle on the state checked in for a Step Function execution. Only the 'StateRef' and hot status
+    fields travel through the State Machine, the full documents are loaded on first access."""
+
+    def __init__(self, payload: dict, store=None):
+        self.payload = payload
+        self._store = store
+        self._state = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_state_store('claims')
+        return self._store
+
+    @property
+    def state(self) -> dict:
+        if self._state is None:
+            if self.payload.get('StateRef'):
+                LOGGER.debug(f"Loading state for {self.payload['StateRef']}")
+                self._state = self.store.get(self.payload['StateRef']) or {}
+
+            # Payloads started before the claim-check still carry the documents inline
+            else:
+                self._state = {k: self.payload[k] for k in CLAIM_DOCUMENTS if k in self.payload}
+
+        return self._state
+
+    def get(self, name: str):
+        """Returns a checked in document (ie: 'CustomResourceEvent')"""
+        return self.state.get(name)
+
+    def check_in(self, **documents):
+        """Stores the documents with the rest of the execution state and sets the payload 'StateRef'"""
+        if not self.payload.get('StateRef'):
+            cfn_event = documents.get('CustomResourceEvent') or self.state['CustomResourceEvent']
+            self.payload['StateRef'] = claim_key(cfn_event)
+
+        self.state.update(documents)
+        self.store.put(self.payload['StateRef'], self.state, ttl=STATE_TTL_SECONDS)
+        for name in documents:
+            self.payload.pop(name, None)
+
+
+def resolve_custom_resource_event(data: dict, store=None) -> dict:
+    """Returns the CloudFormation Custom Resource event from a Custom Resource event, a claim reference
+    ({'StateRef': str}) or a Step Function state ({'Payload': {...}})
+
+    Args:
+        data (dict): Event, reference or Step Function state
+        store (StateStore, optional): State store, defaults to the 'claims' namespace
+
+    Returns:
+        dict: CloudFormation Custom Resource event
+    """
+    if data.get('ResponseURL'):
+        return data
+
+    payload = data.get('Payload', data)
+    if payload.get('CustomResourceEvent'):
+        return payload['CustomResourceEvent']
+
+    return ClaimCheck(payload, store=store).get('CustomResourceEvent')
@@ -0,0 +1,191 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import re
+import time
+import hashlib
+import logging
+from functools import wraps
+from state_store import get_state_store, ConditionFailedException
+
+LOGGER = logging.getLogger()
+
+NAMESPACE = 'requests'
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+# CloudFormation gives up on a custom resource after an hour, records outlive the retries
+RECORD_TTL = 2 * 24 * 3600
+# An IN_PROGRESS record older than this was abandoned (ie: function timeout) and can be taken over, a request
+#  answered by something else than the handler (ie: a State Machine execution) needs the lease of that instead
+LEASE_SECONDS = 900
+WAIT_POLL_SECONDS = 5
+# Kept to send the response once a duplicate stopped waiting
+RESPONSE_MARGIN_SECONDS = 30
+CLIENT_REQUEST_TOKEN_MAX_LEN = 128
+
+
+def request_key(event: dict) -> str:
+    """Identity of a Custom Resource request, the same for every delivery of it"""
+    key = "|".join([event['StackId'], event['LogicalResourceId'], event['RequestId'], event['RequestType']])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def client_request_token(event: dict, *scope) -> str:
+    """CloudFormation ClientRequestToken of the request, so a retried create_stack / update_stack of the same
+    request isn't run twice
+
+    Args:
+        event (dict): Custom Resource event
+        scope (str): What the call applies to (ie: account, region and stack name), a token is per stack
+
+    Returns:
+        str: Token matching [a-zA-Z][-a-zA-Z0-9]*
+    """
+    digest = hashlib.sha256("|".join((request_key(event),) + scope).encode('utf-8')).hexdigest()[:32]
+    token = f"cte-{event['RequestType']}-{digest}"
+    return re.sub(r'[^-a-zA-Z0-9]', '-', token)[:CLIENT_REQUEST_TOKEN_MAX_LEN]
+
+
+class RequestLedger():
+    """Records the requests being handled and the responses sent for them
+
+    Args:
+        store (StateStore, optional): Defaults to the 'requests' namespace of the state store
+        lease_seconds (int, optional): Age of an IN_PROGRESS record after which it is taken over
+    """
+
+    def __init__(self, store=None, lease_seconds: int = LEASE_SECONDS):
+        self.store = store or get_state_store(NAMESPACE)
+        self.lease_seconds = lease_seconds
+
+    def begin(self, event: dict) -> dict:
+        """Claims the request
+
+        Returns:
+            dict: None when the caller owns the request, otherwise the existing record
+                  ({'Status': IN_PROGRESS|COMPLETED, 'Response': dict})
+        """
+        key = request_key(event)
+        record = {'Status': IN_PROGRESS, 'StartedAt': time.time()}
+        for _ in range(2):
+            if self.store.put_if_absent(key, record, ttl=RECORD_TTL):
+                return None
+
+            item = self.store.get_item(key)
+            if item is None:
+                continue
+            existing = item['Data']
+            if existing['Status'] == IN_PROGRESS and time.time() - existing['StartedAt'] > self.lease_seconds:
+                try:
+                    self.store.put(key, record, ttl=RECORD_TTL, expected_version=item['Version'])
+                    LOGGER.warning(f"Taking over abandoned request {event['RequestId']}")
+                    return None
+
+                except ConditionFailedException:
+                    continue
+            return existing
+
+        return self.store.get(key)
+
+    def complete(self, event: dict, response: dict):
+        """Stores the response sent for the request"""
+        self.store.put(request_key(event), {'Status': COMPLETED, 'Response': response, 'CompletedAt': time.time()},
+                       ttl=RECORD_TTL)
+
+    def release(self, event: dict):
+        """Forgets a request that failed before sending a response, a re-sent request handles it again"""
+        self.store.delete(request_key(event))
+
+    def wait(self, event: dict, timeout: float, poll_seconds: float = WAIT_POLL_SECONDS) -> dict:
+        """Waits for another invocation to complete the request
+
+        Returns:
+            dict: The COMPLETED record, or None when it wasn't completed in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.store.get(request_key(event))
+            if record and record['Status'] == COMPLETED:
+                return record
+            if record is None or time.monotonic() + poll_seconds > deadline:
+                return None
+            time.sleep(poll_seconds)
+
+
+def record_responses(ledger: RequestLedger = None):
+    """Stores every response cfnresponse.send() delivers in the ledger, see idempotent_handler()"""
+    import cfnresponse
+
+    def _record(event, response_body):
+        try:
+            (ledger or RequestLedger()).complete(event, response_body)
+
+        except Exception as e:
+            LOGGER.warning(f"Unable to record the response of {event.get('RequestId')}: {e}")
+
+    if not any(getattr(x, 'cte_ledger', False) for x in cfnresponse.RESPONSE_HOOKS):
+        _record.cte_ledger = True
+        cfnresponse.RESPONSE_HOOKS.append(_record)
+
+
+def replay(event: dict, context, record: dict):
+    """Sends the stored response of a request again"""
+    import cfnresponse
+    response = record['Response']
+    LOGGER.info(f"Replaying the {response['Status']} response of request {event['RequestId']}")
+    cfnresponse.send(
+        event=event,
+        context=context,
+        responseStatus=response['Status'],
+        responseData=response.get('Data') or {},
+        physicalResourceId=response.get('PhysicalResourceId'),
+        noEcho=response.get('NoEcho', False),
+        reason=response.get('Reason')
+    )
+
+
+def idempotent_handler(attach: bool = True, lease_seconds: int = LEASE_SECONDS):
+    """Decorates a Custom Resource handler so a request delivered again doesn't redo the work
+
+    The first delivery of (StackId, LogicalResourceId, RequestId, RequestType) runs the handler. A duplicate of a
+    completed request replays the stored response at once. A duplicate of a request in progress waits for it
+    (attach=True) and replays its response, otherwise it returns and leaves the response to the first invocation.
+
+    Args:
+        attach (bool, optional): Wait for the request in progress, within the remaining time of the function
+        lease_seconds (int, optional): Time the response of a request can take, defaults to the function timeout
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            if 'RequestId' not in event:
+                return handler(event, context)
+
+            ledger = RequestLedger(lease_seconds=lease_seconds)
+            record_responses(ledger)
+            record = ledger.begin(event)
+            if record is None:
+                try:
+                    return handler(event, context)
+
+                except Exception:
+                    ledger.release(event)
+                    raise
+
+            if record['Status'] == IN_PROGRESS:
+                if not attach:
+                    LOGGER.info(f"Request {event['RequestId']} is already in progress")
+                    return None
+                LOGGER.info(f"Request {event['RequestId']} is already in progress, waiting for it")
+                remaining = context.get_remaining_time_in_millis() / 1000 - RESPONSE_MARGIN_SECONDS
+                record = ledger.wait(event, timeout=remaining)
+                if record is None:
+                    return None
+            replay(event, context, record)
+            return None
+
+        return wrapper
+    return decorator
@@ -0,0 +1,196 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import os
+import io
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from functools import wraps
+
+LOGGER = logging.getLogger()
+
+# Key of the per request flag in the event / Custom Resource properties / Step Function payload
+PROFILE_KEY = 'Profile'
+CPU = 'cpu'
+MEMORY = 'memory'
+MODES = {CPU, MEMORY}
+DEFAULT_TOP = 20
+# Frames kept per allocation, more frames cost more memory and time while tracing
+TRACEMALLOC_FRAMES = 1
+S3_PREFIX = 'profiles'
+
+
+def parse_modes(value) -> set:
+    """Profiles a flag turns on: true / all (every profile), cpu, memory or a list / comma separated string of them
+
+    Returns:
+        set: Subset of MODES, empty when profiling is off
+    """
+    if not value:
+        return set()
+    if isinstance(value, (list, tuple, set)):
+        items = [str(x).strip().lower() for x in value]
+    else:
+        items = [x.strip().lower() for x in str(value).split(',')]
+    if {'true', 'all'} & set(items):
+        return set(MODES)
+    return MODES & set(items)
+
+
+def _event_flag(event):
+    if not isinstance(event, dict):
+        return None
+    for carrier in (event, event.get('ResourceProperties'), event.get('Payload')):
+        if isinstance(carrier, dict) and carrier.get(PROFILE_KEY):
+            return carrier[PROFILE_KEY]
+    return None
+
+
+def profile_modes(event) -> set:
+    """Profiles of the invocation, CTE_PROFILE turns them on for every invocation of the function and the Profile
+    flag of the event for one request"""
+    return parse_modes(os.getenv('CTE_PROFILE')) | parse_modes(_event_flag(event))
+
+
+class Profile():
+    """cProfile and / or tracemalloc profile of one invocation
+
+    Only the thread calling start() is CPU profiled, the time spent waiting on worker threads shows up in the
+    function waiting on them. Allocations are traced in every thread.
+
+    Args:
+        name (str): Handler name, prefix of the files
+        request_id (str): Lambda request id, makes the file names unique
+        modes (set): CPU and / or MEMORY
+        top (int, optional): Entries of the logged summaries
+    """
+
+    def __init__(self, name: str, request_id: str, modes: set, top: int = DEFAULT_TOP):
+        self.name = name
+        self.request_id = request_id or str(int(time.time() * 1000))
+        self.modes = modes
+        self.top = top
+        self.profiler = None
+        self.baseline = None
+        self.snapshot = None
+        self.peak = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if MEMORY in self.modes:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            # python3.9+, the peak of python3.7 runtimes includes the allocations made before the invocation
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.baseline = tracemalloc.take_snapshot()
+        if CPU in self.modes:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.baseline is not None:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    def cpu_summary(self) -> str:
+        """Functions with the highest cumulative time"""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        return stream.getvalue()
+
+    def memory_summary(self) -> str:
+        """Lines with the largest allocations made during the invocation"""
+        lines = [f"Peak traced memory: {self.peak / 1024:.1f} KiB"]
+        for stat in self.snapshot.compare_to(self.baseline, 'lineno')[:self.top]:
+            lines.append(str(stat))
+        return "\n".join(lines)
+
+    def write(self, directory: str) -> list:
+        """Writes the pstats (.prof) and tracemalloc snapshot (.tracemalloc) files
+
+        Returns:
+            list: Paths of the written files
+        """
+        base = os.path.join(directory, f"{self.name}-{self.request_id}")
+        paths = []
+        if self.profiler:
+            self.profiler.dump_stats(f"{base}.prof")
+            paths.append(f"{base}.prof")
+        if self.snapshot is not None:
+            self.snapshot.dump(f"{base}.tracemalloc")
+            paths.append(f"{base}.tracemalloc")
+        return paths
+
+    def report(self, directory: str = None, bucket: str = None) -> list:
+        """Logs the summaries, writes the files and uploads them to the bucket, a failure is only logged
+
+        Returns:
+            list: Paths of the written files
+        """
+        if self.profiler:
+            LOGGER.info(f"CPU profile of {self.name} ({self.request_id}):\n{self.cpu_summary()}")
+        if self.snapshot is not None:
+            LOGGER.info(f"Memory profile of {self.name} ({self.request_id}):\n{self.memory_summary()}")
+
+        try:
+            paths = self.write(directory or os.getenv('CTE_PROFILE_DIR', '/tmp'))  # nosec B108 Lambda scratch space
+        except Exception as e:
+            LOGGER.warning(f"Unable to write the profile of {self.name}: {e}")
+            return []
+
+        if bucket:
+            try:
+                from rate_limiter import rate_limited_client
+                client = rate_limited_client('s3')
+                for path in paths:
+                    key = f"{S3_PREFIX}/{self.name}/{os.path.basename(path)}"
+                    client.upload_file(path, bucket, key)
+                    LOGGER.info(f"Uploaded profile s3://{bucket}/{key}")
+            except Exception as e:
+                LOGGER.warning(f"Unable to upload the profile of {self.name} to {bucket}: {e}")
+        return paths
+
+
+def profile_handler(name: str = None):
+    """Profiles a Lambda handler when CTE_PROFILE or the Profile flag of the event is set
+
+    The files are written to CTE_PROFILE_DIR (defaults to /tmp) and uploaded to CTE_PROFILE_BUCKET when set,
+    CTE_PROFILE_TOP sets the number of entries of the logged summaries. Without a flag the handler is called
+    directly.
+
+    Args:
+        name (str, optional): Name of the profile files, defaults to the handler module name
+    """
+
+    def profile_decorator(function):
+        @wraps(function)
+        def wrapper(event, context):
+            modes = profile_modes(event)
+            if not modes:
+                return function(event, context)
+
+            profile = Profile(name=name or function.__module__, request_id=getattr(context, 'aws_request_id', None),
+                              modes=modes, top=int(os.getenv('CTE_PROFILE_TOP', DEFAULT_TOP)))
+            profile.start()
+            try:
+                return function(event, context)
+
+            finally:
+                profile.stop()
+                profile.report(bucket=os.getenv('CTE_PROFILE_BUCKET'))
+
+        return wrapper
+
+    return profile_decorator
@@ -0,0 +1,220 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import os
+import json
+import time
+import logging
+import threading
+import boto3
+from botocore.config import Config
+
+LOGGER = logging.getLogger()
+
+# Error codes the services use to signal throttling (botocore standard retry list)
+THROTTLING_ERRORS = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException', 'TransactionInProgressException',
+    'RequestLimitExceeded', 'BandwidthLimitExceeded', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+    'EC2ThrottledException'
+}
+
+# Starting requests per second of a bucket, override with CTE_RATE_LIMITS='{"cloudformation": 4}'
+DEFAULT_RATE = 10.0
+SERVICE_RATES = {
+    'cloudformation': 5.0,
+    'organizations': 2.0,
+    'service-catalog': 5.0,
+    'sts': 10.0
+}
+RATE_LIMITS_ENV = 'CTE_RATE_LIMITS'
+MAX_ATTEMPTS = 10
+
+# AIMD: +INCREASE_STEP of the starting rate per successful call (up to MAX_RATE_FACTOR x),
+#  x DECREASE_FACTOR on throttling (at most once per DECREASE_WINDOW seconds)
+INCREASE_STEP = 0.05
+MAX_RATE_FACTOR = 2.0
+DECREASE_FACTOR = 0.5
+DECREASE_WINDOW = 1.0
+MIN_RATE = 0.5
+
+
+def client_config(max_attempts: int = MAX_ATTEMPTS, config: Config = None) -> Config:
+    """botocore Config with the standard retry mode, the request rate is left to the shared buckets (the adaptive
+    mode would throttle the client a second time)
+
+    Args:
+        max_attempts (int): Attempts including the first call
+        config (Config, optional): Config to merge the retry settings into
+
+    Returns:
+        Config: Client config
+    """
+    retries = Config(retries={'max_attempts': max_attempts, 'mode': 'standard'})
+    return config.merge(retries) if config else retries
+
+
+class TokenBucket():
+    """Thread safe token bucket whose rate follows the throttling of the service (AIMD)
+
+    Args:
+        rate (float): Starting requests per second
+        burst (float, optional): Bucket capacity, defaults to one second of requests
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.base_rate = rate
+        self.rate = rate
+        self.max_rate = rate * MAX_RATE_FACTOR
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.decreased_at = 0.0
+        self.stats = {'Acquired': 0, 'Waited': 0.0, 'Throttles': 0}
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """Takes a token, waiting for it when the bucket is empty. Waiting callers reserve their token so
+        they are served in arrival order.
+
+        Returns:
+            float: Seconds waited
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.stats['Acquired'] += 1
+            self.stats['Waited'] += wait
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.base_rate * INCREASE_STEP)
+
+    def on_throttle(self):
+        """Halves the rate, concurrent throttles of the same burst count once"""
+        with self._lock:
+            now = time.monotonic()
+            self.stats['Throttles'] += 1
+            if now - self.decreased_at >= DECREASE_WINDOW:
+                self._refill(now)
+                self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+                self.decreased_at = now
+                LOGGER.info(f"Throttled, request rate lowered to {self.rate:.2f}/s")
+
+
+class RateLimiter():
+    """Token buckets shared by every client of the process, one per (account, region, service)
+
+    Args:
+        rates (dict, optional): Starting requests per second per service id (ie: {'cloudformation': 5})
+        default_rate (float, optional): Starting rate of the other services
+    """
+
+    def __init__(self, rates: dict = None, default_rate: float = DEFAULT_RATE):
+        self.rates = dict(SERVICE_RATES, **(rates or {}))
+        self.default_rate = default_rate
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, account: str, region: str, service: str) -> TokenBucket:
+        key = (account or 'default', region or 'default', service)
+        with self._lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(rate=self.rates.get(service, self.default_rate))
+            return self.buckets[key]
+
+    def register(self, events, account: str = None, region: str = None):
+        """Adds the bucket handlers to a botocore event emitter (client.meta.events or session.events)
+
+        A token is taken before every attempt, including the retries, and every response adjusts the rate.
+        """
+
+        def _service(event_name: str) -> str:
+            return event_name.split('.')[1]
+
+        def _before_send(event_name, **kwargs):  # pylint: disable=unused-argument
+            self.bucket(account, region, _service(event_name)).acquire()
+
+        def _needs_retry(event_name, response=None, **kwargs):  # pylint: disable=unused-argument
+            if response is None:
+                return
+            bucket = self.bucket(account, region, _service(event_name))
+            if response[1].get('Error', {}).get('Code') in THROTTLING_ERRORS:
+                bucket.on_throttle()
+            elif response[0].status_code < 300:
+                bucket.on_success()
+
+        events.register_first('before-send.*.*', _before_send, unique_id='cte-rate-limit-before-send')
+        events.register('needs-retry.*.*', _needs_retry, unique_id='cte-rate-limit-needs-retry')
+
+
+_RATE_LIMITER = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process wide rate limiter, starting rates can be overridden with CTE_RATE_LIMITS"""
+    global _RATE_LIMITER  # pylint: disable=global-statement
+    if _RATE_LIMITER is None:
+        try:
+            rates = json.loads(os.getenv(RATE_LIMITS_ENV) or '{}')
+        except ValueError:
+            LOGGER.warning(f"Ignoring invalid {RATE_LIMITS_ENV}")
+            rates = {}
+        _RATE_LIMITER = RateLimiter(rates=rates)
+    return _RATE_LIMITER
+
+
+def set_rate_limiter(limiter: RateLimiter):
+    global _RATE_LIMITER  # pylint: disable=global-statement
+    _RATE_LIMITER = limiter
+
+
+def rate_limit_session(session, account: str = None, limiter: RateLimiter = None):
+    """Every client the boto3 session creates uses the standard retry mode and the shared buckets
+
+    Args:
+        session (boto3.Session): Session (ie: of an assumed role)
+        account (str, optional): Account the session calls into
+        limiter (RateLimiter, optional): Defaults to the process wide rate limiter
+
+    Returns:
+        boto3.Session: The session
+    """
+    botocore_session = getattr(session, '_session', None)
+    if botocore_session is None:
+        return session
+    botocore_session.set_default_client_config(client_config(config=botocore_session.get_default_client_config()))
+    (limiter or get_rate_limiter()).register(session.events, account=account, region=session.region_name)
+    return session
+
+
+def rate_limit_client(client, account: str = None, limiter: RateLimiter = None):
+    """Adds the shared buckets to an existing client, see client_config() for its retry mode"""
+    (limiter or get_rate_limiter()).register(client.meta.events, account=account, region=client.meta.region_name)
+    return client
+
+
+def rate_limited_client(service: str, account: str = None, **kwargs):
+    """boto3.client() with the standard retry mode and the shared buckets
+
+    Args:
+        service (str): Service name (ie: 'servicecatalog')
+        account (str, optional): Account the client calls into, defaults to the function account
+        kwargs: boto3.client() arguments
+
+    Returns:
+        :obj:`boto3.client`: Client
+    """
+    kwargs['config'] = client_config(config=kwargs.get('config'))
+    return rate_limit_client(boto3.client(service, **kwargs), account=account)
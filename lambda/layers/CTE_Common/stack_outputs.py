@@ -0,0 +1,157 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import os
+import time
+import logging
+from abc import ABC, abstractmethod
+from state_store import get_state_store
+
+LOGGER = logging.getLogger()
+
+NAMESPACE = 'stack-outputs'
+# Parameter Store path of the index (ie: /cte/outputs), when unset the outputs are kept in the state store
+OUTPUT_PARAMETER_PATH_ENV = 'CTE_OUTPUT_PARAMETER_PATH'
+
+
+def _stack_key(account: str, region: str, stack_name: str) -> str:
+    return f"{account}/{region}/{stack_name}"
+
+
+class OutputIndex(ABC):
+    """Outputs of the stacks deployed in the target accounts, readable from the function account
+
+    Outputs are indexed by account, region, stack and output key. Publishing the outputs of a stack only writes the
+    ones that changed since the last publication.
+    """
+
+    @abstractmethod
+    def get_outputs(self, account: str, region: str, stack_name: str) -> dict:
+        """Returns:
+            dict: {OutputKey: OutputValue}, empty when the stack wasn't published
+        """
+
+    def get_output(self, account: str, region: str, stack_name: str, output_key: str) -> str:
+        return self.get_outputs(account, region, stack_name).get(output_key)
+
+    @abstractmethod
+    def publish(self, account: str, region: str, stack_name: str, outputs: dict) -> int:
+        """Stores the outputs of a stack, outputs it no longer has are removed
+
+        Returns:
+            int: Number of outputs written or removed
+        """
+
+    @abstractmethod
+    def unpublish(self, account: str, region: str, stack_name: str):
+        """Removes the outputs of a deleted stack"""
+
+
+class StateStoreOutputIndex(OutputIndex):
+    """One state store document per stack, see state_store.get_state_store()"""
+
+    def __init__(self, store=None):
+        self.store = store or get_state_store(NAMESPACE)
+
+    def get_outputs(self, account: str, region: str, stack_name: str) -> dict:
+        item = self.store.get(_stack_key(account, region, stack_name))
+        return item['Outputs'] if item else {}
+
+    def publish(self, account: str, region: str, stack_name: str, outputs: dict) -> int:
+        key = _stack_key(account, region, stack_name)
+        current = self.get_outputs(account, region, stack_name)
+        changed = {k for k in set(current) | set(outputs) if current.get(k) != outputs.get(k)}
+        if changed:
+            self.store.put(key, {'Outputs': outputs, 'UpdatedAt': time.time()})
+            LOGGER.info(f"Published {len(changed)} outputs of {key}")
+        return len(changed)
+
+    def unpublish(self, account: str, region: str, stack_name: str):
+        self.store.delete(_stack_key(account, region, stack_name))
+
+
+class ParameterStoreOutputIndex(OutputIndex):
+    """One String parameter per output, <path>/<account>/<region>/<stack>/<OutputKey>
+
+    Args:
+        path (str): Root path of the index (ie: /cte/outputs)
+        client (boto3.client, optional): SSM client of the function account
+    """
+
+    def __init__(self, path: str, client=None):
+        self.path = path.rstrip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from rate_limiter import rate_limited_client
+            self._client = rate_limited_client('ssm')
+        return self._client
+
+    def _stack_path(self, account: str, region: str, stack_name: str) -> str:
+        return f"{self.path}/{_stack_key(account, region, stack_name)}"
+
+    def get_outputs(self, account: str, region: str, stack_name: str) -> dict:
+        stack_path = self._stack_path(account, region, stack_name)
+        outputs = {}
+        paginator = self.client.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path=stack_path, Recursive=False):
+            for parameter in page['Parameters']:
+                outputs[parameter['Name'][len(stack_path) + 1:]] = parameter['Value']
+        return outputs
+
+    def publish(self, account: str, region: str, stack_name: str, outputs: dict) -> int:
+        stack_path = self._stack_path(account, region, stack_name)
+        current = self.get_outputs(account, region, stack_name)
+        # A parameter can't be empty, an empty output is removed like an output the stack no longer has
+        empty = [key for key, value in outputs.items() if value in (None, '')]
+        if empty:
+            LOGGER.warning(f"Outputs {empty} of {stack_path} are empty, they aren't published")
+        outputs = {key: value for key, value in outputs.items() if key not in empty}
+
+        changed = 0
+        for key, value in outputs.items():
+            if current.get(key) == value:
+                continue
+            self.client.put_parameter(Name=f"{stack_path}/{key}", Value=str(value), Type='String', Overwrite=True)
+            changed += 1
+
+        removed = [f"{stack_path}/{x}" for x in current if x not in outputs]
+        # delete_parameters takes up to 10 names
+        for i in range(0, len(removed), 10):
+            self.client.delete_parameters(Names=removed[i:i + 10])
+        if changed or removed:
+            LOGGER.info(f"Published {changed} outputs of {stack_path}, removed {len(removed)}")
+        return changed + len(removed)
+
+    def unpublish(self, account: str, region: str, stack_name: str):
+        stack_path = self._stack_path(account, region, stack_name)
+        names = [f"{stack_path}/{x}" for x in self.get_outputs(account, region, stack_name)]
+        for i in range(0, len(names), 10):
+            self.client.delete_parameters(Names=names[i:i + 10])
+
+
+def get_output_index() -> OutputIndex:
+    """Returns the Parameter Store index when CTE_OUTPUT_PARAMETER_PATH is set, otherwise the state store one"""
+    path = os.getenv(OUTPUT_PARAMETER_PATH_ENV)
+    if path:
+        return ParameterStoreOutputIndex(path=path)
+    return StateStoreOutputIndex()
+
+
+def get_stack_outputs(account: str, region: str, stack_name: str, index: OutputIndex = None) -> dict:
+    """Outputs of a stack deployed in another account, read from the index of the function account
+
+    Args:
+        account (str): Account of the stack
+        region (str): Region of the stack
+        stack_name (str): Name of the stack
+        index (OutputIndex, optional): Defaults to get_output_index()
+
+    Returns:
+        dict: {OutputKey: OutputValue}
+    """
+    return (index or get_output_index()).get_outputs(account, region, stack_name)
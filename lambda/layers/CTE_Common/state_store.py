@@ -0,0 +1,228 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import os
+import json
+import time
+import logging
+import threading
+
+LOGGER = logging.getLogger()
+
+# DynamoDB table used by the deployed functions, when unset the local stand-in is used
+STATE_TABLE_ENV = 'CTE_STATE_TABLE'
+# Optional directory for the local stand-in so state survives between processes
+LOCAL_STATE_DIR_ENV = 'CTE_LOCAL_STATE_DIR'
+
+_DYNAMODB_CLIENT = None
+
+
+class ConditionFailedException(Exception):
+    pass
+
+
+class StateStore():
+    """Namespaced JSON document store. Each item carries a version that is used for optimistic concurrency."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    def get(self, key: str) -> dict:
+        """Returns the stored document or None"""
+        item = self.get_item(key)
+        return item['Data'] if item else None
+
+    def get_item(self, key: str) -> dict:
+        """Returns {'Data': dict, 'Version': int} or None"""
+        raise NotImplementedError
+
+    def put(self, key: str, data: dict, ttl: int = None, expected_version: int = None, if_absent: bool = False) -> int:
+        """Stores the document and returns the new version. Raises ConditionFailedException if the
+        expected_version or if_absent condition does not hold."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def put_if_absent(self, key: str, data: dict, ttl: int = None) -> bool:
+        """Stores the document only when the key does not exist yet
+
+        Returns:
+            bool: True if the document was stored
+        """
+        try:
+            self.put(key, data, ttl=ttl, if_absent=True)
+            return True
+
+        except ConditionFailedException:
+            return False
+
+    def update(self, key: str, update_fn, ttl: int = None, max_attempts: int = 10) -> dict:
+        """Read-modify-write of a document. update_fn receives the current document (or None) and
+        returns the new one. Retries when another writer changed the item in between.
+
+        Returns:
+            dict: The document that was stored
+        """
+        for _ in range(max_attempts):
+            item = self.get_item(key)
+            data = update_fn(item['Data'] if item else None)
+            try:
+                if item:
+                    self.put(key, data, ttl=ttl, expected_version=item['Version'])
+                else:
+                    self.put(key, data, ttl=ttl, if_absent=True)
+                return data
+
+            except ConditionFailedException:
+                LOGGER.debug(f"Concurrent update on {self.namespace}#{key}, retrying")
+
+        raise ConditionFailedException(f"Unable to update {self.namespace}#{key} after {max_attempts} attempts")
+
+
+class LocalStateStore(StateStore):
+    """Local stand-in for the DynamoDB store. Items are kept in memory for the whole process and
+    optionally written to CTE_LOCAL_STATE_DIR."""
+
+    _items = {}
+    _lock = threading.RLock()
+
+    def __init__(self, namespace: str, state_dir: str = None):
+        super().__init__(namespace)
+        self.state_dir = state_dir
+
+    def _path(self, key):
+        file_name = f"{self.namespace}#{key}".replace('/', '%2F')
+        return os.path.join(self.state_dir, f"{file_name}.json")
+
+    def _load(self, key):
+        pk = f"{self.namespace}#{key}"
+        item = self._items.get(pk)
+        if item is None and self.state_dir and os.path.exists(self._path(key)):
+            with open(self._path(key)) as f:
+                item = json.load(f)
+            self._items[pk] = item
+
+        if item and item.get('ExpiresAt') and item['ExpiresAt'] < time.time():
+            return None
+        return item
+
+    def get_item(self, key: str) -> dict:
+        with self._lock:
+            item = self._load(key)
+            if item:
+                return {'Data': json.loads(item['Data']), 'Version': item['Version']}
+
+    def put(self, key: str, data: dict, ttl: int = None, expected_version: int = None, if_absent: bool = False) -> int:
+        with self._lock:
+            item = self._load(key)
+            if if_absent and item:
+                raise ConditionFailedException(f"{self.namespace}#{key} already exists")
+            if expected_version is not None and (not item or item['Version'] != expected_version):
+                raise ConditionFailedException(f"{self.namespace}#{key} version changed")
+
+            version = (item['Version'] + 1) if item else 1
+            new_item = {'Data': json.dumps(data), 'Version': version}
+            if ttl:
+                new_item['ExpiresAt'] = int(time.time() + ttl)
+
+            self._items[f"{self.namespace}#{key}"] = new_item
+            if self.state_dir:
+                os.makedirs(self.state_dir, exist_ok=True)
+                with open(self._path(key), 'w') as f:
+                    json.dump(new_item, f)
+
+            return version
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(f"{self.namespace}#{key}", None)
+            if self.state_dir and os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+
+    @classmethod
+    def reset(cls):
+        """Clears all in-memory items, used between local runs and tests"""
+        with cls._lock:
+            cls._items.clear()
+
+
+class DynamoDBStateStore(StateStore):
+    """Stores documents in a DynamoDB table with a 'pk' (S) hash key and 'ExpiresAt' TTL attribute"""
+
+    def __init__(self, namespace: str, table_name: str, client=None):
+        super().__init__(namespace)
+        self.table_name = table_name
+        self.client = client or _dynamodb_client()
+
+    def _key(self, key):
+        return {'pk': {'S': f"{self.namespace}#{key}"}}
+
+    def get_item(self, key: str) -> dict:
+        response = self.client.get_item(TableName=self.table_name, Key=self._key(key), ConsistentRead=True)
+        item = response.get('Item')
+        if not item:
+            return None
+        if item.get('ExpiresAt') and int(item['ExpiresAt']['N']) < time.time():
+            return None
+        return {'Data': json.loads(item['Data']['S']), 'Version': int(item['Version']['N'])}
+
+    def put(self, key: str, data: dict, ttl: int = None, expected_version: int = None, if_absent: bool = False) -> int:
+        update_expression = 'SET #data = :data ADD #version :one'
+        values = {':data': {'S': json.dumps(data)}, ':one': {'N': '1'}}
+        if ttl:
+            update_expression = 'SET #data = :data, ExpiresAt = :expires ADD #version :one'
+            values[':expires'] = {'N': str(int(time.time() + ttl))}
+
+        args = {
+            'TableName': self.table_name,
+            'Key': self._key(key),
+            'UpdateExpression': update_expression,
+            'ExpressionAttributeNames': {'#data': 'Data', '#version': 'Version'},
+            'ExpressionAttributeValues': values,
+            'ReturnValues': 'UPDATED_NEW'
+        }
+        if if_absent:
+            args['ConditionExpression'] = 'attribute_not_exists(pk) OR ExpiresAt < :now'
+            values[':now'] = {'N': str(int(time.time()))}
+        elif expected_version is not None:
+            args['ConditionExpression'] = '#version = :expected'
+            values[':expected'] = {'N': str(expected_version)}
+
+        try:
+            response = self.client.update_item(**args)
+
+        except self.client.exceptions.ConditionalCheckFailedException as e:
+            raise ConditionFailedException(f"{self.namespace}#{key} condition failed") from e
+
+        return int(response['Attributes']['Version']['N'])
+
+    def delete(self, key: str):
+        self.client.delete_item(TableName=self.table_name, Key=self._key(key))
+
+
+def _dynamodb_client():
+    global _DYNAMODB_CLIENT
+    if _DYNAMODB_CLIENT is None:
+        import boto3
+        _DYNAMODB_CLIENT = boto3.client('dynamodb')
+    return _DYNAMODB_CLIENT
+
+
+def get_state_store(namespace: str) -> StateStore:
+    """Returns the state store for the namespace. Uses DynamoDB when CTE_STATE_TABLE is set,
+    otherwise the local stand-in.
+
+    Args:
+        namespace (str): Logical namespace for the items (ie: 'durations')
+
+    Returns:
+        StateStore: State store for the namespace
+    """
+    table_name = os.getenv(STATE_TABLE_ENV)
+    if table_name:
+        return DynamoDBStateStore(namespace=namespace, table_name=table_name)
+
+    return LocalStateStore(namespace=namespace, state_dir=os.getenv(LOCAL_STATE_DIR_ENV))
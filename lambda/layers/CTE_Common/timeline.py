@@ -0,0 +1,164 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import json
+import time
+import logging
+import datetime
+from state_store import get_state_store
+
+LOGGER = logging.getLogger()
+
+# Phase markers in the order an account goes through them
+QUEUED = 'Queued'
+ADMITTED = 'Admitted'
+PROVISIONING_STARTED = 'ProvisioningStarted'
+PROVISIONING_COMPLETED = 'ProvisioningCompleted'
+AVAILABLE_OBSERVED = 'AvailableObserved'
+SIGNALLED = 'Signalled'
+
+# Critical path segments: (name, from phase, to phase)
+SEGMENTS = (
+    ('QueueWait', QUEUED, ADMITTED),
+    ('Provisioning', PROVISIONING_STARTED, PROVISIONING_COMPLETED),
+    ('DetectionLag', PROVISIONING_COMPLETED, AVAILABLE_OBSERVED),
+    ('SignalLag', AVAILABLE_OBSERVED, SIGNALLED),
+    ('EndToEnd', QUEUED, SIGNALLED)
+)
+
+METRIC_NAMESPACE = 'CTE/AccountVending'
+MAX_SAMPLES = 500
+PERCENTILES = (50, 90, 99)
+
+
+def _timestamp(at) -> float:
+    if at is None:
+        return time.time()
+    if isinstance(at, datetime.datetime):
+        return at.timestamp()
+    try:
+        if isinstance(at, str):
+            return datetime.datetime.fromisoformat(at).timestamp()
+        return float(at)
+
+    # A marker is never worth failing the account for, fall back to now
+    except (TypeError, ValueError):
+        LOGGER.debug(f"Unable to parse timestamp {at!r}, using now")
+        return time.time()
+
+
+def mark(payload: dict, phase: str, at=None) -> dict:
+    """Adds a phase marker to the payload 'Timeline', the first marker of a phase is kept
+
+    Args:
+        payload (dict): Step Function payload (or State Machine input)
+        phase (str): Phase name (ie: timeline.ADMITTED)
+        at (float or datetime, optional): When the phase was reached, defaults to now
+
+    Returns:
+        dict: The payload timeline
+    """
+    timeline = payload.setdefault('Timeline', {})
+    if phase not in timeline:
+        timeline[phase] = round(_timestamp(at), 3)
+    return timeline
+
+
+def breakdown(timeline: dict) -> dict:
+    """Splits the timeline in critical path segments, segments with a missing marker are left out
+
+    Returns:
+        dict: {'QueueWait': seconds, 'Provisioning': seconds, 'DetectionLag': seconds, ...}
+    """
+    segments = {}
+    for name, start, end in SEGMENTS:
+        if start in (timeline or {}) and end in (timeline or {}):
+            segments[name] = round(max(0.0, timeline[end] - timeline[start]), 3)
+    return segments
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return round(ordered[low] + (ordered[high] - ordered[low]) * (rank - low), 3)
+
+
+def aggregate(segments: dict, store=None) -> dict:
+    """Adds the segments of a vended account to the history and returns the percentiles of every segment
+
+    Args:
+        segments (dict): Output of breakdown()
+        store (StateStore, optional): State store, defaults to the 'timelines' namespace
+
+    Returns:
+        dict: {'QueueWait': {'p50': seconds, 'p90': seconds, 'p99': seconds, 'Count': int}, ...}
+    """
+    store = store or get_state_store('timelines')
+
+    def _append(history):
+        history = history or {}
+        for name, seconds in segments.items():
+            history[name] = (history.get(name, []) + [seconds])[-MAX_SAMPLES:]
+        return history
+
+    history = store.update('breakdown', _append)
+    summary = {}
+    for name, samples in history.items():
+        summary[name] = {f"p{pct}": _percentile(samples, pct) for pct in PERCENTILES}
+        summary[name]['Count'] = len(samples)
+    return summary
+
+
+def emit_metrics(segments: dict, dimensions: dict):
+    """Prints the segments in the CloudWatch Embedded Metric Format, CloudWatch computes the percentiles"""
+    if not segments:
+        return
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRIC_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': 'Seconds'} for name in segments]
+            }]
+        }
+    }
+    record.update(dimensions)
+    record.update(segments)
+    print(json.dumps(record))
+
+
+def report(payload: dict, status: str, request_type: str = None) -> dict:
+    """Logs the final timeline of an account with its critical path breakdown. Successful accounts are added to
+    the segment history and emitted as CloudWatch metrics.
+
+    Args:
+        payload (dict): Step Function payload with the 'Timeline'
+        status (str): Account status signalled to CloudFormation
+        request_type (str, optional): Custom Resource request type (Create / Update)
+
+    Returns:
+        dict: Timeline record
+    """
+    segments = breakdown(payload.get('Timeline'))
+    record = {
+        'AccountName': payload.get('AccountName'),
+        'Status': status,
+        'RequestType': request_type,
+        'Timeline': payload.get('Timeline', {}),
+        'Breakdown': segments
+    }
+
+    if status == 'SUCCESS' and segments:
+        emit_metrics(segments, {'RequestType': request_type or 'Unknown'})
+        try:
+            record['Percentiles'] = aggregate(segments)
+        except Exception as e:
+            LOGGER.warning(f"Unable to aggregate the vending timeline: {e}")
+
+    LOGGER.info(f"Vending timeline:{json.dumps(record)}")
+    return record
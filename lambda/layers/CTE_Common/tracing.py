@@ -0,0 +1,398 @@
+# (c) 2022 Amazon Web Services, Inc. or its affiliates. All Rights Reserved.
+# This AWS Content is provided subject to the terms of the AWS Customer Agreement
+# available at http://aws.amazon.com/agreement or other written agreement between
+# Customer and Amazon Web Services, Inc.
+
+import os
+import re
+import json
+import time
+import logging
+import binascii
+import threading
+import contextlib
+import urllib.request
+from functools import wraps
+
+LOGGER = logging.getLogger()
+
+# Key of the W3C trace context in the Step Function payload / Custom Resource event
+TRACE_KEY = 'TraceContext'
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OpenTelemetry span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SCOPE_NAME = 'cte.tracing'
+MAX_BUFFERED_SPANS = 512
+
+
+def _random_id(size: int) -> str:
+    return binascii.hexlify(os.urandom(size)).decode()
+
+
+def _unix_nano(seconds: float) -> str:
+    return str(int(seconds * 1e9))
+
+
+def _attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes: dict) -> list:
+    return [{'key': k, 'value': _attribute_value(v)} for k, v in attributes.items() if v is not None]
+
+
+class SpanContext():
+    """Trace and parent span of a remote caller"""
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span():
+    """Timed operation of a trace, exported in the OpenTelemetry (OTLP/JSON) span format"""
+
+    def __init__(self, tracer, name: str, parent=None, kind: int = KIND_INTERNAL, attributes: dict = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else _random_id(16)
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = _random_id(8)
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = {}
+        self.start_time = time.time()
+        self.end_time = None
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(trace_id=self.trace_id, span_id=self.span_id)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: dict = None):
+        self.events.append({'name': name, 'time': time.time(), 'attributes': attributes or {}})
+
+    def record_exception(self, error: Exception):
+        self.add_event('exception', {'exception.type': type(error).__name__, 'exception.message': str(error)})
+        self.status = {'code': STATUS_ERROR, 'message': str(error)}
+
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        if not self.status:
+            self.status = {'code': STATUS_OK}
+        self.tracer.on_end(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': _unix_nano(self.start_time),
+            'endTimeUnixNano': _unix_nano(self.end_time or time.time()),
+            'attributes': _attributes(self.attributes),
+            'events': [{'name': x['name'], 'timeUnixNano': _unix_nano(x['time']),
+                        'attributes': _attributes(x['attributes'])} for x in self.events],
+            'status': self.status
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def otlp_payload(service_name: str, spans: list) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest of the spans"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attributes({'service.name': service_name})},
+        'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': [x.to_otlp() for x in spans]}]
+    }]}
+
+
+class InMemoryExporter():
+    """Keeps the finished spans, used by the tests and the local State Machine runs"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, service_name: str, spans: list):  # pylint: disable=unused-argument
+        self.spans.extend(spans)
+
+    def find(self, name: str) -> list:
+        return [x for x in self.spans if x.name == name]
+
+    def clear(self):
+        self.spans = []
+
+
+class ConsoleExporter():
+    """Prints the spans as one OTLP/JSON line, the log group can be shipped to any OpenTelemetry backend"""
+
+    def export(self, service_name: str, spans: list):
+        print(json.dumps(otlp_payload(service_name=service_name, spans=spans)))
+
+
+class OtlpHttpExporter():
+    """Posts the spans to an OTLP/HTTP collector (ie: the ADOT Lambda extension on localhost:4318)
+
+    Args:
+        endpoint (str): Collector base URL, /v1/traces is appended
+        timeout (float): Seconds, a slow collector must not slow the deployment down
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 2.0):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.timeout = timeout
+
+    def export(self, service_name: str, spans: list):
+        body = json.dumps(otlp_payload(service_name=service_name, spans=spans)).encode()
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()  # nosec B310 configured endpoint
+        except Exception as e:
+            LOGGER.warning(f"Unable to export {len(spans)} spans to {self.url}: {e}")
+
+
+def default_exporter():
+    """CTE_TRACE_EXPORTER=none (default) | console | otlp, otlp uses OTEL_EXPORTER_OTLP_ENDPOINT
+
+    The export is opt-in, the trace context is still propagated when the spans aren't exported.
+    """
+    exporter = os.getenv('CTE_TRACE_EXPORTER', 'none').lower()
+    if exporter == 'console':
+        return ConsoleExporter()
+    if exporter == 'otlp':
+        return OtlpHttpExporter(endpoint=os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318'))
+    return None
+
+
+class Tracer():
+    """Creates spans and exports them in batches
+
+    The active span is kept per thread, so spans started from worker threads need an explicit parent.
+
+    Args:
+        service_name (str): Resource service.name of the spans (ie: the Lambda function name)
+        exporter (object, optional): Any object with export(service_name, spans), None disables the export
+    """
+
+    def __init__(self, service_name: str, exporter=None):
+        self.service_name = service_name
+        self.exporter = exporter
+        self._finished = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def begin_span(self, name: str, parent=None, kind: int = KIND_INTERNAL, attributes: dict = None) -> Span:
+        """Starts a span without activating it, the caller ends it"""
+        return Span(self, name=name, parent=parent or self.current_span(), kind=kind, attributes=attributes)
+
+    @contextlib.contextmanager
+    def start_span(self, name: str, parent=None, kind: int = KIND_INTERNAL, attributes: dict = None):
+        """Starts the span as the active span of the thread, errors are recorded on the span and re-raised
+
+        Args:
+            name (str): Span name
+            parent (Span or SpanContext, optional): Defaults to the active span
+            kind (int, optional): KIND_INTERNAL, KIND_SERVER or KIND_CLIENT
+            attributes (dict, optional): Span attributes
+
+        Yields:
+            Span: The started span
+        """
+        span = self.begin_span(name=name, parent=parent, kind=kind, attributes=attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+
+        except Exception as e:
+            span.record_exception(e)
+            raise
+
+        finally:
+            stack.remove(span)
+            span.end()
+
+    def on_end(self, span: Span):
+        with self._lock:
+            self._finished.append(span)
+            full = len(self._finished) >= MAX_BUFFERED_SPANS
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._finished = self._finished, []
+        if spans and self.exporter:
+            try:
+                self.exporter.export(self.service_name, spans)
+            except Exception as e:
+                LOGGER.warning(f"Unable to export spans: {e}")
+
+
+_TRACER = None
+
+
+def get_tracer(service_name: str = None) -> Tracer:
+    """Process wide tracer, named after the Lambda function"""
+    global _TRACER  # pylint: disable=global-statement
+    if _TRACER is None:
+        _TRACER = Tracer(
+            service_name=service_name or os.getenv('AWS_LAMBDA_FUNCTION_NAME', 'cte'),
+            exporter=default_exporter()
+        )
+    return _TRACER
+
+
+def set_tracer(tracer: Tracer):
+    """Replaces the process wide tracer (ie: a Tracer with an InMemoryExporter in the tests)"""
+    global _TRACER  # pylint: disable=global-statement
+    _TRACER = tracer
+
+
+def inject(carrier: dict, span=None) -> dict:
+    """Adds the W3C traceparent of the span (defaults to the active span) to the payload or event
+
+    Returns:
+        dict: The carrier
+    """
+    span = span or get_tracer().current_span()
+    if span:
+        carrier[TRACE_KEY] = {'traceparent': span.context.traceparent}
+    return carrier
+
+
+def extract(carrier: dict):
+    """Reads the W3C traceparent of a payload or event
+
+    Returns:
+        SpanContext: Remote parent, None when the carrier has no (valid) trace context
+    """
+    traceparent = ((carrier or {}).get(TRACE_KEY) or {}).get('traceparent', '')
+    match = TRACEPARENT.match(traceparent)
+    if not match:
+        return None
+    return SpanContext(trace_id=match.group(1), span_id=match.group(2), sampled=match.group(3) == '01')
+
+
+def _event_parent(event: dict):
+    """The trace context is on the event (Custom Resource / State Machine input) or on the step Payload"""
+    if not isinstance(event, dict):
+        return None
+    return extract(event) or extract(event.get('Payload') if isinstance(event.get('Payload'), dict) else None) \
+        or extract(event.get('ResourceProperties'))
+
+
+def trace_handler(name: str = None):
+    """Wraps a Lambda handler in a server span continuing the trace of the event, spans are exported when
+    the handler returns
+
+    Args:
+        name (str, optional): Span name, defaults to the handler module name
+    """
+
+    def trace_decorator(function):
+        @wraps(function)
+        def wrapper(event, context):
+            tracer = get_tracer()
+            attributes = {'faas.name': getattr(context, 'function_name', None),
+                          'faas.invocation_id': getattr(context, 'aws_request_id', None)}
+            if isinstance(event, dict):
+                attributes['cloudformation.request_type'] = event.get('RequestType')
+                attributes['cloudformation.logical_resource_id'] = event.get('LogicalResourceId')
+            try:
+                with tracer.start_span(name or function.__module__, parent=_event_parent(event),
+                                       kind=KIND_SERVER, attributes=attributes):
+                    return function(event, context)
+            finally:
+                tracer.flush()
+
+        return wrapper
+
+    return trace_decorator
+
+
+def _before_call(model, context, **kwargs):  # pylint: disable=unused-argument
+    tracer = get_tracer()
+    parent = tracer.current_span()
+    if parent is None:
+        return
+    service = model.service_model.service_id.hyphenize()
+    context['cte_span'] = tracer.begin_span(name=f"{service}.{model.name}", parent=parent, kind=KIND_CLIENT,
+                                            attributes={'rpc.system': 'aws-api', 'rpc.service': service,
+                                                        'rpc.method': model.name})
+
+
+def _after_call(parsed, context, **kwargs):  # pylint: disable=unused-argument
+    span = context.pop('cte_span', None)
+    if span is None:
+        return
+    metadata = (parsed or {}).get('ResponseMetadata', {})
+    span.set_attribute('aws.request_id', metadata.get('RequestId'))
+    span.set_attribute('http.status_code', metadata.get('HTTPStatusCode'))
+    span.set_attribute('aws.retry_attempts', metadata.get('RetryAttempts'))
+    error = (parsed or {}).get('Error', {})
+    if error.get('Code'):
+        span.status = {'code': STATUS_ERROR, 'message': f"{error['Code']}: {error.get('Message', '')}"}
+    span.end()
+
+
+def _after_call_error(exception, context, **kwargs):  # pylint: disable=unused-argument
+    span = context.pop('cte_span', None)
+    if span is not None:
+        span.record_exception(exception)
+        span.end()
+
+
+def instrument(client_or_session):
+    """Adds a client span to every API call of a boto3 client, or of the clients a boto3 session creates
+
+    Objects without botocore events (ie: test doubles) are returned unchanged.
+
+    Returns:
+        The instrumented client or session
+    """
+    events = getattr(getattr(client_or_session, 'meta', None), 'events', None) \
+        or getattr(client_or_session, 'events', None)
+    if events is None or not hasattr(events, 'register'):
+        return client_or_session
+    # First, a before-call handler returning a response (ie: botocore Stubber) skips the ones after it
+    events.register_first('before-call.*.*', _before_call, unique_id='cte-tracing-before-call')
+    events.register('after-call.*.*', _after_call, unique_id='cte-tracing-after-call')
+    events.register('after-call-error.*.*', _after_call_error, unique_id='cte-tracing-after-call-error')
+    return client_or_session
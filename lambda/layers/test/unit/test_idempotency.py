@@ -0,0 +1,127 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import re
+import json
+import time
+import types
+import pytest
+import cfnresponse
+import idempotency
+from idempotency import RequestLedger, idempotent_handler, client_request_token
+
+
+@pytest.fixture()
+def cfn_event():
+    return {
+        'RequestType': 'Create',
+        'ResponseURL': 'https://cloudformation-custom-resource-response-useast1.s3.amazonaws.com/x',
+        'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/sdlc/abc',
+        'RequestId': 'a1b2c3d4',
+        'LogicalResourceId': 'rCrossAccount',
+        'ResourceProperties': {}
+    }
+
+
+@pytest.fixture()
+def responses(monkeypatch, mocker):
+    """Bodies PUT to the ResponseURL"""
+    monkeypatch.setattr(cfnresponse, 'RESPONSE_HOOKS', [])
+    http = mocker.patch.object(cfnresponse, 'http')
+    http.request.return_value.status = 200
+    return lambda: [json.loads(x[1]['body']) for x in http.request.call_args_list]
+
+
+def test_duplicate_of_a_completed_request_replays_its_response(cfn_event, responses, lambda_context):
+    calls = []
+
+    @idempotent_handler()
+    def handler(event, context):
+        calls.append(event)
+        cfnresponse.send(event, context, cfnresponse.SUCCESS, {'Bucket': 'cte-bucket'}, 'cte-bucket')
+
+    handler(cfn_event, lambda_context)
+    handler(dict(cfn_event), lambda_context)
+
+    assert len(calls) == 1
+    first, replayed = responses()
+    assert first == replayed
+    assert replayed['Data'] == {'Bucket': 'cte-bucket'}
+
+
+def test_rejected_response_is_not_recorded(cfn_event, responses, lambda_context):
+    cfnresponse.http.request.return_value.status = 403
+    RequestLedger().begin(cfn_event)
+    idempotency.record_responses()
+
+    cfnresponse.send(cfn_event, lambda_context, cfnresponse.SUCCESS, {})
+
+    assert RequestLedger().begin(cfn_event)['Status'] == idempotency.IN_PROGRESS
+
+
+def test_failed_hook_is_logged_apart_from_the_request(cfn_event, responses, caplog, lambda_context):
+    def _failing(event, response_body):
+        raise Exception('Throttling')
+    cfnresponse.RESPONSE_HOOKS.append(_failing)
+
+    cfnresponse.send(cfn_event, lambda_context, cfnresponse.SUCCESS, {})
+
+    assert 'response hook _failing failed: Throttling' in caplog.text
+    assert 'http.request' not in caplog.text
+
+
+def test_failed_handler_releases_the_request(cfn_event, responses, lambda_context):
+    calls = []
+
+    @idempotent_handler()
+    def handler(event, context):
+        calls.append(event)
+        raise Exception('Throttling')
+
+    for _ in range(2):
+        with pytest.raises(Exception, match='Throttling'):
+            handler(cfn_event, lambda_context)
+
+    assert len(calls) == 2
+    assert responses() == []
+
+
+def test_duplicate_of_a_request_in_progress(cfn_event, responses, lambda_context):
+    RequestLedger().begin(cfn_event)
+
+    assert idempotent_handler(attach=False)(lambda event, context: pytest.fail())(cfn_event, lambda_context) is None
+    assert responses() == []
+    # Not completed within the remaining time of the function
+    ledger = RequestLedger()
+    assert ledger.begin(cfn_event)['Status'] == idempotency.IN_PROGRESS
+    assert ledger.wait(cfn_event, timeout=0.2, poll_seconds=0.1) is None
+
+
+def test_abandoned_request_is_taken_over(cfn_event, monkeypatch):
+    ledger = RequestLedger(lease_seconds=900)
+    assert ledger.begin(cfn_event) is None
+
+    started = time.time()
+    monkeypatch.setattr(idempotency, 'time', types.SimpleNamespace(time=lambda: started + 901))
+    assert ledger.begin(cfn_event) is None
+    assert ledger.begin(cfn_event)['Status'] == idempotency.IN_PROGRESS
+
+
+def test_request_answered_by_an_execution_keeps_its_lease(cfn_event, responses, monkeypatch, lambda_context):
+    started = time.time()
+    handler = idempotent_handler(attach=False, lease_seconds=7200)(lambda event, context: None)
+    handler(cfn_event, lambda_context)
+
+    # Account vending takes longer than the function timeout, the re-sent request doesn't start it again
+    monkeypatch.setattr(idempotency, 'time', types.SimpleNamespace(time=lambda: started + 3600))
+    assert idempotent_handler(attach=False, lease_seconds=7200)(lambda event, context: pytest.fail())(
+        cfn_event, lambda_context) is None
+
+
+def test_client_request_token_is_stable_per_request_and_stack(cfn_event):
+    token = client_request_token(cfn_event, '111111111111', 'us-east-1', 'cte-bucket')
+
+    assert re.fullmatch(r'[a-zA-Z][-a-zA-Z0-9]*', token) and len(token) <= 128
+    assert token == client_request_token(dict(cfn_event), '111111111111', 'us-east-1', 'cte-bucket')
+    assert token != client_request_token(cfn_event, '111111111111', 'us-west-2', 'cte-bucket')
+    assert token != client_request_token(dict(cfn_event, RequestId='e5f6'), '111111111111', 'us-east-1', 'cte-bucket')
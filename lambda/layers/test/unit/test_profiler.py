@@ -0,0 +1,87 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import pstats
+import tracemalloc
+import pytest
+import profiler
+
+RESOURCE_COUNT = 500
+
+
+def large_event(**properties):
+    resources = {
+        f"rParameter{i}": {'Type': 'AWS::SSM::Parameter',
+                           'Properties': {'Name': f"/cte/parameter/{i}", 'Type': 'String',
+                                          'Value': {'&Fn::Sub': '${AWS::Region}-' + 'x' * 64}}}
+        for i in range(RESOURCE_COUNT)
+    }
+    return {
+        'RequestType': 'Create',
+        'RequestId': 'a1b2c3d4',
+        'LogicalResourceId': 'rParameters',
+        'ResourceProperties': dict(properties, Parameters={'Configuration': {
+            'StackName': 'cte-parameters',
+            'Resources': resources,
+            'Outputs': {'oParameter0': {'Value': {'&Ref': 'rParameter0'}}}
+        }})
+    }
+
+
+@pytest.fixture()
+def handler(monkeypatch, tmp_path):
+    """Profiled handler rendering the template of the event"""
+    monkeypatch.delenv('CTE_PROFILE', raising=False)
+    monkeypatch.setenv('CTE_PROFILE_DIR', str(tmp_path))
+
+    @profiler.profile_handler('CTE_Test')
+    def lambda_handler(event, context):
+        lambda_handler.templates.append(json.dumps(event['ResourceProperties']['Parameters']['Configuration']))
+
+    lambda_handler.templates = []
+    return lambda_handler
+
+
+def test_parse_modes():
+    assert profiler.parse_modes(None) == set()
+    assert profiler.parse_modes('false') == set()
+    assert profiler.parse_modes('true') == {profiler.CPU, profiler.MEMORY}
+    assert profiler.parse_modes('cpu') == {profiler.CPU}
+    assert profiler.parse_modes(['Memory', 'gpu']) == {profiler.MEMORY}
+
+
+def test_handler_is_not_profiled_without_a_flag(handler, tmp_path, lambda_context):
+    handler(large_event(), lambda_context)
+
+    assert list(tmp_path.iterdir()) == []
+    assert len(handler.templates) == 1
+
+
+def test_request_flag_profiles_a_large_template(handler, tmp_path, caplog, lambda_context):
+    caplog.set_level(logging.INFO)
+
+    handler(large_event(Profile='cpu,memory'), lambda_context)
+
+    prof = tmp_path / 'CTE_Test-f1e2d3c4.prof'
+    snapshot = tmp_path / 'CTE_Test-f1e2d3c4.tracemalloc'
+    assert prof.exists() and snapshot.exists()
+    assert any('lambda_handler' in x for x in pstats.Stats(str(prof)).stats)
+    assert tracemalloc.Snapshot.load(str(snapshot)).statistics('lineno')
+    assert not tracemalloc.is_tracing()
+    assert 'CPU profile of CTE_Test (f1e2d3c4)' in caplog.text
+    assert 'Peak traced memory' in caplog.text
+
+
+def test_env_var_profiles_every_invocation_and_uploads(handler, monkeypatch, mocker, tmp_path, lambda_context):
+    monkeypatch.setenv('CTE_PROFILE', 'cpu')
+    monkeypatch.setenv('CTE_PROFILE_BUCKET', 'cte-profiles')
+    client = mocker.patch('rate_limiter.rate_limited_client').return_value
+
+    handler(large_event(), lambda_context)
+
+    assert [x.name for x in tmp_path.iterdir()] == ['CTE_Test-f1e2d3c4.prof']
+    client.upload_file.assert_called_once_with(
+        str(tmp_path / 'CTE_Test-f1e2d3c4.prof'), 'cte-profiles',
+        'profiles/CTE_Test/CTE_Test-f1e2d3c4.prof')
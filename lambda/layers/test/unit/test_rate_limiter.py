@@ -0,0 +1,102 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import types
+import boto3
+import pytest
+import botocore.endpoint
+from botocore.awsrequest import AWSResponse
+import rate_limiter
+
+THROTTLED = b"""<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code><Message>Rate exceeded</Message></Error>
+<RequestId>1</RequestId></ErrorResponse>"""
+DESCRIBED = b"""<DescribeStacksResponse><DescribeStacksResult><Stacks/></DescribeStacksResult>
+<ResponseMetadata><RequestId>2</RequestId></ResponseMetadata></DescribeStacksResponse>"""
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+        # False: the callers wait at the same time (ie: one per thread)
+        self.advance = True
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        if self.advance:
+            self.now += seconds
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+@pytest.fixture()
+def limiter():
+    limiter = rate_limiter.RateLimiter()
+    rate_limiter.set_rate_limiter(limiter)
+    yield limiter
+    rate_limiter.set_rate_limiter(None)
+
+
+def test_bucket_waits_once_the_burst_is_spent(clock):
+    bucket = rate_limiter.TokenBucket(rate=5.0)
+    waits = [bucket.acquire() for _ in range(7)]
+
+    assert waits[:5] == [0.0] * 5
+    assert waits[5:] == pytest.approx([0.2, 0.2])
+
+
+def test_concurrent_callers_reserve_their_token(clock):
+    clock.advance = False
+    bucket = rate_limiter.TokenBucket(rate=5.0, burst=1)
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == pytest.approx([0.0, 0.2, 0.4, 0.6])
+    assert bucket.stats['Waited'] == pytest.approx(1.2)
+
+
+def test_rate_halves_on_throttling_and_recovers_additively(clock):
+    bucket = rate_limiter.TokenBucket(rate=4.0)
+    clock.now = 10.0
+    bucket.on_throttle()
+    bucket.on_throttle()
+    assert bucket.rate == 2.0 and bucket.stats['Throttles'] == 2
+
+    clock.now += rate_limiter.DECREASE_WINDOW
+    bucket.on_throttle()
+    assert bucket.rate == 1.0
+
+    for _ in range(200):
+        bucket.on_success()
+    assert bucket.rate == bucket.max_rate == 8.0
+
+
+def test_session_clients_share_the_account_bucket(limiter, monkeypatch):
+    # No retry backoff sleeps, the first attempt is throttled
+    monkeypatch.setattr(botocore.endpoint, 'time', types.SimpleNamespace(time=lambda: 0.0, sleep=lambda x: None))
+    responses = [(400, THROTTLED), (200, DESCRIBED), (200, DESCRIBED)]
+
+    def _send(request, **kwargs):
+        status, body = responses.pop(0)
+        return AWSResponse(request.url, status, {}, types.SimpleNamespace(stream=lambda: [body], read=lambda: body))
+
+    session = rate_limiter.rate_limit_session(
+        boto3.Session(aws_access_key_id='TEST_KEY_ID', aws_secret_access_key='TEST_SECRET', region_name='us-east-1'),
+        account='111111111111')
+    clients = [session.client('cloudformation'), session.client('cloudformation')]
+    for client in clients:
+        client.meta.events.register('before-send', _send)
+        client.describe_stacks()
+
+    bucket = limiter.bucket('111111111111', 'us-east-1', 'cloudformation')
+    assert clients[0].meta.config.retries['mode'] == 'standard'
+    assert list(limiter.buckets) == [('111111111111', 'us-east-1', 'cloudformation')]
+    assert bucket.stats['Acquired'] == 3 and bucket.stats['Throttles'] == 1
+    assert bucket.rate < bucket.base_rate
@@ -0,0 +1,79 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+import tracing
+
+
+def test_traceparent_round_trip(exporter):
+    with tracing.get_tracer().start_span('invoke') as span:
+        carrier = tracing.inject({})
+
+    parent = tracing.extract(carrier)
+    assert parent.trace_id == span.trace_id and parent.span_id == span.span_id
+    assert tracing.extract({'TraceContext': {'traceparent': 'not-a-traceparent'}}) is None
+    assert tracing.extract({}) is None
+
+
+def test_trace_continues_through_the_step_payload(exporter, lambda_context):
+    @tracing.trace_handler('invoke')
+    def invoke(event, context):
+        return tracing.inject(event)
+
+    @tracing.trace_handler('create_account')
+    def create_account(event, context):
+        return {'AccountName': 'cte-test', 'TraceContext': event.pop('TraceContext')}
+
+    @tracing.trace_handler('get_account_status')
+    def get_account_status(event, context):
+        with tracing.get_tracer().start_span('describe_account_status'):
+            return event['Payload']
+
+    get_account_status({'Payload': create_account(invoke({'RequestType': 'Create'}, lambda_context), lambda_context)},
+                       lambda_context)
+
+    spans = {x.name: x for x in exporter.spans}
+    assert len({x.trace_id for x in exporter.spans}) == 1
+    assert spans['create_account'].parent_id == spans['invoke'].span_id
+    assert spans['get_account_status'].parent_id == spans['invoke'].span_id
+    assert spans['describe_account_status'].parent_id == spans['get_account_status'].span_id
+    assert spans['invoke'].attributes['cloudformation.request_type'] == 'Create'
+
+
+def test_boto_calls_are_client_spans(exporter):
+    client = tracing.instrument(boto3.client('servicecatalog', region_name='us-east-1'))
+    stubber = Stubber(client)
+    stubber.add_response('describe_product', {'ProductViewSummary': {'Id': 'prod-1'}}, {'Name': 'AWS Control Tower'})
+    stubber.add_client_error('describe_record', service_error_code='ResourceNotFoundException',
+                             expected_params={'Id': 'rec-1'})
+
+    with stubber, tracing.get_tracer().start_span('phase') as phase:
+        client.describe_product(Name='AWS Control Tower')
+        with pytest.raises(client.exceptions.ResourceNotFoundException):
+            client.describe_record(Id='rec-1')
+    tracing.get_tracer().flush()
+
+    describe_product = exporter.find('service-catalog.DescribeProduct')[0]
+    assert describe_product.parent_id == phase.span_id
+    assert describe_product.kind == tracing.KIND_CLIENT
+    assert describe_product.status['code'] == tracing.STATUS_OK
+    assert exporter.find('service-catalog.DescribeRecord')[0].status['code'] == tracing.STATUS_ERROR
+
+
+def test_failed_handler_span_is_exported_as_otlp(exporter, lambda_context):
+    @tracing.trace_handler('create_account')
+    def create_account(event, context):
+        raise TypeError('OU not found')
+
+    with pytest.raises(TypeError):
+        create_account({}, lambda_context)
+
+    otlp = tracing.otlp_payload('CTE_Test', exporter.spans)['resourceSpans'][0]
+    span = otlp['scopeSpans'][0]['spans'][0]
+    assert otlp['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'CTE_Test'}}]
+    assert span['kind'] == tracing.KIND_SERVER and 'parentSpanId' not in span
+    assert span['status'] == {'code': tracing.STATUS_ERROR, 'message': 'OU not found'}
+    assert span['events'][0]['name'] == 'exception'
+    assert int(span['endTimeUnixNano']) >= int(span['startTimeUnixNano'])
@@ -0,0 +1,295 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import time
+import uuid
+import boto3
+from helper import get_ou_id, get_provisioning_artifact_id, build_service_catalog_parameters, \
+    create_update_provision_product
+from state_store import get_state_store
+from tracing import trace_handler, instrument
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+
+NAMESPACE = 'account-pool'
+POOL_KEY = 'pool'
+CLAIM_PREFIX = 'claim#'
+# Pool account states
+PROVISIONING = 'PROVISIONING'
+READY = 'READY'
+# Claim recorded in the pool until Service Catalog accepted the update of the pool account
+PENDING = 'PENDING'
+# Control Tower runs at most 5 account operations at a time
+CONTROL_TOWER_CONCURRENCY = 5
+METRIC_NAMESPACE = 'CTE/AccountPool'
+POOL_NAME_PREFIX = 'cte-pool-'
+
+
+def pool_size() -> int:
+    """CTE_POOL_SIZE accounts are kept ready, 0 (default) disables the warm pool"""
+    return int(os.getenv('CTE_POOL_SIZE', '0'))
+
+
+def emit_metrics(metrics: dict, unit: str = 'Count'):
+    """Prints the metrics in the CloudWatch Embedded Metric Format"""
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRIC_NAMESPACE,
+                'Dimensions': [[]],
+                'Metrics': [{'Name': name, 'Unit': unit} for name in metrics]
+            }]
+        }
+    }
+    record.update(metrics)
+    print(json.dumps(record))
+
+
+def get_claim(account_name: str, store=None) -> dict:
+    """Pool account serving the account, None when the account wasn't served from the pool
+
+    Returns:
+        dict: {'ProvisionedProductName', 'ProvisionedProductId', 'AccountEmail', 'ClaimedAt'}
+    """
+    store = store or get_state_store(NAMESPACE)
+    return store.get(f"{CLAIM_PREFIX}{account_name}")
+
+
+def apply_claim(parameters: dict, claim: dict) -> dict:
+    """Requested parameters as they can be applied to a pool account, Control Tower can't change the email of an
+    existing account so the pool email is kept"""
+    if not claim:
+        return parameters
+    return dict(parameters, AccountEmail=claim['AccountEmail'])
+
+
+def claim_account(account_name: str, parameters: dict, client: boto3.client, store=None) -> dict:
+    """Serves the account from the pool: takes the oldest READY pool account and updates it with the requested
+    parameters
+
+    The account is taken and its claim recorded as pending in the same update of the pool, the claim is confirmed
+    once Service Catalog accepted the update. A retry after a failure in between carries on with the pending claim.
+
+    Args:
+        account_name (str): Requested account name
+        parameters (dict): Requested Service Catalog parameters (OU already resolved)
+        client (boto3.client): Boto3 Client for Service Catalog
+        store (StateStore, optional): State store, defaults to the 'account-pool' namespace
+
+    Returns:
+        dict: update_provisioned_product response, None when no pool account is READY
+    """
+    store = store or get_state_store(NAMESPACE)
+    started = time.monotonic()
+    taken = {}
+
+    def _take(pool):
+        pool = pool or {'Accounts': {}}
+        pool.setdefault('Claims', {})
+        taken.clear()
+        if account_name in pool['Claims']:
+            taken.update(pool['Claims'][account_name], Resumed=True)
+            return pool
+        ready = sorted((x for x in pool['Accounts'].items() if x[1]['Status'] == READY), key=lambda x: x[1]['ReadyAt'])
+        if ready:
+            name, account = ready[0]
+            del pool['Accounts'][name]
+            pool['Claims'][account_name] = {'ProvisionedProductName': name, 'ProvisionedProductId': account['Id'],
+                                            'AccountEmail': account['AccountEmail'], 'ClaimedAt': time.time(),
+                                            'Status': PENDING, 'Account': account}
+            taken.update(pool['Claims'][account_name])
+        return pool
+
+    store.update(POOL_KEY, _take)
+    if not taken:
+        LOGGER.info(f"No pool account is ready for {account_name}")
+        emit_metrics({'PoolMisses': 1})
+        return None
+
+    claim = {x: taken[x] for x in ('ProvisionedProductName', 'ProvisionedProductId', 'AccountEmail', 'ClaimedAt')}
+    try:
+        product = os.getenv('SC_CT_PRODUCT_NAME')
+        response = create_update_provision_product(
+            product_name=product,
+            pp_name=claim['ProvisionedProductName'],
+            pa_id=get_provisioning_artifact_id(product_name=product, client=client),
+            client=client,
+            params=build_service_catalog_parameters(parameters=apply_claim(parameters, claim)),
+            update=True
+        )
+
+    except Exception as e:
+        # A resumed claim may have been updated before the failure, it stays pending for the next retry
+        if not taken.get('Resumed'):
+            LOGGER.error(f"Unable to claim {claim['ProvisionedProductName']} for {account_name}, returning it: {e}")
+            store.update(POOL_KEY, lambda pool: _return(pool, account_name, claim['ProvisionedProductName'],
+                                                        taken['Account']))
+        raise
+
+    store.put(f"{CLAIM_PREFIX}{account_name}", claim)
+    store.update(POOL_KEY, lambda pool: _confirm(pool, account_name))
+    LOGGER.warning(f"Serving {account_name} from pool account {claim['ProvisionedProductName']}, the account keeps "
+                   f"the pool email {claim['AccountEmail']} instead of {parameters.get('AccountEmail')}")
+    emit_metrics({'ClaimLatency': round(time.monotonic() - started, 3)}, unit='Seconds')
+    emit_metrics({'PoolClaims': 1})
+    request_refill()
+    return response
+
+
+def _return(pool: dict, account_name: str, name: str, account: dict) -> dict:
+    pool = _confirm(pool, account_name)
+    pool['Accounts'][name] = {x: account[x] for x in ('Id', 'Status', 'AccountEmail', 'CreatedAt', 'ReadyAt')}
+    return pool
+
+
+def _confirm(pool: dict, account_name: str) -> dict:
+    # Confirmed claims are kept under their own key, the pool only keeps the pending ones
+    pool = pool or {'Accounts': {}}
+    pool.get('Claims', {}).pop(account_name, None)
+    return pool
+
+
+def request_refill():
+    """Starts the refiller asynchronously (CTE_POOL_REFILL_FUNCTION), the schedule refills the pool otherwise"""
+    function_name = os.getenv('CTE_POOL_REFILL_FUNCTION')
+    if not function_name:
+        return
+    try:
+        rate_limited_client('lambda').invoke(FunctionName=function_name, InvocationType='Event', Payload=b'{}')
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to start the pool refill: {e}")
+
+
+def control_tower_operations(client: boto3.client) -> int:
+    """Control Tower account operations in progress, pool and requested accounts alike"""
+    count = 0
+    paginator = client.get_paginator("scan_provisioned_products")
+    for page in paginator.paginate(AccessLevelFilter={'Key': 'Account', 'Value': 'self'}):
+        count += sum(1 for x in page['ProvisionedProducts']
+                     if x['Type'] == 'CONTROL_TOWER_ACCOUNT' and x['Status'] == 'UNDER_CHANGE')
+    return count
+
+
+def pool_parameters(name: str) -> dict:
+    """Service Catalog parameters of a new pool account
+
+    CTE_POOL_OU is the staging OU path, CTE_POOL_EMAIL the account email with a {name} placeholder
+    (ie: aws+{name}@example.com) and CTE_POOL_SSO_EMAIL / CTE_POOL_SSO_FIRST_NAME / CTE_POOL_SSO_LAST_NAME the SSO
+    user of the pool accounts.
+    """
+    ou_path = os.environ['CTE_POOL_OU']
+    return {
+        'AccountName': name,
+        'AccountEmail': os.environ['CTE_POOL_EMAIL'].format(name=name),
+        'SSOUserEmail': os.environ['CTE_POOL_SSO_EMAIL'],
+        'SSOUserFirstName': os.getenv('CTE_POOL_SSO_FIRST_NAME', 'Account'),
+        'SSOUserLastName': os.getenv('CTE_POOL_SSO_LAST_NAME', 'Pool'),
+        'ManagedOrganizationalUnit': f"{ou_path.split(':')[-1]} ({get_ou_id(ou_path=ou_path)})"
+    }
+
+
+def refresh_pool(pool: dict, client: boto3.client) -> dict:
+    """Marks the provisioned pool accounts READY and drops the ones that failed
+
+    Returns:
+        dict: The pool
+    """
+    for name, account in list(pool['Accounts'].items()):
+        if account['Status'] != PROVISIONING:
+            continue
+        status = client.describe_provisioned_product(Id=account['Id'])['ProvisionedProductDetail']['Status']
+        if status == 'AVAILABLE':
+            account.update(Status=READY, ReadyAt=time.time())
+        elif status in ('ERROR', 'TAINTED'):
+            LOGGER.error(f"Pool account {name} failed to provision ({status}), it is left out of the pool")
+            del pool['Accounts'][name]
+    return pool
+
+
+def refill(client: boto3.client, size: int = None, max_refills: int = None, store=None) -> dict:
+    """Provisions pool accounts until the pool has `size` accounts READY or PROVISIONING, without taking more than
+    max_refills of the Control Tower operation slots left
+
+    Args:
+        client (boto3.client): Boto3 Client for Service Catalog
+        size (int, optional): Pool size, defaults to CTE_POOL_SIZE
+        max_refills (int, optional): Pool accounts provisioned at a time, defaults to CTE_POOL_REFILL_CONCURRENCY (2)
+            so requested accounts keep slots
+        store (StateStore, optional): State store, defaults to the 'account-pool' namespace
+
+    Returns:
+        dict: {'PoolReady', 'PoolProvisioning', 'RefillsStarted'}
+    """
+    store = store or get_state_store(NAMESPACE)
+    size = pool_size() if size is None else size
+    max_refills = int(os.getenv('CTE_POOL_REFILL_CONCURRENCY', '2')) if max_refills is None else max_refills
+
+    pool = store.get(POOL_KEY) or {'Accounts': {}}
+    known = set(pool['Accounts'])
+    pool = refresh_pool(pool, client=client)
+    dropped = known - set(pool['Accounts'])
+    provisioning = sum(1 for x in pool['Accounts'].values() if x['Status'] == PROVISIONING)
+    slots = min(CONTROL_TOWER_CONCURRENCY - control_tower_operations(client=client), max_refills - provisioning)
+    missing = size - len(pool['Accounts'])
+
+    started = {}
+    if missing > 0 and slots > 0:
+        product = os.getenv('SC_CT_PRODUCT_NAME')
+        pa_id = get_provisioning_artifact_id(product_name=product, client=client)
+        for _ in range(min(missing, slots)):
+            name = f"{POOL_NAME_PREFIX}{uuid.uuid4().hex[:12]}"
+            parameters = pool_parameters(name)
+            response = create_update_provision_product(
+                product_name=product, pp_name=name, pa_id=pa_id, client=client,
+                params=build_service_catalog_parameters(parameters=parameters)
+            )
+            started[name] = {'Id': response['RecordDetail']['ProvisionedProductId'], 'Status': PROVISIONING,
+                             'AccountEmail': parameters['AccountEmail'], 'CreatedAt': time.time(), 'ReadyAt': None}
+            LOGGER.info(f"Provisioning pool account {name}")
+
+    def _merge(current):
+        # Claims made since the pool was read win, refreshed statuses and new accounts are added
+        current = current or {'Accounts': {}}
+        for name, account in pool['Accounts'].items():
+            if name in current['Accounts']:
+                current['Accounts'][name] = account
+        for name in dropped:
+            current['Accounts'].pop(name, None)
+        current['Accounts'].update(started)
+        return current
+
+    pool = store.update(POOL_KEY, _merge)
+    metrics = {
+        'PoolReady': sum(1 for x in pool['Accounts'].values() if x['Status'] == READY),
+        'PoolProvisioning': sum(1 for x in pool['Accounts'].values() if x['Status'] == PROVISIONING),
+        'RefillsStarted': len(started)
+    }
+    emit_metrics(metrics)
+    return metrics
+
+
+@trace_handler('CTE_AccountPoolRefillFn')
+@profile_handler('CTE_AccountPoolRefillFn')
+def lambda_handler(event, context):
+    """This function keeps CTE_POOL_SIZE Control Tower accounts provisioned in the staging OU, it is scheduled and
+    started by CTE_CreateAccountFn after a claim.
+
+    Args:
+        event (dict): Scheduled event passed in by Amazon EventBridge, or {} when started after a claim
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: Pool metrics
+    """
+    print(json.dumps(event))
+    if not pool_size():
+        LOGGER.info("The warm account pool is disabled (CTE_POOL_SIZE)")
+        return None
+    return refill(client=instrument(rate_limited_client('servicecatalog')))
@@ -3,11 +3,16 @@
 
 import time
 import copy
+import functools
 import boto3
+from rate_limiter import rate_limited_client
 from custom_logger import CustomLogger
 
 LOGGER = CustomLogger().logger
 
+# Service Catalog parameters are kept as tags of the Provisioned Product
+SC_PARAMETER_PREFIX = 'SCParameter:'
+
 
 def scan_provisioned_products(search_pp_name, client: boto3.client, acc_fac_limit=5) -> dict:
     """Search for existing Service Catalog Provisioned Products
@@ -85,11 +90,7 @@ def build_service_catalog_parameters(parameters: dict) -> list:
     Returns:
         list: Parameters in the format of {"Key":"string", "Value":"string"}
     """
-    new_parameters = []
-    for key, value in parameters.items():
-        y = {'Key': key, 'Value': value}
-        new_parameters.append(y)
-    return new_parameters
+    return [{'Key': key, 'Value': value} for key, value in parameters.items()]
 
 
 def get_provisioning_artifact_id(product_name: str, client: boto3.client) -> str:
@@ -135,7 +136,7 @@ def create_update_provision_product(product_name: str, pp_name: str, pa_id: str,
     # Since there can't be any () within a tag, so we remove them and add a : between the OU name and OU id
     for d in param_tags:
         d.update((k, v.replace(' ', ':').replace('(', '').replace(')', '')) for k, v in d.items() if ("(" and ")") in v)
-        d.update((k, f"SCParameter:{v}") for k, v in d.items() if k == "Key")
+        d.update((k, f"{SC_PARAMETER_PREFIX}{v}") for k, v in d.items() if k == "Key")
 
     if tags:
         for x in param_tags:
@@ -166,9 +167,10 @@ def create_update_provision_product(product_name: str, pp_name: str, pa_id: str,
     return sc_response
 
 
+@functools.lru_cache(maxsize=256)
 def list_children_ous(parent_id: str):
     ou_info = {}
-    org = boto3.client('organizations')
+    org = rate_limited_client('organizations')
     LOGGER.info(f"Getting Children Ous for Id:{parent_id}")
     list_child_paginator = org.get_paginator('list_organizational_units_for_parent')
     for _org_info in list_child_paginator.paginate(ParentId=parent_id):
@@ -180,7 +182,9 @@ def list_children_ous(parent_id: str):
 
 
 def get_ou_id(ou_path: str):
-    """Gets OU IDs for a particular Organizational Unit
+    """Gets OU IDs for a particular Organizational Unit. Results are cached for the life of the
+    Lambda container since the same OU paths are resolved on every loop of the State Machine, a path missing from
+    the cache (e.g. an OU created since) clears it and is looked up again once.
 
     Args:
         ou_path (str): The Organizational Unit path to get OU ID
@@ -188,8 +192,20 @@ def get_ou_id(ou_path: str):
     Returns:
         str: AWS Organizations ID
     """
+    try:
+        return _get_ou_id(ou_path=ou_path)
+
+    except KeyError:
+        LOGGER.info(f"OU path {ou_path} not found in the cached OUs, refreshing them")
+        _get_ou_id.cache_clear()
+        list_children_ous.cache_clear()
+        return _get_ou_id(ou_path=ou_path)
+
+
+@functools.lru_cache(maxsize=128)
+def _get_ou_id(ou_path: str):
     LOGGER.info("Scanning AWS Organizations for OU Ids")
-    org = boto3.client('organizations')
+    org = rate_limited_client('organizations')
     root_id = org.list_roots()['Roots'][0]['Id']
     if ou_path == 'root':
         LOGGER.debug(f'root_id:{root_id}')
@@ -218,25 +234,42 @@ def tags_to_dict(tags):
     Returns:
         dict: of tags
     """
-    output = {}
-    if tags:
-        LOGGER.debug(f"Found tags: {tags}")
-        for tag in tags:
-            output[tag['Key']] = tag['Value']
-
-    return output
+    LOGGER.debug(f"Found tags: {tags}")
+    return {tag['Key']: tag['Value'] for tag in tags or []}
 
 
 def get_service_catalog_tags(prov_product_info: dict):
-    all_sc_pp_tags = tags_to_dict(tags=prov_product_info.get('Tags'))
+    """Service Catalog parameters recorded in the SCParameter:<key> tags of a Provisioned Product, the
+    "<ou name>:<ou id>" tag of the OU is turned back into "<ou name> (<ou id>)"
+
+    Args:
+        prov_product_info (dict): Provisioned Product with its Tags
 
+    Returns:
+        dict: {"key1":"value1", "key2":"value2"}
+    """
     req_sc_pp_tags = {}
-    for k, v in all_sc_pp_tags.items():
-        if ("SCParameter:" in k) and (":ou-" in v):
-            val = v.split(':')
-            req_sc_pp_tags.update({k.replace('SCParameter:', ''): f"{val[0]} ({val[1]})"})
+    for key, value in tags_to_dict(tags=prov_product_info.get('Tags')).items():
+        if not key.startswith(SC_PARAMETER_PREFIX):
+            continue
+        if ":ou-" in value:
+            val = value.split(':')
+            value = f"{val[0]} ({val[1]})"
+        req_sc_pp_tags[key[len(SC_PARAMETER_PREFIX):]] = value
+
+    return req_sc_pp_tags
+
 
-        elif "SCParameter:" in k:
-            req_sc_pp_tags.update({k.replace('SCParameter:', ''): v})
+def compact_sc_event(sc_event: dict) -> dict:
+    """Keeps the Service Catalog fields the State Machine and status checks need, the full record is
+    kept in the claim-check state store
 
-    return req_sc_pp_tags
\ No newline at end of file
+    Args:
+        sc_event (dict): Service Catalog Record Detail (new) or Provisioned Product (existing)
+
+    Returns:
+        dict: Hot status fields of the Service Catalog event
+    """
+    hot_fields = ('Id', 'LastProvisioningRecordId', 'ProvisionedProductId', 'RecordId', 'ProductId', 'RecordType',
+                  'Status')
+    return {k: v for k, v in sc_event.items() if k in hot_fields}
@@ -4,19 +4,27 @@
 import json
 import logging
 import os
-import boto3
 from helper import search_provisioned_products, build_service_catalog_parameters, create_update_provision_product, \
-    get_provisioning_artifact_id, get_ou_id, scan_provisioned_products
+    get_provisioning_artifact_id, get_ou_id, scan_provisioned_products, compact_sc_event, get_service_catalog_tags
+from claim_check import ClaimCheck
+from account_parameters import diff_parameters, update_required
+from account_pool import pool_size, get_claim, apply_claim, claim_account
+import timeline
+from tracing import get_tracer, trace_handler, instrument, TRACE_KEY
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
 from custom_logger import CustomLogger
 
 LOGGER = CustomLogger().logger
-SC_CLIENT = boto3.client('servicecatalog')
+SC_CLIENT = instrument(rate_limited_client('servicecatalog'))
 
 
 class OuNotFoundException(Exception):
     pass
 
 
+@trace_handler('CTE_CreateAccountFn')
+@profile_handler('CTE_CreateAccountFn')
 def lambda_handler(event, context):
     """This function will create/setup account(s) that will live within a Control Tower ecosystem.
 
@@ -30,26 +38,43 @@ def lambda_handler(event, context):
     print(json.dumps(event))
     payload = {}
     update_needed = None
+    cfn_event = None
 
     try:
         # If the Payload key is found this indicates that this isn't the first attempt that the
-        #  CreateAccount Function has been executed.
+        #  CreateAccount Function has been executed. The Custom Resource event is loaded from the claim-check.
         if event.get('Payload'):
-            resource_prop = event['Payload']['CustomResourceEvent']['ResourceProperties']
             payload = event['Payload']
+            claim = ClaimCheck(payload)
+            cfn_event = claim.get('CustomResourceEvent')
 
         else:
-            resource_prop = event['ResourceProperties']
-            payload['CustomResourceEvent'] = event
-
-        # See if there's a difference between new and old SC Parameters
-        if event.get('OldResourceProperties'):
+            cfn_event = event
+            payload['AccountName'] = event['ResourceProperties']['ServiceCatalogParameters']['AccountName']
+            # CTE_InvokeCreateAccountFn marks when the request was queued, it isn't part of the Custom Resource event
+            payload['Timeline'] = event.pop('Timeline', {})
+            timeline.mark(payload, timeline.QUEUED)
+            # The trace context travels with the payload through the remaining steps
+            if event.get(TRACE_KEY):
+                payload[TRACE_KEY] = event.pop(TRACE_KEY)
+            claim = ClaimCheck(payload)
+            claim.check_in(CustomResourceEvent=event)
+
+        resource_prop = cfn_event['ResourceProperties']
+
+        # See if there's a difference between new and old SC Parameters that Control Tower acts on
+        if cfn_event.get('OldResourceProperties'):
             logging.info("Found update call, identifying if Service Catalog needs to be updated")
-            new = json.dumps(event['ResourceProperties']['ServiceCatalogParameters'])
-            current = json.dumps(event['OldResourceProperties']['ServiceCatalogParameters'])
-            update_needed = (new != current)
+            diff = diff_parameters(
+                current=cfn_event['OldResourceProperties']['ServiceCatalogParameters'],
+                desired=cfn_event['ResourceProperties']['ServiceCatalogParameters'],
+                ou_resolver=get_ou_id
+            )
+            LOGGER.info(f"Service Catalog Parameter changes:{diff}")
+            update_needed = update_required(diff=diff)
 
-        sc_parameters = resource_prop['ServiceCatalogParameters']
+        # Copy, the claim-checked event keeps the parameters as requested (outputs cache fingerprint)
+        sc_parameters = dict(resource_prop['ServiceCatalogParameters'])
 
         # Update Account Information
         try:
@@ -61,16 +86,32 @@ def lambda_handler(event, context):
             raise OuNotFoundException(
                 f'The organizational unit was not found. OU Name: {ou_name}') from key_error
 
+        # An account served from the warm pool keeps the Provisioned Product name and email of the pool account
+        pool_claim = get_claim(account_name=sc_parameters['AccountName']) if pool_size() else None
+        pp_name = pool_claim['ProvisionedProductName'] if pool_claim else sc_parameters['AccountName']
+        sc_parameters = apply_claim(parameters=sc_parameters, claim=pool_claim)
+
         # Determine if there's already a Provisioned Product In-Progress
-        pp_in_progress = scan_provisioned_products(
-            search_pp_name=sc_parameters['AccountName'],
-            client=SC_CLIENT
-        )
+        tracer = get_tracer()
+        with tracer.start_span('find_provisioned_product', attributes={'account.name': sc_parameters['AccountName']}):
+            pp_in_progress = scan_provisioned_products(
+                search_pp_name=pp_name,
+                client=SC_CLIENT
+            )
+
+            provisioned_product = search_provisioned_products(
+                search_pp_name=pp_name,
+                client=SC_CLIENT
+            )
 
-        provisioned_product = search_provisioned_products(
-            search_pp_name=sc_parameters['AccountName'],
-            client=SC_CLIENT
-        )
+        # Skip the update if the live Provisioned Product already carries the requested parameters
+        #  (ie: a retried update or a template change that was already applied)
+        if update_needed and provisioned_product:
+            live_parameters = get_service_catalog_tags(prov_product_info=provisioned_product)
+            if live_parameters and not update_required(
+                    diff=diff_parameters(current=live_parameters, desired=sc_parameters, ou_resolver=get_ou_id)):
+                LOGGER.info(f"{sc_parameters['AccountName']} already matches the requested parameters")
+                update_needed = False
 
         # If not found, execute new SC Product Artifact deployment
         if (not pp_in_progress and not provisioned_product) or update_needed:
@@ -79,26 +120,53 @@ def lambda_handler(event, context):
             sc_params = build_service_catalog_parameters(
                 parameters=sc_parameters
             )
-            pa_id = get_provisioning_artifact_id(
-                product_name=product_name,
-                client=SC_CLIENT
-            )
-
-            pp_info = create_update_provision_product(
-                product_name=product_name,
-                pp_name=sc_parameters['AccountName'],
-                pa_id=pa_id,
-                client=SC_CLIENT,
-                params=sc_params,
-                update=update_needed,
-            )
-
+            with tracer.start_span('provision_product', attributes={'account.name': sc_parameters['AccountName'],
+                                                                     'account.update': bool(update_needed)}):
+                pp_info = None
+                # A new account is served from the warm pool when one is ready
+                if not update_needed and pool_size():
+                    pp_info = claim_account(account_name=sc_parameters['AccountName'], parameters=sc_parameters,
+                                            client=SC_CLIENT)
+                    if pp_info is not None:
+                        pool_claim = get_claim(account_name=sc_parameters['AccountName'])
+
+                if pp_info is None:
+                    pa_id = get_provisioning_artifact_id(
+                        product_name=product_name,
+                        client=SC_CLIENT
+                    )
+
+                    pp_info = create_update_provision_product(
+                        product_name=product_name,
+                        pp_name=pp_name,
+                        pa_id=pa_id,
+                        client=SC_CLIENT,
+                        params=sc_params,
+                        update=update_needed,
+                    )
+
+            timeline.mark(payload, timeline.ADMITTED)
+            timeline.mark(payload, timeline.PROVISIONING_STARTED, at=pp_info['RecordDetail']['CreatedTime'])
             del pp_info['RecordDetail']['CreatedTime']
             del pp_info['RecordDetail']['UpdatedTime']
-            payload['ServiceCatalogEvent'] = pp_info['RecordDetail']
+            sc_event = pp_info['RecordDetail']
 
         else:
-            payload['ServiceCatalogEvent'] = provisioned_product
+            sc_event = provisioned_product
+            if sc_event:
+                timeline.mark(payload, timeline.ADMITTED)
+
+        # Reported in the Custom Resource response, the account doesn't have the requested email
+        if pool_claim:
+            payload['PoolAccount'] = {'ProvisionedProductName': pool_claim['ProvisionedProductName'],
+                                      'AccountEmail': pool_claim['AccountEmail']}
+
+        # Only the hot status fields travel through the State Machine
+        if sc_event:
+            claim.check_in(ServiceCatalogEvent=sc_event)
+            payload['ServiceCatalogEvent'] = compact_sc_event(sc_event=sc_event)
+        else:
+            payload['ServiceCatalogEvent'] = None
 
         LOGGER.info(f"Payload:{payload}")
         return payload
@@ -106,7 +174,7 @@ def lambda_handler(event, context):
     # If function fails return a FAILED signal to CFN
     except Exception as e:
         error_output = {
-            "event": event,
+            "event": cfn_event or {"StateRef": payload.get('StateRef')},
             "status": "FAILED",
             "error": str(e)
         }
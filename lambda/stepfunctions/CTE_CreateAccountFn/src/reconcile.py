@@ -0,0 +1,130 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import boto3
+from helper import get_ou_id, get_service_catalog_tags
+from account_parameters import diff_parameters, update_required
+from rate_limiter import rate_limited_client
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+SC_CLIENT = rate_limited_client('servicecatalog')
+
+# Largest page search_provisioned_products returns, 500 accounts are read in 5 calls
+SEARCH_PAGE_SIZE = 100
+
+
+def load_live_products(client: boto3.client) -> dict:
+    """Reads every Control Tower account Provisioned Product, including its tags, in one paginated search
+
+    Args:
+        client (boto3.client): Boto3 Client for Service Catalog
+
+    Returns:
+        dict: {provisioned product name: {'Id', 'Status', 'Parameters'}}, Parameters are rebuilt from the
+            'SCParameter:' tags the account was provisioned with
+    """
+    products = {}
+    kwargs = {
+        'AccessLevelFilter': {
+            'Key': 'Account',
+            'Value': 'self'
+        },
+        'PageSize': SEARCH_PAGE_SIZE
+    }
+    # search_provisioned_products has no boto3 paginator
+    while True:
+        page = client.search_provisioned_products(**kwargs)
+        for x in page['ProvisionedProducts']:
+            if x.get('Type') == 'CONTROL_TOWER_ACCOUNT':
+                products[x['Name']] = {
+                    'Id': x['Id'],
+                    'Status': x['Status'],
+                    'Parameters': get_service_catalog_tags(prov_product_info=x)
+                }
+
+        if not page.get('NextPageToken'):
+            break
+        kwargs['PageToken'] = page['NextPageToken']
+
+    LOGGER.info(f"Found {len(products)} Control Tower accounts")
+    return products
+
+
+def plan_account(desired: dict, live: dict, ou_resolver=None) -> dict:
+    """Decides the Service Catalog operation needed for one account
+
+    Args:
+        desired (dict): Requested Service Catalog parameters {"key1":"value1", "key2":"value2"}
+        live (dict): Live Provisioned Product from load_live_products, None if it doesn't exist
+        ou_resolver (callable, optional): Resolves an OU path to its id
+
+    Returns:
+        dict: {'AccountName', 'Action': 'CREATE' | 'UPDATE' | 'NOOP', 'Changes': dict}
+    """
+    plan = {'AccountName': desired['AccountName'], 'Action': 'CREATE', 'Changes': {}}
+    if not live:
+        return plan
+
+    plan['ProvisionedProductId'] = live['Id']
+    plan['Status'] = live['Status']
+    # Accounts provisioned outside of this solution don't carry the parameter tags, nothing to compare
+    if not live['Parameters']:
+        plan['Action'] = 'UPDATE'
+        plan['Reason'] = 'No SCParameter tags found on the Provisioned Product'
+        return plan
+
+    plan['Changes'] = diff_parameters(current=live['Parameters'], desired=desired, ou_resolver=ou_resolver)
+    plan['Action'] = 'UPDATE' if update_required(diff=plan['Changes']) else 'NOOP'
+    return plan
+
+
+def build_plan(accounts: list, client: boto3.client, ou_resolver=get_ou_id) -> dict:
+    """Builds the create / update / no-op plan of many accounts without starting any Service Catalog operation
+
+    Args:
+        accounts (list): Requested Service Catalog parameters of every account
+        client (boto3.client): Boto3 Client for Service Catalog
+        ou_resolver (callable, optional): Resolves an OU path to its id
+
+    Returns:
+        dict: {'Plan': [per account plan], 'Summary': {'CREATE': int, 'UPDATE': int, 'NOOP': int, 'ERROR': int}}
+    """
+    live_products = load_live_products(client=client)
+
+    plan = []
+    summary = {'CREATE': 0, 'UPDATE': 0, 'NOOP': 0, 'ERROR': 0}
+    for desired in accounts:
+        try:
+            account_plan = plan_account(
+                desired=desired,
+                live=live_products.get(desired['AccountName']),
+                ou_resolver=ou_resolver
+            )
+        except Exception as e:
+            LOGGER.error(f"Unable to plan {desired.get('AccountName')}: {e}")
+            account_plan = {'AccountName': desired.get('AccountName'), 'Action': 'ERROR', 'Error': str(e)}
+
+        summary[account_plan['Action']] += 1
+        plan.append(account_plan)
+
+    LOGGER.info(f"Plan summary:{summary}")
+    return {'Plan': plan, 'Summary': summary}
+
+
+def lambda_handler(event, context):
+    """This function will plan the Service Catalog operations needed to bring many accounts to the requested
+    parameters. Nothing is provisioned or updated.
+
+    Args:
+        event (dict): {"Accounts": [{ServiceCatalogParameters}, ...]}, the Custom Resource form
+            {"ResourceProperties": {"ServiceCatalogParameters": {...}}} is accepted for every entry
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: Plan and summary from build_plan
+    """
+    print(json.dumps(event))
+    accounts = [x.get('ResourceProperties', {}).get('ServiceCatalogParameters', x) for x in event['Accounts']]
+    return build_plan(accounts=accounts, client=SC_CLIENT)
@@ -0,0 +1,68 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Times the Service Catalog parameter and tag helpers from 10 to 10k entries.
+
+    python lambda/stepfunctions/CTE_CreateAccountFn/test/benchmark/bench_tags.py --sizes 10 100 1000
+"""
+
+import os
+import sys
+import timeit
+import argparse
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', 'src'))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', '..', '..', 'layers', 'CTE_Common'))
+
+import helper  # noqa: E402 pylint: disable=wrong-import-position
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def fixtures(size: int) -> dict:
+    """`size` parameters and the tags of a Provisioned Product carrying them next to as many other tags"""
+    parameters = {f"Param{x}": f"value-{x}" for x in range(size)}
+    parameters['ManagedOrganizationalUnit'] = 'Dev (ou-abcd-11111111)'
+    tags = [{'Key': f"{helper.SC_PARAMETER_PREFIX}{x}", 'Value': f"value-{x}"} for x in range(size)]
+    tags += [{'Key': f"Team{x}", 'Value': 'platform'} for x in range(size)]
+    tags.append({'Key': f"{helper.SC_PARAMETER_PREFIX}ManagedOrganizationalUnit", 'Value': 'Dev:ou-abcd-11111111'})
+    return {'parameters': parameters, 'product': {'Tags': tags}}
+
+
+def run(sizes: list = None, repeat: int = 3) -> dict:
+    """Best time of each helper in milliseconds
+
+    Returns:
+        dict: {size: {helper: milliseconds}}
+    """
+    results = {}
+    for size in sizes or SIZES:
+        data = fixtures(size)
+        cases = {
+            'build_service_catalog_parameters': lambda: helper.build_service_catalog_parameters(data['parameters']),
+            'tags_to_dict': lambda: helper.tags_to_dict(data['product']['Tags']),
+            'get_service_catalog_tags': lambda: helper.get_service_catalog_tags(data['product']),
+        }
+        number = max(1, 10000 // size)
+        results[size] = {name: min(timeit.repeat(case, number=number, repeat=repeat)) / number * 1000
+                         for name, case in cases.items()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(sizes=args.sizes, repeat=args.repeat)
+    print(f"{'helper':<34}" + ''.join(f"{size:>12}" for size in results) + '  (ms)')
+    for name in results[args.sizes[0]]:
+        print(f"{name:<34}" + ''.join(f"{results[size][name]:>12.3f}" for size in results))
+
+
+if __name__ == '__main__':
+    main()
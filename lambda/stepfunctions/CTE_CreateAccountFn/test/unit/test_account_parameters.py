@@ -0,0 +1,60 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from account_parameters import parse_ou, diff_parameters, update_required, fingerprint_parameters
+
+OU_IDS = {'Workloads:ent:Dev': 'ou-abcd-11111111', 'Workloads:ent:Prod': 'ou-abcd-22222222'}
+
+
+@pytest.fixture()
+def parameters():
+    return {
+        'AccountName': 'ent-ct-team-dev',
+        'AccountEmail': 'Dev@Example.com',
+        'SSOUserFirstName': 'Jane',
+        'SSOUserLastName': 'Doe',
+        'SSOUserEmail': 'jane@example.com',
+        'ManagedOrganizationalUnit': 'Workloads:ent:Dev'
+    }
+
+
+def test_parse_ou_forms():
+    assert parse_ou('Dev (ou-abcd-11111111)') == {'Name': 'Dev', 'Id': 'ou-abcd-11111111', 'Path': None}
+    assert parse_ou('Dev:ou-abcd-11111111') == {'Name': 'Dev', 'Id': 'ou-abcd-11111111', 'Path': None}
+    assert parse_ou('Workloads:ent:Dev') == {'Name': 'Dev', 'Id': None, 'Path': 'Workloads:ent:Dev'}
+
+
+def test_equivalent_parameters_need_no_update(parameters):
+    desired = dict(reversed(list(parameters.items())))
+    desired['AccountEmail'] = ' dev@example.com '
+    desired['SSOUserFirstName'] = 'Jane '
+    desired['ManagedOrganizationalUnit'] = 'Dev (ou-abcd-11111111)'
+
+    diff = diff_parameters(current=parameters, desired=desired, ou_resolver=OU_IDS.get)
+    assert diff == {}
+    assert not update_required(diff)
+    assert fingerprint_parameters(parameters, OU_IDS.get) == fingerprint_parameters(desired, OU_IDS.get)
+
+
+def test_ou_move_is_an_update(parameters):
+    desired = dict(parameters, ManagedOrganizationalUnit='Workloads:ent:Prod')
+    diff = diff_parameters(current=parameters, desired=desired, ou_resolver=OU_IDS.get)
+    assert diff == {'ManagedOrganizationalUnit': {
+        'Current': 'ou-abcd-11111111', 'Desired': 'ou-abcd-22222222', 'ControlTower': True}}
+    assert update_required(diff)
+
+
+def test_non_control_tower_field_is_reported_but_no_update(parameters):
+    desired = dict(parameters, CostCenter='1234')
+    diff = diff_parameters(current=parameters, desired=desired, ou_resolver=OU_IDS.get)
+    assert diff['CostCenter']['ControlTower'] is False
+    assert not update_required(diff)
+
+
+def test_unresolvable_path_compared_as_is(parameters):
+    def resolver(path):
+        raise KeyError(path)
+
+    desired = dict(parameters, ManagedOrganizationalUnit='workloads:ent:dev')
+    assert diff_parameters(current=parameters, desired=desired, ou_resolver=resolver) == {}
@@ -0,0 +1,170 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from state_store import get_state_store
+
+
+class FakeServiceCatalog():
+    """Provisioned products by name, new products stay UNDER_CHANGE until they are marked"""
+
+    def __init__(self, operations=0):
+        self.products = {}
+        self.updates = []
+        self.fail_update = False
+        self.operations = operations
+
+    def describe_product(self, Name):
+        return {'ProvisioningArtifacts': [{'Id': 'pa-1', 'Guidance': 'DEFAULT'}]}
+
+    def provision_product(self, ProvisionedProductName, **kwargs):
+        pp_id = f"pp-{len(self.products)}"
+        self.products[ProvisionedProductName] = {'Id': pp_id, 'Status': 'UNDER_CHANGE'}
+        return {'RecordDetail': {'ProvisionedProductId': pp_id}}
+
+    def update_provisioned_product(self, ProvisionedProductName, ProvisioningParameters, **kwargs):
+        if self.fail_update:
+            raise Exception('InvalidStateException')
+        self.updates.append((ProvisionedProductName, {x['Key']: x['Value'] for x in ProvisioningParameters}))
+        return {'RecordDetail': {'ProvisionedProductId': self.products[ProvisionedProductName]['Id']}}
+
+    def describe_provisioned_product(self, Id):
+        status = next(x['Status'] for x in self.products.values() if x['Id'] == Id)
+        return {'ProvisionedProductDetail': {'Status': status}}
+
+    def get_paginator(self, name):
+        fake = self
+
+        class Paginator():
+            def paginate(self, **kwargs):
+                under_change = [x for x in fake.products.values() if x['Status'] == 'UNDER_CHANGE']
+                yield {'ProvisionedProducts': [{'Type': 'CONTROL_TOWER_ACCOUNT', 'Status': 'UNDER_CHANGE'}
+                                               for _ in range(fake.operations + len(under_change))]}
+        return Paginator()
+
+    def complete(self, status='AVAILABLE'):
+        for product in self.products.values():
+            product['Status'] = status
+
+
+def requested(name='ent-ct-team-1'):
+    return {'AccountName': name, 'AccountEmail': f'{name}@example.com', 'SSOUserFirstName': 'Jane',
+            'SSOUserLastName': 'Doe', 'SSOUserEmail': 'jane@example.com',
+            'ManagedOrganizationalUnit': 'Dev (ou-abcd-11111111)'}
+
+
+@pytest.fixture()
+def account_pool(load_src, monkeypatch):
+    module = load_src('account_pool')
+    monkeypatch.setattr(module, 'get_ou_id', lambda ou_path: 'ou-abcd-00000000')
+    monkeypatch.setenv('SC_CT_PRODUCT_NAME', 'AWS Control Tower Account Factory')
+    monkeypatch.setenv('CTE_POOL_SIZE', '3')
+    monkeypatch.setenv('CTE_POOL_OU', 'Staging')
+    monkeypatch.setenv('CTE_POOL_EMAIL', 'aws+{name}@example.com')
+    monkeypatch.setenv('CTE_POOL_SSO_EMAIL', 'pool@example.com')
+    monkeypatch.delenv('CTE_POOL_REFILL_FUNCTION', raising=False)
+    return module
+
+
+def test_refill_respects_control_tower_and_refill_concurrency(account_pool):
+    client = FakeServiceCatalog(operations=4)
+
+    # A single Control Tower slot is left
+    assert account_pool.refill(client=client)['RefillsStarted'] == 1
+
+    # Pool accounts provisioned at a time are capped by max_refills
+    client.operations = 0
+    assert account_pool.refill(client=client, max_refills=2)['RefillsStarted'] == 1
+
+    client.complete()
+    metrics = account_pool.refill(client=client, max_refills=2)
+    assert metrics == {'PoolReady': 2, 'PoolProvisioning': 1, 'RefillsStarted': 1}
+
+
+def test_claim_takes_the_oldest_ready_account(account_pool):
+    client = FakeServiceCatalog()
+    account_pool.refill(client=client, max_refills=3)
+    client.complete()
+    account_pool.refill(client=client)
+    pool = get_state_store(account_pool.NAMESPACE).get(account_pool.POOL_KEY)
+    oldest = min(pool['Accounts'], key=lambda x: pool['Accounts'][x]['ReadyAt'])
+
+    account_pool.claim_account(account_name='ent-ct-team-1', parameters=requested(), client=client)
+
+    name, parameters = client.updates[0]
+    assert name == oldest
+    # Control Tower can't change the email of an existing account
+    assert parameters['AccountEmail'] == f'aws+{oldest}@example.com'
+    assert parameters['ManagedOrganizationalUnit'] == 'Dev (ou-abcd-11111111)'
+    claim = account_pool.get_claim(account_name='ent-ct-team-1')
+    assert claim['ProvisionedProductName'] == oldest
+    assert oldest not in get_state_store(account_pool.NAMESPACE).get(account_pool.POOL_KEY)['Accounts']
+    assert account_pool.apply_claim(requested(), claim)['AccountEmail'] == claim['AccountEmail']
+
+
+def test_failed_claim_returns_the_account(account_pool):
+    client = FakeServiceCatalog()
+    account_pool.refill(client=client, size=1)
+    client.complete()
+    account_pool.refill(client=client, size=1)
+    client.fail_update = True
+
+    with pytest.raises(Exception):
+        account_pool.claim_account(account_name='ent-ct-team-1', parameters=requested(), client=client)
+
+    pool = get_state_store(account_pool.NAMESPACE).get(account_pool.POOL_KEY)
+    assert [x['Status'] for x in pool['Accounts'].values()] == ['READY']
+    assert account_pool.get_claim(account_name='ent-ct-team-1') is None
+
+
+def test_claim_misses_an_empty_pool(account_pool):
+    client = FakeServiceCatalog()
+    account_pool.refill(client=client, size=1)
+
+    # The pool account is still provisioning
+    assert account_pool.claim_account(account_name='ent-ct-team-1', parameters=requested(), client=client) is None
+    assert not client.updates
+
+
+def test_failed_pool_accounts_are_dropped(account_pool):
+    client = FakeServiceCatalog()
+    account_pool.refill(client=client, size=2)
+    client.complete(status='ERROR')
+
+    metrics = account_pool.refill(client=client, size=2, max_refills=0)
+
+    assert metrics == {'PoolReady': 0, 'PoolProvisioning': 0, 'RefillsStarted': 0}
+
+
+class Timeout(BaseException):
+    """A timed out Lambda Function stops without running its error handling"""
+
+
+def test_claim_is_pending_until_service_catalog_accepts_the_update(account_pool, monkeypatch):
+    client = FakeServiceCatalog()
+    account_pool.refill(client=client, size=2)
+    client.complete()
+    account_pool.refill(client=client, size=2)
+    store = get_state_store(account_pool.NAMESPACE)
+
+    def _crash(**kwargs):
+        # The account was taken and its claim recorded in the same update
+        pool = store.get(account_pool.POOL_KEY)
+        assert pool['Claims']['ent-ct-team-1']['Status'] == account_pool.PENDING
+        assert pool['Claims']['ent-ct-team-1']['ProvisionedProductName'] not in pool['Accounts']
+        raise Timeout()
+
+    monkeypatch.setattr(account_pool, 'get_provisioning_artifact_id', _crash)
+    with pytest.raises(Timeout):
+        account_pool.claim_account(account_name='ent-ct-team-1', parameters=requested(), client=client)
+    assert len(store.get(account_pool.POOL_KEY)['Accounts']) == 1
+
+    # The retry carries on with the pending claim, the pool ends up with a single account taken
+    monkeypatch.undo()
+    monkeypatch.setattr(account_pool, 'get_ou_id', lambda ou_path: 'ou-abcd-00000000')
+    account_pool.claim_account(account_name='ent-ct-team-1', parameters=requested(), client=client)
+
+    pool = store.get(account_pool.POOL_KEY)
+    claim = account_pool.get_claim(account_name='ent-ct-team-1')
+    assert len(pool['Accounts']) == 1 and not pool['Claims']
+    assert [x[0] for x in client.updates] == [claim['ProvisionedProductName']]
@@ -0,0 +1,56 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+
+class FakeOrganizations():
+    """OUs by parent id, counts the list_organizational_units_for_parent pages read"""
+
+    def __init__(self, ous):
+        self.ous = ous
+        self.reads = 0
+
+    def list_roots(self):
+        return {'Roots': [{'Id': 'r-1'}]}
+
+    def get_paginator(self, name):
+        fake = self
+
+        class Paginator():
+            def paginate(self, ParentId):
+                fake.reads += 1
+                yield {'OrganizationalUnits': [{'Name': name, 'Id': ou_id}
+                                               for name, ou_id in fake.ous.get(ParentId, {}).items()]}
+        return Paginator()
+
+
+@pytest.fixture()
+def org():
+    return FakeOrganizations({'r-1': {'Dev': 'ou-1'}})
+
+
+@pytest.fixture()
+def helper(load_src, monkeypatch, org):
+    module = load_src('helper')
+    monkeypatch.setattr(module, 'rate_limited_client', lambda service: org)
+    yield module
+    module._get_ou_id.cache_clear()
+    module.list_children_ous.cache_clear()
+
+
+def test_ou_ids_are_cached(helper, org):
+    assert helper.get_ou_id('Dev') == 'ou-1'
+    assert helper.get_ou_id('Dev') == 'ou-1'
+    assert org.reads == 1
+
+
+def test_ou_created_after_the_cache_is_found(helper, org):
+    helper.get_ou_id('Dev')
+
+    org.ous['r-1']['Sandbox'] = 'ou-2'
+    org.ous['ou-2'] = {'Team': 'ou-3'}
+
+    assert helper.get_ou_id('Sandbox:Team') == 'ou-3'
+    with pytest.raises(KeyError):
+        helper.get_ou_id('Missing')
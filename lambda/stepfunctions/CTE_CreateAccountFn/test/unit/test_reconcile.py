@@ -0,0 +1,69 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import boto3
+import pytest
+from botocore.stub import Stubber, ANY
+
+OU_IDS = {'Workloads:ent:Dev': 'ou-abcd-11111111', 'Workloads:ent:Prod': 'ou-abcd-22222222'}
+
+
+def desired_parameters(index, ou='Workloads:ent:Dev'):
+    return {
+        'AccountName': f'ent-ct-team-{index}',
+        'AccountEmail': f'team-{index}@example.com',
+        'SSOUserFirstName': 'Jane',
+        'SSOUserLastName': 'Doe',
+        'SSOUserEmail': 'jane@example.com',
+        'ManagedOrganizationalUnit': ou
+    }
+
+
+def live_product(index, ou_tag='Dev:ou-abcd-11111111'):
+    parameters = desired_parameters(index)
+    parameters['ManagedOrganizationalUnit'] = ou_tag
+    return {
+        'Name': f'ent-ct-team-{index}',
+        'Id': f'pp-{index}',
+        'Type': 'CONTROL_TOWER_ACCOUNT',
+        'Status': 'AVAILABLE',
+        'Tags': [{'Key': f'SCParameter:{k}', 'Value': v} for k, v in parameters.items()]
+    }
+
+
+@pytest.fixture()
+def reconcile(load_src):
+    return load_src('reconcile')
+
+
+def test_plan_500_accounts_with_bounded_calls(reconcile):
+    client = boto3.client('servicecatalog')
+    products = [live_product(i) for i in range(480)]
+    # Moved to another OU
+    products[7] = live_product(7, ou_tag='Prod:ou-abcd-22222222')
+
+    with Stubber(client) as stubber:
+        for page in range(0, len(products), reconcile.SEARCH_PAGE_SIZE):
+            response = {'ProvisionedProducts': products[page:page + reconcile.SEARCH_PAGE_SIZE]}
+            if page + reconcile.SEARCH_PAGE_SIZE < len(products):
+                response['NextPageToken'] = str(page)
+            stubber.add_response('search_provisioned_products', response, {
+                'AccessLevelFilter': ANY, 'PageSize': reconcile.SEARCH_PAGE_SIZE, **({'PageToken': ANY} if page else {})
+            })
+
+        accounts = [desired_parameters(i) for i in range(500)]
+        # Same account, different formatting
+        accounts[3]['AccountEmail'] = ' TEAM-3@example.com'
+        result = reconcile.build_plan(accounts=accounts, client=client, ou_resolver=OU_IDS.get)
+        stubber.assert_no_pending_responses()
+
+    assert result['Summary'] == {'CREATE': 20, 'UPDATE': 1, 'NOOP': 479, 'ERROR': 0}
+    assert result['Plan'][3]['Action'] == 'NOOP'
+    assert result['Plan'][7]['Changes'] == {'ManagedOrganizationalUnit': {
+        'Current': 'ou-abcd-22222222', 'Desired': 'ou-abcd-11111111', 'ControlTower': True}}
+
+
+def test_untagged_product_is_updated(reconcile):
+    live = {'Id': 'pp-1', 'Status': 'AVAILABLE', 'Parameters': {}}
+    plan = reconcile.plan_account(desired=desired_parameters(1), live=live, ou_resolver=OU_IDS.get)
+    assert plan['Action'] == 'UPDATE'
@@ -0,0 +1,142 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import bisect
+from state_store import get_state_store
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+
+# Percentile grid (0, 5, ..., 100) that is stored for every product / operation
+PERCENTILE_STEP = 5
+MAX_SAMPLES = 200
+MIN_SAMPLES = int(os.getenv('POLL_MIN_SAMPLES', '5'))
+
+# Fraction of the remaining completion probability we are willing to let pass between two polls
+POLL_TARGET_MASS = float(os.getenv('POLL_TARGET_MASS', '0.08'))
+MIN_WAIT_SECONDS = int(os.getenv('POLL_MIN_WAIT_SECONDS', '10'))
+MAX_WAIT_SECONDS = int(os.getenv('POLL_MAX_WAIT_SECONDS', '600'))
+# Used once the run is longer than anything seen before
+OVERDUE_WAIT_SECONDS = int(os.getenv('POLL_OVERDUE_WAIT_SECONDS', '60'))
+
+# Control Tower account creation usually takes 20-40 minutes, used until enough history is recorded
+PRIOR_ANCHORS = [(0, 900), (10, 1200), (50, 1800), (90, 2400), (100, 3600)]
+
+
+def build_percentiles(samples: list) -> list:
+    """Builds the percentile table (0, 5, ..., 100) for a list of durations using linear interpolation
+
+    Args:
+        samples (list): Durations in seconds
+
+    Returns:
+        list: Durations at every PERCENTILE_STEP percentile
+    """
+    ordered = sorted(samples)
+    table = []
+    for pct in range(0, 101, PERCENTILE_STEP):
+        rank = (len(ordered) - 1) * pct / 100
+        low = int(rank)
+        high = min(low + 1, len(ordered) - 1)
+        table.append(ordered[low] + (ordered[high] - ordered[low]) * (rank - low))
+
+    return table
+
+
+def prior_percentiles() -> list:
+    """Percentile table used when there is not enough history for a product / operation"""
+    table = []
+    for pct in range(0, 101, PERCENTILE_STEP):
+        for (p_low, d_low), (p_high, d_high) in zip(PRIOR_ANCHORS, PRIOR_ANCHORS[1:]):
+            if p_low <= pct <= p_high:
+                table.append(d_low + (d_high - d_low) * (pct - p_low) / (p_high - p_low))
+                break
+
+    return table
+
+
+def _history_key(product_id: str, operation: str) -> str:
+    return f"{product_id}#{operation}"
+
+
+def record_duration(product_id: str, operation: str, seconds: float, store=None) -> dict:
+    """Adds a completed duration to the history of a product / operation and refreshes its percentiles
+
+    Args:
+        product_id (str): Service Catalog Product Id
+        operation (str): Service Catalog Record Type (ie: PROVISION_PRODUCT)
+        seconds (float): Duration of the operation
+        store (StateStore, optional): State store, defaults to the 'durations' namespace
+
+    Returns:
+        dict: The stored history
+    """
+    store = store or get_state_store('durations')
+
+    def _append(history):
+        samples = (history or {}).get('Samples', [])
+        samples = (samples + [round(seconds, 1)])[-MAX_SAMPLES:]
+        return {'Samples': samples, 'Percentiles': build_percentiles(samples)}
+
+    LOGGER.info(f"Recording {operation} duration of {seconds:.0f}s for {product_id}")
+    return store.update(_history_key(product_id, operation), _append)
+
+
+def get_percentiles(product_id: str, operation: str, store=None) -> list:
+    """Returns the percentile table for a product / operation, or the prior when history is too short"""
+    try:
+        store = store or get_state_store('durations')
+        history = store.get(_history_key(product_id, operation))
+        if history and len(history.get('Samples', [])) >= MIN_SAMPLES:
+            return history['Percentiles']
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to read duration history, using prior: {e}")
+
+    return prior_percentiles()
+
+
+def _cdf(percentiles: list, elapsed: float) -> float:
+    """Fraction of historical runs that had completed after elapsed seconds"""
+    if elapsed <= percentiles[0]:
+        return 0.0
+    if elapsed >= percentiles[-1]:
+        return 1.0
+
+    idx = bisect.bisect_right(percentiles, elapsed)
+    low, high = percentiles[idx - 1], percentiles[idx]
+    fraction = (elapsed - low) / (high - low) if high > low else 1.0
+    return ((idx - 1) + fraction) * PERCENTILE_STEP / 100
+
+
+def _quantile(percentiles: list, prob: float) -> float:
+    rank = prob * 100 / PERCENTILE_STEP
+    low = int(rank)
+    high = min(low + 1, len(percentiles) - 1)
+    return percentiles[low] + (percentiles[high] - percentiles[low]) * (rank - low)
+
+
+def recommend_wait(elapsed: float, percentiles: list, target_mass: float = POLL_TARGET_MASS,
+                   min_wait: int = MIN_WAIT_SECONDS, max_wait: int = MAX_WAIT_SECONDS) -> int:
+    """Recommends the number of seconds to wait before the next status check. The wait is chosen so that
+    roughly target_mass of the runs still in progress are expected to finish before the next poll, which
+    makes polling sparse early in the run and dense around the expected finish.
+
+    Args:
+        elapsed (float): Seconds since the operation started
+        percentiles (list): Percentile table of historical durations
+        target_mass (float): Conditional completion probability between two polls
+        min_wait (int): Lower bound for the wait
+        max_wait (int): Upper bound for the wait
+
+    Returns:
+        int: Seconds to wait
+    """
+    done = _cdf(percentiles, elapsed)
+    if done >= 1.0:
+        return max(min_wait, min(max_wait, OVERDUE_WAIT_SECONDS))
+
+    next_check = _quantile(percentiles, done + target_mass * (1 - done))
+    wait = next_check - elapsed
+    return int(max(min_wait, min(max_wait, wait)))
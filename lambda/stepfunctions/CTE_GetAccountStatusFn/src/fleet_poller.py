@@ -0,0 +1,203 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import time
+import boto3
+from helper import describe_record_outputs, mark_available, cache_account_outputs
+from waiter_index import get_waiter, pop_waiter, complete_task, waiter_name, due_rechecks, clear_rechecks
+from state_store import get_state_store
+from tracing import get_tracer, trace_handler, instrument, extract
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+SC_CLIENT = instrument(rate_limited_client('servicecatalog'))
+SFN_CLIENT = instrument(rate_limited_client('stepfunctions'))
+
+SNAPSHOT_KEY = 'snapshot'
+TERMINAL_STATUS = ('AVAILABLE', 'TAINTED', 'ERROR')
+
+
+def scan_control_tower_products(client: boto3.client) -> dict:
+    """Scans all Control Tower account Provisioned Products in one paginated pass
+
+    Args:
+        client (boto3.client): Boto3 Client for Service Catalog
+
+    Returns:
+        dict: {provisioned product name: {'Id', 'Status', 'StatusMessage', 'LastRecordId'}}
+    """
+    products = {}
+    paginator = client.get_paginator("scan_provisioned_products")
+    for page in paginator.paginate(
+            AccessLevelFilter={
+                'Key': 'Account',
+                'Value': 'self'
+            }
+    ):
+        for x in page['ProvisionedProducts']:
+            if x['Type'] == 'CONTROL_TOWER_ACCOUNT':
+                products[x['Name']] = {
+                    'Id': x['Id'],
+                    'Status': x['Status'],
+                    'StatusMessage': x.get('StatusMessage', ''),
+                    'LastRecordId': x.get('LastRecordId')
+                }
+
+    return products
+
+
+def diff_snapshot(previous: dict, products: dict) -> tuple:
+    """Compares the scanned products with the previous snapshot
+
+    Only the in-flight products are kept in the snapshot so it stays small whatever the size of the fleet, a product
+    that finished is reported as changed once, by the poll that finds it out of flight.
+
+    Args:
+        previous (dict): Previous snapshot products {name: {'Status', 'LastRecordId', 'Version'}}
+        products (dict): Scanned products from scan_control_tower_products
+
+    Returns:
+        tuple: (new snapshot products, list of names whose status or record changed)
+    """
+    snapshot = {}
+    changed = []
+    for name, product in products.items():
+        before = previous.get(name)
+        if product['Status'] in TERMINAL_STATUS:
+            if before:
+                changed.append(name)
+            continue
+
+        version = before['Version'] if before else 0
+        if not before or (before['Status'], before['LastRecordId']) != (product['Status'], product['LastRecordId']):
+            version += 1
+            changed.append(name)
+
+        snapshot[name] = {
+            'Id': product['Id'],
+            'Status': product['Status'],
+            'LastRecordId': product['LastRecordId'],
+            'Version': version
+        }
+
+    return snapshot, changed
+
+
+def notify_waiter(name: str, product: dict, client: boto3.client, sfn_client: boto3.client) -> bool:
+    """Completes the task token waiting on the account, if there is one and the account finished
+
+    Returns:
+        bool: True if a waiting execution was notified
+    """
+    if product['Status'] not in TERMINAL_STATUS:
+        return False
+
+    waiter = pop_waiter(account_name=waiter_name(product_name=name))
+    if not waiter:
+        return False
+
+    payload = waiter['Payload']
+    # Linked to the trace of the waiting execution
+    with get_tracer().start_span('complete_waiter', parent=extract(payload),
+                                 attributes={'account.name': name, 'account.product_status': product['Status']}):
+        if product['Status'] == 'AVAILABLE':
+            outputs, record = describe_record_outputs(rec_id=product['LastRecordId'], client=client)
+            mark_available(payload=payload, record=record)
+            payload['Account'] = {"Status": "SUCCESS", "Outputs": outputs}
+            cache_account_outputs(payload=payload)
+        else:
+            payload['Account'] = {"Status": "FAILED", "ERROR": product['StatusMessage']}
+
+        complete_task(task_token=waiter['TaskToken'], payload=payload, client=sfn_client)
+    return True
+
+
+def recheck_due_waiters(products: dict, changed: list, now: float, sfn_client: boto3.client) -> int:
+    """Completes the tokens of the in-flight accounts whose recommended wait (RecheckAt) has passed with the
+    payload CTE_GetAccountStatusFn left with the waiter, the execution goes on to its next status check
+    with its Polling state
+
+    The due accounts are read from the recheck index, only their waiters are read.
+
+    Returns:
+        int: Number of waiting executions moved forward
+    """
+    rechecked = 0
+    handled = {}
+    for account_name, recheck in due_rechecks(now=now).items():
+        product = products.get(recheck['ProductName'])
+        # A product that just changed is checked by the next poll, a finished one by notify_waiter()
+        if product and product['Status'] not in TERMINAL_STATUS and recheck['ProductName'] in changed:
+            continue
+        handled[account_name] = recheck
+        if not product or product['Status'] in TERMINAL_STATUS:
+            continue
+
+        waiter = get_waiter(account_name=account_name)
+        if not waiter or not waiter.get('RecheckAt') or waiter['RecheckAt'] > now:
+            continue
+        if not pop_waiter(account_name=account_name):
+            continue
+
+        payload = waiter['Payload']
+        payload['Account'] = {'Status': product['Status'], 'WaitSeconds': 0}
+        complete_task(task_token=waiter['TaskToken'], payload=payload, client=sfn_client)
+        rechecked += 1
+
+    clear_rechecks(rechecks=handled)
+    return rechecked
+
+
+@trace_handler('CTE_FleetStatusPollerFn')
+@profile_handler('CTE_FleetStatusPollerFn')
+def lambda_handler(event, context):
+    """This function is scheduled to check every in-flight Control Tower account with one paginated scan and
+    notifies the waiting Step Function executions only when their account status moved.
+
+    Args:
+        event (dict): Scheduled event passed in by Amazon EventBridge
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: Poll statistics
+    """
+    print(json.dumps(event))
+    store = get_state_store('fleet-status')
+    products = scan_control_tower_products(client=SC_CLIENT)
+
+    previous = store.get(SNAPSHOT_KEY) or {'Products': {}}
+    snapshot, changed = diff_snapshot(previous=previous['Products'], products=products)
+
+    notified = 0
+    for name in changed:
+        try:
+            if notify_waiter(name=name, product=products[name], client=SC_CLIENT, sfn_client=SFN_CLIENT):
+                notified += 1
+
+        except Exception as e:
+            # The per execution safety net will pick the account up
+            LOGGER.error(f"Unable to notify waiter for {name}: {e}")
+
+    try:
+        rechecked = recheck_due_waiters(products=products, changed=changed, now=time.time(), sfn_client=SFN_CLIENT)
+
+    except Exception as e:
+        # The per execution safety net will pick the accounts up
+        LOGGER.error(f"Unable to recheck the waiting executions: {e}")
+        rechecked = 0
+
+    if changed or set(snapshot) != set(previous['Products']):
+        store.put(SNAPSHOT_KEY, {'Products': snapshot, 'UpdatedAt': time.time()})
+
+    stats = {
+        'Scanned': len(products),
+        'UnderChange': len([p for p in products.values() if p['Status'] == 'UNDER_CHANGE']),
+        'Changed': len(changed),
+        'Notified': notified,
+        'Rechecked': rechecked
+    }
+    LOGGER.info(f"Fleet poll:{stats}")
+    return stats
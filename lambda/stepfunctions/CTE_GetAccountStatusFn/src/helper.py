@@ -2,21 +2,30 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import datetime
 import boto3
+from claim_check import ClaimCheck
+from account_outputs import put_account_outputs
+from duration_model import record_duration
+from state_store import get_state_store
+import timeline
 from custom_logger import CustomLogger
 
 LOGGER = CustomLogger().logger
 
+# A completed record is only added once to the duration history, whichever path observed it first
+RECORDED_TTL_SECONDS = 86400
 
-def get_outputs_from_record(rec_id: str, client: boto3.client) -> dict:
-    """Get output parameters from AWS Service Catalog Record Id
+
+def describe_record_outputs(rec_id: str, client: boto3.client) -> tuple:
+    """Get output parameters and record details from AWS Service Catalog Record Id
 
     Args:
         rec_id (str): Service Catalog Record Id
         client (boto3.client): Boto3 Client for Service Catalog
 
     Returns:
-        dict: {'OutputKey1': 'OutputValue1'}
+        tuple: ({'OutputKey1': 'OutputValue1'}, RecordDetail with the CreatedTime / UpdatedTime of the record)
     """
     outputs = {}
     logging.info(f"Getting Outputs for Record Id:{rec_id}")
@@ -29,4 +38,158 @@ def get_outputs_from_record(rec_id: str, client: boto3.client) -> dict:
         else:
             outputs[_op["OutputKey"]] = "UNAVAILABLE"
 
-    return outputs
+    return outputs, re.get('RecordDetail', {})
+
+
+def get_outputs_from_record(rec_id: str, client: boto3.client) -> dict:
+    """Get output parameters from AWS Service Catalog Record Id
+
+    Args:
+        rec_id (str): Service Catalog Record Id
+        client (boto3.client): Boto3 Client for Service Catalog
+
+    Returns:
+        dict: {'OutputKey1': 'OutputValue1'}
+    """
+    return describe_record_outputs(rec_id=rec_id, client=client)[0]
+
+
+def _epoch(value) -> float:
+    return value.timestamp() if isinstance(value, datetime.datetime) else float(value)
+
+
+def record_completion(payload: dict, record: dict, store=None) -> bool:
+    """Adds the duration of the Service Catalog operation started by this execution to the duration model. The
+    duration is taken from the record (CreatedTime -> UpdatedTime), so it doesn't depend on which path (status
+    check, lifecycle event or fleet poller) observed the completion.
+
+    Args:
+        payload (dict): Step Function payload
+        record (dict): Service Catalog RecordDetail of the completed operation
+        store (StateStore, optional): State store, defaults to the 'durations' namespace
+
+    Returns:
+        bool: True if the duration was recorded
+    """
+    # Only operations this execution started have a meaningful duration
+    if not payload['ServiceCatalogEvent'].get('RecordType'):
+        return False
+    if not record.get('CreatedTime') or not record.get('UpdatedTime'):
+        return False
+
+    try:
+        store = store or get_state_store('durations')
+        if not store.put_if_absent(f"record#{record.get('RecordId')}", {'Recorded': True}, ttl=RECORDED_TTL_SECONDS):
+            return False
+        record_duration(
+            product_id=record.get('ProductId') or payload['ServiceCatalogEvent'].get('ProductId', 'UNKNOWN'),
+            operation=record.get('RecordType') or payload['ServiceCatalogEvent']['RecordType'],
+            seconds=_epoch(record['UpdatedTime']) - _epoch(record['CreatedTime']),
+            store=store
+        )
+        return True
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to record account duration: {e}")
+        return False
+
+
+def mark_available(payload: dict, record: dict = None):
+    """Adds the provisioning completed / first observed AVAILABLE markers to the payload timeline and records the
+    duration of the operation"""
+    record = record or {}
+    if record.get('UpdatedTime'):
+        timeline.mark(payload, timeline.PROVISIONING_COMPLETED, at=record['UpdatedTime'])
+    timeline.mark(payload, timeline.AVAILABLE_OBSERVED)
+    record_completion(payload=payload, record=record)
+
+
+def get_provisioned_product_ids(sc_event: dict) -> tuple:
+    """Get the Provisioned Product Id and Record Id from the Service Catalog event in the payload
+
+    Args:
+        sc_event (dict): Service Catalog Provisioned Product (existing) or Record Detail (new)
+
+    Returns:
+        tuple: (provisioned product id, record id), (None, None) if account creation hasn't started
+    """
+    # If existing provisioned product
+    if sc_event.get('Id'):
+        return sc_event['Id'], sc_event['LastProvisioningRecordId']
+
+    # If creating a new provisioned product
+    if sc_event.get('ProvisionedProductId'):
+        return sc_event['ProvisionedProductId'], sc_event['RecordId']
+
+    return None, None
+
+
+def describe_account_status(pp_id: str, rec_id: str, client: boto3.client, payload: dict = None) -> dict:
+    """Get the account status of a Control Tower Provisioned Product
+
+    Args:
+        pp_id (str): Service Catalog Provisioned Product Id
+        rec_id (str): Service Catalog Record Id
+        client (boto3.client): Boto3 Client for Service Catalog
+        payload (dict, optional): Step Function payload, its timeline is marked once the account is AVAILABLE
+
+    Returns:
+        dict: {'Status': 'SUCCESS', 'Outputs': {...}}, {'Status': 'FAILED', 'ERROR': str}
+            or {'Status': <Service Catalog status>} while the account is still changing
+    """
+    response = client.describe_provisioned_product(
+        Id=pp_id
+    )
+    logging.info(response)
+
+    status = response['ProvisionedProductDetail']['Status']
+    if status == 'AVAILABLE':
+        outputs, record = describe_record_outputs(
+            rec_id=rec_id,
+            client=client
+        )
+        if payload is not None:
+            mark_available(payload=payload, record=record)
+        return {"Status": "SUCCESS", "Outputs": outputs}
+
+    if status in ('TAINTED', 'ERROR'):
+        return {"Status": "FAILED", "ERROR": response['ProvisionedProductDetail']['StatusMessage']}
+
+    return {"Status": status}
+
+
+def get_account_name(payload: dict) -> str:
+    """Get the account name from the hot payload fields, only loading the claim-check state when missing
+
+    Args:
+        payload (dict): Step Function payload
+
+    Returns:
+        str: Account Name (Service Catalog Provisioned Product name)
+    """
+    if payload.get('AccountName'):
+        return payload['AccountName']
+
+    cfn_event = ClaimCheck(payload).get('CustomResourceEvent')
+    return cfn_event['ResourceProperties']['ServiceCatalogParameters']['AccountName']
+
+
+def cache_account_outputs(payload: dict):
+    """Keeps the outputs cache used by CTE_InvokeCreateAccountFn up to date once an account is AVAILABLE
+
+    Args:
+        payload (dict): Step Function payload with a SUCCESS 'Account' status
+    """
+    try:
+        cfn_event = ClaimCheck(payload).get('CustomResourceEvent')
+        provision_product_id, record_id = get_provisioned_product_ids(sc_event=payload['ServiceCatalogEvent'])
+        put_account_outputs(
+            account_name=get_account_name(payload=payload),
+            parameters=cfn_event['ResourceProperties']['ServiceCatalogParameters'],
+            provisioned_product_id=provision_product_id,
+            record_id=record_id,
+            outputs=payload['Account']['Outputs']
+        )
+
+    except Exception as e:
+        LOGGER.warning(f"Unable to cache account outputs: {e}")
@@ -0,0 +1,97 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+from helper import get_provisioned_product_ids, describe_account_status, cache_account_outputs
+from waiter_index import pop_waiter, complete_task
+from tracing import get_tracer, trace_handler, instrument, extract
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+SC_CLIENT = instrument(rate_limited_client('servicecatalog'))
+SFN_CLIENT = instrument(rate_limited_client('stepfunctions'))
+
+# Control Tower can emit the event slightly before Service Catalog marks the product AVAILABLE
+EVENT_RECHECK_SECONDS = int(os.getenv('EVENT_RECHECK_SECONDS', '10'))
+
+LIFECYCLE_EVENTS = {
+    'CreateManagedAccount': 'createManagedAccountStatus',
+    'UpdateManagedAccount': 'updateManagedAccountStatus'
+}
+
+
+def parse_lifecycle_event(event: dict) -> dict:
+    """Extracts the account details from a Control Tower lifecycle event
+
+    Args:
+        event (dict): EventBridge event (source: aws.controltower)
+
+    Returns:
+        dict: {'EventName', 'AccountName', 'AccountId', 'State', 'Message'} or None if not a supported event
+    """
+    detail = event.get('detail', {})
+    status_key = LIFECYCLE_EVENTS.get(detail.get('eventName'))
+    if not status_key:
+        return None
+
+    status = detail.get('serviceEventDetails', {}).get(status_key, {})
+    return {
+        'EventName': detail['eventName'],
+        'AccountName': status.get('account', {}).get('accountName'),
+        'AccountId': status.get('account', {}).get('accountId'),
+        'State': status.get('state'),
+        'Message': status.get('message')
+    }
+
+
+@trace_handler('CTE_AccountLifecycleEventFn')
+@profile_handler('CTE_AccountLifecycleEventFn')
+def lambda_handler(event, context):
+    """This function will complete the Step Function task waiting on an account when Control Tower emits the
+    CreateManagedAccount / UpdateManagedAccount lifecycle event.
+
+    Args:
+        event (dict): Control Tower lifecycle event passed in by Amazon EventBridge
+        context (object): Lambda Function context information
+
+    Returns:
+        dict: The account status the waiting task was completed with, None if nothing was waiting
+    """
+    print(json.dumps(event))
+    lifecycle = parse_lifecycle_event(event=event)
+    if not lifecycle or not lifecycle['AccountName']:
+        LOGGER.info("Not a supported Control Tower lifecycle event, skipping")
+        return None
+
+    waiter = pop_waiter(account_name=lifecycle['AccountName'])
+    if not waiter:
+        LOGGER.info(f"No execution waiting on account {lifecycle['AccountName']}")
+        return None
+
+    payload = waiter['Payload']
+    # Linked to the trace of the waiting execution, the lifecycle event itself carries none
+    with get_tracer().start_span('complete_waiter', parent=extract(payload),
+                                 attributes={'account.name': lifecycle['AccountName'],
+                                             'lifecycle.event': lifecycle['EventName']}):
+        if lifecycle['State'] == 'SUCCEEDED':
+            provision_product_id, record_id = get_provisioned_product_ids(sc_event=payload['ServiceCatalogEvent'])
+            payload['Account'] = describe_account_status(
+                pp_id=provision_product_id,
+                rec_id=record_id,
+                client=SC_CLIENT,
+                payload=payload
+            )
+            if payload['Account']['Status'] == 'SUCCESS':
+                cache_account_outputs(payload=payload)
+            elif payload['Account']['Status'] != 'FAILED':
+                payload['Account']['WaitSeconds'] = EVENT_RECHECK_SECONDS
+
+        else:
+            payload['Account'] = {"Status": "FAILED", "ERROR": lifecycle['Message'] or lifecycle['State']}
+
+        LOGGER.info(f"{lifecycle['EventName']} for {lifecycle['AccountName']}: {payload['Account']['Status']}")
+        complete_task(task_token=waiter['TaskToken'], payload=payload, client=SFN_CLIENT)
+    return payload['Account']
@@ -2,18 +2,31 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import json
-import logging
-import boto3
-from helper import get_outputs_from_record
+import time
+from helper import get_provisioned_product_ids, describe_account_status, get_account_name, \
+    cache_account_outputs
+from duration_model import get_percentiles, recommend_wait
+from waiter_index import register_waiter, get_waiter, pop_waiter, schedule_recheck, complete_task
+from tracing import get_tracer, trace_handler, instrument
+from profiler import profile_handler
+from rate_limiter import rate_limited_client
 from custom_logger import CustomLogger
 
 LOGGER = CustomLogger().logger
-SC_CLIENT = boto3.client('servicecatalog')
+SC_CLIENT = instrument(rate_limited_client('servicecatalog'))
+SFN_CLIENT = instrument(rate_limited_client('stepfunctions'))
 
 
+@trace_handler('CTE_GetAccountStatusFn')
+@profile_handler('CTE_GetAccountStatusFn')
 def lambda_handler(event, context):
     """This function will get the AWS Service Catalog / Control Tower Account Deployment status.
 
+    When the Step Function passes a TaskToken the function registers it in the waiter index and only
+    completes it right away if the account already finished. Otherwise the token is completed by the
+    Control Tower lifecycle event handler, or by the fleet poller with this payload once the recommended
+    wait has passed (the Step Function safety net timeout re-checks the status if both are missed).
+
     Args:
         event (dict): Event information passed in by the AWS Step Functions
         context (object): Lambda Function context information
@@ -24,48 +37,79 @@ def lambda_handler(event, context):
     """
     print(json.dumps(event))
     payload = event['Payload']
+    task_token = event.get('TaskToken')
 
     try:
-        # If existing provisioned product
-        if payload['ServiceCatalogEvent'].get('Id'):
-            provision_product_id = payload['ServiceCatalogEvent']['Id']
-            record_id = payload['ServiceCatalogEvent']['LastProvisioningRecordId']
-
-        # If creating a new provisioned product
-        elif payload['ServiceCatalogEvent'].get('ProvisionedProductId'):
-            provision_product_id = payload['ServiceCatalogEvent']['ProvisionedProductId']
-            record_id = payload['ServiceCatalogEvent']['RecordId']
+        account_name = get_account_name(payload=payload)
+        provision_product_id, record_id = get_provisioned_product_ids(sc_event=payload['ServiceCatalogEvent'])
 
         # Account Creation hasn't started
-        else:
-            LOGGER.info(f"Account creation has not started for {payload['CustomResourceEvent']['AccountName']}")
+        if not provision_product_id:
+            LOGGER.info(f"Account creation has not started for {account_name}")
             LOGGER.info("Attempting to create the account, again...")
             return
 
-        response = SC_CLIENT.describe_provisioned_product(
-            Id=provision_product_id
-        )
-        logging.info(response)
+        # The safety net timeout re-enters with the input of the timed out task, the polling state is kept
+        #  with the waiter that task registered
+        if task_token and not payload.get('Polling'):
+            previous = get_waiter(account_name=account_name)
+            if previous and previous['Payload'].get('Polling'):
+                payload['Polling'] = previous['Payload']['Polling']
+
+        # The first status check marks the start of the polling, the recommended waits are relative to it
+        now = time.time()
+        polling = payload.setdefault('Polling', {'StartedAt': now, 'Checks': 0})
+        polling['Checks'] += 1
+        elapsed = now - polling['StartedAt']
+
+        # Duration history is kept per product and per operation (create vs update)
+        product_id = payload['ServiceCatalogEvent'].get('ProductId', 'UNKNOWN')
+        operation = payload['ServiceCatalogEvent'].get('RecordType', 'IN_PROGRESS')
 
-        status = response['ProvisionedProductDetail']['Status']
-        if status == 'AVAILABLE':
-            outputs = get_outputs_from_record(
+        # Register before checking, so a lifecycle event arriving in between is not missed
+        if task_token:
+            register_waiter(account_name=account_name, task_token=task_token, payload=payload)
+
+        with get_tracer().start_span('describe_account_status', attributes={'account.name': account_name,
+                                                                            'account.checks': polling['Checks']}) as span:
+            payload['Account'] = describe_account_status(
+                pp_id=provision_product_id,
                 rec_id=record_id,
-                client=SC_CLIENT
+                client=SC_CLIENT,
+                payload=payload
+            )
+            span.set_attribute('account.status', payload['Account']['Status'])
+
+        # The duration model is fed by describe_account_status from the Service Catalog record times
+        if payload['Account']['Status'] == 'SUCCESS':
+            cache_account_outputs(payload=payload)
+
+        # UNDER_CHANGE / PLAN_IN_PROGRESS, the Wait state always needs a WaitSeconds value
+        elif payload['Account']['Status'] != 'FAILED':
+            wait_seconds = recommend_wait(
+                elapsed=elapsed,
+                percentiles=get_percentiles(product_id=product_id, operation=operation)
             )
-            payload['Account'] = {"Status": "SUCCESS", "Outputs": outputs}
+            LOGGER.info(f"Account status {payload['Account']['Status']} after {elapsed:.0f}s, "
+                        f"next check in {wait_seconds}s")
+            payload['Account']['WaitSeconds'] = wait_seconds
 
-        elif status in ('TAINTED', 'ERROR'):
-            payload['Account'] = {"Status": "FAILED", "ERROR": response['ProvisionedProductDetail']['StatusMessage']}
+            # Leave the token with the waiter index, the lifecycle event or the fleet poller (once the
+            #  recommended wait has passed) will complete it
+            if task_token:
+                schedule_recheck(account_name=account_name, task_token=task_token, payload=payload,
+                                 recheck_at=now + wait_seconds)
+                return payload
 
-        elif status == 'UNDER_CHANGE':
-            payload['Account'] = {"Status": "UNDER_CHANGE"}
+        if task_token and pop_waiter(account_name=account_name):
+            complete_task(task_token=task_token, payload=payload, client=SFN_CLIENT)
 
         return payload
 
     except Exception as e:
         error_output = {
-            "event": event['Payload']['CustomResourceEvent'],
+            "event": {"Payload": {"StateRef": payload.get('StateRef'),
+                                  "CustomResourceEvent": payload.get('CustomResourceEvent')}},
             "status": "FAILED",
             "error": str(e)
         }
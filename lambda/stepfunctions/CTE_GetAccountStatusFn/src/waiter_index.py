@@ -0,0 +1,160 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import time
+import boto3
+from state_store import get_state_store, ConditionFailedException
+from custom_logger import CustomLogger
+
+LOGGER = CustomLogger().logger
+
+# Waiters never outlive the State Machine timeout
+WAITER_TTL_SECONDS = 7200
+# Waiters are registered by account name, an account served from the warm pool keeps the Provisioned Product name
+#  of the pool account, product#<name> resolves it to the account name
+PRODUCT_PREFIX = 'product#'
+# Single document with the accounts due for a status check, {account name: {'RecheckAt', 'ProductName'}}
+RECHECKS_KEY = 'rechecks'
+
+
+def register_waiter(account_name: str, task_token: str, payload: dict, store=None):
+    """Registers a Step Function task token that is waiting for an account to complete
+
+    Args:
+        account_name (str): Control Tower account name (Service Catalog Provisioned Product name, see waiter_name())
+        task_token (str): Step Function task token
+        payload (dict): Step Function payload that will be returned when the token is completed
+        store (StateStore, optional): State store, defaults to the 'waiters' namespace
+    """
+    store = store or get_state_store('waiters')
+    LOGGER.info(f"Registering waiter for account {account_name}")
+    store.put(
+        account_name,
+        {'TaskToken': task_token, 'Payload': payload, 'RegisteredAt': time.time()},
+        ttl=WAITER_TTL_SECONDS
+    )
+    product_name = (payload.get('PoolAccount') or {}).get('ProvisionedProductName')
+    if product_name:
+        store.put(f"{PRODUCT_PREFIX}{product_name}", {'AccountName': account_name}, ttl=WAITER_TTL_SECONDS)
+
+
+def schedule_recheck(account_name: str, task_token: str, payload: dict, recheck_at: float, store=None) -> bool:
+    """Keeps the latest payload (Polling, recommended WaitSeconds) with the waiter and the time its status is due
+    for a check. CTE_FleetStatusPollerFn completes the token with that payload once recheck_at has passed, so the
+    recommended wait is honoured while the token stays open for the lifecycle event.
+
+    Args:
+        account_name (str): Control Tower account name (Service Catalog Provisioned Product name, see waiter_name())
+        task_token (str): Step Function task token the waiter was registered with
+        payload (dict): Step Function payload including the 'Account' status
+        recheck_at (float): Epoch seconds of the next status check
+        store (StateStore, optional): State store, defaults to the 'waiters' namespace
+
+    Returns:
+        bool: False if the waiter was already completed or replaced by a newer token
+    """
+    store = store or get_state_store('waiters')
+    item = store.get_item(account_name)
+    if not item or item['Data']['TaskToken'] != task_token:
+        return False
+
+    try:
+        store.put(account_name, dict(item['Data'], Payload=payload, RecheckAt=recheck_at), ttl=WAITER_TTL_SECONDS,
+                  expected_version=item['Version'])
+
+    except ConditionFailedException:
+        LOGGER.info(f"Waiter for account {account_name} changed, not scheduling the recheck")
+        return False
+
+    product_name = (payload.get('PoolAccount') or {}).get('ProvisionedProductName', account_name)
+
+    def _schedule(rechecks):
+        rechecks = rechecks or {}
+        rechecks[account_name] = {'RecheckAt': recheck_at, 'ProductName': product_name}
+        return rechecks
+
+    store.update(RECHECKS_KEY, _schedule)
+    return True
+
+
+def due_rechecks(now: float, store=None) -> dict:
+    """Accounts whose status check is due, read from the single recheck index document
+
+    Args:
+        now (float): Epoch seconds
+        store (StateStore, optional): State store, defaults to the 'waiters' namespace
+
+    Returns:
+        dict: {account name: {'RecheckAt', 'ProductName'}}
+    """
+    store = store or get_state_store('waiters')
+    rechecks = store.get(RECHECKS_KEY) or {}
+    return {name: x for name, x in rechecks.items() if x['RecheckAt'] <= now}
+
+
+def clear_rechecks(rechecks: dict, store=None):
+    """Removes the handled rechecks from the index, unless they were scheduled again in between
+
+    Args:
+        rechecks (dict): {account name: {'RecheckAt', 'ProductName'}} from due_rechecks()
+        store (StateStore, optional): State store, defaults to the 'waiters' namespace
+    """
+    if not rechecks:
+        return
+    store = store or get_state_store('waiters')
+
+    def _clear(current):
+        current = current or {}
+        for name, recheck in rechecks.items():
+            if current.get(name) == recheck:
+                del current[name]
+        return current
+
+    store.update(RECHECKS_KEY, _clear)
+
+
+def waiter_name(product_name: str, store=None) -> str:
+    """Account name the waiters of a Service Catalog Provisioned Product are registered under
+
+    Args:
+        product_name (str): Provisioned Product name (the pool account name for an account served from the pool)
+        store (StateStore, optional): State store, defaults to the 'waiters' namespace
+
+    Returns:
+        str: Account name
+    """
+    store = store or get_state_store('waiters')
+    alias = store.get(f"{PRODUCT_PREFIX}{product_name}")
+    return alias['AccountName'] if alias else product_name
+
+
+def get_waiter(account_name: str, store=None) -> dict:
+    """Returns the waiter registered for the account, or None"""
+    store = store or get_state_store('waiters')
+    return store.get(account_name)
+
+
+def pop_waiter(account_name: str, store=None) -> dict:
+    """Returns and removes the waiter registered for the account, or None"""
+    store = store or get_state_store('waiters')
+    waiter = store.get(account_name)
+    if waiter:
+        store.delete(account_name)
+    return waiter
+
+
+def complete_task(task_token: str, payload: dict, client: boto3.client):
+    """Completes a waiting task, the output keeps the same shape as a lambda:invoke task
+
+    Args:
+        task_token (str): Step Function task token
+        payload (dict): Step Function payload including the 'Account' status
+        client (boto3.client): Boto3 Client for Step Functions
+    """
+    try:
+        client.send_task_success(taskToken=task_token, output=json.dumps({'Payload': payload}))
+
+    except (client.exceptions.TaskTimedOut, client.exceptions.TaskDoesNotExist, client.exceptions.InvalidToken) as e:
+        # The safety net already moved the execution forward, a newer token will be registered
+        LOGGER.warning(f"Task token is no longer valid: {e}")
@@ -0,0 +1,89 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Simulates the account status polling loop with fixed and adaptive intervals.
+
+    python lambda/stepfunctions/CTE_GetAccountStatusFn/test/benchmark/bench_polling.py --accounts 1000
+"""
+
+import os
+import sys
+import random
+import argparse
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', 'src'))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', '..', '..', 'layers', 'CTE_Common'))
+
+import duration_model  # noqa: E402 pylint: disable=wrong-import-position
+from state_store import LocalStateStore  # noqa: E402 pylint: disable=wrong-import-position
+
+FIXED_WAIT_SECONDS = 60
+
+
+def sample_duration(rng: random.Random) -> float:
+    """Control Tower account creation, mostly 20-40 minutes with a long tail"""
+    return max(600.0, rng.lognormvariate(7.5, 0.2))
+
+
+def poll(duration: float, next_wait) -> tuple:
+    """Runs the polling loop for one account
+
+    Returns:
+        tuple: (number of status checks, seconds between completion and detection)
+    """
+    elapsed = 0.0
+    checks = 0
+    while True:
+        checks += 1
+        if elapsed >= duration:
+            return checks, elapsed - duration
+        elapsed += next_wait(elapsed)
+
+
+def simulate(accounts: int = 500, history: int = 100, seed: int = 7) -> dict:
+    """Trains the duration model on a history of runs, then compares fixed and adaptive polling
+
+    Returns:
+        dict: {'fixed': {...}, 'adaptive': {...}} with average checks and detection lag
+    """
+    rng = random.Random(seed)
+    LocalStateStore.reset()
+    store = LocalStateStore(namespace='bench-durations')
+    for _ in range(history):
+        duration_model.record_duration('prod-bench', 'PROVISION_PRODUCT', sample_duration(rng), store=store)
+    percentiles = duration_model.get_percentiles('prod-bench', 'PROVISION_PRODUCT', store=store)
+
+    results = {}
+    strategies = {
+        'fixed': lambda elapsed: FIXED_WAIT_SECONDS,
+        'adaptive': lambda elapsed: duration_model.recommend_wait(elapsed=elapsed, percentiles=percentiles)
+    }
+    durations = [sample_duration(rng) for _ in range(accounts)]
+    for name, next_wait in strategies.items():
+        runs = [poll(duration, next_wait) for duration in durations]
+        lags = sorted(lag for _, lag in runs)
+        results[name] = {
+            'avg_checks': sum(checks for checks, _ in runs) / accounts,
+            'avg_lag': sum(lags) / accounts,
+            'p95_lag': lags[int(accounts * 0.95) - 1]
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--history', type=int, default=100)
+    args = parser.parse_args()
+
+    results = simulate(accounts=args.accounts, history=args.history)
+    print(f"{'strategy':<10}{'checks/account':>16}{'avg lag (s)':>14}{'p95 lag (s)':>14}")
+    for name, stats in results.items():
+        print(f"{name:<10}{stats['avg_checks']:>16.1f}{stats['avg_lag']:>14.1f}{stats['p95_lag']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+
+@pytest.fixture()
+def local_modules():
+    """Modules that share their name with modules of other Lambda Functions"""
+    return ['main', 'helper', 'lifecycle_event', 'waiter_index', 'duration_model']
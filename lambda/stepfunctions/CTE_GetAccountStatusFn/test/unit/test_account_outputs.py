@@ -0,0 +1,55 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from account_outputs import get_cached_account_outputs
+
+PARAMETERS = {
+    'AccountName': 'ent-ct-team-dev',
+    'AccountEmail': 'dev@example.com',
+    'SSOUserFirstName': 'Jane',
+    'SSOUserLastName': 'Doe',
+    'SSOUserEmail': 'jane@example.com',
+    'ManagedOrganizationalUnit': 'Workloads:ent:Dev'
+}
+
+
+@pytest.fixture()
+def status_main(load_src, mocker):
+    main = load_src('main')
+    main.SC_CLIENT = mocker.Mock()
+    main.SFN_CLIENT = mocker.Mock()
+    main.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'AVAILABLE'}}
+    main.SC_CLIENT.describe_record.return_value = {
+        'RecordOutputs': [{'OutputKey': 'AccountId', 'OutputValue': '222222222222'}]
+    }
+    main.lambda_handler({'Payload': {
+        'CustomResourceEvent': {'ResourceProperties': {'ServiceCatalogParameters': dict(PARAMETERS)}},
+        'ServiceCatalogEvent': {'ProvisionedProductId': 'pp-1', 'RecordId': 'rec-1'}
+    }}, None)
+    return main
+
+
+def describe(mocker, status='AVAILABLE', record_id='rec-1'):
+    client = mocker.Mock()
+    client.describe_provisioned_product.return_value = {
+        'ProvisionedProductDetail': {'Status': status, 'LastProvisioningRecordId': record_id}
+    }
+    return client
+
+
+def test_status_step_caches_outputs_for_unchanged_request(status_main, mocker):
+    client = describe(mocker)
+    request = dict(PARAMETERS, AccountEmail=' DEV@example.com')
+    assert get_cached_account_outputs(parameters=request, client=client) == {'AccountId': '222222222222'}
+    client.describe_provisioned_product.assert_called_once_with(Id='pp-1')
+
+
+@pytest.mark.parametrize('parameters,status,record_id', [
+    (dict(PARAMETERS, ManagedOrganizationalUnit='Workloads:ent:Prod'), 'AVAILABLE', 'rec-1'),
+    (PARAMETERS, 'UNDER_CHANGE', 'rec-1'),
+    (PARAMETERS, 'AVAILABLE', 'rec-2'),
+    (dict(PARAMETERS, AccountName='ent-ct-team-prod'), 'AVAILABLE', 'rec-1')
+])
+def test_changed_account_takes_the_state_machine(status_main, mocker, parameters, status, record_id):
+    assert get_cached_account_outputs(parameters=parameters, client=describe(mocker, status, record_id)) is None
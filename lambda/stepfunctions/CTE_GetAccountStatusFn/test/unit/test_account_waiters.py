@@ -0,0 +1,232 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import pytest
+
+
+def lifecycle_event(event_name='CreateManagedAccount', state='SUCCEEDED', account_name='ent-ct-team-dev'):
+    status_key = 'createManagedAccountStatus' if event_name == 'CreateManagedAccount' else 'updateManagedAccountStatus'
+    return {
+        'source': 'aws.controltower',
+        'detail-type': 'AWS Service Event via CloudTrail',
+        'detail': {
+            'eventName': event_name,
+            'serviceEventDetails': {
+                status_key: {
+                    'organizationalUnit': {'organizationalUnitName': 'Dev', 'organizationalUnitId': 'ou-abcd-1234'},
+                    'account': {'accountName': account_name, 'accountId': '222222222222'},
+                    'state': state,
+                    'message': 'AWS Control Tower successfully created an enrolled account.'
+                }
+            }
+        }
+    }
+
+
+@pytest.fixture()
+def payload():
+    return {
+        'CustomResourceEvent': {'ResourceProperties': {'ServiceCatalogParameters': {'AccountName': 'ent-ct-team-dev'}}},
+        'ServiceCatalogEvent': {'ProvisionedProductId': 'pp-1', 'RecordId': 'rec-1', 'ProductId': 'prod-1',
+                                'RecordType': 'PROVISION_PRODUCT'}
+    }
+
+
+@pytest.fixture()
+def lifecycle(load_src, mocker):
+    module = load_src('lifecycle_event')
+    module.SC_CLIENT = mocker.Mock()
+    module.SFN_CLIENT = mocker.Mock()
+    module.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'AVAILABLE'}}
+    module.SC_CLIENT.describe_record.return_value = {
+        'RecordOutputs': [{'OutputKey': 'AccountId', 'OutputValue': '222222222222'}]
+    }
+    return module
+
+
+def test_event_completes_waiting_task(lifecycle, load_src, payload):
+    waiter_index = load_src('waiter_index')
+    waiter_index.register_waiter(account_name='ent-ct-team-dev', task_token='token-1', payload=payload)
+
+    account = lifecycle.lambda_handler(lifecycle_event(), None)
+
+    assert account == {'Status': 'SUCCESS', 'Outputs': {'AccountId': '222222222222'}}
+    args = lifecycle.SFN_CLIENT.send_task_success.call_args[1]
+    assert args['taskToken'] == 'token-1'
+    assert json.loads(args['output'])['Payload']['Account']['Status'] == 'SUCCESS'
+    assert waiter_index.get_waiter('ent-ct-team-dev') is None
+
+
+def test_failed_event_fails_account(lifecycle, load_src, payload):
+    load_src('waiter_index').register_waiter(account_name='ent-ct-team-dev', task_token='token-1', payload=payload)
+    account = lifecycle.lambda_handler(lifecycle_event(event_name='UpdateManagedAccount', state='FAILED'), None)
+    assert account['Status'] == 'FAILED'
+    lifecycle.SC_CLIENT.describe_provisioned_product.assert_not_called()
+
+
+def test_product_not_yet_available_rechecks_soon(lifecycle, load_src, payload):
+    load_src('waiter_index').register_waiter(account_name='ent-ct-team-dev', task_token='token-1', payload=payload)
+    lifecycle.SC_CLIENT.describe_provisioned_product.return_value = {
+        'ProvisionedProductDetail': {'Status': 'UNDER_CHANGE'}
+    }
+    account = lifecycle.lambda_handler(lifecycle_event(), None)
+    assert account == {'Status': 'UNDER_CHANGE', 'WaitSeconds': lifecycle.EVENT_RECHECK_SECONDS}
+
+
+def test_no_waiter_is_ignored(lifecycle):
+    assert lifecycle.lambda_handler(lifecycle_event(account_name='unknown'), None) is None
+    assert lifecycle.lambda_handler({'detail': {'eventName': 'SetupLandingZone'}}, None) is None
+    lifecycle.SFN_CLIENT.send_task_success.assert_not_called()
+
+
+def test_status_step_registers_and_waits(load_src, mocker, payload):
+    main = load_src('main')
+    main.SC_CLIENT = mocker.Mock()
+    main.SFN_CLIENT = mocker.Mock()
+    main.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'UNDER_CHANGE'}}
+
+    main.lambda_handler({'Payload': payload, 'TaskToken': 'token-2'}, None)
+
+    main.SFN_CLIENT.send_task_success.assert_not_called()
+    assert load_src('waiter_index').get_waiter('ent-ct-team-dev')['TaskToken'] == 'token-2'
+
+
+def scan_page(*products):
+    return {'ProvisionedProducts': [
+        {'Name': name, 'Id': f"pp-{name}", 'Type': 'CONTROL_TOWER_ACCOUNT', 'Status': status,
+         'LastRecordId': record_id} for name, status, record_id in products
+    ]}
+
+
+def test_fleet_poller_notifies_only_on_change(load_src, mocker, payload):
+    poller = load_src('fleet_poller')
+    poller.SC_CLIENT = mocker.Mock()
+    poller.SFN_CLIENT = mocker.Mock()
+    paginator = poller.SC_CLIENT.get_paginator.return_value
+    poller.SC_CLIENT.describe_record.return_value = {'RecordOutputs': [{'OutputKey': 'AccountId', 'OutputValue': '2'}]}
+
+    paginator.paginate.return_value = [scan_page(('ent-ct-team-dev', 'UNDER_CHANGE', 'rec-1'),
+                                                 ('ent-ct-team-prod', 'AVAILABLE', 'rec-0'))]
+    poller.lambda_handler({}, None)
+    load_src('waiter_index').register_waiter(account_name='ent-ct-team-dev', task_token='token-1', payload=payload)
+
+    # Nothing moved, no record reads and no notifications
+    assert poller.lambda_handler({}, None) == {'Scanned': 2, 'UnderChange': 1, 'Changed': 0, 'Notified': 0,
+                                              'Rechecked': 0}
+    poller.SC_CLIENT.describe_record.assert_not_called()
+
+    paginator.paginate.return_value = [scan_page(('ent-ct-team-dev', 'AVAILABLE', 'rec-1'),
+                                                 ('ent-ct-team-prod', 'AVAILABLE', 'rec-0'))]
+    assert poller.lambda_handler({}, None) == {'Scanned': 2, 'UnderChange': 0, 'Changed': 1, 'Notified': 1,
+                                              'Rechecked': 0}
+    poller.SC_CLIENT.describe_record.assert_called_once_with(Id='rec-1')
+    assert poller.SFN_CLIENT.send_task_success.call_args[1]['taskToken'] == 'token-1'
+
+
+def test_event_completion_records_the_duration(lifecycle, load_src, payload):
+    load_src('waiter_index').register_waiter(account_name='ent-ct-team-dev', task_token='token-1', payload=payload)
+    lifecycle.SC_CLIENT.describe_record.return_value = {
+        'RecordOutputs': [],
+        'RecordDetail': {'RecordId': 'rec-1', 'ProductId': 'prod-1', 'RecordType': 'PROVISION_PRODUCT',
+                         'CreatedTime': 1000.0, 'UpdatedTime': 2500.0}
+    }
+
+    lifecycle.lambda_handler(lifecycle_event(), None)
+    # A second observation of the same record isn't counted twice
+    load_src('helper').record_completion(payload=payload, record=lifecycle.SC_CLIENT.describe_record()['RecordDetail'])
+
+    from state_store import get_state_store
+    assert get_state_store('durations').get('prod-1#PROVISION_PRODUCT')['Samples'] == [1500.0]
+
+
+def test_poller_moves_due_waiters_forward_with_their_polling_state(load_src, mocker, payload):
+    main = load_src('main')
+    main.SC_CLIENT = mocker.Mock()
+    main.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'UNDER_CHANGE'}}
+    main.lambda_handler({'Payload': payload, 'TaskToken': 'token-1'}, None)
+    waiter = load_src('waiter_index').get_waiter('ent-ct-team-dev')
+    assert waiter['RecheckAt'] > waiter['Payload']['Polling']['StartedAt']
+
+    # The safety net timeout re-enters with the original input, the polling state is picked up from the waiter
+    timed_out = {'Payload': {k: v for k, v in payload.items() if k != 'Polling'}, 'TaskToken': 'token-2'}
+    main.lambda_handler(timed_out, None)
+    assert load_src('waiter_index').get_waiter('ent-ct-team-dev')['Payload']['Polling']['Checks'] == 2
+
+    poller = load_src('fleet_poller')
+    poller.SFN_CLIENT = mocker.Mock()
+    products = {'ent-ct-team-dev': {'Status': 'UNDER_CHANGE'}}
+    assert poller.recheck_due_waiters(products=products, changed=[], now=0, sfn_client=poller.SFN_CLIENT) == 0
+    assert poller.recheck_due_waiters(products=products, changed=[], now=10 ** 10, sfn_client=poller.SFN_CLIENT) == 1
+
+    args = poller.SFN_CLIENT.send_task_success.call_args[1]
+    output = json.loads(args['output'])['Payload']
+    assert args['taskToken'] == 'token-2'
+    assert output['Polling']['Checks'] == 2 and output['Account'] == {'Status': 'UNDER_CHANGE', 'WaitSeconds': 0}
+
+
+def test_fleet_snapshot_only_keeps_in_flight_products(load_src):
+    poller = load_src('fleet_poller')
+    products = {f"ent-ct-team-{i}": {'Id': f"pp-{i}", 'Status': 'AVAILABLE', 'LastRecordId': f"rec-{i}"}
+                for i in range(1000)}
+    products['ent-ct-team-1']['Status'] = 'UNDER_CHANGE'
+
+    snapshot, changed = poller.diff_snapshot(previous={}, products=products)
+    assert list(snapshot) == changed == ['ent-ct-team-1']
+
+    # The product that finished is reported once, then left out of the snapshot
+    products['ent-ct-team-1']['Status'] = 'AVAILABLE'
+    snapshot, changed = poller.diff_snapshot(previous=snapshot, products=products)
+    assert (snapshot, changed) == ({}, ['ent-ct-team-1'])
+    assert poller.diff_snapshot(previous=snapshot, products=products) == ({}, [])
+
+
+def test_poller_completes_an_account_served_from_the_pool(load_src, mocker, payload):
+    payload['PoolAccount'] = {'ProvisionedProductName': 'cte-pool-1', 'AccountEmail': 'aws+cte-pool-1@example.com'}
+    main = load_src('main')
+    main.SC_CLIENT = mocker.Mock()
+    main.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'UNDER_CHANGE'}}
+    main.lambda_handler({'Payload': payload, 'TaskToken': 'token-1'}, None)
+
+    poller = load_src('fleet_poller')
+    poller.SC_CLIENT = mocker.Mock()
+    poller.SFN_CLIENT = mocker.Mock()
+    paginator = poller.SC_CLIENT.get_paginator.return_value
+    poller.SC_CLIENT.describe_record.return_value = {'RecordOutputs': [{'OutputKey': 'AccountId', 'OutputValue': '2'}]}
+
+    # The pool account keeps its Provisioned Product name
+    products = {'cte-pool-1': {'Status': 'UNDER_CHANGE'}}
+    assert poller.recheck_due_waiters(products=products, changed=[], now=10 ** 10, sfn_client=poller.SFN_CLIENT) == 1
+    assert poller.SFN_CLIENT.send_task_success.call_args[1]['taskToken'] == 'token-1'
+
+    main.lambda_handler({'Payload': payload, 'TaskToken': 'token-2'}, None)
+    paginator.paginate.return_value = [scan_page(('cte-pool-1', 'UNDER_CHANGE', 'rec-1'))]
+    poller.lambda_handler({}, None)
+    paginator.paginate.return_value = [scan_page(('cte-pool-1', 'AVAILABLE', 'rec-1'))]
+    assert poller.lambda_handler({}, None)['Notified'] == 1
+    args = poller.SFN_CLIENT.send_task_success.call_args[1]
+    assert args['taskToken'] == 'token-2'
+    assert json.loads(args['output'])['Payload']['Account']['Status'] == 'SUCCESS'
+    assert load_src('waiter_index').get_waiter('ent-ct-team-dev') is None
+
+
+def test_poller_only_reads_the_waiters_that_are_due(load_src, mocker, payload):
+    main = load_src('main')
+    main.SC_CLIENT = mocker.Mock()
+    main.SC_CLIENT.describe_provisioned_product.return_value = {'ProvisionedProductDetail': {'Status': 'UNDER_CHANGE'}}
+    main.lambda_handler({'Payload': payload, 'TaskToken': 'token-1'}, None)
+    recheck_at = load_src('waiter_index').get_waiter('ent-ct-team-dev')['RecheckAt']
+
+    poller = load_src('fleet_poller')
+    poller.SFN_CLIENT = mocker.Mock()
+    mocker.patch.object(poller, 'get_waiter', wraps=poller.get_waiter)
+    products = {f"ent-ct-team-{i}": {'Status': 'UNDER_CHANGE'} for i in range(100)}
+    products['ent-ct-team-dev'] = {'Status': 'UNDER_CHANGE'}
+
+    assert poller.recheck_due_waiters(products=products, changed=[], now=recheck_at - 1, sfn_client=None) == 0
+    poller.get_waiter.assert_not_called()
+
+    assert poller.recheck_due_waiters(products=products, changed=[], now=recheck_at, sfn_client=poller.SFN_CLIENT) == 1
+    poller.get_waiter.assert_called_once_with(account_name='ent-ct-team-dev')
+    # The handled recheck is removed from the index
+    assert load_src('waiter_index').due_rechecks(now=recheck_at) == {}
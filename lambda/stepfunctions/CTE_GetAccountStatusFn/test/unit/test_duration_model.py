@@ -0,0 +1,42 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+from stepfunctions.CTE_GetAccountStatusFn.src import duration_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark'))
+import bench_polling  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def test_prior_used_without_history():
+    assert duration_model.get_percentiles('prod-1', 'PROVISION_PRODUCT') == duration_model.prior_percentiles()
+
+
+def test_record_duration_builds_percentiles():
+    for seconds in range(1000, 2100, 100):
+        duration_model.record_duration('prod-1', 'PROVISION_PRODUCT', seconds)
+
+    percentiles = duration_model.get_percentiles('prod-1', 'PROVISION_PRODUCT')
+    assert percentiles[0] == 1000
+    assert percentiles[10] == 1500
+    assert percentiles[-1] == 2000
+    # Update history is kept separately
+    assert duration_model.get_percentiles('prod-1', 'UPDATE_PROVISIONED_PRODUCT') == duration_model.prior_percentiles()
+
+
+def test_recommend_wait_sparse_early_dense_late():
+    percentiles = duration_model.build_percentiles(list(range(1200, 2401, 60)))
+    early = duration_model.recommend_wait(elapsed=0, percentiles=percentiles)
+    near_finish = duration_model.recommend_wait(elapsed=2000, percentiles=percentiles)
+    overdue = duration_model.recommend_wait(elapsed=5000, percentiles=percentiles)
+
+    assert early == duration_model.MAX_WAIT_SECONDS
+    assert duration_model.MIN_WAIT_SECONDS <= near_finish < 60
+    assert overdue == duration_model.OVERDUE_WAIT_SECONDS
+
+
+def test_adaptive_polling_beats_fixed_interval():
+    results = bench_polling.simulate(accounts=200, history=50)
+    assert results['adaptive']['avg_checks'] < results['fixed']['avg_checks'] / 1.5
+    assert results['adaptive']['avg_lag'] <= results['fixed']['avg_lag']
@@ -4,11 +4,18 @@
 import json
 import ast
 import cfnresponse
+from claim_check import resolve_custom_resource_event
+import timeline
+from tracing import get_tracer, trace_handler
+from profiler import profile_handler
 from custom_logger import CustomLogger
+from idempotency import record_responses
 
 LOGGER = CustomLogger().logger
 
 
+@trace_handler('CTE_SignalCfnResponseFn')
+@profile_handler('CTE_SignalCfnResponseFn')
 def lambda_handler(event, context):
     """This function will get send a SUCCESS or a FAILED CloudFormation Response back to the orginial CloudFormation
     Custom Resource execution
@@ -21,12 +28,14 @@ def lambda_handler(event, context):
         N/A
     """
     print(json.dumps(event))
+    # The response completes the request in the ledger of CTE_InvokeCreateAccountFn
+    record_responses()
     response_body = ""
 
     if event.get("Error"):
         error_data = json.loads(event['Cause'])['errorMessage']
         json_data = ast.literal_eval(error_data)
-        response_event = json_data.get('event')
+        response_event = resolve_custom_resource_event(data=json_data.get('event'))
         response_body = {"ERROR": json_data['error']}
         account = {"Status": json_data['status']}
 
@@ -35,7 +44,7 @@ def lambda_handler(event, context):
 
     else:
         account = event["Payload"]['Account']
-        response_event = event["Payload"]['CustomResourceEvent']
+        response_event = resolve_custom_resource_event(data=event["Payload"])
         LOGGER.info(f"response_body:{response_body}")
 
         if event["Payload"]['Account'].get("Outputs"):
@@ -45,6 +54,12 @@ def lambda_handler(event, context):
         else:
             response_body = {}
 
+        # An account served from the warm pool keeps the email of the pool account
+        pool_account = event["Payload"].get('PoolAccount')
+        if pool_account and account["Status"] == 'SUCCESS':
+            response_body = dict(response_body, PoolProvisionedProductName=pool_account['ProvisionedProductName'],
+                                 PoolAccountEmail=pool_account['AccountEmail'])
+
         LOGGER.info(f"response_body:{response_body}")
 
     if account["Status"] == 'SUCCESS':
@@ -52,9 +67,19 @@ def lambda_handler(event, context):
     elif account["Status"] == 'FAILED':
         cfn_res = cfnresponse.FAILED
 
-    cfnresponse.send(
-        event=response_event,
-        context=context,
-        responseStatus=cfn_res,
-        responseData=response_body
-    )
+    with get_tracer().start_span('send_cfn_response', attributes={'cloudformation.response_status': cfn_res}):
+        cfnresponse.send(
+            event=response_event,
+            context=context,
+            responseStatus=cfn_res,
+            responseData=response_body
+        )
+
+    # Step errors only carry the claim reference, the timeline is reported for accounts that reached a status
+    if event.get("Payload"):
+        timeline.mark(event["Payload"], timeline.SIGNALLED)
+        timeline.report(
+            payload=event["Payload"],
+            status=account["Status"],
+            request_type=response_event.get('RequestType')
+        )
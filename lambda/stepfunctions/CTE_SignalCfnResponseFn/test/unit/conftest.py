@@ -0,0 +1,15 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', '..', '..', '..', 'layers', 'CTE_CfnResponse'))
+
+
+@pytest.fixture()
+def local_modules():
+    """Modules that share their name with modules of other Lambda Functions"""
+    return ['main', 'helper']
@@ -0,0 +1,99 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import pytest
+import cfnresponse
+from claim_check import ClaimCheck
+
+
+@pytest.fixture()
+def cfn_event():
+    return {
+        'RequestType': 'Create',
+        'ResponseURL': 'https://cloudformation-custom-resource-response-useast1.s3.amazonaws.com/x',
+        'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/sdlc/abc',
+        'RequestId': 'a1b2c3d4',
+        'LogicalResourceId': 'rCreateDevAccount',
+        'ResourceProperties': {'ServiceCatalogParameters': {'AccountName': 'ent-ct-team-dev'}}
+    }
+
+
+@pytest.fixture()
+def signal(load_src, mocker):
+    main = load_src('main')
+    mocker.patch.object(main.cfnresponse, 'send')
+    return main
+
+
+def test_success_loads_event_from_claim_check(signal, cfn_event):
+    payload = {'AccountName': 'ent-ct-team-dev'}
+    ClaimCheck(payload).check_in(CustomResourceEvent=cfn_event)
+    assert set(payload) == {'AccountName', 'StateRef'}
+
+    payload['Account'] = {'Status': 'SUCCESS', 'Outputs': {'AccountId': '222222222222'}}
+    signal.lambda_handler({'Payload': payload}, None)
+
+    kwargs = signal.cfnresponse.send.call_args[1]
+    assert kwargs['event'] == cfn_event
+    assert kwargs['responseStatus'] == 'SUCCESS'
+    assert kwargs['responseData'] == {'AccountId': '222222222222'}
+
+
+def test_step_error_resolves_state_ref(signal, cfn_event):
+    payload = {}
+    ClaimCheck(payload).check_in(CustomResourceEvent=cfn_event)
+    error = {"event": {"Payload": {"StateRef": payload['StateRef']}}, "status": "FAILED", "error": "boom"}
+
+    signal.lambda_handler({'Error': 'TypeError', 'Cause': json.dumps({'errorMessage': str(error)})}, None)
+
+    kwargs = signal.cfnresponse.send.call_args[1]
+    assert kwargs['event'] == cfn_event
+    assert kwargs['responseStatus'] == 'FAILED'
+    assert kwargs['responseData'] == {'ERROR': 'boom'}
+
+
+def test_inline_payload_still_supported(signal, cfn_event):
+    payload = {'CustomResourceEvent': cfn_event, 'Account': {'Status': 'FAILED', 'ERROR': 'TAINTED'}}
+    signal.lambda_handler({'Payload': payload}, None)
+    assert signal.cfnresponse.send.call_args[1]['event'] == cfn_event
+
+
+def test_success_reports_timeline(signal, cfn_event, capsys):
+    payload = {'AccountName': 'ent-ct-team-dev', 'CustomResourceEvent': cfn_event,
+               'Account': {'Status': 'SUCCESS', 'Outputs': {'AccountId': '222222222222'}},
+               'Timeline': {'Queued': 100.0, 'Admitted': 400.0, 'ProvisioningStarted': 401.0,
+                            'ProvisioningCompleted': 2201.0, 'AvailableObserved': 2261.0}}
+    signal.lambda_handler({'Payload': payload}, None)
+
+    record = signal.timeline.report(payload=payload, status='SUCCESS', request_type='Create')
+    assert record['Breakdown']['QueueWait'] == 300.0
+    assert record['Breakdown']['Provisioning'] == 1800.0
+    assert record['Breakdown']['DetectionLag'] == 60.0
+    assert record['Percentiles']['Provisioning'] == {'p50': 1800.0, 'p90': 1800.0, 'p99': 1800.0, 'Count': 2}
+
+    emf = json.loads([x for x in capsys.readouterr().out.splitlines() if '"_aws"' in x][0])
+    assert emf['_aws']['CloudWatchMetrics'][0]['Namespace'] == 'CTE/AccountVending'
+    assert emf['QueueWait'] == 300.0
+
+
+def test_success_reports_the_email_of_a_pool_account(signal, cfn_event):
+    payload = {'CustomResourceEvent': cfn_event,
+               'Account': {'Status': 'SUCCESS', 'Outputs': {'AccountId': '222222222222'}},
+               'PoolAccount': {'ProvisionedProductName': 'cte-pool-1', 'AccountEmail': 'aws+cte-pool-1@example.com'}}
+    signal.lambda_handler({'Payload': payload}, None)
+
+    assert signal.cfnresponse.send.call_args[1]['responseData'] == {
+        'AccountId': '222222222222', 'PoolProvisionedProductName': 'cte-pool-1',
+        'PoolAccountEmail': 'aws+cte-pool-1@example.com'}
+
+
+def test_response_hook_is_registered_by_the_handler(load_src, mocker, monkeypatch, cfn_event):
+    monkeypatch.setattr(cfnresponse, 'RESPONSE_HOOKS', [])
+    main = load_src('main')
+    assert cfnresponse.RESPONSE_HOOKS == []
+
+    mocker.patch.object(main.cfnresponse, 'send')
+    payload = {'CustomResourceEvent': cfn_event, 'Account': {'Status': 'SUCCESS', 'Outputs': {}}}
+    main.lambda_handler({'Payload': payload}, None)
+    assert len(cfnresponse.RESPONSE_HOOKS) == 1
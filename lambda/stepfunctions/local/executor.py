@@ -0,0 +1,483 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Offline interpreter for the Amazon States Language definition in stepfunctions/serverless.yaml.
+
+Executions run on a virtual clock: Wait states, retry intervals and task timeouts are jumped over instead of
+slept, so hours of simulated account vending run in seconds. Task states call in-process handlers
+(see local/lambdas.py) and the callback pattern (.waitForTaskToken) is completed through the client returned by
+LocalStepFunctions.client().
+"""
+
+import copy
+import json
+import heapq
+import uuid
+import logging
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+
+LOGGER = logging.getLogger()
+
+LAMBDA_INVOKE = 'arn:aws:states:::lambda:invoke'
+WAIT_FOR_TASK_TOKEN = '.waitForTaskToken'
+_MISSING = object()
+
+
+class VirtualClock():
+    """Discrete event clock. Callbacks run in time order, time only moves when the next event is due."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self._queue = []
+        self._seq = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+    def schedule(self, delay: float, callback):
+        heapq.heappush(self._queue, (self.now + max(0.0, delay), next(self._seq), callback))
+
+    def run(self, until: float = None):
+        while self._queue:
+            if until is not None and self._queue[0][0] > until:
+                self.now = until
+                return
+            due, _, callback = heapq.heappop(self._queue)
+            self.now = max(self.now, due)
+            callback()
+
+
+class VirtualTime():
+    """Stand-in for the time module of a loaded handler"""
+
+    def __init__(self, clock: VirtualClock):
+        self._clock = clock
+
+    def time(self) -> float:
+        return self._clock.time()
+
+    def sleep(self, seconds: float):
+        self._clock.sleep(seconds)
+
+    def monotonic(self) -> float:
+        return self._clock.time()
+
+
+class StatesError(Exception):
+    def __init__(self, error: str, cause: str = ''):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def get_path(data, path: str, context: dict = None):
+    """Resolves a reference path ($.a.b, $.a[0], $$.Task.Token)"""
+    if path.startswith('$$'):
+        data, path = context, path[1:]
+
+    value = data
+    for part in path[1:].replace('[', '.[').split('.'):
+        if not part:
+            continue
+        if part.startswith('['):
+            index = int(part[1:-1])
+            if not isinstance(value, list) or index >= len(value):
+                return _MISSING
+            value = value[index]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+
+    return value
+
+
+def set_path(data, path: str, value):
+    """Applies a ResultPath, returns the new state data"""
+    if path is None:
+        return data
+    if path == '$':
+        return value
+
+    data = copy.deepcopy(data) if isinstance(data, dict) else {}
+    parts = path[2:].split('.')
+    node = data
+    for part in parts[:-1]:
+        if not isinstance(node.get(part), dict):
+            node[part] = {}
+        node = node[part]
+    node[parts[-1]] = value
+    return data
+
+
+def resolve_parameters(template, data, context: dict):
+    """Builds the effective Parameters, keys ending with '.$' are reference paths"""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith('.$'):
+                found = get_path(data, value, context)
+                if found is _MISSING:
+                    raise StatesError('States.Runtime', f"Path {value} not found for {key}")
+                resolved[key[:-2]] = found
+            else:
+                resolved[key] = resolve_parameters(value, data, context)
+        return resolved
+
+    if isinstance(template, list):
+        return [resolve_parameters(x, data, context) for x in template]
+
+    return template
+
+
+def error_matches(error_equals: list, error: str) -> bool:
+    if error in error_equals:
+        return True
+    if 'States.ALL' in error_equals:
+        return True
+    return 'States.TaskFailed' in error_equals and error != 'States.Timeout'
+
+
+COMPARATORS = {
+    'StringEquals': lambda a, b: isinstance(a, str) and a == b,
+    'StringLessThan': lambda a, b: isinstance(a, str) and a < b,
+    'StringGreaterThan': lambda a, b: isinstance(a, str) and a > b,
+    'NumericEquals': lambda a, b: isinstance(a, (int, float)) and a == b,
+    'NumericLessThan': lambda a, b: isinstance(a, (int, float)) and a < b,
+    'NumericLessThanEquals': lambda a, b: isinstance(a, (int, float)) and a <= b,
+    'NumericGreaterThan': lambda a, b: isinstance(a, (int, float)) and a > b,
+    'NumericGreaterThanEquals': lambda a, b: isinstance(a, (int, float)) and a >= b,
+    'BooleanEquals': lambda a, b: isinstance(a, bool) and a == b,
+    'IsPresent': lambda a, b: (a is not _MISSING) == b,
+    'IsNull': lambda a, b: (a is None) == b,
+    'IsString': lambda a, b: isinstance(a, str) == b,
+    'IsNumeric': lambda a, b: isinstance(a, (int, float)) == b,
+    'IsBoolean': lambda a, b: isinstance(a, bool) == b,
+}
+
+
+def evaluate_choice(rule: dict, data) -> bool:
+    """Evaluates a Choice Rule"""
+    if 'And' in rule:
+        return all(evaluate_choice(x, data) for x in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate_choice(x, data) for x in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate_choice(rule['Not'], data)
+
+    value = get_path(data, rule['Variable'])
+    for operator, compare in COMPARATORS.items():
+        if operator in rule:
+            return compare(value, rule[operator])
+
+    raise StatesError('States.Runtime', f"Unsupported Choice Rule {rule}")
+
+
+class LambdaContext():
+    def __init__(self, function_name: str, clock: VirtualClock, timeout: int = 900):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_stream_name = f"local/{function_name}/{self.aws_request_id}"
+        self._deadline = clock.time() + timeout
+        self._clock = clock
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self._deadline - self._clock.time()) * 1000)
+
+
+class Execution():
+    """State of one State Machine execution"""
+
+    def __init__(self, name: str, execution_input: dict, started_at: float):
+        self.name = name
+        self.input = execution_input
+        self.status = 'RUNNING'
+        self.output = None
+        self.error = None
+        self.cause = None
+        self.started_at = started_at
+        self.stopped_at = None
+        self.transitions = []
+        self.invocations = Counter()
+
+    def report(self) -> dict:
+        """Summary of the execution: status, simulated end-to-end time, transitions and Lambda invocations"""
+        return {
+            'Name': self.name,
+            'Status': self.status,
+            'StartedAt': self.started_at,
+            'StoppedAt': self.stopped_at,
+            'Duration': (self.stopped_at - self.started_at) if self.stopped_at is not None else None,
+            'StateTransitions': len(self.transitions),
+            'States': dict(Counter(name for _, name in self.transitions)),
+            'Invocations': dict(self.invocations),
+            'Error': self.error,
+            'Cause': self.cause
+        }
+
+
+class LocalStepFunctions():
+    """Runs executions of a State Machine definition against in-process Lambda handlers
+
+    Args:
+        definition (dict): Amazon States Language definition
+        functions (dict): {function name: handler(event, context)}
+        clock (VirtualClock, optional): Clock shared with the handlers and simulated services
+        invoke_seconds (float): Simulated duration of every Lambda invocation
+    """
+
+    def __init__(self, definition: dict, functions: dict, clock: VirtualClock = None, invoke_seconds: float = 0.5):
+        self.definition = definition
+        self.functions = functions
+        self.clock = clock or VirtualClock()
+        self.invoke_seconds = invoke_seconds
+        self.executions = []
+        self.scheduled = Counter()
+        self._tokens = {}
+
+    # ---------------------------
+    # Executions
+    # ---------------------------
+    def start_execution(self, name: str, execution_input: dict, delay: float = 0.0) -> Execution:
+        execution = Execution(name=name, execution_input=execution_input, started_at=self.clock.time() + delay)
+        self.executions.append(execution)
+
+        def _start():
+            timeout = self.definition.get('TimeoutSeconds')
+            if timeout:
+                self.clock.schedule(timeout, lambda: self._stop(execution, 'TIMED_OUT', 'States.Timeout'))
+            self._enter(execution, self.definition['StartAt'], copy.deepcopy(execution_input))
+
+        self.clock.schedule(delay, _start)
+        return execution
+
+    def add_schedule(self, function_name: str, rate_seconds: float, event: dict = None):
+        """Invokes a function every rate_seconds while executions are running (EventBridge schedule)"""
+        def _tick():
+            if not any(x.status == 'RUNNING' for x in self.executions):
+                return
+            self.scheduled[function_name] += 1
+            self.functions[function_name](copy.deepcopy(event or {}), LambdaContext(function_name, self.clock))
+            self.clock.schedule(rate_seconds, _tick)
+
+        self.clock.schedule(rate_seconds, _tick)
+
+    def run(self, until: float = None) -> list:
+        """Runs every started execution to completion (or until the virtual time limit)
+
+        Returns:
+            list: Execution reports
+        """
+        self.clock.run(until=until)
+        return [x.report() for x in self.executions]
+
+    def _stop(self, execution: Execution, status: str, error: str = None, cause: str = None, output=None):
+        if execution.status != 'RUNNING':
+            return
+        execution.status = status
+        execution.stopped_at = self.clock.time()
+        execution.error, execution.cause, execution.output = error, cause, output
+        LOGGER.debug(f"{execution.name} {status} after {execution.stopped_at - execution.started_at:.0f}s")
+
+    def _context(self, execution: Execution, name: str, token: str = None) -> dict:
+        return {
+            'Execution': {'Name': execution.name, 'Input': execution.input, 'StartTime': execution.started_at},
+            'State': {'Name': name, 'EnteredTime': self.clock.time()},
+            'StateMachine': {'Name': self.definition.get('Name', 'local')},
+            'Task': {'Token': token}
+        }
+
+    # ---------------------------
+    # States
+    # ---------------------------
+    def _enter(self, execution: Execution, name: str, data):
+        if execution.status != 'RUNNING':
+            return
+
+        execution.transitions.append((self.clock.time(), name))
+        state = self.definition['States'][name]
+        try:
+            handler = getattr(self, f"_run_{state['Type'].lower()}", None)
+            if not handler:
+                raise StatesError('States.Runtime', f"Unsupported state type {state['Type']}")
+            handler(execution, name, state, data)
+
+        except StatesError as e:
+            self._stop(execution, 'FAILED', e.error, e.cause)
+
+    def _next(self, execution: Execution, state: dict, output):
+        if state.get('End'):
+            self._stop(execution, 'SUCCEEDED', output=output)
+        else:
+            self.clock.schedule(0, lambda: self._enter(execution, state['Next'], output))
+
+    def _run_pass(self, execution, name, state, data):
+        result = state['Result'] if 'Result' in state else data
+        self._next(execution, state, set_path(data, state.get('ResultPath', '$'), result))
+
+    def _run_succeed(self, execution, name, state, data):
+        self._stop(execution, 'SUCCEEDED', output=data)
+
+    def _run_fail(self, execution, name, state, data):
+        self._stop(execution, 'FAILED', state.get('Error'), state.get('Cause'))
+
+    def _run_choice(self, execution, name, state, data):
+        for rule in state['Choices']:
+            if evaluate_choice(rule, data):
+                self.clock.schedule(0, lambda: self._enter(execution, rule['Next'], data))
+                return
+
+        if 'Default' not in state:
+            raise StatesError('States.NoChoiceMatched', f"No Choice matched in {name}")
+        self.clock.schedule(0, lambda: self._enter(execution, state['Default'], data))
+
+    def _run_wait(self, execution, name, state, data):
+        if 'Seconds' in state:
+            seconds = state['Seconds']
+        elif 'SecondsPath' in state:
+            seconds = get_path(data, state['SecondsPath'])
+        else:
+            raise StatesError('States.Runtime', f"Only Seconds / SecondsPath Wait states are supported ({name})")
+
+        if not isinstance(seconds, (int, float)) or isinstance(seconds, bool) or seconds < 0:
+            raise StatesError('States.Runtime', f"Invalid wait of {seconds!r} seconds in {name}")
+
+        if state.get('End'):
+            self.clock.schedule(seconds, lambda: self._stop(execution, 'SUCCEEDED', output=data))
+        else:
+            self.clock.schedule(seconds, lambda: self._enter(execution, state['Next'], data))
+
+    def _run_task(self, execution, name, state, data, retry_counts=None):
+        retry_counts = retry_counts if retry_counts is not None else Counter()
+        resource = state['Resource']
+        wait_for_token = resource.endswith(WAIT_FOR_TASK_TOKEN)
+        if resource.replace(WAIT_FOR_TASK_TOKEN, '') != LAMBDA_INVOKE:
+            raise StatesError('States.Runtime', f"Unsupported resource {resource}")
+
+        token = uuid.uuid4().hex if wait_for_token else None
+        parameters = resolve_parameters(state.get('Parameters', {'Payload.$': '$'}), data,
+                                        self._context(execution, name, token))
+        function_name = function_name_from_arn(parameters['FunctionName'])
+        task = SimpleNamespace(execution=execution, name=name, state=state, data=data, retry_counts=retry_counts)
+
+        def _invoke():
+            if execution.status != 'RUNNING':
+                return
+            execution.invocations[function_name] += 1
+            if wait_for_token:
+                self._tokens[token] = task
+
+            try:
+                handler = self.functions[function_name]
+                event = json.loads(json.dumps(parameters.get('Payload')))
+                # Lambda results are serialized, non JSON values fail like they would in AWS
+                result = json.loads(json.dumps(handler(event, LambdaContext(function_name, self.clock))))
+
+            except Exception as e:
+                self._tokens.pop(token, None)
+                cause = json.dumps({'errorMessage': str(e), 'errorType': type(e).__name__})
+                self._task_failed(task, type(e).__name__, cause)
+                return
+
+            if not wait_for_token:
+                self._task_succeeded(task, {'Payload': result, 'StatusCode': 200})
+
+            # The handler may have completed the token itself, otherwise it waits for a callback or the timeout
+            elif token in self._tokens and state.get('TimeoutSeconds'):
+                self.clock.schedule(state['TimeoutSeconds'], lambda: self._token_timed_out(token))
+
+        self.clock.schedule(self.invoke_seconds, _invoke)
+
+    def _task_succeeded(self, task, result):
+        output = set_path(task.data, task.state.get('ResultPath', '$'), result)
+        self._next(task.execution, task.state, output)
+
+    def _task_failed(self, task, error: str, cause: str):
+        execution, state = task.execution, task.state
+        if execution.status != 'RUNNING':
+            return
+
+        for idx, retrier in enumerate(state.get('Retry', [])):
+            if error_matches(retrier['ErrorEquals'], error):
+                attempt = task.retry_counts[idx]
+                if attempt < retrier.get('MaxAttempts', 3):
+                    task.retry_counts[idx] += 1
+                    interval = retrier.get('IntervalSeconds', 1) * retrier.get('BackoffRate', 2.0) ** attempt
+                    self.clock.schedule(interval, lambda: self._run_task(
+                        execution, task.name, state, task.data, task.retry_counts))
+                    return
+                break
+
+        for catcher in state.get('Catch', []):
+            if error_matches(catcher['ErrorEquals'], error):
+                output = set_path(task.data, catcher.get('ResultPath', '$'), {'Error': error, 'Cause': cause})
+                self.clock.schedule(0, lambda: self._enter(execution, catcher['Next'], output))
+                return
+
+        self._stop(execution, 'FAILED', error, cause)
+
+    def _token_timed_out(self, token: str):
+        task = self._tokens.pop(token, None)
+        if task:
+            self._task_failed(task, 'States.Timeout', 'Task timed out waiting for the task token')
+
+    # ---------------------------
+    # Callback pattern
+    # ---------------------------
+    def send_task_success(self, token: str, output: str):
+        task = self._tokens.pop(token, None)
+        if not task or task.execution.status != 'RUNNING':
+            raise TaskTimedOut(f"Task token {token} is not pending")
+        self.clock.schedule(0, lambda: self._task_succeeded(task, json.loads(output)))
+
+    def send_task_failure(self, token: str, error: str = None, cause: str = None):
+        task = self._tokens.pop(token, None)
+        if not task or task.execution.status != 'RUNNING':
+            raise TaskTimedOut(f"Task token {token} is not pending")
+        self.clock.schedule(0, lambda: self._task_failed(task, error or 'States.TaskFailed', cause or ''))
+
+    def client(self):
+        """Step Functions client for the handlers (SFN_CLIENT)"""
+        return StepFunctionsClient(self)
+
+
+class TaskTimedOut(Exception):
+    pass
+
+
+class TaskDoesNotExist(Exception):
+    pass
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class StepFunctionsClient():
+    """The part of the boto3 Step Functions client the handlers use"""
+
+    exceptions = SimpleNamespace(TaskTimedOut=TaskTimedOut, TaskDoesNotExist=TaskDoesNotExist,
+                                 InvalidToken=InvalidToken)
+
+    def __init__(self, executor: LocalStepFunctions):
+        self._executor = executor
+
+    def send_task_success(self, taskToken, output):  # pylint: disable=invalid-name
+        self._executor.send_task_success(token=taskToken, output=output)
+        return {}
+
+    def send_task_failure(self, taskToken, error=None, cause=None):  # pylint: disable=invalid-name
+        self._executor.send_task_failure(token=taskToken, error=error, cause=cause)
+        return {}
+
+
+def function_name_from_arn(function_arn) -> str:
+    """Function name from an ARN, including the unresolved {'Fn::Sub': arn} form of the template"""
+    if isinstance(function_arn, dict):
+        function_arn = function_arn.get('Fn::Sub')
+    return function_arn.split(':function:')[-1].split(':')[0]
@@ -0,0 +1,144 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Loads the State Machine definition and the Lambda handlers of stepfunctions/serverless.yaml in-process.
+
+Every function gets its own copy of its src modules (main, helper, ...), the same way separate Lambda containers
+would, while the layer modules are shared so the local state store is shared like the DynamoDB table.
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import importlib
+from cfn_tools import load_yaml
+from executor import VirtualTime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(BASE_DIR, '..', 'serverless.yaml')
+
+
+def load_template(template: str = TEMPLATE) -> dict:
+    with open(template) as f:
+        return load_yaml(f.read())
+
+
+def load_definition(template: dict, resource: str = 'rCTEAcountCreationStateMachine') -> dict:
+    """Returns the Amazon States Language definition of the State Machine resource"""
+    properties = template['Resources'][resource]['Properties']
+    return dict(properties['Definition'], Name=properties.get('Name', resource))
+
+
+class LocalLambdas():
+    """Handlers of the AWS::Serverless::Function resources of a template
+
+    Args:
+        template (dict): SAM template
+        template_dir (str): Directory CodeUri / ContentUri are relative to
+        clock (VirtualClock, optional): Replaces the time module of the handlers
+    """
+
+    def __init__(self, template: dict, template_dir: str = os.path.dirname(TEMPLATE), clock=None):
+        self.template = template
+        self.template_dir = template_dir
+        self.clock = clock
+        self.modules = {}
+        self.responses = []
+        self.layer_dirs = []
+        self._cfnresponse_http = None
+        self._patched_layers = []
+
+        resources = template['Resources']
+        self.functions = {
+            x['Properties']['FunctionName']: x['Properties'] for x in resources.values()
+            if x['Type'] == 'AWS::Serverless::Function'
+        }
+        for x in resources.values():
+            if x['Type'] == 'AWS::Serverless::LayerVersion':
+                layer_dir = os.path.normpath(os.path.join(template_dir, x['Properties']['ContentUri']))
+                self.layer_dirs.append(layer_dir)
+                if layer_dir not in sys.path:
+                    sys.path.append(layer_dir)
+
+    def _import(self, function_name: str) -> types.ModuleType:
+        properties = self.functions[function_name]
+        src_dir = os.path.normpath(os.path.join(self.template_dir, properties['CodeUri']))
+        module_name = properties['Handler'].rsplit('.', 1)[0]
+        local_names = [x[:-3] for x in os.listdir(src_dir) if x.endswith('.py')]
+
+        saved = {name: sys.modules.pop(name) for name in local_names if name in sys.modules}
+        sys.path.insert(0, src_dir)
+        try:
+            module = importlib.import_module(module_name)
+            loaded = {name: sys.modules[name] for name in local_names if name in sys.modules}
+
+        finally:
+            sys.path.remove(src_dir)
+            for name in local_names:
+                sys.modules.pop(name, None)
+            sys.modules.update(saved)
+
+        self.modules[function_name] = loaded
+        return module
+
+    def handler(self, function_name: str, clients: dict = None):
+        """Imports a function and returns its handler
+
+        Args:
+            function_name (str): FunctionName of the resource
+            clients (dict, optional): Module globals to replace in the function modules (ie: {'SC_CLIENT': ...})
+
+        Returns:
+            callable: handler(event, context)
+        """
+        module = self._import(function_name)
+        for loaded in self.modules[function_name].values():
+            if self.clock and getattr(loaded, 'time', None) is time:
+                loaded.time = VirtualTime(self.clock)
+            for name, client in (clients or {}).items():
+                if hasattr(loaded, name):
+                    setattr(loaded, name, client)
+        self._patch_layers()
+
+        return getattr(module, self.functions[function_name]['Handler'].rsplit('.', 1)[1])
+
+    def _patch_layers(self):
+        """The shared layer modules (state store TTLs, timeline markers) follow the virtual clock as well"""
+        if not self.clock:
+            return
+        for loaded in list(sys.modules.values()):
+            path = os.path.abspath(getattr(loaded, '__file__', None) or '')
+            if any(path.startswith(x + os.sep) for x in self.layer_dirs) and getattr(loaded, 'time', None) is time:
+                loaded.time = VirtualTime(self.clock)
+                self._patched_layers.append(loaded)
+
+    def handlers(self, function_names: list, clients: dict = None) -> dict:
+        return {x: self.handler(x, clients=clients) for x in function_names}
+
+    def capture_cfn_responses(self):
+        """Records the CloudFormation responses sent by cfnresponse instead of sending them"""
+        import cfnresponse  # pylint: disable=import-outside-toplevel
+        responses = self.responses
+
+        class _Response():
+            status = 200
+
+        class _Http():
+            def request(self, method, url, headers=None, body=None):  # pylint: disable=unused-argument
+                responses.append(dict(json.loads(body), ResponseURL=url))
+                return _Response()
+
+        self._cfnresponse_http = cfnresponse.http
+        cfnresponse.http = _Http()
+        return responses
+
+    def close(self):
+        for loaded in self._patched_layers:
+            loaded.time = time
+        self._patched_layers = []
+        if self._cfnresponse_http:
+            import cfnresponse  # pylint: disable=import-outside-toplevel
+            cfnresponse.http = self._cfnresponse_http
+            self._cfnresponse_http = None
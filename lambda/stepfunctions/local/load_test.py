@@ -0,0 +1,190 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Runs account vending scenarios against the simulated Account Factory on virtual time.
+
+    python lambda/stepfunctions/local/load_test.py --accounts 200
+    python lambda/stepfunctions/local/load_test.py --accounts 200 --lifecycle-events --fleet-poller
+"""
+
+import os
+import sys
+import io
+import json
+import logging
+import argparse
+import contextlib
+
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+from executor import LocalStepFunctions, VirtualClock, LambdaContext  # noqa: E402 pylint: disable=wrong-import-position
+from lambdas import LocalLambdas, load_template, load_definition  # noqa: E402 pylint: disable=wrong-import-position
+from service_catalog import SimulatedServiceCatalog, lognormal_durations  # noqa: E402 pylint: disable=wrong-import-position
+
+STATE_MACHINE_FUNCTIONS = ['CTE_CreateAccountFn', 'CTE_GetAccountStatusFn', 'CTE_SignalCfnResponseFn']
+LIFECYCLE_FUNCTION = 'CTE_AccountLifecycleEventFn'
+POLLER_FUNCTION = 'CTE_FleetStatusPollerFn'
+# Control Tower emits the lifecycle event shortly after the Service Catalog operation completes
+LIFECYCLE_EVENT_DELAY = 5
+
+
+def account_request(index: int, ou: str = 'Dev (ou-abcd-11111111)') -> dict:
+    """CloudFormation Custom Resource event for one account"""
+    name = f"cte-load-test-{index:04d}"
+    return {
+        'RequestType': 'Create',
+        'ResponseURL': f"https://cloudformation-custom-resource-response/{name}",
+        'StackId': f"arn:aws:cloudformation:us-east-1:111111111111:stack/load-test/{index:04d}",
+        'RequestId': f"request-{index:04d}",
+        'LogicalResourceId': 'rAccount',
+        'ResourceProperties': {'ServiceCatalogParameters': {
+            'AccountName': name,
+            'AccountEmail': f"{name}@example.com",
+            'SSOUserFirstName': 'Load',
+            'SSOUserLastName': 'Test',
+            'SSOUserEmail': 'load-test@example.com',
+            'ManagedOrganizationalUnit': ou
+        }}
+    }
+
+
+def lifecycle_event(product: dict, record: dict) -> dict:
+    """Control Tower lifecycle event for a completed Service Catalog operation"""
+    event_name = 'CreateManagedAccount' if record['RecordType'] == 'PROVISION_PRODUCT' else 'UpdateManagedAccount'
+    status_key = 'createManagedAccountStatus' if event_name == 'CreateManagedAccount' else 'updateManagedAccountStatus'
+    return {
+        'source': 'aws.controltower',
+        'detail-type': 'AWS Service Event via CloudTrail',
+        'detail': {
+            'eventName': event_name,
+            'serviceEventDetails': {status_key: {
+                'account': {'accountName': product['Name']},
+                'state': 'SUCCEEDED' if record['Status'] == 'SUCCEEDED' else 'FAILED',
+                'message': product.get('StatusMessage')
+            }}
+        }
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_scenario(accounts: int = 200, arrival_seconds: float = 0.0, lifecycle_events: bool = False,
+                 fleet_poller: bool = False, poller_rate: int = 60, sc_options: dict = None,
+                 quiet: bool = True) -> dict:
+    """Vends a burst of accounts through the State Machine and the simulated Account Factory
+
+    Args:
+        accounts (int): Number of accounts
+        arrival_seconds (float): Seconds between two requests, 0 for one burst
+        lifecycle_events (bool): Emit the Control Tower lifecycle events to CTE_AccountLifecycleEventFn
+        fleet_poller (bool): Run CTE_FleetStatusPollerFn on its schedule
+        poller_rate (int): Fleet poller schedule in seconds
+        sc_options (dict, optional): SimulatedServiceCatalog options (durations, throttle_rate, ...)
+        quiet (bool): Drop the events the handlers print
+
+    Returns:
+        dict: Execution, Service Catalog and CloudFormation response metrics
+    """
+    clock = VirtualClock()
+    template = load_template()
+    lambdas = LocalLambdas(template=template, clock=clock)
+    # The layers are importable once the template is loaded
+    from state_store import LocalStateStore  # pylint: disable=import-outside-toplevel
+    LocalStateStore.reset()
+    responses = lambdas.capture_cfn_responses()
+    sfn = LocalStepFunctions(definition=load_definition(template), functions={}, clock=clock)
+
+    def _on_complete(product, record):
+        if lifecycle_events:
+            clock.schedule(LIFECYCLE_EVENT_DELAY, lambda: sfn.functions[LIFECYCLE_FUNCTION](
+                lifecycle_event(product, record), LambdaContext(LIFECYCLE_FUNCTION, clock)))
+
+    service_catalog = SimulatedServiceCatalog(clock=clock, on_complete=_on_complete, **(sc_options or {}))
+    clients = {'SC_CLIENT': service_catalog, 'SFN_CLIENT': sfn.client()}
+    try:
+        functions = STATE_MACHINE_FUNCTIONS + [LIFECYCLE_FUNCTION, POLLER_FUNCTION]
+        sfn.functions = lambdas.handlers(functions, clients=clients)
+        if fleet_poller:
+            sfn.add_schedule(POLLER_FUNCTION, rate_seconds=poller_rate)
+
+        for index in range(accounts):
+            request = account_request(index)
+            sfn.start_execution(name=request['ResourceProperties']['ServiceCatalogParameters']['AccountName'],
+                                execution_input=request, delay=index * arrival_seconds)
+
+        with contextlib.redirect_stdout(io.StringIO() if quiet else sys.stdout):
+            reports = sfn.run()
+
+    finally:
+        lambdas.close()
+
+    durations = [x['Duration'] for x in reports if x['Status'] == 'SUCCEEDED']
+    statuses = {}
+    invocations = {}
+    for report in reports:
+        statuses[report['Status']] = statuses.get(report['Status'], 0) + 1
+        for name, count in report['Invocations'].items():
+            invocations[name] = invocations.get(name, 0) + count
+    for name, count in sfn.scheduled.items():
+        invocations[name] = invocations.get(name, 0) + count
+
+    return {
+        'Executions': statuses,
+        'CfnResponses': {x: len([r for r in responses if r['Status'] == x]) for x in ('SUCCESS', 'FAILED')},
+        'Makespan': max((x['StoppedAt'] or clock.time() for x in reports), default=0.0),
+        'ExecutionDuration': {'p50': percentile(durations, 50), 'p95': percentile(durations, 95),
+                              'max': max(durations, default=None)},
+        'StateTransitions': sum(x['StateTransitions'] for x in reports),
+        'Invocations': invocations,
+        'ServiceCatalog': service_catalog.stats(),
+        # Critical path breakdown aggregated by CTE_SignalCfnResponseFn
+        'Timeline': timeline_percentiles()
+    }
+
+
+def timeline_percentiles() -> dict:
+    import timeline  # pylint: disable=import-outside-toplevel
+    from state_store import get_state_store  # pylint: disable=import-outside-toplevel
+    history = get_state_store('timelines').get('breakdown') or {}
+    return {name: {f"p{pct}": timeline._percentile(samples, pct)  # pylint: disable=protected-access
+                   for pct in timeline.PERCENTILES} for name, samples in history.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--arrival-seconds', type=float, default=0.0)
+    parser.add_argument('--lifecycle-events', action='store_true')
+    parser.add_argument('--fleet-poller', action='store_true')
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--provision-mu', type=float, default=7.5, help='log-normal mu of new account seconds')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run_scenario(
+        accounts=args.accounts,
+        arrival_seconds=args.arrival_seconds,
+        lifecycle_events=args.lifecycle_events,
+        fleet_poller=args.fleet_poller,
+        sc_options={
+            'durations': lognormal_durations(provision=(args.provision_mu, 0.2)),
+            'throttle_rate': args.throttle_rate,
+            'failure_rate': args.failure_rate,
+            'seed': args.seed
+        }
+    )
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Simulated Service Catalog / Control Tower Account Factory backend running on the executor's virtual clock.
+
+Implements the Service Catalog calls the vending functions make, provisions accounts with configurable
+duration distributions, enforces the Control Tower concurrent account operation limit and injects throttling.
+"""
+
+import random
+import itertools
+from collections import Counter
+from botocore.exceptions import ClientError
+
+CONTROL_TOWER_PRODUCT = 'AWS Control Tower Account Factory'
+PRODUCT_ID = 'prod-ctaccountfactory'
+PROVISIONING_ARTIFACT_ID = 'pa-ctaccountfactory'
+# Control Tower processes at most 5 account operations at a time
+CONCURRENT_OPERATIONS = 5
+SCAN_PAGE_SIZE = 20
+# botocore legacy retry mode, retries after the first attempt
+CLIENT_RETRIES = 4
+
+OPERATION_NAMES = {
+    'scan_provisioned_products': 'ScanProvisionedProducts',
+    'search_provisioned_products': 'SearchProvisionedProducts',
+    'describe_product': 'DescribeProduct',
+    'provision_product': 'ProvisionProduct',
+    'update_provisioned_product': 'UpdateProvisionedProduct',
+    'describe_provisioned_product': 'DescribeProvisionedProduct',
+    'describe_record': 'DescribeRecord'
+}
+
+
+def client_error(code: str, message: str, operation: str) -> ClientError:
+    """Builds the ClientError botocore raises for a service error"""
+    return ClientError({
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': 400}
+    }, OPERATION_NAMES.get(operation, operation))
+
+
+def lognormal_durations(provision: tuple = (7.5, 0.2), update: tuple = (6.5, 0.3), minimum: float = 300.0):
+    """Duration model: (mu, sigma) of the log-normal provisioning time of new accounts and updates. The default
+    is about 30 minutes for a new account and 11 minutes for an update, with a long tail."""
+    def _duration(rng: random.Random, record_type: str) -> float:
+        mu, sigma = provision if record_type == 'PROVISION_PRODUCT' else update
+        return max(minimum, rng.lognormvariate(mu, sigma))
+    return _duration
+
+
+def fixed_durations(provision: float = 1800.0, update: float = 600.0):
+    def _duration(rng: random.Random, record_type: str) -> float:  # pylint: disable=unused-argument
+        return provision if record_type == 'PROVISION_PRODUCT' else update
+    return _duration
+
+
+class SimulatedServiceCatalog():
+    """Stand-in for the boto3 Service Catalog client (SC_CLIENT)
+
+    Args:
+        clock (VirtualClock): Executor clock
+        durations (callable, optional): duration(rng, record_type) in seconds, defaults to lognormal_durations()
+        concurrent_operations (int): Control Tower concurrent account operation limit
+        failure_rate (float): Probability that an operation ends in ERROR
+        throttle_rate (float): Probability that a call is throttled
+        rate_limit (float, optional): Sustained calls per second before throttling (token bucket)
+        burst (int): Token bucket size for rate_limit
+        retries (int): Client side retries of throttled calls, like botocore does
+        on_complete (callable, optional): on_complete(product, record) when an operation finishes, used to emit the
+            Control Tower lifecycle events
+        seed (int): Random seed
+    """
+
+    def __init__(self, clock, durations=None, concurrent_operations: int = CONCURRENT_OPERATIONS,
+                 failure_rate: float = 0.0, throttle_rate: float = 0.0, rate_limit: float = None, burst: int = 10,
+                 retries: int = CLIENT_RETRIES, on_complete=None, seed: int = 7):
+        self.clock = clock
+        self.durations = durations or lognormal_durations()
+        self.concurrent_operations = concurrent_operations
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.retries = retries
+        self.on_complete = on_complete
+        self.rng = random.Random(seed)
+
+        self.products = {}
+        self.records = {}
+        self.calls = Counter()
+        self.throttles = Counter()
+        self.limit_errors = 0
+        self._ids = itertools.count(1)
+        self._tokens = float(burst)
+        self._refilled_at = clock.time()
+
+    # ---------------------------
+    # Request handling
+    # ---------------------------
+    def _throttled(self) -> bool:
+        if self.rate_limit:
+            now = self.clock.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_limit)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+
+        return self.throttle_rate > 0 and self.rng.random() < self.throttle_rate
+
+    def _call(self, operation: str):
+        """Counts the call and applies throttling, throttled calls are retried like the botocore client would"""
+        for _ in range(self.retries + 1):
+            self.calls[operation] += 1
+            if not self._throttled():
+                return
+            self.throttles[operation] += 1
+
+        raise client_error('ThrottlingException', 'Rate exceeded', operation)
+
+    def _refresh(self):
+        """Completes the operations whose duration elapsed"""
+        now = self.clock.time()
+        for record in self.records.values():
+            if record['Status'] == 'IN_PROGRESS' and record['FinishesAt'] <= now:
+                product = self.products[record['ProvisionedProductName']]
+                if record['Fails']:
+                    record['Status'] = 'FAILED'
+                    product['Status'] = 'ERROR' if record['RecordType'] == 'PROVISION_PRODUCT' else 'TAINTED'
+                    product['StatusMessage'] = 'AccountFactory: Account provisioning failed'
+                else:
+                    record['Status'] = 'SUCCEEDED'
+                    product['Status'] = 'AVAILABLE'
+                    product['StatusMessage'] = ''
+                    product['LastSuccessfulProvisioningRecordId'] = record['RecordId']
+                if self.on_complete:
+                    self.on_complete(dict(product), dict(record))
+
+    def in_progress(self) -> int:
+        self._refresh()
+        return len([x for x in self.records.values() if x['Status'] == 'IN_PROGRESS'])
+
+    def _start_operation(self, operation: str, product: dict, record_type: str, parameters: list) -> dict:
+        if self.in_progress() >= self.concurrent_operations:
+            self.limit_errors += 1
+            raise client_error(
+                'InvalidParametersException',
+                f"AWS Control Tower cannot process more than {self.concurrent_operations} concurrent account "
+                f"operations. Wait for an operation to complete and try again.",
+                operation
+            )
+
+        now = self.clock.time()
+        record_id = f"rec-{next(self._ids):012d}"
+        record = {
+            'RecordId': record_id,
+            'ProvisionedProductName': product['Name'],
+            'ProvisionedProductId': product['Id'],
+            'ProductId': PRODUCT_ID,
+            'ProvisioningArtifactId': PROVISIONING_ARTIFACT_ID,
+            'RecordType': record_type,
+            'ProvisionedProductType': 'CONTROL_TOWER_ACCOUNT',
+            'Status': 'IN_PROGRESS',
+            'StartedAt': now,
+            'FinishesAt': now + self.durations(self.rng, record_type),
+            'Fails': self.rng.random() < self.failure_rate,
+            'Outputs': {x['Key']: x['Value'] for x in parameters}
+        }
+        self.records[record_id] = record
+        product.update({
+            'Status': 'UNDER_CHANGE',
+            'LastRecordId': record_id,
+            'LastProvisioningRecordId': record_id
+        })
+
+        # Wake the clock up when the operation finishes so completions are observed in time order
+        self.clock.schedule(record['FinishesAt'] - now, self._refresh)
+        return self._record_detail(record)
+
+    @staticmethod
+    def _record_detail(record: dict) -> dict:
+        status = {'IN_PROGRESS': 'IN_PROGRESS', 'SUCCEEDED': 'SUCCEEDED', 'FAILED': 'FAILED'}[record['Status']]
+        return {
+            'RecordId': record['RecordId'],
+            'ProvisionedProductName': record['ProvisionedProductName'],
+            'ProvisionedProductId': record['ProvisionedProductId'],
+            'ProductId': record['ProductId'],
+            'ProvisioningArtifactId': record['ProvisioningArtifactId'],
+            'RecordType': record['RecordType'],
+            'ProvisionedProductType': record['ProvisionedProductType'],
+            'Status': status,
+            'CreatedTime': record['StartedAt'],
+            'UpdatedTime': record['FinishesAt'] if record['Status'] != 'IN_PROGRESS' else record['StartedAt']
+        }
+
+    def _product_attributes(self, product: dict) -> dict:
+        return {x: product.get(x) for x in ('Name', 'Id', 'Type', 'Status', 'StatusMessage', 'LastRecordId',
+                                            'LastProvisioningRecordId', 'LastSuccessfulProvisioningRecordId',
+                                            'ProductId', 'ProvisioningArtifactId', 'Tags', 'CreatedTime')}
+
+    # ---------------------------
+    # Service Catalog API
+    # ---------------------------
+    def get_paginator(self, operation: str):
+        if operation != 'scan_provisioned_products':
+            raise NotImplementedError(operation)
+        return _ScanPaginator(self)
+
+    def scan_provisioned_products(self, PageSize=SCAN_PAGE_SIZE, PageToken=None, **kwargs):
+        self._call('scan_provisioned_products')
+        self._refresh()
+        names = sorted(self.products)
+        start = int(PageToken or 0)
+        page = {'ProvisionedProducts': [self._product_detail(self.products[x]) for x in names[start:start + PageSize]]}
+        if start + PageSize < len(names):
+            page['NextPageToken'] = str(start + PageSize)
+        return page
+
+    def search_provisioned_products(self, Filters=None, PageSize=20, PageToken=None, **kwargs):
+        self._call('search_provisioned_products')
+        self._refresh()
+        names = sorted(self.products)
+        for query in (Filters or {}).get('SearchQuery', []):
+            field, value = query.split(':', 1)
+            if field == 'name':
+                names = [x for x in names if x == value]
+
+        start = int(PageToken or 0)
+        page = {
+            'ProvisionedProducts': [self._product_attributes(self.products[x]) for x in names[start:start + PageSize]],
+            'TotalResultsCount': len(names)
+        }
+        if start + PageSize < len(names):
+            page['NextPageToken'] = str(start + PageSize)
+        return page
+
+    def describe_product(self, Name=None, Id=None):
+        self._call('describe_product')
+        if Name not in (None, CONTROL_TOWER_PRODUCT) or Id not in (None, PRODUCT_ID):
+            raise client_error('ResourceNotFoundException', f"Product {Name or Id} not found", 'describe_product')
+        return {
+            'ProductViewSummary': {'Id': 'prodview-ctaccountfactory', 'ProductId': PRODUCT_ID,
+                                   'Name': CONTROL_TOWER_PRODUCT},
+            'ProvisioningArtifacts': [{'Id': PROVISIONING_ARTIFACT_ID, 'Name': 'AWS Control Tower Account Factory',
+                                       'Guidance': 'DEFAULT'}]
+        }
+
+    def provision_product(self, ProvisionedProductName, ProvisioningParameters=None, Tags=None, **kwargs):
+        self._call('provision_product')
+        if ProvisionedProductName in self.products:
+            raise client_error('DuplicateResourceException',
+                               f"Provisioned product {ProvisionedProductName} already exists", 'provision_product')
+
+        # The product only exists once Control Tower accepted the operation
+        product = {
+            'Name': ProvisionedProductName,
+            'Id': f"pp-{next(self._ids):012d}",
+            'Type': 'CONTROL_TOWER_ACCOUNT',
+            'ProductId': PRODUCT_ID,
+            'ProvisioningArtifactId': PROVISIONING_ARTIFACT_ID,
+            'Tags': list(Tags or []),
+            'CreatedTime': self.clock.time()
+        }
+        record = self._start_operation('provision_product', product, 'PROVISION_PRODUCT',
+                                       ProvisioningParameters or [])
+        self.products[ProvisionedProductName] = product
+        return {'RecordDetail': record}
+
+    def update_provisioned_product(self, ProvisionedProductName=None, ProvisionedProductId=None,
+                                   ProvisioningParameters=None, Tags=None, **kwargs):
+        self._call('update_provisioned_product')
+        self._refresh()
+        product = self.products.get(ProvisionedProductName) or next(
+            (x for x in self.products.values() if x['Id'] == ProvisionedProductId), None)
+        if not product:
+            raise client_error('ResourceNotFoundException',
+                               f"Provisioned product {ProvisionedProductName or ProvisionedProductId} not found",
+                               'update_provisioned_product')
+        if product['Status'] == 'UNDER_CHANGE':
+            raise client_error('InvalidStateException',
+                               f"Provisioned product {product['Name']} is under change", 'update_provisioned_product')
+
+        record = self._start_operation('update_provisioned_product', product, 'UPDATE_PROVISIONED_PRODUCT',
+                                       ProvisioningParameters or [])
+        if Tags:
+            product['Tags'] = list(Tags)
+        return {'RecordDetail': record}
+
+    def describe_provisioned_product(self, Id=None, Name=None):
+        self._call('describe_provisioned_product')
+        self._refresh()
+        product = self.products.get(Name) or next((x for x in self.products.values() if x['Id'] == Id), None)
+        if not product:
+            raise client_error('ResourceNotFoundException', f"Provisioned product {Id or Name} not found",
+                               'describe_provisioned_product')
+        return {'ProvisionedProductDetail': self._product_detail(product)}
+
+    def describe_record(self, Id):
+        self._call('describe_record')
+        self._refresh()
+        record = self.records.get(Id)
+        if not record:
+            raise client_error('ResourceNotFoundException', f"Record {Id} not found", 'describe_record')
+
+        outputs = []
+        if record['Status'] == 'SUCCEEDED':
+            account_id = f"{int(record['ProvisionedProductId'][3:]):012d}"
+            outputs = [
+                {'OutputKey': 'AccountId', 'OutputValue': account_id},
+                {'OutputKey': 'AccountEmail', 'OutputValue': record['Outputs'].get('AccountEmail')},
+                {'OutputKey': 'SSOUserEmail', 'OutputValue': record['Outputs'].get('SSOUserEmail')},
+                {'OutputKey': 'SSOUserPortal', 'OutputValue': 'https://d-1234567890.awsapps.com/start'}
+            ]
+        return {'RecordDetail': self._record_detail(record), 'RecordOutputs': outputs}
+
+    def _product_detail(self, product: dict) -> dict:
+        detail = self._product_attributes(product)
+        detail.pop('Tags')
+        return detail
+
+    # ---------------------------
+    # Load test metrics
+    # ---------------------------
+    def stats(self, until: float = None) -> dict:
+        """Makespan of the account operations, Control Tower slot utilization and API call counts"""
+        self._refresh()
+        records = list(self.records.values())
+        if not records:
+            return {'Operations': 0, 'Makespan': 0.0, 'SlotUtilization': 0.0, 'Calls': dict(self.calls),
+                    'Throttles': dict(self.throttles), 'LimitErrors': self.limit_errors}
+
+        end = until if until is not None else max(min(x['FinishesAt'], self.clock.time()) for x in records)
+        start = min(x['StartedAt'] for x in records)
+        busy = sum(max(0.0, min(x['FinishesAt'], end) - x['StartedAt']) for x in records)
+        makespan = end - start
+        return {
+            'Operations': len(records),
+            'Failed': len([x for x in records if x['Status'] == 'FAILED']),
+            'Makespan': makespan,
+            'SlotUtilization': busy / (self.concurrent_operations * makespan) if makespan else 0.0,
+            'Calls': dict(self.calls),
+            'Throttles': dict(self.throttles),
+            'LimitErrors': self.limit_errors
+        }
+
+
+class _ScanPaginator():
+    def __init__(self, client: SimulatedServiceCatalog):
+        self._client = client
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self._client.scan_provisioned_products(PageToken=token, **kwargs)
+            yield page
+            token = page.get('NextPageToken')
+            if not token:
+                return
@@ -0,0 +1,65 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from botocore.exceptions import ClientError
+from executor import VirtualClock
+from service_catalog import SimulatedServiceCatalog, fixed_durations
+from load_test import run_scenario
+
+PARAMETERS = [{'Key': 'AccountEmail', 'Value': 'dev@example.com'}]
+
+
+def test_concurrent_operation_limit():
+    sc = SimulatedServiceCatalog(clock=VirtualClock(), durations=fixed_durations(provision=600))
+    for index in range(5):
+        sc.provision_product(ProvisionedProductName=f"account-{index}", ProvisioningParameters=PARAMETERS)
+
+    with pytest.raises(ClientError) as error:
+        sc.provision_product(ProvisionedProductName='account-5', ProvisioningParameters=PARAMETERS)
+    assert error.value.response['Error']['Code'] == 'InvalidParametersException'
+    assert error.value.operation_name == 'ProvisionProduct'
+    assert 'account-5' not in sc.products
+
+    sc.clock.run()
+    sc.provision_product(ProvisionedProductName='account-5', ProvisioningParameters=PARAMETERS)
+    assert sc.stats()['LimitErrors'] == 1
+
+
+def test_throttling_is_retried_then_raised():
+    sc = SimulatedServiceCatalog(clock=VirtualClock(), throttle_rate=1.0, retries=2)
+    with pytest.raises(ClientError) as error:
+        sc.describe_product(Name='AWS Control Tower Account Factory')
+    assert error.value.response['Error']['Code'] == 'ThrottlingException'
+    assert sc.calls['describe_product'] == 3
+
+
+def test_account_lifecycle_and_outputs():
+    sc = SimulatedServiceCatalog(clock=VirtualClock(), durations=fixed_durations(provision=600))
+    record = sc.provision_product(ProvisionedProductName='account-0', ProvisioningParameters=PARAMETERS)['RecordDetail']
+    assert sc.describe_provisioned_product(Id=record['ProvisionedProductId'])[
+        'ProvisionedProductDetail']['Status'] == 'UNDER_CHANGE'
+
+    sc.clock.run()
+    detail = sc.describe_provisioned_product(Name='account-0')['ProvisionedProductDetail']
+    outputs = {x['OutputKey']: x['OutputValue'] for x in sc.describe_record(Id=record['RecordId'])['RecordOutputs']}
+    assert detail['Status'] == 'AVAILABLE'
+    assert detail['LastProvisioningRecordId'] == record['RecordId']
+    assert outputs['AccountEmail'] == 'dev@example.com'
+
+
+def test_burst_of_accounts_through_the_state_machine():
+    result = run_scenario(accounts=12, lifecycle_events=True,
+                          sc_options={'durations': fixed_durations(provision=600)})
+
+    assert result['Executions'] == {'SUCCEEDED': 12}
+    assert result['CfnResponses'] == {'SUCCESS': 12, 'FAILED': 0}
+    sc_stats = result['ServiceCatalog']
+    assert sc_stats['Operations'] == 12
+    assert sc_stats['LimitErrors'] == 0
+    # Three waves of at most five accounts
+    assert 3 * 600 < sc_stats['Makespan'] < 3 * 600 + 3 * 60
+    assert sc_stats['SlotUtilization'] > 0.75
+    # Lifecycle events arrive 5s after the operation completes
+    assert result['Timeline']['DetectionLag']['p50'] == pytest.approx(5, abs=1)
+    assert result['Timeline']['Provisioning']['p99'] == pytest.approx(600, abs=1)
@@ -0,0 +1,149 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from executor import LocalStepFunctions, VirtualClock
+from lambdas import LocalLambdas, load_template, load_definition
+
+ACCOUNT_SECONDS = 1800
+FUNCTIONS = ['CTE_CreateAccountFn', 'CTE_GetAccountStatusFn', 'CTE_SignalCfnResponseFn', 'CTE_FleetStatusPollerFn']
+
+
+class FakeServiceCatalog():
+    """Accounts become AVAILABLE account_seconds after they were provisioned"""
+
+    def __init__(self, clock, account_seconds=ACCOUNT_SECONDS):
+        self.clock = clock
+        self.account_seconds = account_seconds
+        self.products = {}
+
+    def get_paginator(self, operation):
+        assert operation == 'scan_provisioned_products'
+        return self
+
+    def paginate(self, **kwargs):
+        return [{'ProvisionedProducts': [self._product(x) for x in self.products.values()]}]
+
+    def search_provisioned_products(self, Filters, **kwargs):
+        name = Filters['SearchQuery'][0].split(':', 1)[1]
+        return {'ProvisionedProducts': [dict(self._product(self.products[name]), CreatedTime='')]
+                if name in self.products else []}
+
+    def describe_product(self, Name):
+        return {'ProvisioningArtifacts': [{'Id': 'pa-1', 'Guidance': 'DEFAULT'}]}
+
+    def provision_product(self, ProvisionedProductName, **kwargs):
+        self.products[ProvisionedProductName] = {'Name': ProvisionedProductName, 'Id': f"pp-{len(self.products)}",
+                                                 'Started': self.clock.time()}
+        product = self.products[ProvisionedProductName]
+        return {'RecordDetail': {'RecordId': f"rec-{product['Id']}", 'ProvisionedProductId': product['Id'],
+                                 'ProductId': 'prod-1', 'RecordType': 'PROVISION_PRODUCT', 'Status': 'CREATED',
+                                 'CreatedTime': '', 'UpdatedTime': ''}}
+
+    def describe_provisioned_product(self, Id):
+        product = next(x for x in self.products.values() if x['Id'] == Id)
+        return {'ProvisionedProductDetail': dict(self._product(product), StatusMessage='')}
+
+    def describe_record(self, Id):
+        return {'RecordOutputs': [{'OutputKey': 'AccountId', 'OutputValue': '222222222222'}]}
+
+    def _product(self, product):
+        done = self.clock.time() - product['Started'] >= self.account_seconds
+        return {'Name': product['Name'], 'Id': product['Id'], 'Type': 'CONTROL_TOWER_ACCOUNT',
+                'Status': 'AVAILABLE' if done else 'UNDER_CHANGE', 'LastRecordId': f"rec-{product['Id']}",
+                'LastProvisioningRecordId': f"rec-{product['Id']}"}
+
+
+def cfn_event(account_name):
+    return {
+        'RequestType': 'Create',
+        'ResponseURL': f'https://cloudformation-custom-resource-response/{account_name}',
+        'StackId': 'arn:aws:cloudformation:us-east-1:111111111111:stack/sdlc/abc',
+        'RequestId': f'request-{account_name}',
+        'LogicalResourceId': 'rCreateAccount',
+        'ResourceProperties': {'ServiceCatalogParameters': {
+            'AccountName': account_name,
+            'AccountEmail': f'{account_name}@example.com',
+            'SSOUserFirstName': 'Jane',
+            'SSOUserLastName': 'Doe',
+            'SSOUserEmail': 'jane@example.com',
+            'ManagedOrganizationalUnit': 'Dev (ou-abcd-11111111)'
+        }}
+    }
+
+
+@pytest.fixture()
+def local_sfn(request):
+    clock = VirtualClock()
+    template = load_template()
+    lambdas = LocalLambdas(template=template, clock=clock)
+    lambdas.capture_cfn_responses()
+    sfn = LocalStepFunctions(definition=load_definition(template), functions={}, clock=clock)
+    sfn.functions = lambdas.handlers(FUNCTIONS, clients={
+        'SC_CLIENT': FakeServiceCatalog(clock, getattr(request, 'param', ACCOUNT_SECONDS)),
+        'SFN_CLIENT': sfn.client()
+    })
+    yield sfn, lambdas
+    lambdas.close()
+
+
+def test_account_vending_runs_on_virtual_time(local_sfn):
+    sfn, lambdas = local_sfn
+    for name in ('ent-ct-team-dev', 'ent-ct-team-prod'):
+        sfn.start_execution(name=name, execution_input=cfn_event(name))
+
+    reports = sfn.run()
+
+    assert [x['Status'] for x in reports] == ['SUCCEEDED', 'SUCCEEDED']
+    # Without lifecycle events the task token timeout re-checks the status every 900s
+    assert reports[0]['Duration'] == pytest.approx(2 * 900, abs=5)
+    assert reports[0]['Invocations'] == {'CTE_CreateAccountFn': 1, 'CTE_GetAccountStatusFn': 3,
+                                         'CTE_SignalCfnResponseFn': 1}
+    assert sorted((x['Status'], x['Data']['AccountId']) for x in lambdas.responses) == [('SUCCESS', '222222222222')] * 2
+
+
+@pytest.mark.parametrize('local_sfn', [1000], indirect=True)
+def test_fleet_poller_completes_waiting_tasks(local_sfn):
+    sfn, _ = local_sfn
+    sfn.add_schedule('CTE_FleetStatusPollerFn', rate_seconds=60)
+    sfn.start_execution(name='ent-ct-team-dev', execution_input=cfn_event('ent-ct-team-dev'))
+
+    report = sfn.run()[0]
+
+    assert report['Status'] == 'SUCCEEDED'
+    # Completed by the first poll after the account is AVAILABLE, not by the next 900s safety net check
+    assert 1000 < report['Duration'] <= 1000 + 65
+    assert report['Invocations']['CTE_GetAccountStatusFn'] == 2
+
+
+def test_retry_catch_and_wait_semantics():
+    calls = []
+
+    def flaky(event, context):
+        calls.append(context.function_name)
+        raise TypeError("boom")
+
+    definition = {
+        'StartAt': 'Wait',
+        'States': {
+            'Wait': {'Type': 'Wait', 'SecondsPath': '$.Seconds', 'Next': 'Task'},
+            'Task': {
+                'Type': 'Task', 'Resource': 'arn:aws:states:::lambda:invoke',
+                'Parameters': {'FunctionName': 'arn:aws:lambda:us-east-1:111111111111:function:Flaky',
+                               'Payload.$': '$'},
+                'Retry': [{'ErrorEquals': ['States.ALL'], 'IntervalSeconds': 10, 'MaxAttempts': 2, 'BackoffRate': 3}],
+                'Catch': [{'ErrorEquals': ['TypeError'], 'ResultPath': '$.Failure', 'Next': 'Done'}],
+                'Next': 'Done'
+            },
+            'Done': {'Type': 'Succeed'}
+        }
+    }
+    sfn = LocalStepFunctions(definition=definition, functions={'Flaky': flaky}, invoke_seconds=1)
+    execution = sfn.start_execution(name='retry', execution_input={'Seconds': 100})
+    report = sfn.run()[0]
+
+    assert calls == ['Flaky'] * 3
+    assert report['Status'] == 'SUCCEEDED'
+    # 100s wait, three 1s invocations, 10s and 30s retry intervals
+    assert report['Duration'] == pytest.approx(143)
+    assert execution.output['Failure']['Error'] == 'TypeError'